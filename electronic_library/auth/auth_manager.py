@@ -1,4 +1,3 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.orm import Session
 from models.database_models import User, UserRole
 from typing import Optional, Tuple
@@ -44,6 +43,7 @@ class AuthManager:
             return False, "Пользователь с таким email уже существует"
         
         # Создание пользователя
+        from werkzeug.security import generate_password_hash
         try:
             user = User(
                 email=email,
@@ -62,6 +62,8 @@ class AuthManager:
     @staticmethod
     def login_user(session: Session, email: str, password: str) -> Tuple[Optional[User], str]:
             """Аутентификация пользователя"""
+            # werkzeug загружается при первом входе, а не при запуске приложения
+            from werkzeug.security import check_password_hash
             user = session.query(User).filter_by(email=email, is_active=True).first()
 
             if not user:
@@ -75,6 +77,7 @@ class AuthManager:
     @staticmethod
     def change_password(session: Session, user: User, old_password: str, new_password: str) -> Tuple[bool, str]:
         """Смена пароля пользователя"""
+        from werkzeug.security import generate_password_hash, check_password_hash
         
         if not check_password_hash(user.password_hash, old_password):
             return False, "Неверный текущий пароль"
@@ -1,8 +1,9 @@
 import os
 import shutil
+import sqlite3
+import tempfile
 import zipfile
 from datetime import datetime
-import paramiko
 import subprocess
 from typing import Optional, Tuple
 from config import Config
@@ -26,7 +27,13 @@ class BackupManager:
             
             with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 if os.path.exists(self.db_path):
-                    zipf.write(self.db_path, os.path.basename(self.db_path))
+                    # В архив попадает согласованная копия, а не рабочий файл базы:
+                    # в режиме WAL часть данных находится в журнале
+                    snapshot_file = self._copy_database()
+                    try:
+                        zipf.write(snapshot_file, os.path.basename(self.db_path))
+                    finally:
+                        os.remove(snapshot_file)
                 else:
                     # Если используется SQLite в памяти или другой механизм
                     # Создаем дамп через SQLAlchemy или subprocess
@@ -47,6 +54,29 @@ class BackupManager:
         except Exception as e:
             return False, f"Ошибка при создании резервной копии: {str(e)}"
     
+    def _copy_database(self) -> str:
+        """Копия базы во временный файл через online backup API SQLite
+
+        Копия включает зафиксированные транзакции из WAL-журнала и не зависит
+        от открытых читателей, которые не дают выполнить checkpoint.
+        """
+        handle, copy_path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(handle)
+        try:
+            source = sqlite3.connect(self.db_path)
+            target = sqlite3.connect(copy_path)
+            try:
+                source.backup(target)
+                # Восстановленной из архива базе не нужен журнал WAL
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+                source.close()
+        except Exception:
+            os.remove(copy_path)
+            raise
+        return copy_path
+    
     def _create_sql_dump(self, dump_file: str):
         """Создание SQL дампа базы данных"""
         # Для SQLite используем sqlite3 для создания дампа
@@ -79,6 +109,10 @@ class BackupManager:
                 else:
                     # Это файл базы данных, копируем его
                     shutil.copy(temp_db_path, self.db_path)
+                    # Журнал WAL от прежней базы не должен применяться к восстановленной
+                    for suffix in ('-wal', '-shm'):
+                        if os.path.exists(self.db_path + suffix):
+                            os.remove(self.db_path + suffix)
                 
                 # Удаляем временный файл
                 os.remove(temp_db_path)
@@ -129,7 +163,8 @@ class BackupManager:
             if not all([host, username]):
                 return False, "Не указаны параметры подключения к удаленному серверу"
             
-            # Подключение по SSH
+            # Подключение по SSH (paramiko загружается только при выгрузке)
+            import paramiko
             ssh = paramiko.SSHClient()
             ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             
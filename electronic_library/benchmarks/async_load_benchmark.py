@@ -0,0 +1,156 @@
+"""Нагрузочный тест: одновременные читатели каталога, синхронный и асинхронный доступ
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.async_load_benchmark --scale 10k --clients 1 10 50 100 --requests 2000
+
+Каждый клиент выполняет смесь операций чтения: первая страница каталога,
+поиск по жанру и цене, история заказов пользователя. Синхронный путь -
+DatabaseManager и пул потоков (поток на клиента), асинхронный -
+AsyncDatabaseManager и задачи asyncio в одном потоке. Для каждого числа
+клиентов выводятся операций в секунду и задержки p50/p99.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from sqlalchemy import select, desc
+from sqlalchemy.orm import selectinload
+from models.database_models import DatabaseManager, Publication, Order, OrderItem, User
+from models.async_database import AsyncDatabaseManager, AsyncLibraryService
+from models.catalog_queries import CatalogQueries
+from models.synthetic_data import SCALE_PRESETS
+from benchmarks.run_benchmarks import prepare_dataset, DEFAULT_DATA_DIR
+
+GENRES = ['Фантастика', 'Программирование', 'Детектив', 'Классика', 'История']
+
+
+def make_workload(requests: int, user_ids: List[int], seed: int) -> List[tuple]:
+    """Одинаковая последовательность операций для обоих путей"""
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(requests):
+        kind = rng.choices(['browse', 'search', 'orders'], [40, 40, 20])[0]
+        if kind == 'browse':
+            workload.append(('browse', {}))
+        elif kind == 'search':
+            low = rng.choice([100, 300, 500, 1000])
+            workload.append(('search', {'genre': rng.choice(GENRES), 'min_price': low, 'max_price': low * 3}))
+        else:
+            workload.append(('orders', {'user_id': rng.choice(user_ids)}))
+    return workload
+
+
+# --- синхронный путь ---
+
+def sync_operation(db_manager: DatabaseManager, kind: str, params: Dict):
+    with db_manager.session_scope() as session:
+        if kind == 'browse':
+            statement = CatalogQueries.catalog_page(20).options(selectinload(Publication.authors))
+        elif kind == 'search':
+            statement = CatalogQueries.search(**params).options(selectinload(Publication.authors))
+        else:
+            statement = select(Order).where(Order.user_id == params['user_id']) \
+                .order_by(desc(Order.order_date)) \
+                .options(selectinload(Order.items).selectinload(OrderItem.publication))
+        return len(session.scalars(statement).all())
+
+
+def run_sync(db_manager: DatabaseManager, workload: List[tuple], clients: int) -> List[float]:
+    def timed(operation):
+        started = time.perf_counter()
+        sync_operation(db_manager, *operation)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(timed, workload))
+
+
+# --- асинхронный путь ---
+
+async def run_async(service: AsyncLibraryService, workload: List[tuple], clients: int) -> List[float]:
+    operations = {
+        'browse': lambda params: service.browse_catalog(20),
+        'search': lambda params: service.search_publications(**params),
+        'orders': lambda params: service.order_history(params['user_id']),
+    }
+    latencies = []
+    queue = list(reversed(workload))
+
+    async def client():
+        while queue:
+            kind, params = queue.pop()
+            started = time.perf_counter()
+            await operations[kind](params)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        'ops_per_s': len(ordered) / elapsed,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Одновременное чтение каталога: sync и async')
+    parser.add_argument('--scale', choices=sorted(SCALE_PRESETS), default='10k')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+
+    dataset = prepare_dataset(args.scale, args.seed, args.data_dir)
+    work_dir = tempfile.mkdtemp(prefix='async_bench_')
+    db_path = os.path.join(work_dir, 'library.db')
+    shutil.copy(dataset, db_path)
+
+    try:
+        db_manager = DatabaseManager(f'sqlite:///{db_path}')
+        with db_manager.session_scope() as session:
+            user_ids = [row.id for row in session.query(User.id).limit(5000)]
+        workload = make_workload(args.requests, user_ids, args.seed)
+
+        print(f"Набор {args.scale}, операций на прогон: {args.requests}")
+        print(f"{'Клиентов':>8} | {'Путь':<5} | {'Опер/с':>8} | {'p50, мс':>8} | {'p99, мс':>8}")
+        print("-" * 50)
+        for clients in args.clients:
+            started = time.perf_counter()
+            latencies = run_sync(db_manager, workload, clients)
+            sync_stats = summarize(latencies, time.perf_counter() - started)
+
+            async def async_round():
+                async_manager = AsyncDatabaseManager(f'sqlite:///{db_path}')
+                try:
+                    service = AsyncLibraryService(async_manager)
+                    # Прогрев пула соединений, как у синхронного пути после первого прогона
+                    await service.browse_catalog(1)
+                    round_started = time.perf_counter()
+                    result = await run_async(service, workload, clients)
+                    return result, time.perf_counter() - round_started
+                finally:
+                    await async_manager.dispose()
+
+            latencies, elapsed = asyncio.run(async_round())
+            async_stats = summarize(latencies, elapsed)
+
+            for name, stats in (('sync', sync_stats), ('async', async_stats)):
+                print(f"{clients:8d} | {name:<5} | {stats['ops_per_s']:8.0f} | "
+                      f"{stats['p50_ms']:8.2f} | {stats['p99_ms']:8.2f}")
+        db_manager.engine.dispose()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Задержка автодополнения по индексу начал строк на больших объемах
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.autocomplete_benchmark --titles 1000000 --queries 5000
+
+Названия собираются из случайных псевдослов (см. fuzzy_index_benchmark), веса
+распределены по Зипфу, как продажи. Запросы - начала случайных слов
+случайных названий длиной 1-6 символов: короткие начала дают отрезки в сотни
+тысяч ключей, из которых выбираются самые популярные. Выводятся время
+построения, размер снимка, время загрузки при холодном старте и задержки
+подсказок (p50/p99) по длине запроса.
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from models.autocomplete import PrefixIndex
+from benchmarks.fuzzy_index_benchmark import make_titles, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Автодополнение: задержка на больших объемах')
+    parser.add_argument('--titles', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    titles = make_titles(args.titles, rng)
+    weights = [int(1000 / rank) for rank in range(1, args.titles + 1)]
+    rng.shuffle(weights)
+
+    started = time.perf_counter()
+    index = PrefixIndex.build((entity_id, title, weights[entity_id - 1])
+                              for entity_id, title in enumerate(titles, start=1))
+    build_s = time.perf_counter() - started
+    data = index.to_bytes()
+    started = time.perf_counter()
+    index = PrefixIndex.from_bytes(data)
+    load_s = time.perf_counter() - started
+    print(f"Названий: {args.titles}, различных строк: {len(index)}, ключей: {len(index.key_terms)}")
+    print(f"Построение: {build_s:.1f} с, снимок: {len(data) / 2 ** 20:.1f} МБ, загрузка: {load_s:.2f} с")
+
+    latencies = defaultdict(list)
+    for _ in range(args.queries):
+        word = rng.choice(rng.choice(titles).split())
+        length = rng.randint(1, min(6, len(word)))
+        started = time.perf_counter()
+        index.suggest(word[:length], args.limit)
+        latencies[length].append((time.perf_counter() - started) * 1000)
+
+    for length in sorted(latencies):
+        values = latencies[length]
+        print(f"Длина запроса {length}: p50 {percentile(values, 0.5):.3f} мс, "
+              f"p99 {percentile(values, 0.99):.3f} мс ({len(values)} запросов)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Очистка истекших резервов корзин на миллионах позиций
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.cart_sweep_benchmark --items 2000000 --expired 0.01
+
+Во временной базе создается --items позиций корзин (по 4 на покупателя):
+половина без резерва (expires_at = NULL), остальные зарезервированы до
+моментов в ближайший час, доля --expired из них - уже истекла. Замеряются:
+- холостой проход очистки, когда истекших резервов нет;
+- очистка истекших резервов блоками --batch-size;
+- для сравнения - тот же отбор без индекса по expires_at (полный просмотр).
+Выводится план запроса очистки и сверка: сумма остатков и резервов до и
+после очистки совпадает, истекших резервов не осталось.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from models.database_models import DatabaseManager, Publication, cart_items
+
+INSERT_CHUNK = 50000
+ITEMS_PER_CART = 4
+
+
+def fill(db_manager: DatabaseManager, items: int, publications: int, expired: float, rng: random.Random):
+    now = datetime.now()
+    with db_manager.engine.begin() as connection:
+        connection.execute(insert(Publication.__table__), [
+            {'id': publication_id, 'title': f'Издание {publication_id}', 'isbn': f'sweep-{publication_id}',
+             'price': 100.0, 'stock_quantity': 1000}
+            for publication_id in range(1, publications + 1)
+        ])
+    for start in range(0, items, INSERT_CHUNK):
+        rows = []
+        for number in range(start, min(start + INSERT_CHUNK, items)):
+            quantity = rng.randint(1, 3)
+            reserved = rng.random() < 0.5
+            if not reserved:
+                expires_at = None
+            elif rng.random() < expired * 2:
+                expires_at = now - timedelta(seconds=rng.randint(1, 3600))
+            else:
+                expires_at = now + timedelta(seconds=rng.randint(1, 3600))
+            rows.append({'user_id': number // ITEMS_PER_CART + 1,
+                         'publication_id': (number * 7919) % publications + 1,
+                         'quantity': quantity, 'reserved': quantity if reserved else 0, 'unit_price': 100.0,
+                         'added_at': now - timedelta(hours=1), 'expires_at': expires_at})
+        with db_manager.engine.begin() as connection:
+            connection.execute(insert(cart_items), rows)
+
+
+def totals(engine, now: datetime):
+    with engine.connect() as connection:
+        stock = connection.execute(select(func.sum(Publication.stock_quantity))).scalar()
+        reserved = connection.execute(select(func.sum(cart_items.c.reserved))).scalar()
+        expired = connection.execute(
+            select(func.count()).select_from(cart_items).where(cart_items.c.expires_at <= now)).scalar()
+    return stock + reserved, expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Очистка истекших резервов корзин')
+    parser.add_argument('--items', type=int, default=2000000)
+    parser.add_argument('--publications', type=int, default=20000)
+    parser.add_argument('--expired', type=float, default=0.01, help='доля истекших среди зарезервированных')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='cart_sweep_')
+    try:
+        db_manager = DatabaseManager(f"sqlite:///{os.path.join(work_dir, 'carts.db')}")
+        started = time.perf_counter()
+        fill(db_manager, args.items, args.publications, args.expired, rng)
+        print(f"Позиций корзин: {args.items} ({time.perf_counter() - started:.1f} с)")
+
+        now = datetime.now()
+        query = f"SELECT user_id, publication_id, reserved FROM cart_items WHERE expires_at <= ? " \
+                f"ORDER BY expires_at LIMIT {args.batch_size}"
+        with db_manager.engine.connect() as connection:
+            plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {query}', (now,)).all()
+            print("План очистки: " + '; '.join(row[-1] for row in plan))
+            started = time.perf_counter()
+            connection.exec_driver_sql(query.replace('FROM cart_items', 'FROM cart_items NOT INDEXED'), (now,)).all()
+            print(f"Отбор блока без индекса (полный просмотр): {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        before, expired = totals(db_manager.engine, now)
+        carts = db_manager.carts
+        started = time.perf_counter()
+        swept = carts.sweep(args.batch_size, now)
+        elapsed = time.perf_counter() - started
+        print(f"Очистка: {swept} резервов за {elapsed * 1000:.0f} мс "
+              f"({swept / elapsed if elapsed else 0:,.0f} позиций/с), истекших до очистки: {expired}")
+
+        started = time.perf_counter()
+        idle = carts.sweep(args.batch_size, now)
+        print(f"Холостой проход: {idle} резервов за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        after, left = totals(db_manager.engine, now)
+        print(f"Остатки + резервы до и после: {before} / {after}, истекших после очистки: {left}")
+        db_manager.engine.dispose()
+        return 0 if before == after and left == 0 and swept == expired else 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
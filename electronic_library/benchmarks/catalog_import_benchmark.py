@@ -0,0 +1,118 @@
+"""Скорость пакетного импорта каталога и память процесса
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.catalog_import_benchmark --records 1000000
+    python -m benchmarks.catalog_import_benchmark --records 100000 --format csv
+
+Во временном каталоге создается файл выгрузки в формате
+JSONExporter.export_publications (или CSV с теми же колонками) из
+синтетических названий и имен (см. models/synthetic_data.py), затем он
+импортируется в новую базу. Доля --duplicates записей повторяет ISBN более
+ранних записей. Выводятся скорость импорта (записей/с), счетчики и пиковый
+резидентный размер процесса: он не должен расти с объемом файла.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from models.catalog_import import CatalogImporter, LIST_SEPARATOR
+from models.database_models import DatabaseManager
+from models.synthetic_data import FIRST_NAMES, GENRE_NAMES, LANGUAGES, LANGUAGE_WEIGHTS, LAST_NAMES, \
+    TITLE_ADJECTIVES, TITLE_NOUNS, TITLE_TAILS
+
+FIELDS = ['title', 'isbn', 'publication_year', 'price', 'stock_quantity', 'language',
+          'authors', 'genres', 'publisher', 'description', 'pages']
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def make_records(count: int, rng: random.Random, duplicates: float):
+    """Записи выгрузки; доля duplicates повторяет ISBN одной из предыдущих записей"""
+    # Около одного автора на 20 изданий: сочетания имени и фамилии, затем с номером
+    names = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES]
+    authors = [names[number % len(names)] + (f' ({number // len(names)})' if number >= len(names) else '')
+               for number in range(max(len(names), count // 20))]
+    publishers = [f'Издательство «{noun.capitalize()}» №{number}' for number in range(1, 51) for noun in TITLE_NOUNS]
+    for number in range(1, count + 1):
+        isbn_number = rng.randint(1, number - 1) if number > 1 and rng.random() < duplicates else number
+        title = f'{rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)}{rng.choice(TITLE_TAILS)}'
+        yield {
+            'title': title,
+            'isbn': f'978-{isbn_number:012d}',
+            'publication_year': rng.randint(1950, 2024),
+            'price': float(rng.randint(99, 3000)),
+            'stock_quantity': rng.randint(0, 200),
+            'language': rng.choices(LANGUAGES, LANGUAGE_WEIGHTS)[0],
+            'authors': rng.sample(authors, rng.choices([1, 2, 3], [80, 15, 5])[0]),
+            'genres': rng.sample(GENRE_NAMES, rng.choices([1, 2], [75, 25])[0]),
+            'publisher': rng.choice(publishers),
+            'description': f'{title}. ' + ' '.join(rng.choices(TITLE_NOUNS, k=12)),
+            'pages': rng.randint(80, 1200),
+        }
+
+
+def write_feed(path: str, records, file_format: str):
+    """Записать файл построчно, не собирая записи в памяти"""
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        if file_format == 'csv':
+            writer = csv.DictWriter(stream, fieldnames=FIELDS)
+            writer.writeheader()
+            for record in records:
+                writer.writerow({**record, 'authors': LIST_SEPARATOR.join(record['authors']),
+                                 'genres': LIST_SEPARATOR.join(record['genres'])})
+            return
+        stream.write('[\n')
+        for number, record in enumerate(records):
+            stream.write((',\n' if number else '') + json.dumps(record, ensure_ascii=False))
+        stream.write('\n]\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт каталога: скорость и память')
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('--duplicates', type=float, default=0.01)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rebuild', action='store_true', help='перестроить нечеткий индекс и автодополнение')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='import_bench_')
+    try:
+        feed_path = os.path.join(work_dir, f'publications.{args.format}')
+        started = time.perf_counter()
+        write_feed(feed_path, make_records(args.records, random.Random(args.seed), args.duplicates), args.format)
+        print(f"Файл: {args.records} записей, {os.path.getsize(feed_path) / 2 ** 20:.0f} МБ "
+              f"({time.perf_counter() - started:.1f} с)")
+        rss_before = peak_rss_mb()
+
+        db_manager = DatabaseManager(f"sqlite:///{os.path.join(work_dir, 'import.db')}")
+        importer = CatalogImporter(db_manager, batch_size=args.batch_size)
+        counts = importer.import_file(feed_path, progress=True, rebuild_indexes=args.rebuild)
+
+        elapsed = counts['elapsed_ms'] / 1000
+        print(f"Импорт: {elapsed:.1f} с, {counts['records'] / elapsed:.0f} записей/с, "
+              f"{counts['inserted'] / elapsed:.0f} изданий/с")
+        print(f"  добавлено: {counts['inserted']}, дублей ISBN: {counts['duplicates']}, "
+              f"ошибочных: {counts['invalid']}")
+        print(f"  новых авторов: {counts['authors']}, жанров: {counts['genres']}, "
+              f"издательств: {counts['publishers']}")
+        if 'rebuild_ms' in counts:
+            print(f"  перестроение индексов: {counts['rebuild_ms'] / 1000:.1f} с")
+        print(f"Пиковый RSS: до импорта {rss_before:.0f} МБ, после {peak_rss_mb():.0f} МБ")
+        db_manager.engine.dispose()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
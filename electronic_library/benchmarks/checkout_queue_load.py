@@ -0,0 +1,138 @@
+"""Нагрузочный тест оформления заказов: по одному и через очередь с групповой фиксацией
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.checkout_queue_load --clients 1 8 32 --orders 2000
+    python -m benchmarks.checkout_queue_load --synchronous FULL
+
+--clients потоков одновременно оформляют заказы из 1-3 случайных изданий
+набора --scale, пока не оформят --orders заказов на прогон. Пути:
+- direct - models/checkout.checkout: транзакция и фиксация на каждый заказ;
+- queued - models/checkout_queue.CheckoutQueue: клиент ждет future, заказы
+  пишутся пакетами до --batch-size заказов или --wait-ms миллисекунд.
+Каждый прогон - на свежей копии базы с остатками, которых хватает на все
+заказы. Выводятся заказов в секунду, задержки p50/p99 от вызова до
+получения номера, средний размер пакета и сверка: число заказов в базе и
+списанные экземпляры совпадают с оформленными.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+from sqlalchemy import func, select, update
+from config import Config
+from models.checkout import checkout
+from models.checkout_queue import CheckoutQueue
+from models.database_models import DatabaseManager, Order, Publication, User
+from models.synthetic_data import SCALE_PRESETS
+from benchmarks.async_load_benchmark import summarize
+from benchmarks.run_benchmarks import prepare_dataset, DEFAULT_DATA_DIR
+
+STOCK = 1000000
+
+
+def make_workload(orders: int, user_ids: List[int], publication_ids: List[int], seed: int) -> List[tuple]:
+    """Одинаковые заказы для обоих путей: (пользователь, корзина)"""
+    rng = random.Random(seed)
+    return [(rng.choice(user_ids), [{'publication_id': publication_id, 'title': '', 'quantity': rng.randint(1, 3),
+                                     'unit_price': 100.0}
+                                    for publication_id in rng.sample(publication_ids, rng.randint(1, 3))])
+            for _ in range(orders)]
+
+
+def run(db_manager: DatabaseManager, path: str, workload: List[tuple], clients: int, batch_size: int,
+        wait_ms: float) -> Dict[str, float]:
+    checkout_queue = CheckoutQueue(db_manager, batch_size, wait_ms) if path == 'queued' else None
+    pending = list(reversed(workload))
+    lock = threading.Lock()
+    latencies: List[float] = []
+
+    def client():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                user_id, cart = pending.pop()
+            started = time.perf_counter()
+            if checkout_queue is not None:
+                checkout_queue.checkout(user_id, cart)
+            else:
+                checkout(db_manager, user_id, cart)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = summarize(latencies, time.perf_counter() - started)
+    if checkout_queue is not None:
+        checkout_queue.close()
+        stats['batch'] = checkout_queue.requests / max(checkout_queue.batches, 1)
+    return stats
+
+
+def verify(db_manager: DatabaseManager, workload: List[tuple], orders_before: int, stock_before: int) -> bool:
+    with db_manager.engine.connect() as connection:
+        orders = connection.execute(select(func.count()).select_from(Order.__table__)).scalar()
+        stock = connection.execute(select(func.sum(Publication.stock_quantity))).scalar()
+    sold = sum(item['quantity'] for _, cart in workload for item in cart)
+    return orders - orders_before == len(workload) and stock_before - stock == sold
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Оформление заказов: по одному и через очередь')
+    parser.add_argument('--scale', choices=sorted(SCALE_PRESETS), default='10k')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--orders', type=int, default=2000, help='заказов на прогон')
+    parser.add_argument('--batch-size', type=int, default=Config.CHECKOUT_BATCH_ORDERS)
+    parser.add_argument('--wait-ms', type=float, default=Config.CHECKOUT_BATCH_WAIT_MS)
+    parser.add_argument('--synchronous', default='', help='PRAGMA synchronous (пусто - из профиля движка)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+
+    if args.synchronous:
+        Config.DB_SYNCHRONOUS = args.synchronous
+    dataset = prepare_dataset(args.scale, args.seed, args.data_dir)
+    work_dir = tempfile.mkdtemp(prefix='checkout_queue_')
+    ok = True
+    try:
+        print(f"Набор {args.scale}, заказов на прогон: {args.orders}, пакет до {args.batch_size} заказов "
+              f"или {args.wait_ms:g} мс, synchronous: {args.synchronous or 'из профиля'}")
+        print(f"{'Клиентов':>8} | {'Путь':<6} | {'Заказов/с':>9} | {'p50, мс':>8} | {'p99, мс':>8} | "
+              f"{'Пакет':>5} | Сверка")
+        print("-" * 70)
+        for clients in args.clients:
+            for path in ('direct', 'queued'):
+                db_path = os.path.join(work_dir, f'{path}-{clients}.db')
+                shutil.copy(dataset, db_path)
+                db_manager = DatabaseManager(f'sqlite:///{db_path}')
+                with db_manager.engine.begin() as connection:
+                    connection.execute(update(Publication.__table__).values(stock_quantity=STOCK))
+                    user_ids = list(connection.execute(select(User.id).limit(5000)).scalars())
+                    publication_ids = list(connection.execute(select(Publication.id)).scalars())
+                    orders_before = connection.execute(select(func.count()).select_from(Order.__table__)).scalar()
+                workload = make_workload(args.orders, user_ids, publication_ids, args.seed)
+
+                stats = run(db_manager, path, workload, clients, args.batch_size, args.wait_ms)
+                consistent = verify(db_manager, workload, orders_before, STOCK * len(publication_ids))
+                ok &= consistent
+                batch = f"{stats['batch']:5.1f}" if 'batch' in stats else f"{1:5d}"
+                print(f"{clients:8d} | {path:<6} | {stats['ops_per_s']:9.0f} | {stats['p50_ms']:8.2f} | "
+                      f"{stats['p99_ms']:8.2f} | {batch} | {'да' if consistent else 'НЕТ'}")
+                db_manager.engine.dispose()
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
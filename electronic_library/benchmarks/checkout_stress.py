@@ -0,0 +1,144 @@
+"""Параллельное оформление заказов: нет ли перепродажи
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.checkout_stress --workers 8 --orders 300
+    python -m benchmarks.checkout_stress --mode legacy
+
+Во временной базе создаются --publications изданий по --stock экземпляров.
+--workers процессов одновременно оформляют по --orders заказов из 1-3
+случайных изданий по 1-3 экземпляра - спрос заведомо больше остатков, и за
+последние экземпляры идет гонка. Режимы:
+- atomic - models/checkout.py: условный UPDATE, откат всего заказа при нехватке;
+- legacy - прежний create_order: остаток проверяется при добавлении в корзину,
+  списывается уменьшением атрибута загруженного объекта.
+
+После прогона для каждого издания сверяется проданное (сумма позиций
+заказов) с начальным и конечным остатком. Перепроданные экземпляры и
+потерянные списания в режиме atomic - ошибка (код выхода 1).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+from models.checkout import InsufficientStock, checkout, new_order
+from models.database_models import DatabaseManager, OrderItem, Publication
+from models.engine_profile import is_lock_error
+
+
+def make_cart(rng: random.Random, publications: int):
+    return [{'publication_id': publication_id, 'title': f'Издание {publication_id}',
+             'quantity': rng.randint(1, 3), 'unit_price': 100.0}
+            for publication_id in rng.sample(range(1, publications + 1), rng.randint(1, 3))]
+
+
+def legacy_checkout(db_manager: DatabaseManager, user_id: int, cart):
+    """Оформление как до атомарного списания"""
+    with db_manager.session_scope() as session:
+        # Проверка при добавлении в корзину
+        for item in cart:
+            if session.get(Publication, item['publication_id']).stock_quantity < item['quantity']:
+                raise InsufficientStock({item['publication_id']: 0})
+        session.commit()
+        # Оформление: уменьшение атрибута объекта, загруженного раньше
+        order = new_order(db_manager.order_numbers.next_number(), user_id, cart)
+        session.add(order)
+        for item in cart:
+            session.get(Publication, item['publication_id']).stock_quantity -= item['quantity']
+        session.commit()
+
+
+def worker(args, worker_number: int, start_event, results):
+    db_manager = DatabaseManager(args.database_url)
+    rng = random.Random(args.seed * 1000 + worker_number)
+    counts = {'placed': 0, 'rejected': 0, 'lock_errors': 0}
+    start_event.wait()
+    for _ in range(args.orders):
+        cart = make_cart(rng, args.publications)
+        user_id = rng.randint(1, 50)
+        try:
+            if args.mode == 'atomic':
+                checkout(db_manager, user_id, cart)
+            else:
+                legacy_checkout(db_manager, user_id, cart)
+            counts['placed'] += 1
+        except InsufficientStock:
+            counts['rejected'] += 1
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            counts['lock_errors'] += 1
+    db_manager.engine.dispose()
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Параллельное оформление заказов: проверка перепродажи')
+    parser.add_argument('--mode', choices=['atomic', 'legacy'], default='atomic')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=300, help='заказов на процесс')
+    parser.add_argument('--publications', type=int, default=20)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='checkout_stress_')
+    try:
+        args.database_url = f"sqlite:///{os.path.join(work_dir, 'stress.db')}"
+        db_manager = DatabaseManager(args.database_url)
+        with db_manager.engine.begin() as connection:
+            connection.execute(insert(Publication.__table__), [
+                {'id': publication_id, 'title': f'Издание {publication_id}', 'isbn': f'stress-{publication_id}',
+                 'price': 100.0, 'stock_quantity': args.stock}
+                for publication_id in range(1, args.publications + 1)
+            ])
+
+        context = multiprocessing.get_context('spawn')
+        start_event, results = context.Event(), context.Queue()
+        processes = [context.Process(target=worker, args=(args, number, start_event, results))
+                     for number in range(args.workers)]
+        for process in processes:
+            process.start()
+        # Процессы стартуют одновременно, когда все готовы
+        time.sleep(2)
+        started = time.perf_counter()
+        start_event.set()
+        totals = {'placed': 0, 'rejected': 0, 'lock_errors': 0}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] += value
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        with db_manager.engine.connect() as connection:
+            stock = dict(connection.execute(select(Publication.id, Publication.stock_quantity)).all())
+            sold = dict(connection.execute(
+                select(OrderItem.publication_id, func.sum(OrderItem.quantity)).group_by(OrderItem.publication_id)
+            ).all())
+        oversold = sum(max(0, sold.get(publication_id, 0) - args.stock) for publication_id in stock)
+        lost = sum(1 for publication_id, left in stock.items() if left != args.stock - sold.get(publication_id, 0))
+        negative = sum(1 for left in stock.values() if left < 0)
+
+        print(f"Режим: {args.mode}, процессов: {args.workers}, попыток заказа: {args.workers * args.orders}, "
+              f"изданий: {args.publications} по {args.stock} шт.")
+        print(f"Оформлено: {totals['placed']}, отклонено из-за остатка: {totals['rejected']}, "
+              f"ошибок блокировки после повторов: {totals['lock_errors']}")
+        print(f"Время: {elapsed:.1f} с, {totals['placed'] / elapsed:.0f} заказов/с")
+        print(f"Продано: {sum(sold.values())} из {args.stock * args.publications} экземпляров, "
+              f"осталось: {sum(stock.values())}")
+        print(f"Перепродано экземпляров: {oversold}, изданий с расхождением остатка: {lost}, "
+              f"с отрицательным остатком: {negative}")
+        db_manager.engine.dispose()
+        return 1 if args.mode == 'atomic' and (oversold or lost or negative) else 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
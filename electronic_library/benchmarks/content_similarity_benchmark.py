@@ -0,0 +1,96 @@
+"""Индекс похожести по содержанию на больших объемах: построение, память, задержка
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.content_similarity_benchmark --publications 200000
+
+Карточки генерируются без базы: названия - из словаря models/synthetic_data.py,
+описания - из --vocabulary псевдослов с частотами по Ципфу, жанры - из
+GENRE_NAMES. Матрица векторов пишется во временный файл и читается через
+mmap, как в приложении. Выводятся время построения, пиковый резидентный
+размер процесса, размер файла, задержки similar() (p50/p99), время
+пакетного запроса similar_many() на --batch изданий и время учета
+измененных карточек в надстройке.
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from models.content_similarity import ContentIndex
+from models.synthetic_data import GENRE_NAMES, TITLE_ADJECTIVES, TITLE_NOUNS, TITLE_TAILS
+from benchmarks.catalog_import_benchmark import peak_rss_mb
+from benchmarks.fuzzy_index_benchmark import percentile
+
+SYLLABLES = ['ка', 'ро', 'ми', 'на', 'ле', 'то', 'ва', 'ди', 'ус', 'ор', 'ен', 'ли', 'сто', 'гра', 'пре', 'мон']
+ENDINGS = ['', 'а', 'ы', 'ом', 'ами', 'ой', 'ие', 'ого']
+
+
+def make_documents(count: int, vocabulary: int, rng: random.Random, first_id: int = 1):
+    """Карточки (id, название, описание, жанры); описание - 20-60 слов"""
+    words = list({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(vocabulary * 2)})[:vocabulary]
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(words) + 1)))
+    for publication_id in range(first_id, first_id + count):
+        title = f'{rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)}{rng.choice(TITLE_TAILS)}'
+        description = ' '.join(word + rng.choice(ENDINGS)
+                               for word in rng.choices(words, cum_weights=cum_weights, k=rng.randint(20, 60)))
+        yield publication_id, title, description, rng.sample(GENRE_NAMES, rng.choices([1, 2], [75, 25])[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Похожесть по содержанию: построение и запросы')
+    parser.add_argument('--publications', type=int, default=200000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--changes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='content_bench_')
+    try:
+        path = os.path.join(work_dir, 'vectors.npy')
+        started = time.perf_counter()
+        index = ContentIndex.build(make_documents(args.publications, args.vocabulary, random.Random(args.seed)),
+                                   path=path)
+        build_s = time.perf_counter() - started
+        print(f"Изданий: {len(index)}, построение: {build_s:.1f} с ({len(index) / build_s:.0f} изданий/с), "
+              f"пиковый RSS: {peak_rss_mb():.0f} МБ, файл векторов: {os.path.getsize(path) / 2 ** 20:.0f} МБ, "
+              f"метаданные: {len(index.meta_bytes()) / 2 ** 20:.1f} МБ")
+
+        sample = random.Random(args.seed)
+        for name in ('снимок', 'снимок с надстройкой'):
+            latencies = []
+            for _ in range(args.queries):
+                publication_id = sample.randint(1, args.publications)
+                started = time.perf_counter()
+                index.similar(publication_id, 5)
+                latencies.append((time.perf_counter() - started) * 1000)
+            print(f"similar(), {name}: p50 {percentile(latencies, 0.5):.1f} мс, "
+                  f"p99 {percentile(latencies, 0.99):.1f} мс")
+
+            batch = [sample.randint(1, args.publications) for _ in range(args.batch)]
+            started = time.perf_counter()
+            index.similar_many(batch, 5)
+            batch_ms = (time.perf_counter() - started) * 1000
+            print(f"similar_many() на {args.batch} изданий: {batch_ms:.1f} мс "
+                  f"({batch_ms / args.batch:.2f} мс на издание)")
+
+            if not index.overlay:
+                # Измененные карточки: половина - правки существующих, половина - новые издания
+                edited = list(make_documents(args.changes // 2, args.vocabulary, random.Random(args.seed + 1),
+                                             first_id=args.publications // 2))
+                added = list(make_documents(args.changes - len(edited), args.vocabulary,
+                                            random.Random(args.seed + 2), first_id=args.publications + 1))
+                started = time.perf_counter()
+                index.apply_changes(index.vectorize(edited + added), 1)
+                print(f"Учет {args.changes} измененных карточек: "
+                      f"{(time.perf_counter() - started) * 1000:.0f} мс")
+        del index
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Сравнение профилей движка БД: пропускная способность коммитов и задержка чтения
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.engine_profile_benchmark --commits 2000 --reads 5000 --threads 4
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import select, insert
+from sqlalchemy.exc import OperationalError
+from models.database_models import DatabaseManager, Author
+from models.engine_profile import is_lock_error
+
+
+def _percentile(values, percent):
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+def run_profile(profile: str, commits: int, reads: int, threads: int, work_dir: str) -> dict:
+    """Замер одного профиля на свежей базе"""
+    db_path = os.path.join(work_dir, f'bench_{profile}.db')
+    manager = DatabaseManager(f'sqlite:///{db_path}', engine_profile=profile)
+    engine = manager.engine
+    author_table = Author.__table__
+
+    # Пропускная способность коммитов: каждая вставка - отдельная транзакция
+    started = time.perf_counter()
+    for i in range(commits):
+        with engine.begin() as connection:
+            connection.execute(insert(author_table).values(full_name=f'Автор {i}', country='Россия'))
+    commit_seconds = time.perf_counter() - started
+
+    # Задержка чтения по первичному ключу при параллельной записи
+    latencies = []
+    lock_errors = 0
+    lock = threading.Lock()
+    stop_writers = threading.Event()
+
+    def reader(count):
+        nonlocal lock_errors
+        local = []
+        with engine.connect() as connection:
+            for i in range(count):
+                author_id = (i * 7919) % commits + 1
+                t0 = time.perf_counter()
+                try:
+                    connection.execute(select(author_table.c.full_name).where(author_table.c.id == author_id)).first()
+                except OperationalError as e:
+                    if not is_lock_error(e):
+                        raise
+                    with lock:
+                        lock_errors += 1
+                local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    def writer():
+        nonlocal lock_errors
+        i = 0
+        while not stop_writers.is_set():
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(author_table).values(full_name=f'Писатель {i}'))
+            except OperationalError as e:
+                if not is_lock_error(e):
+                    raise
+                with lock:
+                    lock_errors += 1
+            i += 1
+
+    writer_threads = [threading.Thread(target=writer) for _ in range(max(1, threads // 2))]
+    reader_threads = [threading.Thread(target=reader, args=(reads // threads,)) for _ in range(threads)]
+    for t in writer_threads + reader_threads:
+        t.start()
+    for t in reader_threads:
+        t.join()
+    stop_writers.set()
+    for t in writer_threads:
+        t.join()
+
+    engine.dispose()
+
+    return {
+        'profile': profile,
+        'commits_per_second': commits / commit_seconds if commit_seconds else 0.0,
+        'read_latency_mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'read_latency_p99_ms': _percentile(latencies, 99) * 1000,
+        'lock_errors': lock_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение профилей движка БД')
+    parser.add_argument('--commits', type=int, default=1000)
+    parser.add_argument('--reads', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='engine_bench_')
+    try:
+        results = [run_profile(p, args.commits, args.reads, args.threads, work_dir) for p in args.profiles]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Профиль':12} | {'Коммитов/с':>10} | {'Чтение, мс':>10} | {'p99, мс':>8} | {'Блокировок':>10}")
+    print("-" * 62)
+    for r in results:
+        print(f"{r['profile']:12} | {r['commits_per_second']:10.1f} | {r['read_latency_mean_ms']:10.3f} | "
+              f"{r['read_latency_p99_ms']:8.3f} | {r['lock_errors']:10d}")
+
+
+if __name__ == '__main__':
+    main()
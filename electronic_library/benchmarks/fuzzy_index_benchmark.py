@@ -0,0 +1,96 @@
+"""Задержка нечеткого поиска по триграммному индексу на больших объемах
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.fuzzy_index_benchmark --titles 1000000 --queries 2000
+
+Названия собираются из случайных псевдослов, поэтому почти все они
+различны - это худший случай для индекса (в синтетических наборах названия
+повторяются). Запросы - случайные названия или их части с одной-двумя
+опечатками. Выводятся время построения, размер сжатого снимка, задержки
+поиска в памяти (p50/p99) и доля запросов, для которых исходное название
+оказалось среди результатов.
+"""
+import argparse
+import random
+import time
+from typing import List
+from models.fuzzy_index import TrigramIndex
+
+CONSONANTS = 'бвгджзклмнпрстфхцчшщ'
+VOWELS = 'аеиоуыэюя'
+LETTERS = CONSONANTS + VOWELS
+
+
+def make_word(rng: random.Random) -> str:
+    syllables = rng.randint(2, 4)
+    return ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) + rng.choice(['', '', rng.choice(CONSONANTS)])
+                   for _ in range(syllables))
+
+
+def make_titles(count: int, rng: random.Random) -> List[str]:
+    vocabulary = sorted({make_word(rng) for _ in range(100000)})
+    titles = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(2, 5))
+        titles.append(' '.join(words).capitalize())
+    return titles
+
+
+def misspell(value: str, rng: random.Random) -> str:
+    """Одна-две опечатки: замена, пропуск или перестановка букв"""
+    chars = list(value)
+    for _ in range(rng.randint(1, 2)):
+        position = rng.randrange(1, len(chars) - 1)
+        operation = rng.choice(['replace', 'drop', 'swap'])
+        if operation == 'replace':
+            chars[position] = rng.choice(LETTERS)
+        elif operation == 'drop':
+            del chars[position]
+        else:
+            chars[position - 1], chars[position] = chars[position], chars[position - 1]
+    return ''.join(chars)
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нечеткий поиск: задержка на больших объемах')
+    parser.add_argument('--titles', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    titles = make_titles(args.titles, rng)
+
+    started = time.perf_counter()
+    index = TrigramIndex.build(enumerate(titles, start=1))
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    data = index.to_bytes()
+    index = TrigramIndex.from_bytes(data)
+    load_s = time.perf_counter() - started
+    print(f"Названий: {args.titles}, различных строк: {len(index)}, триграмм: {len(index.trigram_keys)}")
+    print(f"Построение: {build_s:.1f} с, снимок: {len(data) / 2 ** 20:.1f} МБ, "
+          f"сохранение и загрузка: {load_s:.2f} с")
+
+    for mode, by_words in (('целиком', False), ('по словам', True)):
+        latencies, found = [], 0
+        for _ in range(args.queries):
+            entity_id = rng.randint(1, args.titles)
+            target = titles[entity_id - 1]
+            query = target if not by_words else ' '.join(target.split()[:2])
+            query = misspell(query, rng)
+            started = time.perf_counter()
+            matches = index.search(query, limit=10, min_similarity=0.3, by_words=by_words)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += any(entity_id in match.entity_ids for match in matches)
+        print(f"Поиск {mode:<9}: p50 {percentile(latencies, 0.5):.3f} мс, "
+              f"p99 {percentile(latencies, 0.99):.3f} мс, найдено исходное: {found / args.queries:.0%}")
+
+
+if __name__ == '__main__':
+    main()
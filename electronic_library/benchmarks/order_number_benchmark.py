@@ -0,0 +1,82 @@
+"""Выдача номеров заказов несколькими процессами: скорость и уникальность
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.order_number_benchmark --workers 4 --numbers 20000 --blocks 1 10 100 1000
+
+Для каждого размера блока --workers процессов одновременно получают по
+--numbers значений из общей последовательности во временной базе.
+Размер блока 1 - обращение к базе на каждый номер, как при выдаче номера
+запросом к последовательности. Выводятся выдача в секунду (всего по
+процессам), число резервирований блоков и проверка, что все значения
+различны.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from models.database_models import DatabaseManager
+from models.order_numbers import OrderNumberAllocator
+
+
+def worker(database_url: str, block_size: int, numbers: int, start_event, results):
+    db_manager = DatabaseManager(database_url)
+    allocator = OrderNumberAllocator(db_manager.engine, block_size)
+    values = array('q')
+    start_event.wait()
+    started = time.perf_counter()
+    for _ in range(numbers):
+        values.append(allocator.allocate())
+    results.put((values.tobytes(), allocator.reservations, time.perf_counter() - started))
+    db_manager.engine.dispose()
+
+
+def run(database_url: str, block_size: int, workers: int, numbers: int):
+    context = multiprocessing.get_context('spawn')
+    start_event, results = context.Event(), context.Queue()
+    processes = [context.Process(target=worker, args=(database_url, block_size, numbers, start_event, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    # Процессы стартуют одновременно, когда все готовы
+    time.sleep(2)
+    started = time.perf_counter()
+    start_event.set()
+    values, reservations, slowest = array('q'), 0, 0.0
+    for _ in processes:
+        data, worker_reservations, elapsed = results.get()
+        values.frombytes(data)
+        reservations += worker_reservations
+        slowest = max(slowest, elapsed)
+    wall = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    unique = len(set(values)) == len(values)
+    print(f"Блок {block_size:>5}: {len(values) / wall:>9.0f} номеров/с, резервирований: {reservations}, "
+          f"самый медленный процесс: {slowest:.2f} с, все различны: {'да' if unique else 'НЕТ'}")
+    return unique
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Номера заказов: выдача блоками несколькими процессами')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--numbers', type=int, default=20000, help='номеров на процесс')
+    parser.add_argument('--blocks', type=int, nargs='+', default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='order_numbers_')
+    try:
+        database_url = f"sqlite:///{os.path.join(work_dir, 'numbers.db')}"
+        DatabaseManager(database_url).engine.dispose()
+        print(f"Процессов: {args.workers}, номеров на процесс: {args.numbers}")
+        ok = all([run(database_url, block_size, args.workers, args.numbers) for block_size in args.blocks])
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
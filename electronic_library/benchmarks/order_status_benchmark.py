@@ -0,0 +1,90 @@
+"""Массовое изменение статуса заказов: заказов в минуту
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.order_status_benchmark --orders 500000
+
+Во временной базе создается --orders заказов за последний год со
+статусами в пропорциях models/synthetic_data.py. Замеряются:
+- перевод всех оплаченных заказов старше 30 дней в «отправлен» (фильтр);
+- перевод --ids случайных заказов в «доставлен» по списку id: допустим
+  только переход из «отправлен», остальные заказы пропускаются.
+Выводятся скорость (заказов в минуту), счетчики по статусам и сверка
+журнала с таблицей заказов.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from models.database_models import DatabaseManager, Order, OrderStatus, order_status_log
+from models.order_status import allowed_sources, bulk_change_status
+from models.synthetic_data import STATUS_WEIGHTS
+
+INSERT_CHUNK = 50000
+
+
+def fill_orders(db_manager: DatabaseManager, count: int, rng: random.Random):
+    statuses, weights = zip(*STATUS_WEIGHTS)
+    now = datetime.now()
+    orders = Order.__table__
+    for start in range(0, count, INSERT_CHUNK):
+        rows = [{'id': order_id, 'order_number': f'BENCH-{order_id:010d}', 'user_id': rng.randint(1, 10000),
+                 'order_date': now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+                 'total_amount': 100.0, 'status': rng.choices(statuses, weights)[0]}
+                for order_id in range(start + 1, min(start + INSERT_CHUNK, count) + 1)]
+        with db_manager.engine.begin() as connection:
+            connection.execute(insert(orders), rows)
+
+
+def report(name: str, result, engine):
+    changed = sum(result.changed.values())
+    per_minute = changed / (result.elapsed_ms / 1000) * 60 if result.elapsed_ms else 0
+    print(f"{name}: изменено {changed} за {result.elapsed_ms / 1000:.1f} с ({per_minute:,.0f} заказов/мин)")
+    print(f"  по прежнему статусу: {', '.join(f'{s.value} {n}' for s, n in result.changed.items()) or '-'}")
+    print(f"  пропущено: {', '.join(f'{s.value} {n}' for s, n in result.skipped.items()) or '-'}")
+    orders = Order.__table__
+    with engine.connect() as connection:
+        wrong = connection.execute(
+            select(func.count()).select_from(order_status_log.join(orders, orders.c.id == order_status_log.c.order_id))
+            .where(order_status_log.c.batch_id == result.batch_id,
+                   (orders.c.status != result.target) | order_status_log.c.from_status.notin_(
+                       allowed_sources(result.target)))
+        ).scalar()
+    print(f"  записей журнала, не совпадающих с заказами или с правилами: {wrong}")
+    return wrong == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Массовое изменение статуса заказов')
+    parser.add_argument('--orders', type=int, default=500000)
+    parser.add_argument('--ids', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='order_status_')
+    try:
+        db_manager = DatabaseManager(f"sqlite:///{os.path.join(work_dir, 'orders.db')}")
+        started = time.perf_counter()
+        fill_orders(db_manager, args.orders, rng)
+        print(f"Заказов: {args.orders} ({time.perf_counter() - started:.1f} с)")
+
+        ok = report('Оплаченные старше 30 дней -> отправлен', bulk_change_status(
+            db_manager.engine, OrderStatus.SHIPPED, current_status=OrderStatus.PAID,
+            placed_before=datetime.now() - timedelta(days=30), chunk_size=args.chunk_size), db_manager.engine)
+        ids = rng.sample(range(1, args.orders + 1), min(args.ids, args.orders))
+        ok &= report(f'{len(ids)} заказов по id -> доставлен', bulk_change_status(
+            db_manager.engine, OrderStatus.DELIVERED, order_ids=ids, chunk_size=args.chunk_size), db_manager.engine)
+        db_manager.engine.dispose()
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Построение матрицы совместных покупок на больших объемах: время, память, задержка
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.recommendations_benchmark --items 10000000 --publications 200000
+
+Позиции заказов генерируются сразу массивами numpy, без базы: размер заказа
+распределен как в models/synthetic_data.py (1-5 изданий), популярность
+изданий - по Ципфу. Выводятся время построения снимка, пиковый объем памяти
+numpy во время построения (tracemalloc), размер снимка, задержки similar()
+(p50/p99) для популярных и случайных изданий и время учета новых заказов в
+надстройке.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+import numpy as np
+from models.recommendations import CoPurchaseIndex
+from benchmarks.fuzzy_index_benchmark import percentile
+
+BASKET_SIZES = [1, 2, 3, 4, 5]
+BASKET_WEIGHTS = [55, 25, 11, 6, 3]
+
+
+def make_order_items(items: int, publications: int, rng: np.random.Generator, exponent: float = 1.1):
+    """Массивы (заказ, издание) примерно из items позиций"""
+    weights = np.array(BASKET_WEIGHTS, dtype=float) / sum(BASKET_WEIGHTS)
+    mean_size = float(np.dot(BASKET_SIZES, weights))
+    sizes = rng.choice(BASKET_SIZES, size=int(items / mean_size), p=weights)
+    order_ids = np.repeat(np.arange(1, len(sizes) + 1, dtype=np.int64), sizes)
+    popularity = 1.0 / np.arange(1, publications + 1) ** exponent
+    ranked = rng.permutation(np.arange(1, publications + 1))
+    publication_ids = ranked[rng.choice(publications, size=len(order_ids), p=popularity / popularity.sum())]
+    return order_ids, publication_ids.astype(np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Матрица совместных покупок: построение и запросы')
+    parser.add_argument('--items', type=int, default=10000000)
+    parser.add_argument('--publications', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--new-orders', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    order_ids, publication_ids = make_order_items(args.items, args.publications, rng)
+    print(f"Позиций: {len(order_ids)}, заказов: {int(order_ids[-1])}, изданий: {args.publications}")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = CoPurchaseIndex.build(order_ids, publication_ids, int(order_ids[-1]))
+    build_s = time.perf_counter() - started
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    data = index.to_bytes()
+    started = time.perf_counter()
+    index = CoPurchaseIndex.from_bytes(data, index.order_seq)
+    load_s = time.perf_counter() - started
+    print(f"Построение: {build_s:.1f} с, пик памяти: {peak_mb:.0f} МБ, снимок: {len(data) / 2 ** 20:.1f} МБ, "
+          f"загрузка: {load_s:.2f} с")
+    print(f"Изданий с соседями: {len(index)}, хранимых пар: {len(index.neighbors)}")
+
+    # Новые заказы попадают в надстройку; запросы идут и к измененным строкам
+    sample = random.Random(args.seed)
+    baskets = [publication_ids[sample.randrange(len(publication_ids) - 5):][:sample.choice(BASKET_SIZES)].tolist()
+               for _ in range(args.new_orders)]
+    started = time.perf_counter()
+    index.apply_orders(baskets, index.order_seq + args.new_orders)
+    print(f"Учет {args.new_orders} новых заказов: {(time.perf_counter() - started) * 1000:.0f} мс, "
+          f"изданий в надстройке: {len(index.overlay)}")
+
+    popular = np.bincount(publication_ids).argsort()[::-1][:100].tolist()
+    for name, ids in (('популярные', popular), ('случайные', list(range(1, args.publications + 1)))):
+        latencies = []
+        for _ in range(args.queries):
+            publication_id = sample.choice(ids)
+            started = time.perf_counter()
+            index.similar(publication_id, 5)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(f"similar(), {name} издания: p50 {percentile(latencies, 0.5):.3f} мс, "
+              f"p99 {percentile(latencies, 0.99):.3f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+"""Набор бенчмарков основных сценариев на синтетических данных разного объема
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.run_benchmarks --scales 10k 100k
+    python -m benchmarks.run_benchmarks --scales 10k --save-baseline
+    python -m benchmarks.run_benchmarks --scales 1m --cases browse_catalog sales_report
+
+Наборы данных строит models.synthetic_data (объемы из SCALE_PRESETS) и хранит
+в benchmarks/data/, повторные запуски используют готовые файлы. Каждый прогон
+идет на копии набора, так как оформление заказа и восстановление из резервной
+копии изменяют базу.
+
+Сценарии вызывают методы ElectronicLibraryApp так же, как меню: ответы на
+input() подставляются из заранее заданного списка, вывод подавляется. Для
+каждого сценария записываются время (медиана повторов), число SQL-запросов,
+пиковая память Python (tracemalloc, отдельным прогоном), строки, полученные
+из базы (models.instrumentation), и строк в секунду.
+Результаты сравниваются с базовым файлом; код возврата 1 означает регрессию.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+from sqlalchemy import func
+from config import Config
+from models.database_models import DatabaseManager, Base, Order, OrderItem, Publication, User, UserRole
+from models.instrumentation import query_budget
+from models.pagination import fetch_page
+from models.catalog_cache import publication_views
+from models.synthetic_data import SCALE_PRESETS, SyntheticDataGenerator
+from main import ElectronicLibraryApp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BENCH_DIR, 'data')
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, 'results.json')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Последний день истории заказов, чтобы наборы данных были воспроизводимы
+DATASET_END_DATE = datetime(2025, 1, 1)
+# Период отчетов по продажам и экспорта заказов
+REPORT_PERIOD_DAYS = 30
+
+# Допустимое ухудшение времени и памяти относительно базового файла
+DEFAULT_TOLERANCE = 0.25
+# Разница во времени меньше этого порога считается шумом
+MIN_SIGNIFICANT_MS = 5.0
+
+
+class ScriptedInput:
+    """Подстановка ответов вместо input(); после конца списка возвращается пустая строка"""
+
+    def __init__(self, answers: List[str]):
+        self.answers = list(answers)
+        self.prompts: List[str] = []
+
+    def __call__(self, prompt: str = '') -> str:
+        self.prompts.append(prompt)
+        return self.answers.pop(0) if self.answers else ''
+
+
+class BenchmarkContext:
+    """Состояние прогона одного набора данных: приложение, пути, объемы"""
+
+    def __init__(self, db_path: str, work_dir: str):
+        self.db_path = db_path
+        self.work_dir = work_dir
+        self.export_dir = os.path.join(work_dir, 'exports') + os.sep
+        self.backup_dir = os.path.join(work_dir, 'backups') + os.sep
+        self.db_manager = DatabaseManager(f'sqlite:///{db_path}')
+        self.app = ElectronicLibraryApp(self.db_manager)
+        self.end_date = DATASET_END_DATE
+        self.start_date = self.end_date - timedelta(days=REPORT_PERIOD_DAYS)
+        self.volumes = self._collect_volumes()
+        self.last_backup: Optional[str] = None
+
+    def _collect_volumes(self) -> Dict[str, object]:
+        """Объемы данных, которые обрабатывает каждый сценарий (вне замеров)"""
+        with self.db_manager.session_scope() as session:
+            period = (Order.order_date >= self.start_date, Order.order_date <= self.end_date)
+            volumes = {
+                'publications': session.query(func.count(Publication.id)).scalar(),
+                'order_items': session.query(func.count(OrderItem.id)).scalar(),
+                'orders_in_period': session.query(func.count(Order.id)).filter(*period).scalar(),
+                'order_items_in_period': session.query(func.count(OrderItem.id)).join(Order)
+                .filter(*period).scalar(),
+                'admin_id': session.query(User.id).filter(User.role == UserRole.ADMIN)
+                .order_by(User.id).limit(1).scalar(),
+                # Номера заказов выдаются из блоков последовательности (models/order_numbers.py),
+                # поэтому все повторы оформляет один покупатель
+                'buyer_id': session.query(User.id).filter(User.role == UserRole.USER)
+                .order_by(User.id.desc()).limit(1).scalar(),
+                'popular_ids': [row.publication_id for row in session.query(OrderItem.publication_id)
+                                .group_by(OrderItem.publication_id)
+                                .order_by(func.sum(OrderItem.quantity).desc()).limit(3)],
+            }
+            # Позиция на 90% каталога по названию для замера дальней страницы
+            deep = session.query(Publication.title, Publication.id).order_by(Publication.title, Publication.id) \
+                .offset(int(volumes['publications'] * 0.9)).limit(1).first()
+            volumes['deep_title_cursor'] = tuple(deep) if deep else None
+            volumes['total_rows'] = sum(
+                session.execute(table.select().with_only_columns(func.count())).scalar()
+                for table in Base.metadata.sorted_tables
+            )
+        return volumes
+
+    def date_answers(self) -> List[str]:
+        return [self.start_date.strftime('%Y-%m-%d'), self.end_date.strftime('%Y-%m-%d')]
+
+    def run_action(self, action: Callable, answers: List[str], user_id: Optional[int] = None):
+        """Выполнить пункт меню с заданными ответами, как это делает run()"""
+        self.app.current_user_id = user_id
+        output = io.StringIO()
+        with mock.patch('builtins.input', ScriptedInput(answers)), contextlib.redirect_stdout(output):
+            with self.app._action_scope():
+                action()
+        self.app.current_user_id = None
+        # Меню перехватывает исключения и печатает ошибку, замер такого прогона недействителен
+        errors = [line.strip() for line in output.getvalue().splitlines() if line.strip().startswith('✗')]
+        if errors:
+            raise RuntimeError(errors[0])
+
+    def engines(self) -> list:
+        """Основной движок и движок отчетов (снимок создается при первом обращении)"""
+        reporting_engine = self.db_manager.reporting.engine
+        if reporting_engine is self.db_manager.engine:
+            return [self.db_manager.engine]
+        return [self.db_manager.engine, reporting_engine]
+
+    def close(self):
+        self.db_manager.reporting.dispose()
+        self.db_manager.engine.dispose()
+
+
+# --- сценарии: каждый возвращает число обработанных строк ---
+
+def case_browse_catalog(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.browse_catalog, [])
+    return min(20, ctx.volumes['publications'])
+
+
+def case_browse_catalog_deep_page(ctx: BenchmarkContext) -> int:
+    # Страница ближе к концу каталога по названию должна стоить столько же, сколько первая
+    with ctx.db_manager.session_scope() as session:
+        page = fetch_page(session, Publication, 'title', ctx.volumes['deep_title_cursor'])
+    return len(page.items)
+
+
+def case_publication_details(ctx: BenchmarkContext) -> int:
+    # Карточки популярных изданий: после первого повтора - из кэша каталога, без запросов
+    with ctx.db_manager.session_scope() as session:
+        views = publication_views(session, ctx.volumes['popular_ids'])
+    return len(views)
+
+
+def case_search_publications(ctx: BenchmarkContext) -> int:
+    # Поиск по жанру и диапазонам требует просмотра каталога
+    ctx.run_action(ctx.app.search_publications, ['', '', 'Фантастика', '1990', '2024', '300', '3000'])
+    return ctx.volumes['publications']
+
+
+def case_faceted_search(ctx: BenchmarkContext) -> int:
+    # Столбцы загружаются при первом вызове (первый повтор), далее - только журнал изменений
+    ctx.db_manager.facets.search(genre_ids=[1, 2], languages=['Русский'], price_bands=[2, 3], min_year=1990)
+    return ctx.volumes['publications']
+
+
+def case_create_order(ctx: BenchmarkContext) -> int:
+    # Корзина хранится в базе (models/carts.py); заказ ее удаляет
+    buyer_id = ctx.volumes['buyer_id']
+    for publication_id in ctx.volumes['popular_ids']:
+        ctx.db_manager.carts.add(buyer_id, publication_id, 1, 500.0)
+    ctx.run_action(ctx.app.create_order, ['1', 'г. Москва, ул. Тестовая, д. 1', 'y'], buyer_id)
+    return 1 + len(ctx.volumes['popular_ids'])
+
+
+def case_sales_report(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.sales_report, ctx.date_answers() + ['n'], ctx.volumes['admin_id'])
+    return ctx.volumes['order_items_in_period']
+
+
+def case_popular_publications_report(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.popular_publications_report, ['10'], ctx.volumes['admin_id'])
+    return ctx.volumes['order_items']
+
+
+def case_export_csv_publications(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.export_menu, ['2', '2'], ctx.volumes['admin_id'])
+    return ctx.volumes['publications']
+
+
+def case_export_csv_orders(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.export_menu, ['2', '3'] + ctx.date_answers(), ctx.volumes['admin_id'])
+    return ctx.volumes['order_items_in_period']
+
+
+def case_export_json_publications(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.export_menu, ['1', '2'], ctx.volumes['admin_id'])
+    return ctx.volumes['publications']
+
+
+def case_export_json_sales(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.export_menu, ['1', '5'] + ctx.date_answers(), ctx.volumes['admin_id'])
+    return ctx.volumes['order_items_in_period']
+
+
+def case_export_pdf_inventory(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.export_menu, ['3', '2'], ctx.volumes['admin_id'])
+    return ctx.volumes['publications']
+
+
+def case_export_pdf_sales(ctx: BenchmarkContext) -> int:
+    ctx.run_action(ctx.app.export_menu, ['3', '5'] + ctx.date_answers(), ctx.volumes['admin_id'])
+    return ctx.volumes['order_items_in_period']
+
+
+def case_backup_create(ctx: BenchmarkContext) -> int:
+    success, result = ctx.app.backup_manager.create_backup()
+    if not success:
+        raise RuntimeError(result)
+    ctx.last_backup = result
+    return ctx.volumes['total_rows']
+
+
+def case_backup_restore(ctx: BenchmarkContext) -> int:
+    if ctx.last_backup is None:
+        case_backup_create(ctx)
+    # Как в backup_menu: соединения закрываются до замены файла базы
+    ctx.db_manager.engine.dispose()
+    success, message = ctx.app.backup_manager.restore_backup(ctx.last_backup)
+    if not success:
+        raise RuntimeError(message)
+    return ctx.volumes['total_rows']
+
+
+# Порядок важен: резервное копирование в конце, после изменений базы
+CASES: Dict[str, Callable[[BenchmarkContext], int]] = {
+    'browse_catalog': case_browse_catalog,
+    'browse_catalog_deep_page': case_browse_catalog_deep_page,
+    'publication_details': case_publication_details,
+    'search_publications': case_search_publications,
+    'faceted_search': case_faceted_search,
+    'create_order': case_create_order,
+    'sales_report': case_sales_report,
+    'popular_publications_report': case_popular_publications_report,
+    'export_csv_publications': case_export_csv_publications,
+    'export_csv_orders': case_export_csv_orders,
+    'export_json_publications': case_export_json_publications,
+    'export_json_sales': case_export_json_sales,
+    'export_pdf_inventory': case_export_pdf_inventory,
+    'export_pdf_sales': case_export_pdf_sales,
+    'backup_create': case_backup_create,
+    'backup_restore': case_backup_restore,
+}
+
+
+def prepare_dataset(scale: str, seed: int, data_dir: str) -> str:
+    """Путь к набору данных; при отсутствии набор генерируется"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'bench_{scale}_seed{seed}.db')
+    if os.path.exists(path):
+        # Набор, созданный до изменения схемы, обновляется один раз на месте
+        DatabaseManager(f'sqlite:///{path}').engine.dispose()
+        return path
+
+    print(f"Генерация набора данных {scale} (seed={seed})...")
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    db_manager = DatabaseManager(f'sqlite:///{partial}')
+    generator = SyntheticDataGenerator(db_manager, seed=seed, end_date=DATASET_END_DATE)
+    generator.generate(progress=True, **SCALE_PRESETS[scale])
+    with db_manager.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    db_manager.engine.dispose()
+    os.replace(partial, path)
+    return path
+
+
+def measure(ctx: BenchmarkContext, case: Callable[[BenchmarkContext], int], repeats: int,
+            track_memory: bool) -> Dict[str, float]:
+    """Замеры одного сценария"""
+    timings = []
+    queries = 0
+    rows_fetched = 0
+    rows = 0
+    for _ in range(repeats):
+        with query_budget(ctx.engines()) as recorder:
+            started = time.perf_counter()
+            try:
+                rows = case(ctx)
+            finally:
+                timings.append((time.perf_counter() - started) * 1000)
+        queries, rows_fetched = recorder.queries, recorder.rows
+
+    peak_mb = None
+    if track_memory:
+        # tracemalloc замедляет выполнение, поэтому память снимается отдельным прогоном
+        tracemalloc.start()
+        try:
+            case(ctx)
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    wall_ms = sorted(timings)[len(timings) // 2]
+    return {
+        'wall_ms': round(wall_ms, 2),
+        'queries': queries,
+        'rows_fetched': rows_fetched,
+        'peak_memory_mb': round(peak_mb, 2) if peak_mb is not None else None,
+        'rows': rows,
+        'rows_per_s': round(rows / (wall_ms / 1000), 1) if wall_ms else None,
+    }
+
+
+def run_scale(scale: str, dataset: str, case_names: List[str], repeats: int, track_memory: bool) -> Dict:
+    """Прогон всех сценариев на копии набора данных"""
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{scale}_')
+    db_path = os.path.join(work_dir, 'library.db')
+    shutil.copy(dataset, db_path)
+
+    saved_paths = Config.EXPORT_PATH, Config.BACKUP_PATH
+    results = {}
+    try:
+        ctx = BenchmarkContext(db_path, work_dir)
+        Config.EXPORT_PATH, Config.BACKUP_PATH = ctx.export_dir, ctx.backup_dir
+        ctx.app.backup_manager.db_path = db_path
+        try:
+            for name in case_names:
+                print(f"  {name}...", end=' ', flush=True)
+                try:
+                    results[name] = measure(ctx, CASES[name], repeats, track_memory)
+                except Exception as e:
+                    results[name] = {'error': str(e)}
+                    print(f"ошибка: {e}")
+                    continue
+                print(f"{results[name]['wall_ms']:.1f} мс, {results[name]['queries']} запросов")
+        finally:
+            ctx.close()
+    finally:
+        Config.EXPORT_PATH, Config.BACKUP_PATH = saved_paths
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Регрессии относительно базового файла"""
+    regressions = []
+    for scale, cases in results['scales'].items():
+        for name, current in cases.items():
+            base = baseline.get('scales', {}).get(scale, {}).get(name)
+            if not base or 'error' in base:
+                continue
+            label = f"{scale}/{name}"
+            if 'error' in current:
+                regressions.append(f"{label}: ошибка ({current['error']})")
+                continue
+            if current['queries'] > base['queries']:
+                regressions.append(f"{label}: запросов {base['queries']} -> {current['queries']}")
+            if (current['wall_ms'] > base['wall_ms'] * (1 + tolerance)
+                    and current['wall_ms'] - base['wall_ms'] > MIN_SIGNIFICANT_MS):
+                regressions.append(f"{label}: время {base['wall_ms']:.1f} -> {current['wall_ms']:.1f} мс")
+            if (current.get('peak_memory_mb') and base.get('peak_memory_mb')
+                    and current['peak_memory_mb'] > base['peak_memory_mb'] * (1 + tolerance)):
+                regressions.append(
+                    f"{label}: память {base['peak_memory_mb']:.1f} -> {current['peak_memory_mb']:.1f} МБ")
+    return regressions
+
+
+def print_table(results: Dict):
+    print(f"\n{'Набор/сценарий':<42} | {'Время, мс':>10} | {'Запросов':>8} | {'Память, МБ':>10} | {'Строк/с':>11}")
+    print("-" * 92)
+    for scale, cases in results['scales'].items():
+        for name, row in cases.items():
+            label = f"{scale}/{name}"
+            if 'error' in row:
+                print(f"{label:<42} | ошибка: {row['error']}")
+                continue
+            memory = f"{row['peak_memory_mb']:.1f}" if row['peak_memory_mb'] is not None else '-'
+            print(f"{label:<42} | {row['wall_ms']:10.1f} | {row['queries']:8d} | {memory:>10} | "
+                  f"{row['rows_per_s'] or 0:11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки основных сценариев приложения')
+    parser.add_argument('--scales', nargs='+', choices=sorted(SCALE_PRESETS), default=['10k'])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-memory', action='store_true', help='не замерять пиковую память')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--output', default=DEFAULT_RESULTS)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='сохранить результаты как базовые')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeats': args.repeats,
+        'scales': {},
+    }
+    for scale in args.scales:
+        dataset = prepare_dataset(scale, args.seed, args.data_dir)
+        print(f"Набор {scale}: {dataset}")
+        results['scales'][scale] = run_scale(scale, dataset, args.cases, args.repeats, not args.no_memory)
+
+    print_table(results)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {args.output}")
+
+    if args.save_baseline:
+        shutil.copy(args.output, args.baseline)
+        print(f"Базовые результаты сохранены: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Базовый файл не найден, сравнение пропущено (используйте --save-baseline).")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n✗ Регрессии относительно базовых результатов:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n✓ Регрессий не обнаружено")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
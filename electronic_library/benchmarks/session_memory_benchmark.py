@@ -0,0 +1,122 @@
+"""Длительный прогон операций меню: память процесса и размер карты идентичности
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.session_memory_benchmark --operations 3000 --publications 1000
+
+Режим scoped соответствует ElectronicLibraryApp (сессия на действие),
+режим long-lived - прежней единой сессии на весь процесс.
+"""
+import argparse
+import gc
+import os
+import resource
+import shutil
+import sys
+import tempfile
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+from models.database_models import DatabaseManager, Publication, User, Author, publication_authors
+
+
+def current_rss_mb() -> float:
+    """Текущий резидентный размер процесса в МБ"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        # Вне Linux доступен только пиковый размер
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def seed(db_manager: DatabaseManager, publications: int, users: int):
+    """Заполнение базы для прогона"""
+    with db_manager.engine.begin() as connection:
+        connection.execute(insert(Author.__table__), [
+            {'full_name': f'Автор {i}'} for i in range(1, publications // 2 + 2)
+        ])
+        connection.execute(insert(Publication.__table__), [
+            {'title': f'Издание {i}', 'description': 'Описание ' * 20, 'price': 100.0 + i % 900,
+             'stock_quantity': i % 50, 'publication_year': 1900 + i % 120}
+            for i in range(1, publications + 1)
+        ])
+        connection.execute(insert(publication_authors), [
+            {'publication_id': i, 'author_id': i // 2 + 1} for i in range(1, publications + 1)
+        ])
+        connection.execute(insert(User.__table__), [
+            {'email': f'user{i}@example.com', 'password_hash': '-', 'first_name': 'Имя', 'last_name': 'Фамилия'}
+            for i in range(users)
+        ])
+
+
+def operation(session, step: int):
+    """Типичное действие администратора: просмотр публикаций и пользователей"""
+    if step % 2:
+        for pub in session.query(Publication).options(selectinload(Publication.authors)).all():
+            _ = [a.full_name for a in pub.authors]
+    else:
+        for user in session.query(User).all():
+            _ = user.email
+    # Изменение, как при редактировании публикации
+    publication = session.get(Publication, step % 100 + 1)
+    publication.stock_quantity = step
+    session.commit()
+
+
+def run(mode: str, db_manager: DatabaseManager, operations: int, checkpoints: int) -> list:
+    """Прогон операций и снятие замеров"""
+    samples = []
+    long_lived = db_manager.get_session() if mode == 'long-lived' else None
+    every = max(1, operations // checkpoints)
+
+    for step in range(1, operations + 1):
+        if long_lived is not None:
+            operation(long_lived, step)
+            held = len(long_lived.identity_map)
+        else:
+            with db_manager.session_scope() as session:
+                operation(session, step)
+            held = db_manager.session_stats()['held_objects']
+        if step % every == 0:
+            gc.collect()
+            samples.append((step, current_rss_mb(), held))
+
+    if long_lived is not None:
+        long_lived.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Память при длительной работе с сессиями')
+    parser.add_argument('--operations', type=int, default=3000)
+    parser.add_argument('--publications', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--checkpoints', type=int, default=10)
+    parser.add_argument('--mode', choices=['scoped', 'long-lived'], default='scoped')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='session_bench_')
+    try:
+        db_manager = DatabaseManager(f'sqlite:///{os.path.join(work_dir, "bench.db")}')
+        seed(db_manager, args.publications, args.users)
+        samples = run(args.mode, db_manager, args.operations, args.checkpoints)
+        stats = db_manager.session_stats()
+        db_manager.engine.dispose()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Режим: {args.mode}")
+    print(f"{'Операций':>9} | {'RSS, МБ':>8} | {'Объектов в сессии':>17}")
+    print("-" * 42)
+    for step, rss, held in samples:
+        print(f"{step:9d} | {rss:8.1f} | {held:17d}")
+
+    first_rss, last_rss = samples[0][1], samples[-1][1]
+    print(f"\nПрирост RSS после первого замера: {last_rss - first_rss:+.1f} МБ")
+    if args.mode == 'scoped':
+        print(f"Пик объектов в сессии за операцию: {stats['peak_held_objects']}")
+
+
+if __name__ == '__main__':
+    main()
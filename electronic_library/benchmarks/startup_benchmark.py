@@ -0,0 +1,106 @@
+"""Время запуска приложения: импорт main и появление первого меню
+
+Запуск из каталога electronic_library:
+    python -m benchmarks.startup_benchmark --budget-ms 600
+
+Импорт замеряется через `python -X importtime` в отдельном процессе; запуск
+приложения - как создание ElectronicLibraryApp и init_db на готовой базе
+(второй запуск, когда отпечаток схемы совпадает). Код возврата 1 означает
+превышение бюджета или загрузку тяжелых модулей при старте.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Бюджет на импорт main (совокупное время по данным -X importtime)
+STARTUP_BUDGET_MS = 600
+
+# Модули, которые не должны загружаться до выбора пункта меню
+LAZY_MODULES = ['pandas', 'reportlab', 'paramiko', 'export.pdf_exporter', 'backup.backup_manager']
+
+APP_START_SNIPPET = """
+import time
+t0 = time.perf_counter()
+from main import ElectronicLibraryApp
+app = ElectronicLibraryApp()
+app.db_manager.init_db()
+print(f"{(time.perf_counter() - t0) * 1000:.1f}")
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Совокупное время импорта по модулям, мкс"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, module = line.split('|')
+        cumulative[module.strip()] = int(cumulative_us.strip())
+    return cumulative
+
+
+def measure_import(cwd: str, env: dict) -> dict:
+    """Импорт main с -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(completed.stderr)
+
+
+def measure_app_start(cwd: str, env: dict) -> float:
+    """Время до готовности первого меню, мс"""
+    completed = subprocess.run(
+        [sys.executable, '-c', APP_START_SNIPPET],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время запуска приложения')
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    work_dir = tempfile.mkdtemp(prefix='startup_bench_')
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f'sqlite:///{os.path.join(work_dir, "startup.db")}'
+    env['BACKUP_PATH'] = os.path.join(work_dir, 'backups/')
+    env['PYTHONWARNINGS'] = 'ignore'
+
+    try:
+        # Первый запуск создает схему и тестовые данные
+        first_start = measure_app_start(app_dir, env)
+        import_runs = [measure_import(app_dir, env) for _ in range(args.runs)]
+        start_runs = [measure_app_start(app_dir, env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    import_ms = sorted(run['main'] / 1000 for run in import_runs)[len(import_runs) // 2]
+    start_ms = sorted(start_runs)[len(start_runs) // 2]
+
+    heaviest = sorted(import_runs[-1].items(), key=lambda item: item[1], reverse=True)[:10]
+    print("Самые тяжелые импорты (совокупно, мс):")
+    for module, cumulative_us in heaviest:
+        print(f"  {cumulative_us / 1000:8.1f}  {module}")
+
+    loaded_lazy = sorted({m for run in import_runs for m in LAZY_MODULES if m in run})
+
+    print(f"\nИмпорт main (медиана): {import_ms:.1f} мс, бюджет {args.budget_ms:.0f} мс")
+    print(f"Запуск с созданием схемы: {first_start:.1f} мс")
+    print(f"Запуск на готовой базе (медиана): {start_ms:.1f} мс")
+    if loaded_lazy:
+        print(f"✗ При запуске загружены модули: {', '.join(loaded_lazy)}")
+
+    ok = import_ms <= args.budget_ms and not loaded_lazy
+    print("✓ Бюджет соблюден" if ok else "✗ Бюджет превышен")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
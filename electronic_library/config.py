@@ -6,7 +6,74 @@ load_dotenv()
 class Config:
     # База данных
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///library.db')
-    
+
+    # Адрес для асинхронного доступа (models/async_database.py); пусто - DATABASE_URL
+    # с асинхронным драйвером (sqlite+aiosqlite, postgresql+asyncpg)
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', '')
+
+    # Профиль движка БД: 'default' (без настроек) или 'production' (WAL, прагмы, пул)
+    DB_ENGINE_PROFILE = os.getenv('DB_ENGINE_PROFILE', 'production')
+    # Переопределения отдельных параметров профиля (пусто - значение из профиля)
+    DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', '')
+    DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', '')
+    DB_CACHE_SIZE_KB = os.getenv('DB_CACHE_SIZE_KB', '')
+    DB_MMAP_SIZE_MB = os.getenv('DB_MMAP_SIZE_MB', '')
+    DB_BUSY_TIMEOUT_MS = os.getenv('DB_BUSY_TIMEOUT_MS', '')
+    DB_POOL_SIZE = os.getenv('DB_POOL_SIZE', '')
+    DB_MAX_OVERFLOW = os.getenv('DB_MAX_OVERFLOW', '')
+    DB_POOL_TIMEOUT = os.getenv('DB_POOL_TIMEOUT', '')
+    # Повторные попытки транзакции при блокировке БД
+    DB_RETRY_ATTEMPTS = int(os.getenv('DB_RETRY_ATTEMPTS', '5'))
+    DB_RETRY_BACKOFF_MS = int(os.getenv('DB_RETRY_BACKOFF_MS', '50'))
+
+    # Источник данных для отчетов и экспорта: 'snapshot' (копия базы SQLite,
+    # обновляемая через online backup API), 'replica' (REPORTING_DATABASE_URL)
+    # или 'primary' (основная база, как раньше)
+    REPORTING_MODE = os.getenv('REPORTING_MODE', 'snapshot')
+    REPORTING_DATABASE_URL = os.getenv('REPORTING_DATABASE_URL', '')
+    REPORTING_SNAPSHOT_PATH = os.getenv('REPORTING_SNAPSHOT_PATH', '')
+    # Допустимый возраст снимка в секундах, после которого он обновляется
+    REPORTING_MAX_STALENESS_S = int(os.getenv('REPORTING_MAX_STALENESS_S', '300'))
+
+    # Учет SQL-запросов по действиям меню и поиск N+1 (см. models/instrumentation.py)
+    SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SQL_INSTRUMENTATION_REPORT = os.getenv('SQL_INSTRUMENTATION_REPORT', '')
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', '5'))
+
+    # Кэш представлений изданий для каталога и карточки издания (models/catalog_cache.py);
+    # 0 записей - кэш отключен
+    CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', '20000'))
+    CATALOG_CACHE_MAX_MB = int(os.getenv('CATALOG_CACHE_MAX_MB', '32'))
+    CATALOG_CACHE_TTL_S = int(os.getenv('CATALOG_CACHE_TTL_S', '300'))
+
+    # Кэш результатов поиска по критериям (models/search_cache.py); 0 записей - кэш отключен
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '1000'))
+    SEARCH_CACHE_TTL_S = int(os.getenv('SEARCH_CACHE_TTL_S', '600'))
+
+    # Каталог файлов векторов для похожих изданий (models/content_similarity.py);
+    # пусто - рядом с файлом базы SQLite, для других СУБД - indexes/
+    CONTENT_INDEX_DIR = os.getenv('CONTENT_INDEX_DIR', '')
+
+    # Номеров заказов, которые процесс резервирует за одно обращение к базе (models/order_numbers.py)
+    ORDER_NUMBER_BLOCK = int(os.getenv('ORDER_NUMBER_BLOCK', '100'))
+
+    # Корзины (models/carts.py): сколько секунд держится резерв экземпляров,
+    # как часто фоновая очистка возвращает истекшие резервы (0 - не запускать
+    # в процессе приложения) и сколько позиций обрабатывается за транзакцию
+    CART_RESERVATION_TTL_S = int(os.getenv('CART_RESERVATION_TTL_S', '900'))
+    CART_SWEEP_INTERVAL_S = int(os.getenv('CART_SWEEP_INTERVAL_S', '60'))
+    CART_SWEEP_BATCH = int(os.getenv('CART_SWEEP_BATCH', '5000'))
+
+    # Оформление заказов (models/checkout_queue.py): 'direct' - каждый заказ в своей
+    # транзакции, 'queued' - через очередь пакетами до CHECKOUT_BATCH_ORDERS заказов,
+    # собранных не дольше CHECKOUT_BATCH_WAIT_MS, с одной фиксацией на пакет;
+    # 0 мс - в пакет попадают заявки, накопившиеся за время записи предыдущего
+    CHECKOUT_MODE = os.getenv('CHECKOUT_MODE', 'direct')
+    CHECKOUT_BATCH_ORDERS = int(os.getenv('CHECKOUT_BATCH_ORDERS', '50'))
+    CHECKOUT_BATCH_WAIT_MS = float(os.getenv('CHECKOUT_BATCH_WAIT_MS', '0'))
+    CHECKOUT_WORKERS = int(os.getenv('CHECKOUT_WORKERS', '1'))
+    CHECKOUT_QUEUE_SIZE = int(os.getenv('CHECKOUT_QUEUE_SIZE', '10000'))
+
     # Параметры резервного копирования
     BACKUP_PATH = os.getenv('BACKUP_PATH', 'backups/')
     REMOTE_HOST = os.getenv('REMOTE_HOST', '')
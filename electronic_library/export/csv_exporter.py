@@ -3,10 +3,11 @@ import os
 from datetime import datetime
 from typing import List
 from sqlalchemy.orm import Session
-from models.database_models import User, Publication, Order, OrderItem, Review
-import pandas as pd
+from models.database_models import User, Publication, Order, OrderItem
+from models.instrumentation import instrumented
 from config import Config
 
+@instrumented
 class CSVExporter:
     """Экспорт данных в CSV формат"""
     
@@ -108,10 +109,10 @@ class CSVExporter:
             Publication.isbn,
             Publication.price,
             Publication.stock_quantity,
-            func.count(Review.id).label('reviews_count'),
-            func.avg(Review.rating).label('avg_rating'),
+            Publication.reviews_count,
+            Publication.rating_sum,
             func.sum(OrderItem.quantity).label('total_sold')
-        ).outerjoin(Review).outerjoin(OrderItem).group_by(Publication.id).all()
+        ).outerjoin(OrderItem).group_by(Publication.id).all()
         
         if not file_path:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -139,7 +140,7 @@ class CSVExporter:
                     pub.price,
                     pub.stock_quantity,
                     pub.reviews_count,
-                    round(pub.avg_rating, 2) if pub.avg_rating else 0,
+                    round(pub.rating_sum / pub.reviews_count, 2) if pub.reviews_count else 0,
                     pub.total_sold or 0,
                     total_revenue
                 ])
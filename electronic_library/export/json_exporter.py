@@ -2,11 +2,14 @@ import json
 import os
 from datetime import datetime
 from typing import List, Dict, Any
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from models.database_models import User, Publication, Order, Review, Author, Genre, Publisher
-import pandas as pd
+from models.catalog_cache import publication_views
+from models.instrumentation import instrumented
 from config import Config
 
+@instrumented
 class JSONExporter:
     """Экспорт данных в JSON формат"""
     
@@ -29,13 +32,15 @@ class JSONExporter:
     @staticmethod
     def export_publications(session: Session, file_path: str = None) -> str:
         """Экспорт публикаций в JSON"""
-        publications = session.query(Publication).all()
+        ids = session.scalars(select(Publication.id).order_by(Publication.id)).all()
         data = []
         
-        for pub in publications:
-            pub_data = pub.to_dict()
-            pub_data['reviews_count'] = len(pub.reviews)
-            pub_data['average_rating'] = sum(r.rating for r in pub.reviews) / len(pub.reviews) if pub.reviews else 0
+        # Представления берутся из кэша каталога без пополнения: выгрузка
+        # всего каталога вытеснила бы из кэша часто просматриваемые издания
+        for view in publication_views(session, ids, populate=False):
+            pub_data = view.to_dict()
+            pub_data['reviews_count'] = view.reviews_count
+            pub_data['average_rating'] = view.average_rating
             data.append(pub_data)
         
         if not file_path:
@@ -75,19 +80,10 @@ class JSONExporter:
     @staticmethod
     def export_sales_report(session: Session, start_date: datetime, end_date: datetime, file_path: str = None) -> str:
         """Экспорт отчета по продажам в JSON"""
-        from sqlalchemy import func
-        
-        # Агрегированные данные по продажам
-        result = session.query(
-            func.date(Order.order_date).label('date'),
-            func.count(Order.id).label('orders_count'),
-            func.sum(Order.total_amount).label('total_revenue'),
-            func.sum(func.coalesce(OrderItem.quantity, 0)).label('items_sold')
-        ).join(Order.items).filter(
-            Order.status.in_(['paid', 'delivered']),
-            Order.order_date >= start_date,
-            Order.order_date <= end_date
-        ).group_by(func.date(Order.order_date)).order_by('date').all()
+        from reports.report_queries import ReportQueries
+
+        # Агрегированные данные по продажам (тот же запрос, что и в меню отчетов)
+        result = ReportQueries.sales_by_day(session, start_date, end_date).all()
         
         data = []
         total_revenue = 0
@@ -95,7 +91,7 @@ class JSONExporter:
         
         for row in result:
             data.append({
-                'date': row.date.isoformat(),
+                'date': str(row.date),
                 'orders_count': row.orders_count,
                 'total_revenue': float(row.total_revenue or 0),
                 'items_sold': row.items_sold or 0
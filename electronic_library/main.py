@@ -1,29 +1,79 @@
+import functools
 import os
 import sys
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional
+from config import Config
 from models.database_models import DatabaseManager, User, Publication, Order, Review, Author, Genre, Publisher, \
-    UserRole, OrderItem, OrderStatus
+    UserRole, OrderStatus, OrderItem
 from auth.auth_manager import AuthManager
-from export.json_exporter import JSONExporter
-from export.csv_exporter import CSVExporter
-from export.pdf_exporter import PDFExporter
-from backup.backup_manager import BackupManager
-import pandas as pd
-from sqlalchemy import func, desc
-from models.database_models import DatabaseManager, User, Publication, Order, Review, Author, Genre, Publisher, UserRole, OrderItem, OrderStatus
+from reports.report_queries import ReportQueries
+from models.catalog_queries import CatalogQueries
+from models.pagination import PageNavigator
+from models.catalog_cache import publication_views
+from models.checkout import InsufficientStock
+from models.order_status import TRANSITIONS, bulk_change_status, status_history
+from models.fulltext import fulltext_supported
+from models.fuzzy_index import SEARCH_SIMILARITY, SUGGEST_SIMILARITY
+from models.instrumentation import instrumented
+from sqlalchemy import func, desc, inspect, select
+from sqlalchemy.orm import joinedload, selectinload
+
+# Экспортеры (reportlab) и резервное копирование (paramiko) импортируются
+# только при выборе соответствующего пункта меню, чтобы не замедлять запуск.
+
+# Варианты сортировки списков изданий (ключи - из models.pagination.SORT_KEYS)
+PUBLICATION_SORT_LABELS = {
+    'id': 'по номеру',
+    'title': 'по названию',
+    'price': 'по цене',
+    'year': 'по году издания',
+}
+
+
+def reporting_action(method):
+    """Действие только для чтения: self.session указывает на базу отчетов
+
+    Отчеты и экспорт читают снимок или реплику (см. models/reporting.py) и не
+    блокируют запись заказов в основную базу.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._in_reporting_scope:
+            return method(self, *args, **kwargs)
+        primary_session = self.session
+        with self.db_manager.report_scope() as session:
+            self.session = session
+            self._in_reporting_scope = True
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.session = primary_session
+                self._in_reporting_scope = False
+    return wrapper
 
 
+@instrumented
 class ElectronicLibraryApp:
     """Основное приложение электронной библиотеки"""
 
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        self.db_manager = db_manager or DatabaseManager()
         self.auth_manager = AuthManager()
-        self.backup_manager = BackupManager()
+        self._backup_manager = None
         self.current_user: Optional[User] = None
-        self.session = self.db_manager.get_session()
-        self.cart = []  # Временная корзина для текущей сессии
+        self.current_user_id: Optional[int] = None
+        self.session = None  # Сессия текущего действия меню, см. _action_scope
+        self._in_reporting_scope = False
+
+    @property
+    def backup_manager(self):
+        """Менеджер резервного копирования, создается при первом обращении"""
+        if self._backup_manager is None:
+            from backup.backup_manager import BackupManager
+            self._backup_manager = BackupManager()
+        return self._backup_manager
 
     def run(self):
         """Запуск приложения"""
@@ -33,12 +83,35 @@ class ElectronicLibraryApp:
 
         # Инициализация базы данных
         self.db_manager.init_db()
+        # Истекшие резервы корзин возвращаются на склад в фоне (models/carts.py)
+        self.db_manager.carts.start_sweeper()
+        # Индекс похожих изданий загружается или строится в фоне, а не при первом открытии издания
+        self.db_manager.content_similarity.start_loading()
 
         while True:
-            if not self.current_user:
-                self.show_main_menu()
-            else:
-                self.show_user_menu()
+            with self._action_scope():
+                if not self.current_user:
+                    self.show_main_menu()
+                else:
+                    self.show_user_menu()
+
+    @contextmanager
+    def _action_scope(self):
+        """Отдельная сессия БД на каждое действие меню
+
+        Объекты, загруженные за время действия, освобождаются при его
+        завершении; текущий пользователь перечитывается в новой сессии.
+        """
+        with self.db_manager.session_scope() as session:
+            self.session = session
+            self.current_user = session.get(User, self.current_user_id) if self.current_user_id else None
+            try:
+                yield session
+            finally:
+                # Запоминаем только идентификатор: объект не переживает сессию
+                self.current_user_id = inspect(self.current_user).identity[0] if self.current_user else None
+                self.current_user = None
+                self.session = None
 
     def show_main_menu(self):
         """Главное меню (неавторизованный пользователь)"""
@@ -51,8 +124,10 @@ class ElectronicLibraryApp:
         print("4. Поиск изданий")
         print("5. Экспорт каталога (JSON/CSV)")
         print("6. Выход из программы")
+        # Новые пункты добавляются в конец, чтобы номера прежних не менялись
+        print("7. Поиск по фильтрам")
 
-        choice = input("\nВыберите действие (1-6): ").strip()
+        choice = input("\nВыберите действие (1-7): ").strip()
 
         if choice == "1":
             self.login()
@@ -68,6 +143,8 @@ class ElectronicLibraryApp:
             print("\nДо свидания!")
             self.session.close()
             sys.exit(0)
+        elif choice == "7":
+            self.faceted_search()
         else:
             print("\nНеверный выбор. Попробуйте снова.")
 
@@ -97,6 +174,8 @@ class ElectronicLibraryApp:
 
         print("\n13. Выйти из аккаунта")
         print("14. Выход из программы")
+        # Новые пункты добавляются в конец, чтобы номера прежних не менялись
+        print("15. Поиск по фильтрам")
 
         choice = input("\nВыберите действие: ").strip()
 
@@ -126,12 +205,13 @@ class ElectronicLibraryApp:
             self.backup_menu()
         elif choice == "13":
             self.current_user = None
-            self.cart = []
             print("\nВы вышли из аккаунта.")
         elif choice == "14":
             print("\nДо свидания!")
             self.session.close()
             sys.exit(0)
+        elif choice == "15":
+            self.faceted_search()
         else:
             print("\nНеверный выбор или недостаточно прав.")
 
@@ -187,14 +267,16 @@ class ElectronicLibraryApp:
         print("КАТАЛОГ ИЗДАНИЙ")
         print("=" * 60)
 
-        publications = self.session.query(Publication).limit(20).all()
+        sort, descending = self._choose_sort(PUBLICATION_SORT_LABELS)
+        # Страница выбирается по индексу, а сами издания берутся из кэша каталога
+        self._show_pages(PageNavigator(Publication, sort, descending, ids_only=True),
+                         lambda ids, start: self._show_catalog_page(publication_views(self.session, ids), start),
+                         "Каталог пуст.")
 
-        if not publications:
-            print("Каталог пуст.")
-            return
-
-        for i, pub in enumerate(publications, 1):
-            authors = ", ".join([a.full_name for a in pub.authors[:2]])
+    def _show_catalog_page(self, publications, start: int):
+        """Страница каталога (PublicationView); вошедшему пользователю предлагается добавить издание в корзину"""
+        for i, pub in enumerate(publications, start):
+            authors = ", ".join(pub.authors[:2])
             if len(pub.authors) > 2:
                 authors += " и др."
 
@@ -214,18 +296,46 @@ class ElectronicLibraryApp:
                     try:
                         quantity = int(input("Количество: "))
                         if quantity > 0 and quantity <= pub.stock_quantity:
-                            self.cart.append({
-                                'publication': pub,
-                                'quantity': quantity,
-                                'unit_price': pub.price
-                            })
-                            print(f"✓ Добавлено в корзину: {pub.title}")
+                            self._add_to_cart(pub.id, pub.title, quantity, pub.price)
                         else:
                             print("✗ Неверное количество или недостаточно на складе.")
                     except ValueError:
                         print("✗ Неверный ввод.")
 
-        print(f"\nВсего изданий: {len(publications)}")
+    def _choose_sort(self, labels: dict) -> tuple:
+        """Выбор ключа сортировки из labels (ключи - из models.pagination.SORT_KEYS) и направления"""
+        keys = list(labels)
+        print("\nСортировка: " + ", ".join(f"{number} - {labels[key]}" for number, key in enumerate(keys, 1)))
+        choice = input(f"Выберите сортировку (Enter - {labels[keys[0]]}): ").strip()
+        sort = keys[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(keys) else keys[0]
+        descending = input("По убыванию? (y/n): ").strip().lower() == 'y'
+        return sort, descending
+
+    def _show_pages(self, navigator: PageNavigator, show_page, empty_message: str):
+        """Постраничный вывод с переходом вперед и назад; каждая страница - отдельный запрос по ключу"""
+        page = navigator.load(self.session)
+        if not page.items:
+            print(empty_message)
+            return
+
+        while True:
+            show_page(page.items, (navigator.number - 1) * navigator.limit + 1)
+            print(f"\nСтраница {navigator.number}" + ("" if page.has_more else " (последняя)"))
+
+            actions = []
+            if page.has_more:
+                actions.append("n - следующая")
+            if navigator.number > 1:
+                actions.append("p - предыдущая")
+            if not actions:
+                return
+            choice = input(f"{', '.join(actions)}, Enter - выход: ").strip().lower()
+            if choice == 'n' and page.has_more:
+                page = navigator.next(self.session)
+            elif choice == 'p' and navigator.number > 1:
+                page = navigator.previous(self.session)
+            else:
+                return
 
     def search_publications(self):
         """Поиск изданий"""
@@ -233,34 +343,35 @@ class ElectronicLibraryApp:
         print("ПОИСК ИЗДАНИЙ")
         print("=" * 60)
 
-        print("\nКритерии поиска (оставьте пустым для пропуска):")
-        title = input("Название: ").strip()
-        author = input("Автор: ").strip()
-        genre = input("Жанр: ").strip()
+        print("\nКритерии поиска (оставьте пустым для пропуска; Tab или «?» в конце - подсказки):")
+        title = self._input_with_suggestions("Название: ", 'title')
+        author = self._input_with_suggestions("Автор: ", 'author')
+        genre = self._input_with_suggestions("Жанр: ", 'genre')
         min_year = input("Минимальный год издания: ").strip()
         max_year = input("Максимальный год издания: ").strip()
         min_price = input("Минимальная цена: ").strip()
         max_price = input("Максимальная цена: ").strip()
 
-        # Построение запроса
-        query = self.session.query(Publication)
-
-        if title:
-            query = query.filter(Publication.title.ilike(f"%{title}%"))
-        if author:
-            query = query.filter(Publication.authors.any(Author.full_name.ilike(f"%{author}%")))
-        if genre:
-            query = query.filter(Publication.genres.any(Genre.name.ilike(f"%{genre}%")))
-        if min_year:
-            query = query.filter(Publication.publication_year >= int(min_year))
-        if max_year:
-            query = query.filter(Publication.publication_year <= int(max_year))
-        if min_price:
-            query = query.filter(Publication.price >= float(min_price))
-        if max_price:
-            query = query.filter(Publication.price <= float(max_price))
-
-        publications = query.limit(50).all()
+        criteria = dict(
+            genre=genre,
+            min_year=int(min_year) if min_year else None,
+            max_year=int(max_year) if max_year else None,
+            min_price=float(min_price) if min_price else None,
+            max_price=float(max_price) if max_price else None,
+        )
+        # Найденные id берутся из кэша поиска, сами издания - из кэша каталога
+        publications = publication_views(self.session, self.db_manager.search_cache.search_ids(
+            self.session,
+            title=title,
+            author=author,
+            use_fulltext=fulltext_supported(self.session.get_bind()),
+            **criteria
+        ))
+
+        if not publications and (title or author):
+            publications = self._fuzzy_search(title, author, criteria)
+            if publications:
+                print("\nТочных совпадений нет, показаны похожие результаты.")
 
         if not publications:
             print("\nПо вашему запросу ничего не найдено.")
@@ -268,7 +379,7 @@ class ElectronicLibraryApp:
 
         print(f"\nНайдено изданий: {len(publications)}")
         for i, pub in enumerate(publications, 1):
-            authors = ", ".join([a.full_name for a in pub.authors[:2]])
+            authors = ", ".join(pub.authors[:2])
             print(f"\n{i}. {pub.title}")
             print(f"   Авторы: {authors}")
             print(f"   Год: {pub.publication_year} | Цена: {pub.price} руб.")
@@ -278,36 +389,217 @@ class ElectronicLibraryApp:
             if pub_num.isdigit() and 1 <= int(pub_num) <= len(publications):
                 self.show_publication_details(publications[int(pub_num) - 1])
 
+    def faceted_search(self):
+        """Поиск по фильтрам с количеством изданий по каждому значению (models/facets.py)"""
+        print("\n" + "=" * 60)
+        print("ПОИСК ПО ФИЛЬТРАМ")
+        print("=" * 60)
+
+        titles = {'genre': 'Жанр', 'language': 'Язык', 'publisher': 'Издательство',
+                  'year': 'Годы издания', 'price': 'Цена'}
+        commands = {'ж': 'genre', 'я': 'language', 'и': 'publisher', 'г': 'year', 'ц': 'price'}
+        # Фасет -> множество выбранных значений (значения одного фасета объединяются по ИЛИ)
+        selected = {'genre': set(), 'language': set(), 'publisher': set(), 'price': set()}
+        years = None
+
+        while True:
+            result = self.db_manager.facets.search(
+                genre_ids=selected['genre'], languages=selected['language'],
+                publisher_ids=selected['publisher'], price_bands=selected['price'],
+                min_year=years[0] if years else None, max_year=years[1] if years else None
+            )
+            print(f"\nНайдено изданий: {result.total}")
+            for facet, values in result.facets.items():
+                if values:
+                    print(f"\n{titles[facet]}:")
+                for number, value in enumerate(values[:10], 1):
+                    chosen = value.key == years if facet == 'year' else value.key in selected[facet]
+                    print(f"  {'*' if chosen else ' '}{number}. {value.label} ({value.count})")
+
+            print("\nКоманды: ж<номер> - жанр, я<номер> - язык, и<номер> - издательство, ц<номер> - цена,")
+            print("г<номер> или г<год>-<год> - годы издания, с - сбросить фильтры, Enter - показать издания")
+            command = input("Команда: ").strip().lower()
+            if not command:
+                break
+            if command == 'с':
+                for values in selected.values():
+                    values.clear()
+                years = None
+                continue
+
+            facet, argument = commands.get(command[0]), command[1:].strip()
+            low, _, high = argument.partition('-')
+            if facet == 'year' and low.isdigit() and high.isdigit():
+                years = (int(low), int(high))
+            elif facet and argument.isdigit() and 1 <= int(argument) <= len(result.facets[facet][:10]):
+                value = result.facets[facet][int(argument) - 1]
+                if facet == 'year':
+                    years = value.key
+                else:
+                    # Повторный выбор значения снимает фильтр
+                    selected[facet] ^= {value.key}
+            else:
+                print("✗ Неизвестная команда.")
+
+        if not result.publication_ids:
+            print("\nПо выбранным фильтрам ничего не найдено.")
+            return
+
+        publications = self.session.scalars(
+            select(Publication).where(Publication.id.in_(result.publication_ids))
+            .order_by(Publication.id).options(selectinload(Publication.authors))
+        ).all()
+        print(f"\nПервые {len(publications)} из {result.total}:")
+        for i, pub in enumerate(publications, 1):
+            authors = ", ".join([a.full_name for a in pub.authors[:2]])
+            print(f"\n{i}. {pub.title}")
+            print(f"   Авторы: {authors}")
+            print(f"   Год: {pub.publication_year} | Цена: {pub.price} руб. | Язык: {pub.language}")
+
+    def _input_with_suggestions(self, prompt: str, kind: str) -> str:
+        """Ввод с автодополнением (models/autocomplete.py)
+
+        В терминале с readline Tab дополняет начало строки популярными
+        вариантами; «?» в конце ввода показывает варианты для выбора по номеру.
+        """
+        with self._completion(kind):
+            value = input(prompt).strip()
+        if not value.endswith('?'):
+            return value
+
+        prefix = value[:-1].strip()
+        suggestions = self.db_manager.autocomplete.suggest(kind, prefix)
+        if not suggestions:
+            print("Подсказок нет.")
+            return prefix
+        for number, suggestion in enumerate(suggestions, 1):
+            print(f"  {number}. {suggestion.text}")
+        choice = input("Номер подсказки (Enter - оставить как есть): ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+            return suggestions[int(choice) - 1].text
+        return prefix
+
+    @contextmanager
+    def _completion(self, kind: str):
+        """Дополнение по Tab на время одного input(), если readline доступен"""
+        try:
+            import readline
+        except ImportError:  # Windows без pyreadline
+            readline = None
+        if readline is None or not sys.stdin.isatty():
+            yield
+            return
+
+        matches = []
+
+        def complete(text: str, state: int):
+            if state == 0:
+                matches[:] = [suggestion.text for suggestion in self.db_manager.autocomplete.suggest(kind, text)]
+            return matches[state] if state < len(matches) else None
+
+        previous_completer, previous_delims = readline.get_completer(), readline.get_completer_delims()
+        readline.set_completer(complete)
+        readline.set_completer_delims('')  # Дополняется вся строка, а не последнее слово
+        readline.parse_and_bind('tab: complete')
+        try:
+            yield
+        finally:
+            readline.set_completer(previous_completer)
+            readline.set_completer_delims(previous_delims)
+
+    def _fuzzy_search(self, title: str, author: str, criteria: dict) -> list:
+        """Поиск с опечатками: представления изданий с похожими названиями и авторами"""
+        fuzzy = self.db_manager.fuzzy
+        found = {}
+        for kind, value in (('title', title), ('author', author)):
+            if not value:
+                continue
+            matches = fuzzy.similar(kind, value, limit=10, min_similarity=SEARCH_SIMILARITY, by_words=True)
+            if not matches:
+                return []
+            found[kind] = [entity_id for match in matches for entity_id in match.entity_ids]
+
+        return publication_views(self.session, self.db_manager.search_cache.search_ids(
+            self.session,
+            publication_ids=found.get('title'),
+            author_ids=found.get('author'),
+            **criteria
+        ))
+
+    def _find_author(self, author_name: str) -> Author:
+        """Автор с указанным именем; если его нет, предложить похожего, иначе создать нового"""
+        author = self.session.query(Author).filter_by(full_name=author_name).first()
+        if author:
+            return author
+
+        for match in self.db_manager.fuzzy.similar('author', author_name, limit=1,
+                                                   min_similarity=SUGGEST_SIMILARITY):
+            answer = input(f"Возможно, вы имели в виду автора «{match.text}»? (y/n): ").strip().lower()
+            if answer == 'y':
+                return self.session.get(Author, match.entity_ids[0])
+
+        author = Author(full_name=author_name)
+        self.session.add(author)
+        return author
+
     def show_publication_details(self, publication):
         """Показать детальную информацию об издании"""
+        view = self.db_manager.catalog_cache.get(self.session, publication.id)
+        if view is None:
+            print("✗ Издание не найдено.")
+            return
+
         print(f"\n{'=' * 60}")
-        print(f"{publication.title}")
+        print(f"{view.title}")
         print(f"{'=' * 60}")
 
-        print(f"\nАвторы: {', '.join([a.full_name for a in publication.authors])}")
-        print(f"Жанры: {', '.join([g.name for g in publication.genres])}")
-        if publication.publisher:
-            print(f"Издательство: {publication.publisher.name}")
-        print(f"\nISBN: {publication.isbn or 'не указан'}")
-        print(f"Год издания: {publication.publication_year}")
-        print(f"Язык: {publication.language}")
-        print(f"Страниц: {publication.pages or 'не указано'}")
-        print(f"\nЦена: {publication.price} руб.")
-        print(f"На складе: {publication.stock_quantity} шт.")
-
-        if publication.description:
-            print(f"\nОписание:\n{publication.description}")
-
-        # Отзывы
-        reviews = publication.reviews
-        if reviews:
-            avg_rating = sum(r.rating for r in reviews) / len(reviews)
-            print(f"\nРейтинг: {avg_rating:.1f}/5 ({len(reviews)} отзывов)")
-            for review in reviews[:3]:  # Показать первые 3 отзыва
+        print(f"\nАвторы: {', '.join(view.authors)}")
+        print(f"Жанры: {', '.join(view.genres)}")
+        if view.publisher:
+            print(f"Издательство: {view.publisher}")
+        print(f"\nISBN: {view.isbn or 'не указан'}")
+        print(f"Год издания: {view.publication_year}")
+        print(f"Язык: {view.language}")
+        print(f"Страниц: {view.pages or 'не указано'}")
+        print(f"\nЦена: {view.price} руб.")
+        print(f"На складе: {view.stock_quantity} шт.")
+
+        if view.description:
+            print(f"\nОписание:\n{view.description}")
+
+        # Отзывы: рейтинг из сводки в строке издания, читаются только первые 3 отзыва
+        if view.reviews_count:
+            print(f"\nРейтинг: {view.average_rating:.1f}/5 ({view.reviews_count} отзывов)")
+            for stars in range(5, 0, -1):
+                count = view.rating_histogram[stars - 1]
+                print(f"  {stars}★ {'█' * round(20 * count / view.reviews_count):<20} {count}")
+            reviews = self.session.query(Review).options(joinedload(Review.user)) \
+                .filter(Review.publication_id == view.id).order_by(Review.id).limit(3).all()
+            for review in reviews:
                 print(f"\n  {review.user.first_name}: {review.rating}★")
                 if review.comment:
                     print(f"  {review.comment[:100]}...")
 
+        # Соседи по совместным покупкам берутся из матрицы в памяти, названия - из кэша каталога
+        recommended = self.db_manager.recommendations.similar(view.id, limit=5)
+        if recommended:
+            print("\nС этим изданием также покупают:")
+            for other in publication_views(self.session, [item.publication_id for item in recommended]):
+                print(f"  • {other.title} ({', '.join(other.authors) or 'автор не указан'}) - {other.price} руб.")
+
+        # Новинки и редко покупаемые издания добираются похожими по названию, описанию и жанрам;
+        # пока индекс строится в фоне, похожие не показываются
+        if len(recommended) < 5:
+            shown = {view.id} | {item.publication_id for item in recommended}
+            similar = [item.publication_id
+                       for item in self.db_manager.content_similarity.similar(view.id, limit=5 + len(shown),
+                                                                              wait=False)
+                       if item.publication_id not in shown][:5 - len(recommended)]
+            if similar:
+                print("\nПохожие издания:")
+                for other in publication_views(self.session, similar):
+                    print(f"  • {other.title} ({', '.join(other.authors) or 'автор не указан'}) - {other.price} руб.")
+
         if self.current_user:
             print("\nДействия:")
             print("1. Добавить в корзину")
@@ -318,18 +610,23 @@ class ElectronicLibraryApp:
 
             if choice == "1":
                 quantity = int(input("Количество: "))
-                if 0 < quantity <= publication.stock_quantity:
-                    self.cart.append({
-                        'publication': publication,
-                        'quantity': quantity,
-                        'unit_price': publication.price
-                    })
-                    print(f"✓ Добавлено в корзину: {publication.title}")
+                if 0 < quantity <= view.stock_quantity:
+                    self._add_to_cart(view.id, view.title, quantity, view.price)
                 else:
                     print("✗ Неверное количество или недостаточно на складе.")
             elif choice == "2":
                 self.add_review(publication)
 
+    def _add_to_cart(self, publication_id: int, title: str, quantity: int, unit_price: float):
+        """Добавить издание в корзину пользователя с резервом экземпляров"""
+        try:
+            expires_at = self.db_manager.carts.add(self.current_user.id, publication_id, quantity, unit_price)
+        except InsufficientStock as e:
+            print(f"✗ Недостаточно на складе: осталось {e.shortages[publication_id]} шт.")
+            return
+        print(f"✓ Добавлено в корзину: {title}")
+        print(f"  Экземпляры отложены до {expires_at:%H:%M}.")
+
     def cart_menu(self):
         """Управление корзиной"""
         if not self.current_user:
@@ -340,16 +637,22 @@ class ElectronicLibraryApp:
         print("КОРЗИНА ПОКУПОК")
         print("=" * 60)
 
-        if not self.cart:
+        # Корзина хранится в базе (models/carts.py) и сохраняется между входами
+        cart = self.db_manager.carts.items(self.current_user.id)
+        if not cart:
             print("Корзина пуста.")
             return
 
         total = 0
-        for i, item in enumerate(self.cart, 1):
+        for i, item in enumerate(cart, 1):
             item_total = item['quantity'] * item['unit_price']
             total += item_total
-            print(f"\n{i}. {item['publication'].title}")
+            print(f"\n{i}. {item['title']}")
             print(f"   Количество: {item['quantity']} x {item['unit_price']} = {item_total} руб.")
+            if item['reserved'] >= item['quantity']:
+                print(f"   Отложено до {item['expires_at']:%H:%M}")
+            else:
+                print("   Срок резерва истек: наличие проверится при оформлении")
 
         print(f"\nИтого: {total} руб.")
 
@@ -365,20 +668,22 @@ class ElectronicLibraryApp:
             self.create_order()
         elif choice == "2":
             item_num = int(input("Номер товара для удаления: "))
-            if 1 <= item_num <= len(self.cart):
-                removed = self.cart.pop(item_num - 1)
-                print(f"✓ Удалено: {removed['publication'].title}")
+            if 1 <= item_num <= len(cart):
+                removed = cart[item_num - 1]
+                self.db_manager.carts.remove(self.current_user.id, removed['publication_id'])
+                print(f"✓ Удалено: {removed['title']}")
         elif choice == "3":
-            self.cart = []
+            self.db_manager.carts.clear(self.current_user.id)
             print("✓ Корзина очищена.")
 
     def create_order(self):
         """Создание заказа из корзины"""
-        if not self.cart:
+        cart = self.db_manager.carts.items(self.current_user.id)
+        if not cart:
             print("✗ Корзина пуста.")
             return
 
-        total = sum(item['quantity'] * item['unit_price'] for item in self.cart)
+        total = sum(item['quantity'] * item['unit_price'] for item in cart)
 
         print(f"\nОформление заказа на сумму: {total} руб.")
         print("Способы оплаты:")
@@ -411,42 +716,26 @@ class ElectronicLibraryApp:
 
         if confirm == 'y':
             try:
-                # Создаем заказ
-                order = Order(
-                    order_number=f"ORD-{datetime.now().strftime('%Y%m%d')}-{self.current_user.id:04d}",
-                    user_id=self.current_user.id,
-                    total_amount=total,
-                    status=OrderStatus.PENDING,
-                    payment_method=payment_method_text,
-                    shipping_address=address
-                )
-                self.session.add(order)
-                self.session.flush()  # Получаем ID заказа
-
-                # Добавляем позиции заказа
-                for item in self.cart:
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        publication_id=item['publication'].id,
-                        quantity=item['quantity'],
-                        unit_price=item['unit_price']
-                    )
-                    self.session.add(order_item)
-
-                    # Уменьшаем количество на складе
-                    item['publication'].stock_quantity -= item['quantity']
-
-                self.session.commit()
-
-                # Очищаем корзину
-                self.cart = []
+                # Зарезервированные экземпляры уже списаны; позиции с истекшим резервом
+                # списываются условным UPDATE, корзина удаляется в той же транзакции
+                if Config.CHECKOUT_MODE == 'queued':
+                    order_id, order_number = self.db_manager.checkout_queue.checkout(
+                        self.current_user.id, None, payment_method_text, address)
+                else:
+                    order_id, order_number = self.db_manager.carts.checkout(self.current_user.id,
+                                                                            payment_method_text, address)
 
                 print(f"\n✓ Заказ успешно оформлен!")
-                print(f"Номер заказа: {order.order_number}")
+                print(f"Номер заказа: {order_number}")
                 print("Вы можете отслеживать статус заказа в разделе 'Мои заказы'.")
 
+            except InsufficientStock as e:
+                titles = {item['publication_id']: item['title'] for item in cart}
+                print("\n✗ Заказ не оформлен: резерв истек, и часть экземпляров купили.")
+                for publication_id, available in e.shortages.items():
+                    print(f"  • {titles.get(publication_id, publication_id)}: на складе {available} шт.")
+                print("Измените состав корзины и повторите оформление.")
             except Exception as e:
-                self.session.rollback()
                 print(f"\n✗ Ошибка при оформлении заказа: {str(e)}")
 
     def view_my_orders(self):
@@ -459,8 +748,9 @@ class ElectronicLibraryApp:
         print("МОИ ЗАКАЗЫ")
         print("=" * 60)
 
-        orders = self.session.query(Order).filter_by(user_id=self.current_user.id) \
-            .order_by(desc(Order.order_date)).all()
+        # Позиции заказов и их издания загружаются двумя запросами на все заказы, а не по одному на заказ
+        orders = ReportQueries.user_orders(self.session, self.current_user.id) \
+            .options(selectinload(Order.items).joinedload(OrderItem.publication)).all()
 
         if not orders:
             print("У вас еще нет заказов.")
@@ -639,6 +929,7 @@ class ElectronicLibraryApp:
         print("4. Просмотр всех публикаций")
         print("5. Поиск публикаций для редактирования")
         print("6. Вернуться")
+        print("7. Импорт каталога из файла (JSON/CSV)")
 
         choice = input("\nВыберите действие: ").strip()
 
@@ -652,6 +943,34 @@ class ElectronicLibraryApp:
             self.view_all_publications()
         elif choice == "5":
             self.search_publications_to_edit()
+        elif choice == "7":
+            self.import_publications()
+
+    def import_publications(self):
+        """Импорт изданий из файла в формате выгрузки каталога"""
+        from models.catalog_import import CatalogImporter
+
+        path = input("\nПуть к файлу (.json, .jsonl или .csv): ").strip()
+        if not os.path.isfile(path):
+            print("✗ Файл не найден.")
+            return
+
+        importer = CatalogImporter(self.db_manager)
+        try:
+            counts = importer.import_file(path, progress=True)
+        except Exception as e:
+            print(f"✗ Ошибка при импорте: {str(e)}")
+            return
+
+        elapsed = counts['elapsed_ms'] / 1000
+        print(f"✓ Обработано записей: {counts['records']} за {elapsed:.1f} с "
+              f"({counts['records'] / elapsed if elapsed else 0:.0f} записей/с)")
+        print(f"  Добавлено изданий: {counts['inserted']}, пропущено дублей ISBN: {counts['duplicates']}")
+        print(f"  Новых авторов: {counts['authors']}, жанров: {counts['genres']}, издательств: {counts['publishers']}")
+        if counts['invalid']:
+            print(f"  Ошибочных записей: {counts['invalid']}")
+            for message in importer.errors[:10]:
+                print(f"    {message}")
 
     def add_publication(self):
         """Добавление новой публикации"""
@@ -705,11 +1024,7 @@ class ElectronicLibraryApp:
             if authors_input:
                 author_names = [name.strip() for name in authors_input.split(',')]
                 for author_name in author_names:
-                    author = self.session.query(Author).filter_by(full_name=author_name).first()
-                    if not author:
-                        author = Author(full_name=author_name)
-                        self.session.add(author)
-                    publication.authors.append(author)
+                    publication.authors.append(self._find_author(author_name))
 
             # Добавление жанров
             genres_input = input("Жанры (через запятую): ").strip()
@@ -804,13 +1119,11 @@ class ElectronicLibraryApp:
 
     def view_all_publications(self):
         """Просмотр всех публикаций"""
-        publications = self.session.query(Publication).all()
-
-        if not publications:
-            print("Нет публикаций.")
-            return
+        sort, descending = self._choose_sort(PUBLICATION_SORT_LABELS)
+        self._show_pages(PageNavigator(Publication, sort, descending), self._show_publications_page,
+                         "Нет публикаций.")
 
-        print(f"\nВсего публикаций: {len(publications)}")
+    def _show_publications_page(self, publications, start: int):
         for pub in publications:
             print(f"\nID: {pub.id} | {pub.title}")
             print(f"  Авторы: {', '.join([a.full_name for a in pub.authors])}")
@@ -824,10 +1137,9 @@ class ElectronicLibraryApp:
             print("✗ Введите ключевое слово для поиска.")
             return
 
-        publications = self.session.query(Publication).filter(
-            Publication.title.ilike(f"%{keyword}%") |
-            Publication.isbn.ilike(f"%{keyword}%")
-        ).all()
+        publications = self.session.scalars(CatalogQueries.keyword_search(
+            keyword, use_fulltext=fulltext_supported(self.session.get_bind())
+        )).all()
 
         if not publications:
             print("Публикации не найдены.")
@@ -872,13 +1184,12 @@ class ElectronicLibraryApp:
 
     def view_all_users(self):
         """Просмотр всех пользователей"""
-        users = self.session.query(User).all()
-
-        if not users:
-            print("Нет пользователей.")
-            return
+        sort, descending = self._choose_sort({
+            'id': 'по ID', 'email': 'по email', 'registered': 'по дате регистрации'
+        })
+        self._show_pages(PageNavigator(User, sort, descending), self._show_users_page, "Нет пользователей.")
 
-        print(f"\nВсего пользователей: {len(users)}")
+    def _show_users_page(self, users, start: int):
         for user in users:
             status = "Активен" if user.is_active else "Неактивен"
             print(f"\nID: {user.id} | {user.email}")
@@ -1046,6 +1357,7 @@ class ElectronicLibraryApp:
         print("3. Изменить статус заказа")
         print("4. Просмотр деталей заказа")
         print("5. Вернуться")
+        print("6. Массовое изменение статуса")
 
         choice = input("\nВыберите действие: ").strip()
 
@@ -1057,16 +1369,14 @@ class ElectronicLibraryApp:
             self.change_order_status()
         elif choice == "4":
             self.view_order_details()
+        elif choice == "6":
+            self.bulk_change_order_status()
 
     def view_all_orders(self):
-        """Просмотр всех заказов"""
-        orders = self.session.query(Order).order_by(desc(Order.order_date)).limit(50).all()
-
-        if not orders:
-            print("Нет заказов.")
-            return
+        """Просмотр всех заказов, новые сначала"""
+        self._show_pages(PageNavigator(Order, 'date', descending=True), self._show_orders_page, "Нет заказов.")
 
-        print(f"\nПоследние {len(orders)} заказов:")
+    def _show_orders_page(self, orders, start: int):
         for order in orders:
             print(f"\n{order.order_number}")
             print(f"  Дата: {order.order_date.strftime('%d.%m.%Y %H:%M')}")
@@ -1114,27 +1424,76 @@ class ElectronicLibraryApp:
             return
 
         print(f"\nТекущий статус заказа {order_number}: {order.status.value}")
+        targets = TRANSITIONS[order.status]
+        if not targets:
+            print("✗ Статус заказа окончательный, изменить его нельзя.")
+            return
         print("Доступные статусы:")
-        for i, status in enumerate(OrderStatus, 1):
+        for i, status in enumerate(targets, 1):
             print(f"{i}. {status.value}")
 
-        status_choice = input("Выберите новый статус (1-5): ").strip()
+        status_choice = input(f"Выберите новый статус (1-{len(targets)}): ").strip()
 
         try:
             status_index = int(status_choice) - 1
-            if 0 <= status_index < len(list(OrderStatus)):
-                new_status = list(OrderStatus)[status_index]
-                order.status = new_status
-                self.session.commit()
-                print(f"✓ Статус заказа {order_number} изменен на {new_status.value}.")
+            if 0 <= status_index < len(targets):
+                new_status = targets[status_index]
+                # Переход проверяется и записывается в журнал статусов тем же путем, что и массовый
+                result = bulk_change_status(self.db_manager.engine, new_status, order_ids=[order.id],
+                                            user_id=self.current_user.id)
+                if result.changed:
+                    print(f"✓ Статус заказа {order_number} изменен на {new_status.value}.")
+                else:
+                    print("✗ Статус заказа уже изменен другим пользователем.")
             else:
                 print("✗ Неверный выбор статуса.")
         except (ValueError, IndexError):
             print("✗ Неверный выбор статуса.")
         except Exception as e:
-            self.session.rollback()
             print(f"✗ Ошибка при изменении статуса: {str(e)}")
 
+    def bulk_change_order_status(self):
+        """Перевод всех заказов с заданным статусом, оформленных до даты, в следующий статус"""
+        statuses = [status for status in OrderStatus if TRANSITIONS[status]]
+        print("\nТекущий статус заказов:")
+        for i, status in enumerate(statuses, 1):
+            print(f"{i}. {status.value}")
+
+        try:
+            current = statuses[int(input(f"Выберите статус (1-{len(statuses)}): ").strip()) - 1]
+            targets = TRANSITIONS[current]
+            print("Новый статус:")
+            for i, status in enumerate(targets, 1):
+                print(f"{i}. {status.value}")
+            target = targets[int(input(f"Выберите статус (1-{len(targets)}): ").strip()) - 1]
+            before_str = input("Заказы, оформленные до даты (ГГГГ-ММ-ДД, пусто - все): ").strip()
+            placed_before = datetime.strptime(before_str, "%Y-%m-%d") if before_str else None
+        except (ValueError, IndexError):
+            print("✗ Неверный ввод.")
+            return
+
+        query = self.session.query(func.count(Order.id)).filter(Order.status == current)
+        if placed_before:
+            query = query.filter(Order.order_date < placed_before)
+        count = query.scalar()
+        if not count:
+            print("Подходящих заказов нет.")
+            return
+
+        confirm = input(f"Перевести {count} заказов из статуса {current.value} в {target.value}? (y/n): ")
+        if confirm.strip().lower() != 'y':
+            return
+
+        try:
+            result = bulk_change_status(self.db_manager.engine, target, current_status=current,
+                                        placed_before=placed_before, user_id=self.current_user.id)
+        except Exception as e:
+            print(f"✗ Ошибка при изменении статуса: {str(e)}")
+            return
+        print(f"✓ Изменено заказов: {sum(result.changed.values())} за {result.elapsed_ms / 1000:.1f} с.")
+        for status, skipped in result.skipped.items():
+            print(f"  пропущено (статус {status.value}): {skipped}")
+
     def view_order_details(self):
         """Просмотр деталей заказа"""
         order_number = input("\nВведите номер заказа: ").strip()
@@ -1162,6 +1521,12 @@ class ElectronicLibraryApp:
 
         print(f"\nИтого: {total} руб.")
 
+        history = status_history(self.session.connection(), order.id)
+        if history:
+            print("\nИстория статусов:")
+            for changed_at, from_status, to_status, _ in history:
+                print(f"  {changed_at.strftime('%d.%m.%Y %H:%M')}: {from_status.value} → {to_status.value}")
+
     def reports_menu(self):
         """Меню отчетов и аналитики"""
         if not self.current_user or self.current_user.role not in [UserRole.ADMIN, UserRole.LIBRARIAN]:
@@ -1179,8 +1544,11 @@ class ElectronicLibraryApp:
         print("4. Отчет по инвентарю")
         print("5. Статистика по жанрам")
         print("6. Вернуться")
+        print("7. Обновить данные для отчетов")
+        print("8. Статистика кэшей каталога и поиска")
+        print(f"\nИсточник данных: {self.db_manager.reporting.describe()}")
 
-        choice = input("\nВыберите отчет (1-6): ").strip()
+        choice = input("\nВыберите отчет (1-8): ").strip()
 
         if choice == "1":
             self.sales_report()
@@ -1192,7 +1560,38 @@ class ElectronicLibraryApp:
             self.inventory_report()
         elif choice == "5":
             self.genres_report()
-
+        elif choice == "7":
+            elapsed = self.db_manager.reporting.refresh()
+            print(f"✓ Данные для отчетов обновлены за {elapsed:.2f} с ({self.db_manager.reporting.describe()})")
+        elif choice == "8":
+            self.cache_report()
+
+    def cache_report(self):
+        """Статистика кэша представлений изданий и кэша результатов поиска"""
+        cache = self.db_manager.catalog_cache
+        stats = cache.stats()
+        print("\nКэш каталога")
+        print(f"Записей: {stats['entries']} из {cache.max_entries}, "
+              f"объем: {stats['bytes'] / 2 ** 20:.1f} из {cache.max_bytes / 2 ** 20:.0f} МБ, "
+              f"срок жизни: {cache.ttl_s} с")
+        print(f"Попадания: {stats['hits']}, промахи: {stats['misses']} (доля попаданий {stats['hit_ratio']:.0%})")
+        print(f"Устарели: {stats['expired']}, вытеснены: {stats['evictions']}, сброшены при записи: "
+              f"{stats['invalidations']}")
+
+        search_cache = self.db_manager.search_cache
+        stats = search_cache.stats()
+        print("\nКэш поиска")
+        if not search_cache.enabled:
+            print("Отключен.")
+            return
+        print(f"Записей: {stats['entries']} из {search_cache.max_entries}, срок жизни: {search_cache.ttl_s} с")
+        print(f"Попадания: {stats['hits']}, промахи: {stats['misses']} (доля попаданий {stats['hit_ratio']:.0%})")
+        print(f"Из промахов: изменились таблицы - {stats['stale']}, истек срок - {stats['expired']}; "
+              f"вытеснены: {stats['evictions']}")
+        print(f"Среднее время запроса поиска: {stats['avg_query_ms']:.1f} мс, "
+              f"сэкономлено: {stats['saved_s'] * 1000:.0f} мс")
+
+    @reporting_action
     def sales_report(self):
         """Отчет по продажам за период"""
         print("\nОтчет по продажам за период")
@@ -1212,16 +1611,7 @@ class ElectronicLibraryApp:
                 end_date = datetime.now()
 
             # Получаем данные
-            result = self.session.query(
-                func.date(Order.order_date).label('date'),
-                func.count(Order.id).label('orders_count'),
-                func.sum(Order.total_amount).label('total_revenue'),
-                func.sum(func.coalesce(OrderItem.quantity, 0)).label('items_sold')
-            ).join(Order.items).filter(
-                Order.status.in_([OrderStatus.PAID, OrderStatus.DELIVERED]),
-                Order.order_date >= start_date,
-                Order.order_date <= end_date
-            ).group_by(func.date(Order.order_date)).order_by('date').all()
+            result = ReportQueries.sales_by_day(self.session, start_date, end_date).all()
 
             if not result:
                 print("Нет данных за указанный период.")
@@ -1255,6 +1645,7 @@ class ElectronicLibraryApp:
         except ValueError:
             print("✗ Неверный формат даты. Используйте ГГГГ-ММ-ДД.")
 
+    @reporting_action
     def popular_publications_report(self):
         """Отчет по популярным изданиям"""
         print("\nОтчет по популярным изданиям")
@@ -1263,14 +1654,7 @@ class ElectronicLibraryApp:
         limit = int(limit) if limit.isdigit() else 10
 
         # Издания с наибольшим количеством продаж
-        result = self.session.query(
-            Publication.id,
-            Publication.title,
-            func.sum(OrderItem.quantity).label('total_sold'),
-            func.sum(OrderItem.quantity * OrderItem.unit_price).label('total_revenue'),
-            func.avg(Review.rating).label('avg_rating')
-        ).join(OrderItem).outerjoin(Review).group_by(Publication.id) \
-            .order_by(desc('total_sold')).limit(limit).all()
+        result = ReportQueries.popular_publications(self.session, limit).all()
 
         if not result:
             print("Нет данных о продажах.")
@@ -1289,6 +1673,7 @@ class ElectronicLibraryApp:
 
             print(f"{title} | {sold:7d} | {revenue:9.2f} | {rating:>7}")
 
+    @reporting_action
     def user_activity_report(self):
         """Отчет по пользовательской активности"""
         print("\nОтчет по пользовательской активности")
@@ -1297,16 +1682,7 @@ class ElectronicLibraryApp:
         limit = int(limit) if limit.isdigit() else 10
 
         # Самые активные пользователи
-        result = self.session.query(
-            User.id,
-            User.email,
-            User.first_name,
-            User.last_name,
-            func.count(Order.id).label('orders_count'),
-            func.sum(Order.total_amount).label('total_spent'),
-            func.count(Review.id).label('reviews_count')
-        ).outerjoin(Order).outerjoin(Review).group_by(User.id) \
-            .order_by(desc('orders_count')).limit(limit).all()
+        result = ReportQueries.user_activity(self.session, limit).all()
 
         print(f"\nТоп-{limit} самых активных пользователей:")
         print("=" * 100)
@@ -1322,12 +1698,13 @@ class ElectronicLibraryApp:
 
             print(f"{user_info} | {orders:7d} | {spent:10.2f} | {reviews:7d}")
 
+    @reporting_action
     def inventory_report(self):
         """Отчет по инвентарю"""
         print("\nОтчет по инвентарю")
 
         # Все публикации с количеством на складе
-        publications = self.session.query(Publication).order_by(desc(Publication.stock_quantity)).all()
+        publications = ReportQueries.inventory(self.session).all()
 
         if not publications:
             print("Нет данных об инвентаре.")
@@ -1349,18 +1726,13 @@ class ElectronicLibraryApp:
                 status = "НЕТ В НАЛИЧИИ" if pub.stock_quantity == 0 else f"мало ({pub.stock_quantity} шт.)"
                 print(f"  - {pub.title}: {status}")
 
+    @reporting_action
     def genres_report(self):
         """Отчет по жанрам"""
         print("\nОтчет по жанрам")
 
         # Статистика по жанрам
-        result = self.session.query(
-            Genre.name,
-            func.count(Publication.id).label('publications_count'),
-            func.sum(OrderItem.quantity).label('total_sold'),
-            func.sum(OrderItem.quantity * OrderItem.unit_price).label('total_revenue')
-        ).join(publication_genres).join(Publication).outerjoin(OrderItem).group_by(Genre.id) \
-            .order_by(desc('total_revenue')).all()
+        result = ReportQueries.genres_stats(self.session).all()
 
         if not result:
             print("Нет данных по жанрам.")
@@ -1379,30 +1751,24 @@ class ElectronicLibraryApp:
 
             print(f"{genre_name} | {publications:7d} | {sold:7d} | {revenue:8.2f}")
 
+    @reporting_action
     def export_report(self, report_type, start_date, end_date, format_type):
         """Экспорт отчета"""
         if format_type == 'json':
+            from export.json_exporter import JSONExporter
             exporter = JSONExporter()
             file_path = exporter.export_sales_report(self.session, start_date, end_date)
             print(f"✓ Отчет экспортирован в JSON: {file_path}")
 
         elif format_type == 'csv':
+            from export.csv_exporter import CSVExporter
             exporter = CSVExporter()
             file_path = exporter.export_orders_detailed(self.session, start_date, end_date)
             print(f"✓ Отчет экспортирован в CSV: {file_path}")
 
         elif format_type == 'pdf':
             # Сначала получаем данные для PDF
-            result = self.session.query(
-                func.date(Order.order_date).label('date'),
-                func.count(Order.id).label('orders_count'),
-                func.sum(Order.total_amount).label('total_revenue'),
-                func.sum(func.coalesce(OrderItem.quantity, 0)).label('items_sold')
-            ).join(Order.items).filter(
-                Order.status.in_([OrderStatus.PAID, OrderStatus.DELIVERED]),
-                Order.order_date >= start_date,
-                Order.order_date <= end_date
-            ).group_by(func.date(Order.order_date)).order_by('date').all()
+            result = ReportQueries.sales_by_day(self.session, start_date, end_date).all()
 
             data = {
                 'period': {
@@ -1423,16 +1789,18 @@ class ElectronicLibraryApp:
 
             for row in result:
                 data['daily_data'].append({
-                    'date': row.date.isoformat(),
+                    'date': str(row.date),
                     'orders_count': row.orders_count,
                     'total_revenue': float(row.total_revenue or 0),
                     'items_sold': row.items_sold or 0
                 })
 
+            from export.pdf_exporter import PDFExporter
             exporter = PDFExporter()
             file_path = exporter.export_sales_report_pdf(data)
             print(f"✓ Отчет экспортирован в PDF: {file_path}")
 
+    @reporting_action
     def export_menu(self):
         """Меню экспорта данных"""
         if not self.current_user or self.current_user.role not in [UserRole.ADMIN, UserRole.LIBRARIAN]:
@@ -1466,6 +1834,9 @@ class ElectronicLibraryApp:
         formats = {'1': 'json', '2': 'csv', '3': 'pdf'}
         format_type = formats.get(format_choice)
 
+        from export.json_exporter import JSONExporter
+        from export.csv_exporter import CSVExporter
+
         try:
             if data_choice == "1":
                 if format_type == 'json':
@@ -1492,6 +1863,7 @@ class ElectronicLibraryApp:
                             'price': pub.price,
                             'stock_quantity': pub.stock_quantity
                         })
+                    from export.pdf_exporter import PDFExporter
                     file_path = PDFExporter.export_inventory_report_pdf(pub_data)
 
             elif data_choice == "3":
@@ -1539,6 +1911,7 @@ class ElectronicLibraryApp:
         except Exception as e:
             print(f"✗ Ошибка при экспорте данных: {str(e)}")
 
+    @reporting_action
     def export_catalog_public(self):
         """Экспорт каталога для неавторизованных пользователей"""
         print("\n" + "=" * 60)
@@ -1551,6 +1924,9 @@ class ElectronicLibraryApp:
 
         choice = input("\nВыберите формат (1-2): ").strip()
 
+        from export.json_exporter import JSONExporter
+        from export.csv_exporter import CSVExporter
+
         if choice == "1":
             try:
                 file_path = JSONExporter.export_publications(self.session)
@@ -1658,18 +2034,18 @@ class ElectronicLibraryApp:
                 confirm = input(
                     f"\nВы уверены, что хотите восстановить базу данных из {backup_path}? (y/n): ").strip().lower()
                 if confirm == 'y':
-                    # Закрываем текущую сессию
+                    # Закрываем текущую сессию и соединения пула
                     self.session.close()
+                    self.db_manager.engine.dispose()
 
+                    # Закрытая сессия снова откроет соединение при следующем запросе
                     success, message = self.backup_manager.restore_backup(backup_path)
                     if success:
+                        # Снимок для отчетов должен отражать восстановленные данные
+                        self.db_manager.reporting.refresh()
                         print(f"✓ {message}")
-                        # Перезапускаем сессию
-                        self.session = self.db_manager.get_session()
                     else:
                         print(f"✗ {message}")
-                        # Пытаемся переоткрыть сессию
-                        self.session = self.db_manager.get_session()
 
         elif choice == "5":
             days = input("Удалить копии старше скольки дней? (по умолчанию 30): ").strip()
@@ -0,0 +1,152 @@
+"""Асинхронный доступ к базе данных
+
+Вариант DatabaseManager для обслуживания множества одновременных читателей
+каталога из одного процесса без потока на клиента. Используется асинхронный
+движок SQLAlchemy: aiosqlite для SQLite и asyncpg для PostgreSQL (драйвер
+ставится отдельно). Адрес берется из ASYNC_DATABASE_URL или выводится из
+DATABASE_URL заменой драйвера.
+
+Асинхронные сессии не поддерживают ленивую загрузку связей, поэтому все
+операции AsyncLibraryService заранее подгружают нужные связи (selectinload).
+
+Пример:
+    db = AsyncDatabaseManager()
+    service = AsyncLibraryService(db)
+    publications = await service.browse_catalog()
+    await db.dispose()
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from sqlalchemy import select, desc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+from config import Config
+from models.database_models import Base, Publication, Order, OrderItem
+from models.catalog_queries import CatalogQueries
+from models.fulltext import fulltext_supported
+from models.pagination import Cursor, KeysetPage, make_page, segment_queries
+from models.checkout import InsufficientStock, available_stock, cart_quantities, new_order, stock_decrement
+from models.engine_profile import create_configured_async_engine, run_with_retry_async
+from models.order_numbers import AsyncOrderNumberAllocator
+
+# Асинхронные драйверы по имени СУБД
+ASYNC_DRIVERS = {
+    'sqlite': 'aiosqlite',
+    'postgresql': 'asyncpg',
+}
+
+
+def to_async_url(database_url: str) -> str:
+    """Адрес БД с асинхронным драйвером"""
+    url = make_url(database_url)
+    if url.get_driver_name() in ASYNC_DRIVERS.values():
+        return database_url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Асинхронный доступ не поддерживается для СУБД {backend}")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}').render_as_string(hide_password=False)
+
+
+class AsyncDatabaseManager:
+    """Асинхронный менеджер базы данных"""
+
+    def __init__(self, database_url: Optional[str] = None, engine_profile: Optional[str] = None):
+        self.database_url = to_async_url(database_url or Config.ASYNC_DATABASE_URL or Config.DATABASE_URL)
+        self.engine = create_configured_async_engine(self.database_url, engine_profile, echo=False)
+        # Объекты остаются доступными после commit: повторная загрузка в async невозможна
+        self.SessionLocal = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.order_numbers = AsyncOrderNumberAllocator(self.engine)
+
+    async def create_schema(self):
+        """Создать отсутствующие таблицы (основную схему ведет DatabaseManager)"""
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    @asynccontextmanager
+    async def session_scope(self) -> AsyncIterator[AsyncSession]:
+        """Сессия на одну операцию; при ошибке изменения откатываются"""
+        session = self.SessionLocal()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+
+class AsyncLibraryService:
+    """Асинхронные аналоги операций меню: каталог, поиск, заказы, оформление"""
+
+    def __init__(self, db_manager: AsyncDatabaseManager):
+        self.db_manager = db_manager
+
+    async def browse_catalog(self, limit: int = 20) -> List[Publication]:
+        """Первая страница каталога с авторами (как browse_catalog)"""
+        async with self.db_manager.session_scope() as session:
+            result = await session.scalars(
+                CatalogQueries.catalog_page(limit).options(selectinload(Publication.authors))
+            )
+            return list(result)
+
+    async def catalog_page(self, sort: str = 'id', after: Optional[Cursor] = None, descending: bool = False,
+                           limit: int = 20) -> KeysetPage:
+        """Страница каталога по ключу с авторами, жанрами и издательством (см. models/pagination.py)"""
+        async with self.db_manager.session_scope() as session:
+            rows = []
+            for query in segment_queries(Publication, sort, after, descending):
+                rows.extend(await session.scalars(query.limit(limit + 1 - len(rows))))
+                if len(rows) > limit:
+                    break
+            return make_page(Publication, sort, rows, limit)
+
+    async def search_publications(self, **criteria) -> List[Publication]:
+        """Поиск изданий; критерии те же, что у CatalogQueries.search"""
+        async with self.db_manager.session_scope() as session:
+            result = await session.scalars(
+                CatalogQueries.search(use_fulltext=fulltext_supported(self.db_manager.engine), **criteria)
+                .options(selectinload(Publication.authors))
+            )
+            return list(result)
+
+    async def order_history(self, user_id: int) -> List[Order]:
+        """Заказы пользователя с позициями и изданиями (как view_my_orders)"""
+        async with self.db_manager.session_scope() as session:
+            result = await session.scalars(
+                select(Order).where(Order.user_id == user_id).order_by(desc(Order.order_date))
+                .options(selectinload(Order.items).selectinload(OrderItem.publication))
+            )
+            return list(result)
+
+    async def checkout(self, user_id: int, cart: List[Dict], payment_method: Optional[str] = None,
+                       shipping_address: Optional[str] = None) -> Order:
+        """Оформление заказа из корзины (как create_order)
+
+        Элементы корзины имеют тот же вид, что и для models/checkout.checkout:
+        {'publication_id', 'title', 'quantity', 'unit_price'}. Остатки
+        списываются условным UPDATE, как в models/checkout.py; при нехватке
+        экземпляров выбрасывается InsufficientStock, и заказ не создается.
+        """
+        if not cart:
+            raise ValueError("Корзина пуста")
+        quantities = cart_quantities(cart)
+        order_number = await self.db_manager.order_numbers.next_number()
+
+        async def attempt() -> Order:
+            async with self.db_manager.session_scope() as session:
+                short = [publication_id for publication_id, quantity in quantities.items()
+                         if (await session.execute(stock_decrement(publication_id, quantity))).rowcount != 1]
+                if short:
+                    available = dict((await session.execute(available_stock(short))).all())
+                    raise InsufficientStock({publication_id: available.get(publication_id, 0)
+                                             for publication_id in short})
+                order = new_order(order_number, user_id, cart, payment_method, shipping_address)
+                session.add(order)
+                await session.commit()
+                return order
+
+        return await run_with_retry_async(attempt)
@@ -0,0 +1,461 @@
+"""Автодополнение по началу названия, имени автора, издательства и жанра
+
+Строка приводится к виду для сравнения (casefold, «ё» -> «е», пробелы
+схлопываются), и каждое ее слово (не больше MAX_WORD_STARTS) дает ключ -
+остаток строки, начиная с этого слова. Поэтому «тол» находит «Лев Толстой»,
+а «война и» - «Война и мир».
+
+Индекс одного вида (title, author, publisher, genre) состоит из снимка и
+надстройки, как нечеткий индекс (models/fuzzy_index.py):
+- снимок - массивы numpy: различные строки, их идентификаторы с весами (CSR)
+  и ключи (номер строки, смещение слова), упорядоченные по тексту ключа.
+  Ключи с заданным началом занимают непрерывный отрезок, его границы
+  находит bisect за O(log n) сравнений строк. Снимок хранится в таблице
+  autocomplete_index без сжатия: загрузка при холодном старте - доли секунды;
+- надстройка - словари для записей, измененных после снимка; изменения
+  приходят из журнала autocomplete_journal, который заполняют триггеры.
+
+Вес строки - популярность: число проданных экземпляров изданий (для
+автора, издательства и жанра - всех их изданий). Из отрезка ключей
+выбираются limit строк с наибольшим весом, при равном весе - по алфавиту.
+Веса пересчитываются при перестроении снимка и для измененных записей.
+
+Перестроить снимки и проверить подсказки:
+    python -m models.autocomplete rebuild
+    python -m models.autocomplete suggest --kind author --prefix "тол"
+Задержка на больших объемах: benchmarks/autocomplete_benchmark.py.
+"""
+import argparse
+import io
+import sys
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from models.database_models import Author, Genre, OrderItem, Publication, Publisher, autocomplete_index, \
+    autocomplete_journal, publication_authors, publication_genres
+from models.fuzzy_index import _pack_strings, _unpack_strings
+
+# Вид индекса -> колонка с текстом
+KINDS = {
+    'title': Publication.__table__.c.title,
+    'author': Author.__table__.c.full_name,
+    'publisher': Publisher.__table__.c.name,
+    'genre': Genre.__table__.c.name,
+}
+
+# Сколько слов строки становятся началом ключа
+MAX_WORD_STARTS = 6
+# Ключ сравнивается по первым MAX_KEY_CHARS символам; более длинный запрос
+# дополнительно проверяется целиком
+MAX_KEY_CHARS = 40
+# Во сколько раз больше строк отбирается по весу до удаления повторов
+# (строка попадает в отрезок столько раз, сколько ее слов начинаются с запроса)
+OVERSAMPLE = 4
+# Подсказки для запросов не длиннее SHORT_QUERY запоминаются до следующего
+# изменения: их отрезки - сотни тысяч ключей на миллионе названий
+SHORT_QUERY = 2
+
+Suggestion = namedtuple('Suggestion', 'text weight')
+
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(value: str) -> str:
+    """Строка для сравнения начала: регистр, «ё» и лишние пробелы не учитываются"""
+    return ' '.join((value or '').casefold().replace('ё', 'е').split())
+
+
+def word_starts(term: str) -> List[int]:
+    """Смещения первых MAX_WORD_STARTS слов строки"""
+    starts = []
+    for position, char in enumerate(term):
+        if char.isalnum() and (position == 0 or not term[position - 1].isalnum()):
+            starts.append(position)
+            if len(starts) == MAX_WORD_STARTS:
+                break
+    return starts
+
+
+class _Keys:
+    """Упорядоченные ключи снимка как последовательность строк для bisect"""
+
+    def __init__(self, terms: List[str], key_terms: np.ndarray, key_offsets: np.ndarray):
+        self.terms = terms
+        self.key_terms = key_terms
+        self.key_offsets = key_offsets
+
+    def __len__(self):
+        return len(self.key_terms)
+
+    def __getitem__(self, position: int) -> str:
+        offset = int(self.key_offsets[position])
+        return self.terms[self.key_terms[position]][offset:offset + MAX_KEY_CHARS]
+
+
+class PrefixIndex:
+    """Индекс начал строк одного вида: снимок numpy и надстройка изменений"""
+
+    def __init__(self, terms: List[str], displays: List[str], entity_offsets: np.ndarray,
+                 entity_ids: np.ndarray, entity_weights: np.ndarray, key_terms: np.ndarray,
+                 key_offsets: np.ndarray, journal_seq: int = 0):
+        # Снимок: строки (слоты), их идентификаторы с весами и упорядоченные ключи
+        self.terms = terms
+        self.displays = displays
+        self.entity_offsets = entity_offsets
+        self.entity_ids = entity_ids
+        self.entity_weights = entity_weights
+        self.key_terms = key_terms
+        self.key_offsets = key_offsets
+        self.keys = _Keys(terms, key_terms, key_offsets)
+        self.journal_seq = journal_seq
+        # Вес и число действующих идентификаторов слота без измененных после снимка
+        slot_of_entity = np.repeat(np.arange(len(terms)), np.diff(entity_offsets))
+        self.term_weights = np.bincount(slot_of_entity, weights=entity_weights, minlength=len(terms)) \
+            .astype(np.int64)
+        self.term_live = np.diff(entity_offsets).astype(np.int32)
+        self._entity_order: Optional[np.ndarray] = None
+
+        # Надстройка: строка -> {идентификатор: вес} для записей, измененных после снимка
+        self.stale_ids: Set[int] = set()
+        self.overlay_terms: Dict[str, Dict[int, int]] = {}
+        self.overlay_displays: Dict[str, str] = {}
+        self.overlay_entity_terms: Dict[int, str] = {}
+        self._short_results: Dict[Tuple[str, int], List[Suggestion]] = {}
+
+    # --- построение и сохранение ---
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, str, int]], journal_seq: int = 0) -> 'PrefixIndex':
+        """Построить снимок по тройкам (идентификатор, текст, вес)"""
+        slots: Dict[str, int] = {}
+        displays: List[str] = []
+        slot_entities: List[List[Tuple[int, int]]] = []
+        for entity_id, value, weight in rows:
+            term = normalize(value)
+            if not term:
+                continue
+            slot = slots.get(term)
+            if slot is None:
+                slot = slots[term] = len(displays)
+                displays.append(' '.join(value.split()))
+                slot_entities.append([])
+            slot_entities[slot].append((entity_id, weight))
+
+        terms = list(slots)
+        entity_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        entity_offsets[1:] = np.cumsum([len(entities) for entities in slot_entities])
+        count = int(entity_offsets[-1])
+        entity_ids = np.fromiter((entity_id for entities in slot_entities for entity_id, _ in entities),
+                                 dtype=np.int64, count=count)
+        entity_weights = np.fromiter((weight for entities in slot_entities for _, weight in entities),
+                                     dtype=np.int64, count=count)
+
+        key_terms, key_offsets = [], []
+        for slot, term in enumerate(terms):
+            for offset in word_starts(term):
+                key_terms.append(slot)
+                key_offsets.append(offset)
+        key_terms = np.array(key_terms, dtype=np.int32)
+        key_offsets = np.array(key_offsets, dtype=np.int32)
+        keys = _Keys(terms, key_terms, key_offsets)
+        order = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+
+        return cls(terms, displays, entity_offsets, entity_ids, entity_weights,
+                   key_terms[order], key_offsets[order], journal_seq)
+
+    def to_bytes(self) -> bytes:
+        """Снимок без сжатия (надстройка не сохраняется: ее восстановит журнал)"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            terms=_pack_strings(self.terms),
+            displays=_pack_strings(self.displays),
+            entity_offsets=self.entity_offsets,
+            entity_ids=self.entity_ids,
+            entity_weights=self.entity_weights,
+            key_terms=self.key_terms,
+            key_offsets=self.key_offsets,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, journal_seq: int = 0) -> 'PrefixIndex':
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(
+                _unpack_strings(arrays['terms']), _unpack_strings(arrays['displays']),
+                arrays['entity_offsets'], arrays['entity_ids'], arrays['entity_weights'],
+                arrays['key_terms'], arrays['key_offsets'], journal_seq,
+            )
+
+    def __len__(self) -> int:
+        return len(self.terms) + len(self.overlay_terms)
+
+    # --- изменения ---
+
+    def _snapshot_positions(self, entity_id: int) -> np.ndarray:
+        """Позиции идентификатора в entity_ids"""
+        if self._entity_order is None:
+            self._entity_order = np.argsort(self.entity_ids, kind='stable')
+        ordered = self.entity_ids[self._entity_order]
+        start, end = np.searchsorted(ordered, [entity_id, entity_id + 1])
+        return self._entity_order[start:end]
+
+    def apply_changes(self, changes: Dict[int, Optional[Tuple[str, int]]], journal_seq: int):
+        """Учесть новые (текст, вес) по идентификаторам (None - запись удалена)"""
+        self._short_results.clear()
+        for entity_id, value in changes.items():
+            if entity_id not in self.stale_ids:
+                self.stale_ids.add(entity_id)
+                for position in self._snapshot_positions(entity_id):
+                    slot = int(np.searchsorted(self.entity_offsets, position, side='right')) - 1
+                    self.term_live[slot] -= 1
+                    self.term_weights[slot] -= self.entity_weights[position]
+            old_term = self.overlay_entity_terms.pop(entity_id, None)
+            if old_term is not None:
+                entities = self.overlay_terms[old_term]
+                del entities[entity_id]
+                if not entities:
+                    del self.overlay_terms[old_term]
+                    del self.overlay_displays[old_term]
+
+            term = normalize(value[0]) if value is not None else ''
+            if not term:
+                continue
+            self.overlay_entity_terms[entity_id] = term
+            self.overlay_terms.setdefault(term, {})[entity_id] = value[1]
+            self.overlay_displays.setdefault(term, ' '.join(value[0].split()))
+        self.journal_seq = max(self.journal_seq, journal_seq)
+
+    # --- подсказки ---
+
+    def _snapshot_slots(self, query: str, limit: int) -> np.ndarray:
+        """Слоты снимка, начало слова которых совпадает с query; до limit * OVERSAMPLE самых популярных"""
+        key = query[:MAX_KEY_CHARS]
+        start = bisect_left(self.keys, key)
+        end = bisect_left(self.keys, key + _MAX_CHAR, start)
+        slots = self.key_terms[start:end]
+        if len(query) > MAX_KEY_CHARS:
+            offsets = self.key_offsets[start:end]
+            slots = slots[[self.terms[slot][offset:].startswith(query) for slot, offset in zip(slots, offsets)]]
+        slots = slots[self.term_live[slots] > 0]
+
+        wanted = limit * OVERSAMPLE
+        if len(slots) <= wanted:
+            return slots
+        # Самые популярные, а при равном весе - первые по алфавиту (отрезок уже упорядочен)
+        weights = self.term_weights[slots]
+        threshold = np.partition(weights, len(weights) - wanted)[len(weights) - wanted]
+        above = np.flatnonzero(weights > threshold)
+        equal = np.flatnonzero(weights == threshold)[:wanted - len(above)]
+        return slots[np.sort(np.concatenate([above, equal]))]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Suggestion]:
+        """До limit строк, слово которых начинается с prefix, по убыванию популярности"""
+        query = normalize(prefix)
+        if not query:
+            return []
+        if len(query) <= SHORT_QUERY:
+            key = (query, limit)
+            if key not in self._short_results:
+                self._short_results[key] = self._suggest(query, limit)
+            return list(self._short_results[key])
+        return self._suggest(query, limit)
+
+    def _suggest(self, query: str, limit: int) -> List[Suggestion]:
+        weights: Dict[str, int] = {}
+        displays: Dict[str, str] = {}
+        for slot in self._snapshot_slots(query, limit):
+            term = self.terms[slot]
+            if term not in weights:
+                weights[term] = int(self.term_weights[slot])
+                displays[term] = self.displays[slot]
+
+        for term, entities in self.overlay_terms.items():
+            if not any(term.startswith(query, offset) for offset in word_starts(term)):
+                continue
+            weights[term] = weights.get(term, 0) + sum(entities.values())
+            displays.setdefault(term, self.overlay_displays[term])
+
+        ranked = sorted(weights, key=lambda term: (-weights[term], displays[term]))
+        return [Suggestion(displays[term], weights[term]) for term in ranked[:limit]]
+
+
+# --- популярность ---
+
+_ITEMS = OrderItem.__table__
+_PUBLICATIONS = Publication.__table__
+
+# Вид -> (колонка идентификатора, откуда брать проданные экземпляры)
+_SALES = {
+    'title': (_ITEMS.c.publication_id, _ITEMS),
+    'author': (publication_authors.c.author_id,
+               publication_authors.join(_ITEMS, _ITEMS.c.publication_id == publication_authors.c.publication_id)),
+    'publisher': (_PUBLICATIONS.c.publisher_id,
+                  _PUBLICATIONS.join(_ITEMS, _ITEMS.c.publication_id == _PUBLICATIONS.c.id)),
+    'genre': (publication_genres.c.genre_id,
+              publication_genres.join(_ITEMS, _ITEMS.c.publication_id == publication_genres.c.publication_id)),
+}
+
+
+def popularity(connection: Connection, kind: str, ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Число проданных экземпляров по идентификаторам вида kind"""
+    key, source = _SALES[kind]
+    query = select(key, func.sum(_ITEMS.c.quantity)).select_from(source).group_by(key)
+    if ids is not None:
+        query = query.where(key.in_(list(ids)))
+    return {entity_id: int(total or 0) for entity_id, total in connection.execute(query) if entity_id is not None}
+
+
+class Autocomplete:
+    """Индексы всех видов для одной базы: загрузка, синхронизация с журналом, подсказки"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._indexes: Dict[str, PrefixIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, kind: str) -> PrefixIndex:
+        """Актуальный индекс вида kind: загрузить или построить, затем применить журнал"""
+        if kind not in KINDS:
+            raise ValueError(f"Неизвестный вид индекса: {kind}")
+        with self._lock:
+            with self.engine.connect() as connection:
+                index = self._indexes.get(kind)
+                stored_seq = connection.execute(
+                    select(autocomplete_index.c.journal_seq).where(autocomplete_index.c.kind == kind)
+                ).scalar()
+                if stored_seq is None:
+                    index = None
+                elif index is None or stored_seq > index.journal_seq:
+                    # Снимок в базе новее: журнал до него мог быть очищен
+                    index = self._load(connection, kind)
+            if index is None:
+                index = self.rebuild(kind)[kind]
+            self._sync(index, kind)
+            self._indexes[kind] = index
+            return index
+
+    def suggest(self, kind: str, prefix: str, limit: int = 10) -> List[Suggestion]:
+        """Популярные названия (title), авторы, издательства или жанры, начинающиеся с prefix"""
+        return self.index(kind).suggest(prefix, limit)
+
+    def _load(self, connection: Connection, kind: str) -> PrefixIndex:
+        row = connection.execute(
+            select(autocomplete_index.c.data, autocomplete_index.c.journal_seq)
+            .where(autocomplete_index.c.kind == kind)
+        ).one()
+        return PrefixIndex.from_bytes(row.data, row.journal_seq)
+
+    def _sync(self, index: PrefixIndex, kind: str):
+        """Применить записи журнала, появившиеся после снимка"""
+        column = KINDS[kind]
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(autocomplete_journal.c.seq, autocomplete_journal.c.entity_id)
+                .where(autocomplete_journal.c.seq > index.journal_seq, autocomplete_journal.c.kind == kind)
+            ).all()
+            if not rows:
+                return
+            changed = {row.entity_id for row in rows}
+            current = dict(connection.execute(
+                select(column.table.c.id, column).where(column.table.c.id.in_(changed))
+            ).all())
+            weights = popularity(connection, kind, current)
+        index.apply_changes(
+            {entity_id: (current[entity_id], weights.get(entity_id, 0)) if current.get(entity_id) else None
+             for entity_id in changed},
+            max(row.seq for row in rows))
+
+    def rebuild(self, kind: Optional[str] = None) -> Dict[str, PrefixIndex]:
+        """Построить снимки заново по таблицам и сохранить их в базе"""
+        built = {}
+        for name in ([kind] if kind else list(KINDS)):
+            column = KINDS[name]
+            with self.engine.begin() as connection:
+                # Записи журнала до этой отметки уже отражены в читаемых строках
+                journal_seq = connection.execute(select(func.max(autocomplete_journal.c.seq))).scalar() or 0
+                weights = popularity(connection, name)
+                rows = connection.execute(select(column.table.c.id, column)).yield_per(50000)
+                index = PrefixIndex.build(((row[0], row[1], weights.get(row[0], 0)) for row in rows), journal_seq)
+                connection.execute(delete(autocomplete_index).where(autocomplete_index.c.kind == name))
+                connection.execute(insert(autocomplete_index).values(
+                    kind=name, built_at=datetime.now(), journal_seq=journal_seq, data=index.to_bytes()
+                ))
+            self._indexes[name] = built[name] = index
+        self._trim_journal()
+        return built
+
+    def _trim_journal(self):
+        """Удалить записи журнала, учтенные во всех сохраненных снимках"""
+        with self.engine.begin() as connection:
+            seqs = connection.execute(select(autocomplete_index.c.kind, autocomplete_index.c.journal_seq)).all()
+            if {row.kind for row in seqs} >= set(KINDS):
+                oldest = min(row.journal_seq for row in seqs)
+                connection.execute(delete(autocomplete_journal).where(autocomplete_journal.c.seq <= oldest))
+
+
+# --- журнал изменений ---
+
+def _journal_triggers(table: str, column: str, kind: str) -> Dict[str, str]:
+    journal = autocomplete_journal.name
+    return {
+        f'{table}_autocomplete_ai': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_autocomplete_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {journal} (kind, entity_id) VALUES ('{kind}', NEW.id);
+            END""",
+        f'{table}_autocomplete_au': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_autocomplete_au AFTER UPDATE OF {column} ON {table} BEGIN
+            INSERT INTO {journal} (kind, entity_id) VALUES ('{kind}', NEW.id);
+            END""",
+        f'{table}_autocomplete_ad': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_autocomplete_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {journal} (kind, entity_id) VALUES ('{kind}', OLD.id);
+            END""",
+    }
+
+
+JOURNAL_TRIGGERS: Dict[str, str] = {}
+for _kind, _column in KINDS.items():
+    JOURNAL_TRIGGERS.update(_journal_triggers(_column.table.name, _column.name, _kind))
+
+
+def ensure_journal_triggers(engine: Engine) -> List[str]:
+    """Создать триггеры журнала (только SQLite; для других СУБД снимки перестраиваются командой rebuild)"""
+    if engine.dialect.name != 'sqlite':
+        return []
+    with engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        for ddl in JOURNAL_TRIGGERS.values():
+            connection.exec_driver_sql(ddl)
+    return [name for name in JOURNAL_TRIGGERS if name not in existing]
+
+
+def main():
+    from models.database_models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Автодополнение названий, авторов, издательств и жанров')
+    parser.add_argument('command', choices=['rebuild', 'suggest'])
+    parser.add_argument('--kind', choices=sorted(KINDS), default=None)
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.database_url)
+    if args.command == 'rebuild':
+        for kind, index in db_manager.autocomplete.rebuild(args.kind).items():
+            print(f"{kind}: различных строк {len(index)}, ключей {len(index.key_terms)}")
+        return 0
+
+    for suggestion in db_manager.autocomplete.suggest(args.kind or 'title', args.prefix):
+        print(f"{suggestion.weight:8d}  {suggestion.text}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
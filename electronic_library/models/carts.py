@@ -0,0 +1,286 @@
+"""Корзины покупателей в базе с резервом экземпляров на время
+
+Прежняя корзина - список в памяти процесса приложения: она терялась при
+выходе из аккаунта и перезапуске, а остаток проверялся только при
+добавлении, поэтому к оформлению экземпляры могли закончиться. Теперь
+позиции хранятся в таблице cart_items, а добавление в одной транзакции
+списывает экземпляры с остатка условным UPDATE (как при оформлении, см.
+models/checkout.py) и записывает их в reserved позиции со сроком
+expires_at = сейчас + ttl_s. stock_quantity издания остается числом
+экземпляров, доступных другим покупателям. Добавление продлевает резерв
+всех позиций корзины: покупатель активен.
+
+При оформлении зарезервированные экземпляры уже списаны; остаток
+списывается только для позиций, резерв которых истек или неполон. Заказ
+создается и корзина удаляется в той же транзакции.
+
+Истекшие резервы возвращает на склад очистка (sweep): блоками по
+batch_size позиций с наименьшим expires_at,
+
+    SELECT ... FROM cart_items WHERE expires_at <= :now ORDER BY expires_at LIMIT :n
+
+каждый блок - одна транзакция: резерв позиции обнуляется (сама позиция
+остается в корзине), экземпляры прибавляются к остаткам изданий. Запрос
+читает только начало индекса ix_cart_items_expires, поэтому стоимость
+очистки зависит от числа истекших позиций, а не от числа корзин. Позиции
+без резерва имеют expires_at = NULL и в выборку не попадают.
+
+Очистку выполняет фоновый поток приложения (CartSweeper, раз в
+Config.CART_SWEEP_INTERVAL_S секунд) или отдельный процесс:
+
+    python -m models.carts sweep --loop
+
+Несколько очисток одновременно не мешают друг другу: в PostgreSQL строки
+блока берутся с SKIP LOCKED, в SQLite запись сериализуется блокировкой
+базы. Стоимость очистки на миллионах позиций: benchmarks/cart_sweep_benchmark.py.
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+from config import Config
+from models.checkout import new_order, stock_release, take_stock
+from models.database_models import Order, Publication, cart_items
+
+
+def _release(session: Session, reserved: Iterable[Tuple[int, int]]) -> List[int]:
+    """Вернуть на склад резервы (id издания, экземпляров); возвращает id изданий"""
+    released = Counter()
+    for publication_id, quantity in reserved:
+        released[publication_id] += quantity
+    # Одним executemany по возрастанию id изданий, как списание при оформлении
+    parameters = [{'publication_id': publication_id, 'quantity': quantity}
+                  for publication_id, quantity in sorted(released.items()) if quantity]
+    if parameters:
+        session.execute(stock_release(), parameters)
+    return sorted(released)
+
+
+class CartService:
+    """Корзины покупателей с резервом экземпляров (см. описание модуля)"""
+
+    def __init__(self, db_manager, ttl_s: Optional[int] = None):
+        self.db_manager = db_manager
+        self.engine = db_manager.engine
+        self.ttl_s = ttl_s if ttl_s is not None else Config.CART_RESERVATION_TTL_S
+        self._sweeper = None
+
+    def _key(self, user_id: int, publication_id: int) -> list:
+        return [cart_items.c.user_id == user_id, cart_items.c.publication_id == publication_id]
+
+    def items(self, user_id: int) -> List[Dict]:
+        """Позиции корзины в порядке добавления
+
+        Ключи: publication_id, title, quantity, reserved, unit_price, expires_at.
+        """
+        publications = Publication.__table__
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(cart_items.c.publication_id, publications.c.title, cart_items.c.quantity,
+                       cart_items.c.reserved, cart_items.c.unit_price, cart_items.c.expires_at)
+                .join_from(cart_items, publications, publications.c.id == cart_items.c.publication_id)
+                .where(cart_items.c.user_id == user_id)
+                .order_by(cart_items.c.added_at, cart_items.c.publication_id)
+            ).all()
+        return [row._asdict() for row in rows]
+
+    def add(self, user_id: int, publication_id: int, quantity: int, unit_price: float) -> datetime:
+        """Добавить экземпляры в корзину и зарезервировать их; возвращает срок резерва
+
+        При нехватке экземпляров выбрасывается InsufficientStock, корзина не меняется.
+        """
+        if quantity <= 0:
+            raise ValueError(f"Неверное количество для издания {publication_id}: {quantity}")
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.ttl_s)
+
+        def operation(session: Session):
+            # Списание - первый оператор транзакции, как при оформлении заказа
+            take_stock(session, {publication_id: quantity})
+            session.execute(update(cart_items).where(cart_items.c.user_id == user_id, cart_items.c.reserved > 0)
+                            .values(expires_at=expires_at))
+            updated = session.execute(update(cart_items).where(*self._key(user_id, publication_id)).values(
+                quantity=cart_items.c.quantity + quantity, reserved=cart_items.c.reserved + quantity,
+                unit_price=unit_price, expires_at=expires_at
+            )).rowcount
+            if not updated:
+                session.execute(insert(cart_items).values(
+                    user_id=user_id, publication_id=publication_id, quantity=quantity, reserved=quantity,
+                    unit_price=unit_price, added_at=now, expires_at=expires_at
+                ))
+
+        try:
+            self.db_manager.run_in_transaction(operation)
+        finally:
+            self.db_manager.catalog_cache.invalidate([publication_id])
+        return expires_at
+
+    def remove(self, user_id: int, publication_id: int) -> bool:
+        """Удалить позицию и вернуть ее резерв на склад; False - позиции нет"""
+        def operation(session: Session) -> bool:
+            reserved = session.execute(
+                select(cart_items.c.reserved).where(*self._key(user_id, publication_id)).with_for_update()
+            ).scalar()
+            if reserved is None:
+                return False
+            session.execute(delete(cart_items).where(*self._key(user_id, publication_id)))
+            _release(session, [(publication_id, reserved)])
+            return True
+
+        removed = self.db_manager.run_in_transaction(operation)
+        if removed:
+            self.db_manager.catalog_cache.invalidate([publication_id])
+        return removed
+
+    def clear(self, user_id: int) -> int:
+        """Очистить корзину и вернуть резервы на склад; возвращает число удаленных позиций"""
+        def operation(session: Session) -> List[int]:
+            rows = session.execute(
+                select(cart_items.c.publication_id, cart_items.c.reserved)
+                .where(cart_items.c.user_id == user_id).with_for_update()
+            ).all()
+            session.execute(delete(cart_items).where(cart_items.c.user_id == user_id))
+            return _release(session, rows)
+
+        publication_ids = self.db_manager.run_in_transaction(operation)
+        self.db_manager.catalog_cache.invalidate(publication_ids)
+        return len(publication_ids)
+
+    def place(self, session: Session, user_id: int, order_number: str, payment_method: Optional[str] = None,
+              shipping_address: Optional[str] = None) -> Order:
+        """Создать заказ из корзины и удалить ее в текущей транзакции session
+
+        Если резерв части позиций истек и экземпляров уже не хватает,
+        выбрасывается InsufficientStock, корзина и резервы не меняются.
+        """
+        rows = session.execute(
+            select(cart_items.c.publication_id, cart_items.c.quantity, cart_items.c.reserved,
+                   cart_items.c.unit_price)
+            .where(cart_items.c.user_id == user_id)
+            .order_by(cart_items.c.publication_id).with_for_update()
+        ).all()
+        if not rows:
+            raise ValueError("Корзина пуста")
+        take_stock(session, {row.publication_id: row.quantity - row.reserved
+                             for row in rows if row.quantity > row.reserved})
+        order = new_order(order_number, user_id, [row._asdict() for row in rows], payment_method, shipping_address)
+        session.add(order)
+        session.execute(delete(cart_items).where(cart_items.c.user_id == user_id))
+        return order
+
+    def checkout(self, user_id: int, payment_method: Optional[str] = None,
+                 shipping_address: Optional[str] = None) -> Tuple[int, str]:
+        """Оформить заказ из корзины в отдельной транзакции; возвращает (id, номер) заказа"""
+        order_number = self.db_manager.order_numbers.next_number()
+        touched: List[int] = []
+
+        def operation(session: Session) -> Tuple[int, str]:
+            order = self.place(session, user_id, order_number, payment_method, shipping_address)
+            touched[:] = [item.publication_id for item in order.items]
+            session.flush()
+            return order.id, order.order_number
+
+        try:
+            return self.db_manager.run_in_transaction(operation)
+        finally:
+            self.db_manager.catalog_cache.invalidate(touched)
+
+    def _sweep_batch(self, session: Session, now: datetime, batch_size: int) -> Tuple[int, List[int]]:
+        """Вернуть на склад один блок истекших резервов; возвращает (позиций, id изданий)"""
+        rows = session.execute(
+            select(cart_items.c.user_id, cart_items.c.publication_id, cart_items.c.reserved)
+            .where(cart_items.c.expires_at <= now)
+            .order_by(cart_items.c.expires_at).limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return 0, []
+        session.execute(
+            update(cart_items).where(cart_items.c.user_id == bindparam('key_user'),
+                                     cart_items.c.publication_id == bindparam('key_publication'))
+            .values(reserved=0, expires_at=None),
+            [{'key_user': row.user_id, 'key_publication': row.publication_id} for row in rows]
+        )
+        return len(rows), _release(session, [(row.publication_id, row.reserved) for row in rows])
+
+    def sweep(self, batch_size: Optional[int] = None, now: Optional[datetime] = None) -> int:
+        """Вернуть на склад все резервы, истекшие к now; возвращает число позиций"""
+        batch_size = batch_size or Config.CART_SWEEP_BATCH
+        now = now or datetime.now()
+        swept = 0
+        touched: Set[int] = set()
+        while True:
+            count, publication_ids = self.db_manager.run_in_transaction(
+                lambda session: self._sweep_batch(session, now, batch_size))
+            swept += count
+            touched.update(publication_ids)
+            if count < batch_size:
+                break
+        if touched:
+            self.db_manager.catalog_cache.invalidate(touched)
+        return swept
+
+    def start_sweeper(self, interval_s: Optional[int] = None) -> Optional['CartSweeper']:
+        """Запустить фоновую очистку в этом процессе (не больше одной); 0 секунд - не запускать"""
+        interval_s = interval_s if interval_s is not None else Config.CART_SWEEP_INTERVAL_S
+        if interval_s <= 0:
+            return None
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._sweeper = CartSweeper(self, interval_s)
+            self._sweeper.start()
+        return self._sweeper
+
+
+class CartSweeper(threading.Thread):
+    """Фоновый поток: очистка истекших резервов раз в interval_s секунд"""
+
+    def __init__(self, carts: CartService, interval_s: float):
+        super().__init__(name='cart-sweeper', daemon=True)
+        self.carts = carts
+        self.interval_s = interval_s
+        self.swept = 0
+        self.last_error: Optional[Exception] = None
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval_s):
+            try:
+                self.swept += self.carts.sweep()
+                self.last_error = None
+            except Exception as e:
+                # Поток не должен мешать работе приложения; следующий проход повторит очистку
+                self.last_error = e
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopped.set()
+        self.join(timeout)
+
+
+def main():
+    from models.database_models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Корзины: возврат истекших резервов на склад')
+    parser.add_argument('command', choices=['sweep'])
+    parser.add_argument('--loop', action='store_true', help='повторять раз в CART_SWEEP_INTERVAL_S секунд')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    carts = DatabaseManager(args.database_url).carts
+    while True:
+        started = time.perf_counter()
+        swept = carts.sweep(args.batch_size)
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} возвращено резервов: {swept} "
+              f"({(time.perf_counter() - started) * 1000:.0f} мс)")
+        if not args.loop:
+            return 0
+        time.sleep(max(Config.CART_SWEEP_INTERVAL_S, 1))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""Кэш представлений изданий для каталога и карточки издания
+
+Представление (PublicationView) - неизменяемый снимок строки издания вместе с
+именами авторов, жанрами, издательством и сводкой отзывов, то есть все, что
+показывают каталог, карточка издания и Publication.to_dict. Представления не связаны с
+сессией, поэтому переживают действие меню и могут отдаваться любым
+читателям.
+
+Размер кэша ограничен числом записей и примерным объемом памяти: при
+превышении вытесняются давно не запрошенные записи (LRU). Запись старше
+ttl_s секунд считается устаревшей и перечитывается из базы.
+
+Записи сбрасываются точно по идентификаторам изданий: обработчик after_flush
+сессий DatabaseManager собирает измененные, добавленные и удаленные издания
+(включая смену авторов, жанров и остатка при оформлении заказа), издания
+с новыми, измененными и удаленными отзывами, а также издания переименованных
+авторов, жанров и издательств. После фиксации или отката транзакции эти
+записи сбрасываются повторно - так в кэше не остается данных, прочитанных
+внутри незафиксированной транзакции. Запись из базы,
+начавшаяся до сброса, в кэш не попадает (см. CatalogCache.generation).
+
+Изменения, минующие сессии DatabaseManager (UPDATE через Core, другие
+процессы, асинхронный слой), кэш не видит: такие места вызывают invalidate()
+сами, иначе данные обновятся не позже чем через ttl_s секунд.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from config import Config
+from models.database_models import Author, Genre, Publication, Publisher, Review, publication_authors, \
+    publication_genres
+
+# Число идентификаторов в одном запросе IN при загрузке промахов
+LOAD_CHUNK = 500
+
+# Ключ session.info, по которому сессия находит кэш
+SESSION_INFO_KEY = 'catalog_cache'
+_PENDING_KEY = 'catalog_cache_pending'
+
+
+class PublicationView(NamedTuple):
+    """Неизменяемое представление издания"""
+    id: int
+    title: str
+    description: Optional[str]
+    isbn: Optional[str]
+    publication_year: Optional[int]
+    price: float
+    stock_quantity: int
+    language: Optional[str]
+    pages: Optional[int]
+    authors: Tuple[str, ...]
+    genres: Tuple[str, ...]
+    publisher: Optional[str]
+    reviews_count: int
+    rating_sum: int
+    # Число отзывов с оценками 1-5
+    rating_histogram: Tuple[int, ...]
+
+    @property
+    def average_rating(self) -> float:
+        return self.rating_sum / self.reviews_count if self.reviews_count else 0.0
+
+    def to_dict(self) -> dict:
+        """То же, что Publication.to_dict"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'isbn': self.isbn,
+            'publication_year': self.publication_year,
+            'price': self.price,
+            'stock_quantity': self.stock_quantity,
+            'language': self.language,
+            'authors': list(self.authors),
+            'genres': list(self.genres),
+            'publisher': self.publisher
+        }
+
+    def size_bytes(self) -> int:
+        """Примерный объем в памяти вместе со строками и кортежами"""
+        size = sys.getsizeof(self) + sum(sys.getsizeof(value) for value in self)
+        return size + sum(sys.getsizeof(value) for value in self.authors + self.genres + self.rating_histogram)
+
+
+def load_views(session: Session, ids: Sequence[int]) -> Dict[int, PublicationView]:
+    """Прочитать представления из базы тремя запросами на каждые LOAD_CHUNK изданий
+
+    Читаются только колонки, без объектов ORM, поэтому карта идентичности
+    сессии не растет. Отсутствующие в базе идентификаторы пропускаются.
+    """
+    publications = Publication.__table__
+    views = {}
+    for start in range(0, len(ids), LOAD_CHUNK):
+        chunk = list(ids[start:start + LOAD_CHUNK])
+        authors: Dict[int, List[str]] = {}
+        for publication_id, name in session.execute(
+                select(publication_authors.c.publication_id, Author.full_name)
+                .join(Author, Author.id == publication_authors.c.author_id)
+                .where(publication_authors.c.publication_id.in_(chunk))
+                .order_by(publication_authors.c.publication_id, Author.id)):
+            authors.setdefault(publication_id, []).append(name)
+        genres: Dict[int, List[str]] = {}
+        for publication_id, name in session.execute(
+                select(publication_genres.c.publication_id, Genre.name)
+                .join(Genre, Genre.id == publication_genres.c.genre_id)
+                .where(publication_genres.c.publication_id.in_(chunk))
+                .order_by(publication_genres.c.publication_id, Genre.id)):
+            genres.setdefault(publication_id, []).append(name)
+        rows = session.execute(
+            select(publications.c.id, publications.c.title, publications.c.description, publications.c.isbn,
+                   publications.c.publication_year, publications.c.price, publications.c.stock_quantity,
+                   publications.c.language, publications.c.pages, Publisher.name,
+                   publications.c.reviews_count, publications.c.rating_sum,
+                   *[publications.c[f'rating_count_{rating}'] for rating in range(1, 6)])
+            .outerjoin(Publisher, Publisher.id == publications.c.publisher_id)
+            .where(publications.c.id.in_(chunk)))
+        for row in rows:
+            views[row[0]] = PublicationView(
+                *row[:9], tuple(authors.get(row[0], ())), tuple(genres.get(row[0], ())), row[9],
+                row[10], row[11], tuple(row[12:17]))
+    return views
+
+
+class CatalogCache:
+    """Ограниченный по размеру кэш PublicationView с вытеснением LRU и сроком жизни"""
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl_s: float = None):
+        self.max_entries = Config.CATALOG_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = Config.CATALOG_CACHE_MAX_MB * 2 ** 20 if max_bytes is None else max_bytes
+        self.ttl_s = Config.CATALOG_CACHE_TTL_S if ttl_s is None else ttl_s
+        self._lock = threading.Lock()
+        # id -> (представление, время загрузки, размер)
+        self._entries: 'OrderedDict[int, Tuple[PublicationView, float, int]]' = OrderedDict()
+        self._bytes = 0
+        # Увеличивается при каждом сбросе; загрузка, за время которой были
+        # сбросы, не сохраняется в кэш
+        self.generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- чтение ---
+
+    def get(self, session: Session, publication_id: int) -> Optional[PublicationView]:
+        return self.get_many(session, [publication_id]).get(publication_id)
+
+    def get_many(self, session: Session, ids: Iterable[int], populate: bool = True) -> Dict[int, PublicationView]:
+        """Представления изданий ids; промахи читаются из базы одним пакетом
+
+        populate=False - не сохранять прочитанное (массовый просмотр всего
+        каталога вытеснил бы из кэша часто запрашиваемые издания).
+        """
+        ids = list(dict.fromkeys(ids))
+        found: Dict[int, PublicationView] = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for publication_id in ids:
+                entry = self._entries.get(publication_id)
+                if entry is not None and now - entry[1] > self.ttl_s:
+                    self._remove(publication_id)
+                    self._stats['expired'] += 1
+                    entry = None
+                if entry is None:
+                    missing.append(publication_id)
+                    continue
+                self._entries.move_to_end(publication_id)
+                found[publication_id] = entry[0]
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(missing)
+            generation = self.generation
+
+        if missing:
+            loaded = load_views(session, missing)
+            found.update(loaded)
+            if populate and self.enabled:
+                self._put(loaded, generation)
+        return found
+
+    def _put(self, views: Dict[int, PublicationView], generation: int):
+        now = time.monotonic()
+        with self._lock:
+            if generation != self.generation:
+                return  # Пока читали, часть изданий изменилась
+            for publication_id, view in views.items():
+                self._remove(publication_id)
+                size = view.size_bytes()
+                self._entries[publication_id] = (view, now, size)
+                self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, size) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._stats['evictions'] += 1
+
+    def _remove(self, publication_id: int) -> bool:
+        entry = self._entries.pop(publication_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        return True
+
+    # --- сброс ---
+
+    def invalidate(self, ids: Iterable[int]) -> int:
+        """Сбросить записи изданий ids; возвращает число сброшенных записей"""
+        with self._lock:
+            self.generation += 1
+            removed = sum(self._remove(publication_id) for publication_id in ids)
+            self._stats['invalidations'] += removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Попадания, промахи, вытеснения, сбросы и текущий размер"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / requests if requests else 0.0
+        return stats
+
+    # --- связь с сессиями ---
+
+    def install(self, session_factory):
+        """Подключить сброс записей к сессиям session_factory (sessionmaker)"""
+        session_factory.kw.setdefault('info', {})[SESSION_INFO_KEY] = self
+        event.listen(session_factory, 'after_flush', self._after_flush)
+        event.listen(session_factory, 'after_commit', self._after_transaction)
+        event.listen(session_factory, 'after_rollback', self._after_transaction)
+
+    def _after_flush(self, session: Session, flush_context):
+        ids = changed_publication_ids(session)
+        if ids is None:
+            self.clear()
+            return
+        if ids:
+            self.invalidate(ids)
+            session.info.setdefault(_PENDING_KEY, set()).update(ids)
+
+    def _after_transaction(self, session: Session):
+        pending = session.info.pop(_PENDING_KEY, None)
+        if pending:
+            self.invalidate(pending)
+
+
+def changed_publication_ids(session: Session) -> Optional[Set[int]]:
+    """Издания, представления которых меняет текущий flush; None - затронут весь каталог
+
+    Вызывается из after_flush: session.new, dirty и deleted еще содержат
+    объекты этого flush, а связи уже записаны в базу.
+    """
+    ids: Set[int] = set()
+    renamed = {Author: set(), Genre: set(), Publisher: set()}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Review):
+            state = inspect(obj)
+            history = state.attrs.publication_id.history
+            ids.update(value for value in (state.dict.get('publication_id'),) + tuple(history.deleted)
+                       if value is not None)
+        elif isinstance(obj, Publication):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            identity = inspect(obj).identity
+            if identity:
+                ids.add(identity[0])
+        elif type(obj) in renamed and obj not in session.new:
+            if obj in session.deleted:
+                return None  # Связи удаленной записи уже стерты, изданий не найти
+            state = inspect(obj)
+            name = state.attrs.full_name if isinstance(obj, Author) else state.attrs.name
+            if name.history.has_changes():
+                renamed[type(obj)].add(state.identity[0])
+
+    connection = session.connection()
+    if renamed[Author]:
+        ids.update(connection.execute(select(publication_authors.c.publication_id)
+                                      .where(publication_authors.c.author_id.in_(renamed[Author]))).scalars())
+    if renamed[Genre]:
+        ids.update(connection.execute(select(publication_genres.c.publication_id)
+                                      .where(publication_genres.c.genre_id.in_(renamed[Genre]))).scalars())
+    if renamed[Publisher]:
+        ids.update(connection.execute(select(Publication.__table__.c.id)
+                                      .where(Publication.__table__.c.publisher_id.in_(renamed[Publisher])))
+                   .scalars())
+    return ids
+
+
+def publication_views(session: Session, ids: Sequence[int], populate: bool = True) -> List[PublicationView]:
+    """Представления изданий ids в том же порядке, через кэш сессии, если он есть
+
+    Сессии баз отчетов (снимок, реплика) кэша не имеют и читают свою базу
+    напрямую: данные основной базы в отчет не подмешиваются.
+    """
+    cache: Optional[CatalogCache] = session.info.get(SESSION_INFO_KEY)
+    views = cache.get_many(session, ids, populate) if cache is not None else load_views(session, list(ids))
+    return [views[publication_id] for publication_id in ids if publication_id in views]
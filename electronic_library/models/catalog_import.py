@@ -0,0 +1,339 @@
+"""Пакетный импорт каталога из CSV и JSON
+
+Формат записи - тот же, что у JSONExporter.export_publications: title, isbn,
+publication_year, price, stock_quantity, language, authors, genres, publisher
+и необязательные description и pages; id, reviews_count и average_rating
+выгрузки не импортируются. JSON читается потоково - массивом выгрузки или по
+объекту в строке (JSON Lines), CSV - с теми же колонками, авторы и жанры
+перечисляются через «;». Файл не загружается в память целиком.
+
+Записи обрабатываются пакетами по batch_size, каждый пакет - одна транзакция:
+- имена авторов, жанров и издательств переводятся в id по словарям в памяти,
+  которые заполняются одним запросом на таблицу при старте; новые имена
+  вставляются одним executemany на таблицу и пакет;
+- ISBN, уже имеющиеся в базе (один запрос по уникальному индексу на пакет)
+  или встретившиеся в файле раньше, пропускаются, поэтому повторный запуск
+  после сбоя продолжает импорт без дублей;
+- издания и связи с авторами и жанрами вставляются через Core executemany.
+
+Полнотекстовый индекс, фасеты, версии таблиц для кэша поиска и журналы
+нечеткого индекса, автодополнения и похожести по содержанию обновляют
+триггеры SQLite. Существующие издания не меняются, поэтому кэш каталога
+сбрасывать не нужно. После загрузки больше REBUILD_THRESHOLD изданий снимки
+нечеткого индекса, автодополнения и похожести перестраиваются: применять к
+ним журнал из миллиона записей дольше, чем построить заново.
+
+Запуск из каталога electronic_library:
+    python -m models.catalog_import exports/publications.json
+    python -m models.catalog_import feed.csv --batch-size 10000 --no-rebuild
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Connection
+from models.database_models import DatabaseManager, Author, Genre, Publisher, Publication, \
+    publication_authors, publication_genres
+from models.engine_profile import run_with_retry
+
+# Разделитель авторов и жанров в колонках CSV
+LIST_SEPARATOR = ';'
+# Размер блока при потоковом чтении JSON, символов
+READ_CHUNK = 1 << 20
+# Наибольший размер одного объекта JSON: дальше файл считается испорченным
+MAX_RECORD_CHARS = 16 * READ_CHUNK
+# Сколько сообщений об ошибочных записях сохранять
+MAX_ERRORS = 100
+# Начиная с этого числа новых изданий снимки нечеткого индекса и автодополнения перестраиваются
+REBUILD_THRESHOLD = 10000
+
+_JSON_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def iter_json_records(stream) -> Iterator[dict]:
+    """Объекты из JSON-массива или JSON Lines по одному, без чтения файла целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        position = _JSON_SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof or len(buffer) - position > MAX_RECORD_CHARS:
+                    raise
+            else:
+                if not isinstance(record, dict):
+                    raise ValueError(f"Ожидался объект издания, получено: {type(record).__name__}")
+                yield record
+                continue
+        elif eof:
+            return
+        # Объект не поместился в буфер: дочитать следующий блок
+        chunk = stream.read(READ_CHUNK)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_csv_records(stream) -> Iterator[dict]:
+    for row in csv.DictReader(stream):
+        yield {key: value for key, value in row.items() if key is not None}
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """Записи файла выгрузки: формат определяется по расширению"""
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            yield from iter_csv_records(stream)
+    else:
+        with open(path, encoding='utf-8-sig') as stream:
+            yield from iter_json_records(stream)
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = ' '.join(str(value).split())
+    return value or None
+
+
+def _number(value, cast, field: str, required: bool = False):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ValueError(f"не заполнено поле {field}")
+        return None
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"поле {field} должно быть числом: {value!r}")
+
+
+def _names(value) -> List[str]:
+    """Список имен из списка JSON или строки CSV; повторы убираются с сохранением порядка"""
+    if value is None:
+        return []
+    items = value if isinstance(value, list) else str(value).split(LIST_SEPARATOR)
+    return list(dict.fromkeys(name for name in map(_text, items) if name))
+
+
+def parse_record(record: dict) -> dict:
+    """Строка для вставки в publications и имена связанных записей; ValueError - запись ошибочна"""
+    title = _text(record.get('title'))
+    if not title:
+        raise ValueError("не заполнено поле title")
+    price = _number(record.get('price'), float, 'price', required=True)
+    if price < 0:
+        raise ValueError(f"отрицательная цена: {price}")
+    stock_quantity = _number(record.get('stock_quantity'), int, 'stock_quantity') or 0
+    if stock_quantity < 0:
+        raise ValueError(f"отрицательный остаток: {stock_quantity}")
+    return {
+        'title': title,
+        'description': record.get('description') or None,
+        'isbn': _text(record.get('isbn')),
+        'publication_year': _number(record.get('publication_year'), int, 'publication_year'),
+        'price': price,
+        'stock_quantity': stock_quantity,
+        'pages': _number(record.get('pages'), int, 'pages'),
+        'language': _text(record.get('language')) or 'Русский',
+        'authors': _names(record.get('authors')),
+        'genres': _names(record.get('genres')),
+        'publisher': _text(record.get('publisher')),
+    }
+
+
+class CatalogImporter:
+    """Потоковый импорт изданий пакетами через Core"""
+
+    def __init__(self, db_manager: DatabaseManager, batch_size: int = 5000):
+        self.db_manager = db_manager
+        self.engine = db_manager.engine
+        self.batch_size = batch_size
+        self.counts: Dict[str, int] = {}
+        self.errors: List[str] = []
+        # Имя -> id; авторы и издательства не уникальны по имени, берется меньший id
+        self.author_ids: Dict[str, int] = {}
+        self.genre_ids: Dict[str, int] = {}
+        self.publisher_ids: Dict[str, int] = {}
+
+    def import_file(self, path: str, progress: bool = False, rebuild_indexes: Optional[bool] = None) -> Dict[str, int]:
+        """Импортировать файл; возвращает счетчики (records, inserted, duplicates, invalid, ...)"""
+        return self.import_records(iter_records(path), progress, rebuild_indexes)
+
+    def import_records(self, records: Iterable[dict], progress: bool = False,
+                       rebuild_indexes: Optional[bool] = None) -> Dict[str, int]:
+        self.counts = {'records': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0,
+                       'authors': 0, 'genres': 0, 'publishers': 0}
+        self.errors = []
+        self._load_names()
+
+        started = time.perf_counter()
+        numbered = enumerate(records, start=1)
+        while True:
+            batch = list(itertools.islice(numbered, self.batch_size))
+            if not batch:
+                break
+            self.counts['records'] += len(batch)
+            rows = self._parse_batch(batch)
+            if rows:
+                run_with_retry(lambda: self._write_batch(rows))
+            if progress:
+                elapsed = time.perf_counter() - started
+                print(f"  записей: {self.counts['records']}, добавлено: {self.counts['inserted']} "
+                      f"({self.counts['records'] / elapsed if elapsed else 0:.0f} записей/с)", end='\r')
+        if progress and self.counts['records']:
+            print()
+        self.counts['elapsed_ms'] = int((time.perf_counter() - started) * 1000)
+
+        if rebuild_indexes is None:
+            rebuild_indexes = self.counts['inserted'] >= REBUILD_THRESHOLD
+        if rebuild_indexes and self.counts['inserted']:
+            started = time.perf_counter()
+            self.db_manager.fuzzy.rebuild()
+            self.db_manager.autocomplete.rebuild()
+            self.db_manager.content_similarity.rebuild()
+            self.counts['rebuild_ms'] = int((time.perf_counter() - started) * 1000)
+        return dict(self.counts)
+
+    # --- служебные методы ---
+
+    def _load_names(self):
+        with self.engine.connect() as connection:
+            for names, column in ((self.author_ids, Author.__table__.c.full_name),
+                                  (self.genre_ids, Genre.__table__.c.name),
+                                  (self.publisher_ids, Publisher.__table__.c.name)):
+                names.clear()
+                id_column = column.table.c.id
+                for name, entity_id in connection.execute(
+                        select(column, func.min(id_column)).group_by(column)):
+                    names[' '.join(name.split())] = entity_id
+
+    def _parse_batch(self, batch: List[Tuple[int, dict]]) -> List[dict]:
+        rows = []
+        for number, record in batch:
+            try:
+                rows.append(parse_record(record))
+            except ValueError as error:
+                self.counts['invalid'] += 1
+                if len(self.errors) < MAX_ERRORS:
+                    self.errors.append(f"запись {number}: {error}")
+        return rows
+
+    def _write_batch(self, rows: List[dict]):
+        """Вставить пакет в одной транзакции; словари имен пополняются только после commit
+
+        Идентификаторы назначаются от max(id) + 1 внутри транзакции: в SQLite
+        запись из другого процесса между чтением и вставкой приводит к ошибке
+        блокировки, и run_with_retry повторяет пакет. Связи вставляются до
+        изданий (проверка внешних ключей отложена до commit), поэтому триггер
+        полнотекстового индекса строит строку издания один раз, уже с авторами
+        и жанрами, а не заново на каждую связь.
+        """
+        publications = Publication.__table__
+        with self.engine.begin() as connection:
+            if connection.dialect.name == 'sqlite':
+                connection.exec_driver_sql('PRAGMA defer_foreign_keys = ON')
+            isbns = {row['isbn'] for row in rows if row['isbn']}
+            seen = set(connection.execute(
+                select(publications.c.isbn).where(publications.c.isbn.in_(isbns))).scalars()) if isbns else set()
+            fresh = []
+            for row in rows:
+                if row['isbn']:
+                    if row['isbn'] in seen:
+                        continue
+                    seen.add(row['isbn'])
+                fresh.append(row)
+
+            new_authors = self._insert_names(connection, Author.__table__.c.full_name, self.author_ids,
+                                             (name for row in fresh for name in row['authors']))
+            new_genres = self._insert_names(connection, Genre.__table__.c.name, self.genre_ids,
+                                            (name for row in fresh for name in row['genres']))
+            new_publishers = self._insert_names(connection, Publisher.__table__.c.name, self.publisher_ids,
+                                                (row['publisher'] for row in fresh if row['publisher']))
+            author_ids = {**self.author_ids, **new_authors}
+            genre_ids = {**self.genre_ids, **new_genres}
+            publisher_ids = {**self.publisher_ids, **new_publishers}
+
+            if fresh:
+                start = self._next_id(connection, publications)
+                values, author_links, genre_links = [], [], []
+                for publication_id, row in enumerate(fresh, start=start):
+                    value = {key: value for key, value in row.items() if key not in ('authors', 'genres', 'publisher')}
+                    value['id'] = publication_id
+                    value['publisher_id'] = publisher_ids.get(row['publisher'])
+                    values.append(value)
+                    author_links.extend({'publication_id': publication_id, 'author_id': author_ids[name]}
+                                        for name in row['authors'])
+                    genre_links.extend({'publication_id': publication_id, 'genre_id': genre_ids[name]}
+                                       for name in row['genres'])
+                if author_links:
+                    connection.execute(insert(publication_authors), author_links)
+                if genre_links:
+                    connection.execute(insert(publication_genres), genre_links)
+                connection.execute(insert(publications), values)
+
+        self.author_ids.update(new_authors)
+        self.genre_ids.update(new_genres)
+        self.publisher_ids.update(new_publishers)
+        self.counts['inserted'] += len(fresh)
+        self.counts['duplicates'] += len(rows) - len(fresh)
+        self.counts['authors'] += len(new_authors)
+        self.counts['genres'] += len(new_genres)
+        self.counts['publishers'] += len(new_publishers)
+
+    @staticmethod
+    def _next_id(connection: Connection, table) -> int:
+        return (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    @classmethod
+    def _insert_names(cls, connection: Connection, column, known: Dict[str, int], names: Iterable[str]) -> Dict[str, int]:
+        """Вставить отсутствующие в known имена одним запросом; возвращает имя -> новый id"""
+        missing = list(dict.fromkeys(name for name in names if name not in known))
+        if not missing:
+            return {}
+        table = column.table
+        start = cls._next_id(connection, table)
+        created = {name: entity_id for entity_id, name in enumerate(missing, start=start)}
+        connection.execute(insert(table), [{'id': entity_id, column.key: name} for name, entity_id in created.items()])
+        return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт каталога из CSV/JSON в формате выгрузки изданий')
+    parser.add_argument('path')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    rebuild = parser.add_mutually_exclusive_group()
+    rebuild.add_argument('--rebuild', dest='rebuild', action='store_true', default=None,
+                         help='перестроить нечеткий индекс, автодополнение и похожесть после импорта')
+    rebuild.add_argument('--no-rebuild', dest='rebuild', action='store_false')
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.database_url)
+    importer = CatalogImporter(db_manager, batch_size=args.batch_size)
+    counts = importer.import_file(args.path, progress=True, rebuild_indexes=args.rebuild)
+
+    elapsed = counts['elapsed_ms'] / 1000
+    print(f"\nЗаписей: {counts['records']} за {elapsed:.1f} с "
+          f"({counts['records'] / elapsed if elapsed else 0:.0f} записей/с)")
+    print(f"  добавлено изданий: {counts['inserted']}, пропущено дублей ISBN: {counts['duplicates']}, "
+          f"ошибочных записей: {counts['invalid']}")
+    print(f"  новых авторов: {counts['authors']}, жанров: {counts['genres']}, издательств: {counts['publishers']}")
+    if 'rebuild_ms' in counts:
+        print(f"  перестроение нечеткого индекса, автодополнения и похожести: {counts['rebuild_ms'] / 1000:.1f} с")
+    for message in importer.errors:
+        print(f"  ✗ {message}")
+    return 1 if counts['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+from typing import Optional, Sequence
+from sqlalchemy import Select, select
+from models.database_models import Publication, Author, Genre
+from models.fulltext import match_expression, apply_fulltext
+
+
+class CatalogQueries:
+    """Запросы каталога
+
+    Запросы строятся как select(), чтобы их выполняли и синхронные сессии меню,
+    и асинхронный слой (models.async_database).
+    """
+
+    @staticmethod
+    def catalog_page(limit: int = 20) -> Select:
+        """Первая страница каталога"""
+        return select(Publication).limit(limit)
+
+    @staticmethod
+    def search(title: str = '', author: str = '', genre: str = '', min_year: Optional[int] = None,
+               max_year: Optional[int] = None, min_price: Optional[float] = None,
+               max_price: Optional[float] = None, limit: int = 50, use_fulltext: bool = False,
+               publication_ids: Optional[Sequence[int]] = None,
+               author_ids: Optional[Sequence[int]] = None) -> Select:
+        """Поиск изданий по критериям; пустые критерии не учитываются
+
+        С use_fulltext текстовые критерии ищутся по индексу FTS5 (префиксы слов,
+        сортировка по BM25), иначе - через ILIKE по подстроке. publication_ids и
+        author_ids ограничивают поиск найденными заранее изданиями и авторами
+        (например, нечетким индексом, см. models/fuzzy_index.py).
+        """
+        query = select(Publication)
+        if publication_ids is not None:
+            query = query.where(Publication.id.in_(publication_ids))
+        if author_ids is not None:
+            query = query.where(Publication.authors.any(Author.id.in_(author_ids)))
+
+        expression = match_expression(title=title, authors=author, genres=genre) if use_fulltext else None
+        if expression:
+            query = apply_fulltext(query, Publication.id, expression)
+        else:
+            if title:
+                query = query.where(Publication.title.ilike(f"%{title}%"))
+            if author:
+                query = query.where(Publication.authors.any(Author.full_name.ilike(f"%{author}%")))
+            if genre:
+                query = query.where(Publication.genres.any(Genre.name.ilike(f"%{genre}%")))
+
+        if min_year is not None:
+            query = query.where(Publication.publication_year >= min_year)
+        if max_year is not None:
+            query = query.where(Publication.publication_year <= max_year)
+        if min_price is not None:
+            query = query.where(Publication.price >= min_price)
+        if max_price is not None:
+            query = query.where(Publication.price <= max_price)
+
+        return query.limit(limit)
+
+    @staticmethod
+    def keyword_search(keyword: str, use_fulltext: bool = False) -> Select:
+        """Поиск по ключевому слову в названии, авторах и ISBN"""
+        expression = match_expression(keyword) if use_fulltext else None
+        if expression:
+            # Описание и жанры не участвуют: ищем конкретное издание
+            expression = f'{{title authors isbn}} : ({expression})'
+            return apply_fulltext(select(Publication), Publication.id, expression)
+        return select(Publication).where(
+            Publication.title.ilike(f"%{keyword}%") |
+            Publication.isbn.ilike(f"%{keyword}%")
+        )
@@ -0,0 +1,139 @@
+"""Оформление заказа с атомарным списанием остатков
+
+Остаток проверяется при добавлении издания в корзину, но к оформлению он
+мог измениться: последние экземпляры успел купить другой покупатель.
+Поэтому при оформлении остаток не читается, а списывается условным UPDATE:
+
+    UPDATE publications SET stock_quantity = stock_quantity - :q
+    WHERE id = :id AND stock_quantity >= :q
+
+Проверку и списание СУБД выполняет атомарно. Если строка не обновилась,
+экземпляров не хватает, и транзакция откатывается целиком: заказ
+оформляется либо со всеми позициями, либо не оформляется вовсе. Позиции
+списываются по возрастанию id изданий, поэтому заказы с общими изданиями не
+ждут друг друга по кругу (в PostgreSQL это исключает взаимные блокировки).
+В SQLite первый UPDATE захватывает блокировку записи; если она занята
+дольше busy_timeout, транзакция повторяется с экспоненциальной паузой
+(DatabaseManager.run_in_transaction).
+
+UPDATE выполняется мимо единицы работы сессии, поэтому кэш каталога
+сбрасывается явно для всех изданий корзины. Проверка на параллельных
+процессах: benchmarks/checkout_stress.py.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Update
+from models.database_models import Order, OrderItem, OrderStatus, Publication
+
+
+class InsufficientStock(Exception):
+    """Недостаточно экземпляров для одной или нескольких позиций заказа"""
+
+    def __init__(self, shortages: Dict[int, int]):
+        # id издания -> сколько экземпляров осталось на складе
+        self.shortages = shortages
+        super().__init__("Недостаточно экземпляров на складе: " + ', '.join(
+            f"издание {publication_id} - {available} шт." for publication_id, available in shortages.items()))
+
+
+def cart_quantities(cart: Iterable[Dict]) -> Dict[int, int]:
+    """Количество экземпляров по изданиям корзины в порядке возрастания id"""
+    quantities = Counter()
+    for item in cart:
+        if item['quantity'] <= 0:
+            raise ValueError(f"Неверное количество для издания {item['publication_id']}: {item['quantity']}")
+        quantities[item['publication_id']] += item['quantity']
+    return dict(sorted(quantities.items()))
+
+
+def stock_decrement(publication_id: int, quantity: int) -> Update:
+    """Списание quantity экземпляров, только если их достаточно"""
+    publications = Publication.__table__
+    return (update(publications)
+            .where(publications.c.id == publication_id, publications.c.stock_quantity >= quantity)
+            .values(stock_quantity=publications.c.stock_quantity - quantity))
+
+
+def stock_release() -> Update:
+    """Возврат :quantity экземпляров издания :publication_id на склад (для executemany)"""
+    publications = Publication.__table__
+    return (update(publications).where(publications.c.id == bindparam('publication_id'))
+            .values(stock_quantity=publications.c.stock_quantity + bindparam('quantity')))
+
+
+def available_stock(publication_ids: Iterable[int]):
+    """Запрос остатков изданий (для сообщения о нехватке)"""
+    publications = Publication.__table__
+    return select(publications.c.id, publications.c.stock_quantity).where(publications.c.id.in_(list(publication_ids)))
+
+
+def take_stock(session: Session, quantities: Dict[int, int]):
+    """Списать остатки по изданиям quantities в текущей транзакции session
+
+    При нехватке хотя бы одного издания уже списанное возвращается на склад
+    и выбрасывается InsufficientStock. Транзакцию откатывать не нужно, поэтому
+    в одной транзакции можно оформлять несколько заказов (models/checkout_queue.py).
+    """
+    taken, short = [], []
+    for publication_id, quantity in quantities.items():
+        if session.execute(stock_decrement(publication_id, quantity)).rowcount == 1:
+            taken.append({'publication_id': publication_id, 'quantity': quantity})
+        else:
+            short.append(publication_id)
+    if short:
+        if taken:
+            session.execute(stock_release(), taken)
+        available = dict(session.execute(available_stock(short)).all())
+        raise InsufficientStock({publication_id: available.get(publication_id, 0) for publication_id in short})
+
+
+def new_order(order_number: str, user_id: int, cart: List[Dict], payment_method: Optional[str] = None,
+              shipping_address: Optional[str] = None) -> Order:
+    """Заказ с позициями по корзине (еще не добавленный в сессию)"""
+    return Order(
+        order_number=order_number,
+        user_id=user_id,
+        total_amount=sum(item['quantity'] * item['unit_price'] for item in cart),
+        status=OrderStatus.PENDING,
+        payment_method=payment_method,
+        shipping_address=shipping_address,
+        items=[OrderItem(publication_id=item['publication_id'], quantity=item['quantity'],
+                         unit_price=item['unit_price']) for item in cart]
+    )
+
+
+def place_order(session: Session, order_number: str, user_id: int, cart: List[Dict],
+                payment_method: Optional[str] = None, shipping_address: Optional[str] = None) -> Order:
+    """Списать остатки и создать заказ в текущей транзакции session
+
+    При нехватке экземпляров хотя бы одной позиции выбрасывается
+    InsufficientStock, списанное по этому заказу возвращается на склад.
+    """
+    if not cart:
+        raise ValueError("Корзина пуста")
+    # Списание - первые операторы транзакции: в SQLite блокировка записи берется сразу, без чтения до нее
+    take_stock(session, cart_quantities(cart))
+    order = new_order(order_number, user_id, cart, payment_method, shipping_address)
+    session.add(order)
+    session.flush()
+    return order
+
+
+def checkout(db_manager, user_id: int, cart: List[Dict], payment_method: Optional[str] = None,
+             shipping_address: Optional[str] = None) -> Tuple[int, str]:
+    """Оформить заказ в отдельной транзакции с повтором при блокировке; возвращает (id, номер) заказа"""
+    # Номер берется из блока процесса до транзакции и не меняется при ее повторе
+    order_number = db_manager.order_numbers.next_number()
+    publication_ids = {item['publication_id'] for item in cart}
+
+    def operation(session: Session) -> Tuple[int, str]:
+        order = place_order(session, order_number, user_id, cart, payment_method, shipping_address)
+        return order.id, order.order_number
+
+    try:
+        return db_manager.run_in_transaction(operation)
+    finally:
+        # Остатки изменились (или оказались меньше, чем в кэше) - карточки нужно перечитать
+        db_manager.catalog_cache.invalidate(publication_ids)
@@ -0,0 +1,208 @@
+"""Оформление заказов через очередь с групповой фиксацией
+
+При оформлении каждого заказа в своей транзакции (models/checkout.py,
+CartService.checkout) на каждый заказ приходится фиксация, то есть запись
+журнала на диск (fsync). В пик продаж скорость оформления упирается в
+задержку fsync, а в SQLite заказы к тому же ждут друг друга на блокировке
+записи.
+
+CheckoutQueue принимает заявки на оформление в очередь процесса и сразу
+возвращает future. Рабочие потоки забирают заявки пакетами - до
+batch_size заявок или сколько пришло за max_wait_ms после первой - и
+оформляют весь пакет в одной транзакции с одной фиксацией. При
+max_wait_ms = 0 (по умолчанию) одиночная заявка не ждет, а под нагрузкой
+пакет составляют заявки, пришедшие, пока записывался предыдущий:
+
+- каждая заявка списывает остатки условным UPDATE (take_stock); при
+  нехватке списанное по ней возвращается на склад, а future получает
+  InsufficientStock - остальные заказы пакета это не затрагивает, откат
+  транзакции не нужен;
+- заказы пакета вставляются одним сбросом сессии после всех списаний;
+- после фиксации future каждой заявки получает (id, номер) заказа.
+
+Номер заказа выдается до транзакции и не меняется при ее повторе после
+блокировки. Если пакет не удалось записать по другой причине (например,
+одна заявка нарушает ограничение базы), заявки пакета оформляются по
+одной, и ошибка достается только своей заявке.
+
+Заявка - либо корзина в виде списка позиций (как для checkout), либо
+cart=None: сохраненная корзина пользователя (models/carts.py). В SQLite
+запись все равно выполняет один процесс за раз, поэтому рабочий поток
+по умолчанию один; для PostgreSQL их можно добавить (CHECKOUT_WORKERS).
+Сравнение с оформлением по одному заказу: benchmarks/checkout_queue_load.py.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set
+from sqlalchemy.orm import Session
+from config import Config
+from models.checkout import InsufficientStock, cart_quantities, new_order, take_stock
+from models.database_models import Order
+from models.engine_profile import is_lock_error
+
+# Сигнал рабочему потоку завершиться
+_STOP = object()
+
+
+class _Request:
+    """Заявка на оформление заказа"""
+
+    __slots__ = ('user_id', 'cart', 'payment_method', 'shipping_address', 'future', 'order_number')
+
+    def __init__(self, user_id: int, cart: Optional[List[Dict]], payment_method: Optional[str],
+                 shipping_address: Optional[str]):
+        self.user_id = user_id
+        self.cart = cart
+        self.payment_method = payment_method
+        self.shipping_address = shipping_address
+        self.future = Future()
+        self.order_number = None
+
+
+class CheckoutQueue:
+    """Очередь оформления заказов с групповой фиксацией (см. описание модуля)"""
+
+    def __init__(self, db_manager, batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                 workers: Optional[int] = None, max_queued: Optional[int] = None):
+        self.db_manager = db_manager
+        self.batch_size = batch_size or Config.CHECKOUT_BATCH_ORDERS
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else Config.CHECKOUT_BATCH_WAIT_MS
+        self.workers = workers or Config.CHECKOUT_WORKERS
+        # Полная очередь задерживает submit: заявки не копятся в памяти без предела
+        self._queue = queue.Queue(max_queued or Config.CHECKOUT_QUEUE_SIZE)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        # Счетчики для нагрузочного теста: записанные пакеты и заявки в них
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, user_id: int, cart: Optional[List[Dict]] = None, payment_method: Optional[str] = None,
+               shipping_address: Optional[str] = None) -> Future:
+        """Поставить заказ в очередь; future вернет (id, номер) заказа или исключение оформления
+
+        cart=None - оформить сохраненную корзину пользователя.
+        """
+        request = _Request(user_id, cart, payment_method, shipping_address)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Очередь оформления заказов закрыта")
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._work, name=f'checkout-{number}', daemon=True)
+                                 for number in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+        self._queue.put(request)
+        return request.future
+
+    def checkout(self, user_id: int, cart: Optional[List[Dict]] = None, payment_method: Optional[str] = None,
+                 shipping_address: Optional[str] = None, timeout: Optional[float] = None):
+        """Оформить заказ через очередь и дождаться результата; возвращает (id, номер) заказа"""
+        return self.submit(user_id, cart, payment_method, shipping_address).result(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Дописать принятые заявки и остановить рабочие потоки"""
+        with self._lock:
+            self._closed = True
+            threads = self._threads
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _next_batch(self) -> Optional[List[_Request]]:
+        """Дождаться заявки и добрать к ней пакет; None - поток должен завершиться"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Уже ожидающие заявки забираются и после истечения max_wait_ms
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(request)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Отмененные до начала записи заявки не оформляются
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Поток не должен завершаться: заявки, оставшиеся в очереди, ждут ответа
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _place(self, session: Session, request: _Request) -> Order:
+        if request.cart is None:
+            return self.db_manager.carts.place(session, request.user_id, request.order_number,
+                                               request.payment_method, request.shipping_address)
+        if not request.cart:
+            raise ValueError("Корзина пуста")
+        take_stock(session, cart_quantities(request.cart))
+        order = new_order(request.order_number, request.user_id, request.cart, request.payment_method,
+                          request.shipping_address)
+        session.add(order)
+        return order
+
+    def _write(self, batch: List[_Request]):
+        """Оформить пакет заявок в одной транзакции и завершить их future"""
+        touched: Set[int] = set()
+
+        def operation(session: Session) -> list:
+            outcomes = []
+            # Заказы вставляются одним сбросом после всех списаний, а не перед каждым UPDATE
+            with session.no_autoflush:
+                for request in batch:
+                    try:
+                        outcomes.append(self._place(session, request))
+                    except (InsufficientStock, ValueError) as e:
+                        # Списанное по заявке уже возвращено на склад
+                        outcomes.append(e)
+            session.flush()
+            touched.clear()
+            for outcome in outcomes:
+                if isinstance(outcome, Order):
+                    touched.update(item.publication_id for item in outcome.items)
+            return [(outcome.id, outcome.order_number) if isinstance(outcome, Order) else outcome
+                    for outcome in outcomes]
+
+        try:
+            for request in batch:
+                if request.order_number is None:
+                    request.order_number = self.db_manager.order_numbers.next_number()
+            outcomes = self.db_manager.run_in_transaction(operation)
+        except Exception as e:
+            if len(batch) > 1 and not is_lock_error(e):
+                for request in batch:
+                    self._write([request])
+                return
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        finally:
+            self.db_manager.catalog_cache.invalidate(touched)
+
+        self.batches += 1
+        self.requests += len(batch)
+        for request, outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                request.future.set_exception(outcome)
+            else:
+                request.future.set_result(outcome)
@@ -0,0 +1,636 @@
+"""Похожие издания по содержанию: название, описание и жанры
+
+Рекомендации по совместным покупкам (models/recommendations.py) пусты для
+изданий, которые еще никто не покупал, - новинок и «длинного хвоста»
+каталога. Для них соседи подбираются по тексту карточки.
+
+Документ издания - слова названия (с весом TITLE_WEIGHT), описания и
+названия жанров целиком (GENRE_WEIGHT). Слова приводятся к нижнему регистру,
+«ё» - к «е», стоп-слова отбрасываются, у русских слов отсекается окончание
+(грубый стеммер без словаря: «романы», «роману» и «романа» дают одну
+основу). Вес слова - TF-IDF: log(1 + tf) * idf, где
+idf = log((1 + N) / (1 + df)) + 1.
+
+Словарь не хранится: слово хешируется (crc32, одинаково во всех процессах)
+в одну из BUCKETS корзин, по корзинам считаются частоты df. Затем каждая
+корзина проецируется со случайным знаком в PROJECTIONS из DIMENSIONS
+измерений плотного вектора, и вектор нормируется. Скалярное произведение
+таких векторов приближает косинусную близость TF-IDF; запрос «похожие на
+несколько изданий» - одно произведение матриц по блокам QUERY_CHUNK строк.
+
+Проекция в 128 измерений смешивает несвязанные слова, поэтому издания без
+общих слов тоже получают положительную близость. Отобранные по векторам
+кандидаты (RESCORE_FACTOR на каждое место выдачи) пересчитываются точно -
+косинусом разреженных векторов TF-IDF по корзинам слов, - и издания с
+близостью ниже MIN_SIMILARITY (в том числе без общих слов) отбрасываются.
+
+Индекс состоит из снимка и надстройки, как нечеткий индекс (models/fuzzy_index.py):
+- снимок - файл .npy с матрицей float32 (N x DIMENSIONS, 512 байт на
+  издание) в каталоге Config.CONTENT_INDEX_DIR; файл открывается через
+  mmap и делится страничным кэшем между процессами. В таблице content_index
+  хранятся имя файла, идентификаторы строк, частоты df и номер последней
+  учтенной записи журнала;
+- надстройка - векторы изданий, измененных после снимка, по журналу
+  content_journal: его заполняют триггеры на publications, publication_genres
+  и genres, так что add_publication, edit_publication и импорт каталога
+  учитываются без изменений в их коде. Строки снимка, измененные после
+  него, исключаются из выдачи.
+
+Первое построение и перестроение после REBUILD_THRESHOLD изменений
+занимают секунды на больших каталогах, поэтому экран издания их не ждет:
+приложение загружает индекс в фоновом потоке при запуске (start_loading),
+а similar(..., wait=False) до готовности индекса возвращает пустой список.
+Снимок можно построить и заранее (также python -m models.migrations reindex).
+Частоты df до перестроения не пересчитываются:
+    python -m models.content_similarity rebuild
+    python -m models.content_similarity similar --publication-id 42
+Время построения и задержки запросов: benchmarks/content_similarity_benchmark.py.
+"""
+import argparse
+import io
+import math
+import os
+import re
+import sys
+import threading
+import zlib
+from array import array
+from collections import Counter, namedtuple
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from config import Config
+from models.database_models import Genre, Publication, content_index, content_journal, publication_genres
+
+INDEX_NAME = 'content'
+# Размер плотного вектора и число корзин хеширования слов
+DIMENSIONS = 128
+BUCKETS = 1 << 20
+# В сколько измерений попадает каждая корзина
+PROJECTIONS = 2
+TITLE_WEIGHT = 2.0
+GENRE_WEIGHT = 3.0
+# Изданий в одном блоке при построении векторов и при умножении на запрос
+BUILD_CHUNK = 50000
+QUERY_CHUNK = 65536
+# Изменений журнала, после которых снимок перестраивается целиком
+REBUILD_THRESHOLD = 20000
+# Сколько изданий читать из базы за один запрос IN при синхронизации
+SYNC_CHUNK = 5000
+MIN_STEM = 3
+# Кандидатов по векторам на одно место выдачи и нижняя граница точной близости
+RESCORE_FACTOR = 4
+MIN_SIMILARITY = 0.05
+
+SimilarPublication = namedtuple('SimilarPublication', 'publication_id score')
+
+_WORD = re.compile(r'[^\W\d_]+')
+_CYRILLIC = re.compile(r'[а-я]+')
+STOP_WORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до его ее
+    если есть еще же за и из или им их к как когда кто ли либо между меня мне может мы на над надо наш не него
+    нее нет ни них но ну о об однако он она они оно от очень по под при про с со так также такой там те тем
+    то того тоже той только том ты у уже чем через что чтобы эта эти это этот я
+    a an and are as at be by for from in is it of on or that the this to with
+""".split())
+# Окончания русских слов
+ENDINGS = frozenset("""
+    иями ями ами иях ах ях ого его ому ему ыми ими ых их ой ей ий ый ая яя ое ее ые ие ую юю ом ем ам ям ов ев ью
+    ость ости ение ения ении ением ться ется ются ит ат ят ет ут ют ил ила или ило ть
+    а я о е ы и у ю ь й
+""".split())
+_ENDING_LENGTHS = sorted({len(ending) for ending in ENDINGS}, reverse=True)
+
+
+@lru_cache(maxsize=200000)
+def normalize_word(word: str) -> str:
+    """Основа слова: у русских слов отсекается самое длинное окончание, остальные не меняются"""
+    if not _CYRILLIC.fullmatch(word):
+        return word
+    for length in _ENDING_LENGTHS:
+        if len(word) - length >= MIN_STEM and word[-length:] in ENDINGS:
+            return word[:-length]
+    return word
+
+
+def words(value: Optional[str]) -> List[str]:
+    """Основы значимых слов текста"""
+    value = (value or '').casefold().replace('ё', 'е')
+    return [normalize_word(word) for word in _WORD.findall(value) if len(word) > 1 and word not in STOP_WORDS]
+
+
+def document_terms(title: Optional[str], description: Optional[str], genres: Iterable[str]) -> Counter:
+    """Взвешенные частоты слов карточки издания"""
+    terms = Counter()
+    for word in words(title):
+        terms[word] += TITLE_WEIGHT
+    for word in words(description):
+        terms[word] += 1
+    for genre in genres:
+        # Жанр - один признак, чтобы «Научная фантастика» не совпадала с «Научной литературой»
+        terms['жанр:' + ' '.join(genre.casefold().replace('ё', 'е').split())] += GENRE_WEIGHT
+    return terms
+
+
+def term_bucket(term: str) -> int:
+    return zlib.crc32(term.encode('utf-8')) % BUCKETS
+
+
+# Множители хеширования корзины в измерения, по одному на проекцию
+_MULTIPLIERS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F], dtype=np.uint64)[:PROJECTIONS]
+
+
+def projections(buckets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Измерения и знаки проекций корзин: два массива формы (len(buckets), PROJECTIONS)"""
+    mixed = (buckets.astype(np.uint64)[:, None] * _MULTIPLIERS) & np.uint64(0xFFFFFFFF)
+    mixed ^= mixed >> np.uint64(15)
+    dimensions = (mixed % np.uint64(DIMENSIONS)).astype(np.int64)
+    signs = np.where(mixed & np.uint64(1 << 20), 1.0, -1.0).astype(np.float32)
+    return dimensions, signs
+
+
+def inverse_frequency(df: np.ndarray, documents: int) -> np.ndarray:
+    return (np.log((1.0 + documents) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+class TermMatrix:
+    """Корзины и частоты слов нескольких документов подряд, как строки CSR"""
+
+    def __init__(self):
+        self.offsets = array('q', [0])
+        self.buckets = array('i')
+        self.tf = array('f')
+        self._cache: Dict[str, int] = {}
+
+    def add(self, terms: Counter):
+        cache = self._cache
+        for term, count in terms.items():
+            bucket = cache.get(term)
+            if bucket is None:
+                bucket = cache[term] = term_bucket(term)
+            self.buckets.append(bucket)
+            self.tf.append(count)
+        self.offsets.append(len(self.buckets))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return (np.frombuffer(self.offsets, dtype=np.int64), np.frombuffer(self.buckets, dtype=np.int32),
+                np.frombuffer(self.tf, dtype=np.float32))
+
+
+def dense_vectors(offsets: np.ndarray, buckets: np.ndarray, tf: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """Нормированные векторы документов (len(offsets) - 1 x DIMENSIONS) по строкам CSR"""
+    count = len(offsets) - 1
+    start, end = int(offsets[0]), int(offsets[-1])
+    buckets = buckets[start:end]
+    weights = np.log1p(tf[start:end]) * idf[buckets]
+    rows = np.repeat(np.arange(count, dtype=np.int64), np.diff(offsets)) * DIMENSIONS
+    dimensions, signs = projections(buckets)
+    flat = np.zeros(count * DIMENSIONS, dtype=np.float64)
+    for k in range(PROJECTIONS):
+        flat += np.bincount(rows + dimensions[:, k], weights=weights * signs[:, k], minlength=count * DIMENSIONS)
+    vectors = flat.reshape(count, DIMENSIONS).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def _top(scores: np.ndarray, ids: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Лучшие limit столбцов каждой строки scores (без упорядочения) и их идентификаторы;
+    ids - общие для всех строк (одномерный массив) или свои у каждой строки"""
+    ids = np.broadcast_to(ids, scores.shape)
+    if scores.shape[1] <= limit:
+        return scores, ids
+    columns = np.argpartition(scores, scores.shape[1] - limit, axis=1)[:, -limit:]
+    return np.take_along_axis(scores, columns, axis=1), np.take_along_axis(ids, columns, axis=1)
+
+
+class ContentIndex:
+    """Снимок векторов изданий (в памяти или в файле через mmap) и надстройка изменений"""
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, df: np.ndarray, documents: int, journal_seq: int = 0):
+        self.ids = ids
+        self.vectors = vectors
+        self.df = df
+        self.documents = documents
+        self.idf = inverse_frequency(df, documents)
+        self.journal_seq = journal_seq
+        # Строки снимка, измененные или удаленные после него
+        self.stale = np.zeros(len(ids), dtype=bool)
+        # Новые векторы измененных изданий
+        self.overlay: Dict[int, np.ndarray] = {}
+        self._overlay_matrix = None
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[int, Optional[str], Optional[str], Sequence[str]]],
+              journal_seq: int = 0, path: Optional[str] = None) -> 'ContentIndex':
+        """Построить снимок по (id, название, описание, жанры), упорядоченным по id;
+        при заданном path матрица пишется в файл .npy"""
+        ids = array('q')
+        terms = TermMatrix()
+        for publication_id, title, description, genres in documents:
+            ids.append(publication_id)
+            terms.add(document_terms(title, description, genres))
+        ids = np.array(ids, dtype=np.int64)
+        offsets, buckets, tf = terms.arrays()
+        df = np.bincount(buckets, minlength=BUCKETS).astype(np.int32)
+        idf = inverse_frequency(df, len(ids))
+        if path is None:
+            vectors = np.zeros((len(ids), DIMENSIONS), dtype=np.float32)
+        else:
+            vectors = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(ids), DIMENSIONS))
+        for start in range(0, len(ids), BUILD_CHUNK):
+            end = min(start + BUILD_CHUNK, len(ids))
+            vectors[start:end] = dense_vectors(offsets[start:end + 1], buckets, tf, idf)
+        if path is not None:
+            vectors.flush()
+            del vectors
+            vectors = np.load(path, mmap_mode='r')
+        return cls(ids, vectors, df, len(ids), journal_seq)
+
+    def meta_bytes(self) -> bytes:
+        """Идентификаторы строк и частоты df для таблицы content_index"""
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, ids=self.ids, df=self.df, documents=np.array([self.documents]))
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, meta: bytes, path: str, journal_seq: int = 0) -> 'ContentIndex':
+        with np.load(io.BytesIO(meta)) as arrays:
+            ids, df, documents = arrays['ids'], arrays['df'], int(arrays['documents'][0])
+        return cls(ids, np.load(path, mmap_mode='r'), df, documents, journal_seq)
+
+    def __len__(self) -> int:
+        return len(self.ids) - int(self.stale.sum()) + len(self.overlay)
+
+    def vectorize(self, documents: Iterable[Tuple[int, Optional[str], Optional[str], Sequence[str]]]
+                  ) -> Dict[int, np.ndarray]:
+        """Векторы документов с частотами df снимка"""
+        ids, terms = [], TermMatrix()
+        for publication_id, title, description, genres in documents:
+            ids.append(publication_id)
+            terms.add(document_terms(title, description, genres))
+        if not ids:
+            return {}
+        return dict(zip(ids, dense_vectors(*terms.arrays(), self.idf)))
+
+    def term_weights(self, documents: Iterable[Tuple[int, Optional[str], Optional[str], Sequence[str]]]
+                     ) -> Dict[int, Dict[int, float]]:
+        """Точные нормированные векторы TF-IDF документов: id -> {корзина слова: вес}"""
+        result = {}
+        for publication_id, title, description, genres in documents:
+            weights: Dict[int, float] = Counter()
+            for term, count in document_terms(title, description, genres).items():
+                bucket = term_bucket(term)
+                weights[bucket] += math.log1p(count) * float(self.idf[bucket])
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            result[publication_id] = {bucket: weight / norm for bucket, weight in weights.items()} if norm else {}
+        return result
+
+    def apply_changes(self, changes: Dict[int, Optional[np.ndarray]], journal_seq: int):
+        """Учесть измененные издания: id -> новый вектор или None для удаленных"""
+        positions = np.searchsorted(self.ids, np.fromiter(changes, dtype=np.int64, count=len(changes)))
+        positions = positions[positions < len(self.ids)]
+        positions = positions[np.isin(self.ids[positions], list(changes))]
+        self.stale[positions] = True
+        for publication_id, vector in changes.items():
+            if vector is None:
+                self.overlay.pop(publication_id, None)
+            else:
+                self.overlay[publication_id] = vector
+        self._overlay_matrix = None
+        self.journal_seq = max(self.journal_seq, journal_seq)
+
+    def vector(self, publication_id: int) -> Optional[np.ndarray]:
+        if publication_id in self.overlay:
+            return self.overlay[publication_id]
+        position = int(np.searchsorted(self.ids, publication_id))
+        if position < len(self.ids) and self.ids[position] == publication_id and not self.stale[position]:
+            return np.asarray(self.vectors[position])
+        return None
+
+    def similar_many(self, publication_ids: Sequence[int], limit: int = 5) -> Dict[int, List[SimilarPublication]]:
+        """Похожие издания сразу для нескольких изданий: одно умножение матриц на блок снимка"""
+        queries = [(publication_id, self.vector(publication_id)) for publication_id in publication_ids]
+        queries = [(publication_id, vector) for publication_id, vector in queries if vector is not None]
+        result: Dict[int, List[SimilarPublication]] = {publication_id: [] for publication_id in publication_ids}
+        if not queries or limit <= 0:
+            return result
+        query_ids = np.array([publication_id for publication_id, _ in queries], dtype=np.int64)
+        matrix = np.stack([vector for _, vector in queries])
+        # Запас в одну строку: само издание отбрасывается после отбора
+        keep = limit + 1
+        best_scores, best_ids = [], []
+        has_stale = self.stale.any()
+        for start in range(0, len(self.ids), QUERY_CHUNK):
+            end = min(start + QUERY_CHUNK, len(self.ids))
+            scores = matrix @ np.asarray(self.vectors[start:end]).T
+            if has_stale:
+                scores[:, self.stale[start:end]] = -np.inf
+            scores, ids = _top(scores, self.ids[start:end], keep)
+            best_scores.append(scores)
+            best_ids.append(ids)
+        if self.overlay:
+            if self._overlay_matrix is None:
+                self._overlay_matrix = (np.fromiter(self.overlay, dtype=np.int64, count=len(self.overlay)),
+                                        np.stack(list(self.overlay.values())))
+            overlay_ids, overlay_vectors = self._overlay_matrix
+            scores, ids = _top(matrix @ overlay_vectors.T, overlay_ids, keep)
+            best_scores.append(scores)
+            best_ids.append(ids)
+        scores = np.concatenate(best_scores, axis=1)
+        ids = np.concatenate(best_ids, axis=1)
+        # Само издание не рекомендуется
+        scores[ids == query_ids[:, None]] = -np.inf
+        scores, ids = _top(scores, ids, keep)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        for row, publication_id in enumerate(query_ids.tolist()):
+            result[publication_id] = [
+                SimilarPublication(int(ids[row, column]), float(scores[row, column]))
+                for column in order[row] if scores[row, column] > 0
+            ][:limit]
+        return result
+
+    def similar(self, publication_id: int, limit: int = 5) -> List[SimilarPublication]:
+        return self.similar_many([publication_id], limit)[publication_id]
+
+
+def iter_documents(connection: Connection, publication_ids: Optional[Sequence[int]] = None
+                   ) -> Iterator[Tuple[int, Optional[str], Optional[str], List[str]]]:
+    """(id, название, описание, жанры) изданий по возрастанию id - двумя потоковыми запросами"""
+    publications = Publication.__table__
+    query = select(publications.c.id, publications.c.title, publications.c.description).order_by(publications.c.id)
+    links = (select(publication_genres.c.publication_id, Genre.__table__.c.name)
+             .select_from(publication_genres.join(Genre.__table__, Genre.__table__.c.id == publication_genres.c.genre_id))
+             .order_by(publication_genres.c.publication_id))
+    if publication_ids is not None:
+        query = query.where(publications.c.id.in_(publication_ids))
+        links = links.where(publication_genres.c.publication_id.in_(publication_ids))
+    genre_rows = iter(connection.execute(links).yield_per(BUILD_CHUNK))
+    pending = next(genre_rows, None)
+    for publication_id, title, description in connection.execute(query).yield_per(BUILD_CHUNK):
+        genres = []
+        while pending is not None and pending[0] <= publication_id:
+            if pending[0] == publication_id:
+                genres.append(pending[1])
+            pending = next(genre_rows, None)
+        yield publication_id, title, description, genres
+
+
+class ContentSimilarity:
+    """Индекс похожести по содержанию одной базы: загрузка, синхронизация с журналом, запросы"""
+
+    def __init__(self, engine: Engine, directory: Optional[str] = None):
+        self.engine = engine
+        self.directory = directory or Config.CONTENT_INDEX_DIR or self._default_directory(engine)
+        self._index = None
+        self._lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        self._loader_lock = threading.Lock()
+        self.last_error: Optional[Exception] = None
+
+    @staticmethod
+    def _default_directory(engine: Engine) -> str:
+        database = engine.url.database if engine.dialect.name == 'sqlite' else None
+        if database and database != ':memory:':
+            return os.path.dirname(os.path.abspath(database))
+        return 'indexes'
+
+    def _vectors_path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+    def index(self) -> ContentIndex:
+        """Актуальный индекс: загрузить или построить, затем применить журнал"""
+        with self._lock:
+            index = self._current()
+            if index is None:
+                index = self._rebuild()
+            self._index = index
+            return index
+
+    def ready_index(self) -> Optional[ContentIndex]:
+        """Актуальный индекс, если его не нужно строить; иначе построение запускается в фоне и возвращается None"""
+        # Блокировку держит фоновое построение - ждать его не нужно
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            index = self._current()
+            if index is not None:
+                self._index = index
+                return index
+        finally:
+            self._lock.release()
+        self.start_loading()
+        return None
+
+    def _current(self) -> Optional[ContentIndex]:
+        """Загруженный или сохраненный снимок с примененным журналом; None - нужно перестроение"""
+        with self.engine.connect() as connection:
+            index = self._index
+            stored = connection.execute(
+                select(content_index.c.journal_seq, content_index.c.vectors_file)
+                .where(content_index.c.name == INDEX_NAME)
+            ).first()
+            if stored is None or not os.path.exists(self._vectors_path(stored.vectors_file)):
+                return None
+            if index is None or stored.journal_seq > index.journal_seq:
+                # Снимок в базе новее: журнал до него мог быть очищен
+                index = self._load(connection)
+            return index if self._sync(connection, index) else None
+
+    def start_loading(self) -> threading.Thread:
+        """Загрузить или построить индекс в фоновом потоке (не больше одного потока)"""
+        with self._loader_lock:
+            if self._loader is None or not self._loader.is_alive():
+                self._loader = threading.Thread(target=self._load_in_background, name='content-index', daemon=True)
+                self._loader.start()
+            return self._loader
+
+    def _load_in_background(self):
+        try:
+            self.index()
+            self.last_error = None
+        except Exception as e:
+            # Следующее обращение к индексу повторит построение
+            self.last_error = e
+
+    def similar(self, publication_id: int, limit: int = 5, wait: bool = True) -> List[SimilarPublication]:
+        return self.similar_many([publication_id], limit, wait)[publication_id]
+
+    def similar_many(self, publication_ids: Sequence[int], limit: int = 5,
+                     wait: bool = True) -> Dict[int, List[SimilarPublication]]:
+        """Похожие издания: кандидаты по векторам индекса, пересчитанные точно
+
+        При wait=False индекс не строится в вызывающем потоке: пока он не
+        готов, для каждого издания возвращается пустой список.
+        """
+        index = self.index() if wait else self.ready_index()
+        if index is None:
+            return {publication_id: [] for publication_id in publication_ids}
+        return self._rescore(index, index.similar_many(publication_ids, limit * RESCORE_FACTOR), limit)
+
+    def _rescore(self, index: ContentIndex, candidates: Dict[int, List[SimilarPublication]],
+                 limit: int) -> Dict[int, List[SimilarPublication]]:
+        """Точная близость кандидатов по словам карточек; слабые и случайные совпадения отбрасываются"""
+        needed = sorted(set(candidates) | {item.publication_id for items in candidates.values() for item in items})
+        weights: Dict[int, Dict[int, float]] = {}
+        if any(candidates.values()):
+            with self.engine.connect() as connection:
+                for start in range(0, len(needed), SYNC_CHUNK):
+                    weights.update(index.term_weights(iter_documents(connection, needed[start:start + SYNC_CHUNK])))
+        result = {}
+        for publication_id, items in candidates.items():
+            query = weights.get(publication_id, {})
+            rescored = []
+            for item in items:
+                other = weights.get(item.publication_id, {})
+                score = sum(weight * other.get(bucket, 0.0) for bucket, weight in query.items())
+                if score >= MIN_SIMILARITY:
+                    rescored.append(SimilarPublication(item.publication_id, score))
+            rescored.sort(key=lambda item: -item.score)
+            result[publication_id] = rescored[:limit]
+        return result
+
+    def _load(self, connection: Connection) -> ContentIndex:
+        row = connection.execute(
+            select(content_index.c.data, content_index.c.journal_seq, content_index.c.vectors_file)
+            .where(content_index.c.name == INDEX_NAME)
+        ).one()
+        return ContentIndex.load(row.data, self._vectors_path(row.vectors_file), row.journal_seq)
+
+    def _sync(self, connection: Connection, index: ContentIndex) -> bool:
+        """Применить записи журнала после снимка; False - изменений слишком много, нужно перестроение"""
+        rows = connection.execute(
+            select(content_journal.c.seq, content_journal.c.publication_id)
+            .where(content_journal.c.seq > index.journal_seq)
+        ).all()
+        if not rows:
+            return True
+        changed = sorted({row.publication_id for row in rows})
+        if len(changed) > REBUILD_THRESHOLD:
+            return False
+        changes: Dict[int, Optional[np.ndarray]] = dict.fromkeys(changed)
+        for start in range(0, len(changed), SYNC_CHUNK):
+            changes.update(index.vectorize(iter_documents(connection, changed[start:start + SYNC_CHUNK])))
+        index.apply_changes(changes, max(row.seq for row in rows))
+        return True
+
+    def rebuild(self) -> ContentIndex:
+        """Построить снимок заново по таблицам и сохранить его"""
+        with self._lock:
+            self._index = self._rebuild()
+            return self._index
+
+    def _rebuild(self) -> ContentIndex:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now()
+        database = os.path.splitext(os.path.basename(self.engine.url.database or 'library'))[0] or 'library'
+        file_name = f"{database}.content.{stamp:%Y%m%d%H%M%S%f}.npy"
+        path = self._vectors_path(file_name)
+        try:
+            with self.engine.begin() as connection:
+                # Записи журнала до этой отметки уже отражены в читаемых строках
+                journal_seq = connection.execute(select(func.max(content_journal.c.seq))).scalar() or 0
+                index = ContentIndex.build(iter_documents(connection), journal_seq, path)
+                previous = connection.execute(
+                    select(content_index.c.vectors_file).where(content_index.c.name == INDEX_NAME)
+                ).scalar()
+                connection.execute(delete(content_index).where(content_index.c.name == INDEX_NAME))
+                connection.execute(insert(content_index).values(
+                    name=INDEX_NAME, built_at=stamp, journal_seq=journal_seq,
+                    vectors_file=file_name, data=index.meta_bytes()
+                ))
+        except Exception:
+            self._remove(path)
+            raise
+        # Прежний файл больше не нужен; процессы, открывшие его через mmap, дочитают свою копию
+        if previous and previous != file_name:
+            self._remove(self._vectors_path(previous))
+        with self.engine.begin() as connection:
+            connection.execute(delete(content_journal).where(content_journal.c.seq <= journal_seq))
+        return index
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# --- журнал изменений ---
+
+JOURNAL_TRIGGERS: Dict[str, str] = {
+    'publications_content_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS publications_content_ai AFTER INSERT ON publications BEGIN
+        INSERT INTO {content_journal.name} (publication_id) VALUES (NEW.id);
+        END""",
+    'publications_content_au': f"""
+        CREATE TRIGGER IF NOT EXISTS publications_content_au AFTER UPDATE OF title, description ON publications BEGIN
+        INSERT INTO {content_journal.name} (publication_id) VALUES (NEW.id);
+        END""",
+    'publications_content_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS publications_content_ad AFTER DELETE ON publications BEGIN
+        INSERT INTO {content_journal.name} (publication_id) VALUES (OLD.id);
+        END""",
+    'publication_genres_content_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS publication_genres_content_ai AFTER INSERT ON publication_genres BEGIN
+        INSERT INTO {content_journal.name} (publication_id) VALUES (NEW.publication_id);
+        END""",
+    'publication_genres_content_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS publication_genres_content_ad AFTER DELETE ON publication_genres BEGIN
+        INSERT INTO {content_journal.name} (publication_id) VALUES (OLD.publication_id);
+        END""",
+    'genres_content_au': f"""
+        CREATE TRIGGER IF NOT EXISTS genres_content_au AFTER UPDATE OF name ON genres BEGIN
+        INSERT INTO {content_journal.name} (publication_id)
+            SELECT publication_id FROM publication_genres WHERE genre_id = NEW.id;
+        END""",
+}
+
+
+def ensure_journal_triggers(engine: Engine) -> List[str]:
+    """Создать триггеры журнала (только SQLite; для других СУБД снимок перестраивается командой rebuild)"""
+    if engine.dialect.name != 'sqlite':
+        return []
+    with engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        for ddl in JOURNAL_TRIGGERS.values():
+            connection.exec_driver_sql(ddl)
+    return [name for name in JOURNAL_TRIGGERS if name not in existing]
+
+
+def main():
+    from models.database_models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Похожие издания по названию, описанию и жанрам')
+    parser.add_argument('command', choices=['rebuild', 'similar'])
+    parser.add_argument('--publication-id', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.database_url)
+    if args.command == 'rebuild':
+        index = db_manager.content_similarity.rebuild()
+        print(f"Изданий: {len(index)}, размер векторов: {index.vectors.nbytes / 2 ** 20:.1f} МБ, "
+              f"журнал до №{index.journal_seq}")
+        return 0
+
+    similar = db_manager.content_similarity.similar(args.publication_id, args.limit)
+    with db_manager.session_scope() as session:
+        titles = dict(session.execute(select(Publication.id, Publication.title).where(
+            Publication.id.in_([item.publication_id for item in similar]))).all())
+    for item in similar:
+        print(f"{item.score:6.3f}  {titles.get(item.publication_id, '?')}  (id: {item.publication_id})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
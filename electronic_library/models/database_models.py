@@ -1,10 +1,16 @@
+import hashlib
+import threading
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Boolean, Enum, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, Enum, ForeignKey, Table, \
+    Index, LargeBinary, select, delete, insert
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker, Session
-from sqlalchemy.sql import func
 import enum
 from config import Config
+from models.engine_profile import create_configured_engine, run_with_retry
 
 Base = declarative_base()
 
@@ -12,16 +18,125 @@ Base = declarative_base()
 publication_authors = Table(
     'publication_authors',
     Base.metadata,
-    Column('publication_id', Integer, ForeignKey('publications.id')),
-    Column('author_id', Integer, ForeignKey('authors.id'))
+    Column('publication_id', Integer, ForeignKey('publications.id'), primary_key=True),
+    Column('author_id', Integer, ForeignKey('authors.id'), primary_key=True),
+    # Обратный поиск: публикации автора
+    Index('ix_publication_authors_author', 'author_id', 'publication_id')
 )
 
 # Таблица для связи многие-ко-многим: публикации и жанры
 publication_genres = Table(
     'publication_genres',
     Base.metadata,
-    Column('publication_id', Integer, ForeignKey('publications.id')),
-    Column('genre_id', Integer, ForeignKey('genres.id'))
+    Column('publication_id', Integer, ForeignKey('publications.id'), primary_key=True),
+    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True),
+    # Обратный поиск: публикации жанра (фильтры поиска, отчет по жанрам)
+    Index('ix_publication_genres_genre', 'genre_id', 'publication_id')
+)
+
+# Служебная таблица: отпечаток схемы, с которой создана база
+schema_info = Table(
+    'schema_info',
+    Base.metadata,
+    Column('key', String(50), primary_key=True),
+    Column('value', String(255))
+)
+
+# Сохраненные нечеткие индексы имен авторов и названий (см. models/fuzzy_index.py)
+fuzzy_index = Table(
+    'fuzzy_index',
+    Base.metadata,
+    Column('kind', String(20), primary_key=True),
+    Column('built_at', DateTime),
+    # Последняя запись журнала, учтенная в data
+    Column('journal_seq', Integer, nullable=False, default=0),
+    Column('data', LargeBinary)
+)
+
+# Журнал изменений имен и названий, заполняется триггерами
+fuzzy_index_journal = Table(
+    'fuzzy_index_journal',
+    Base.metadata,
+    Column('seq', Integer, primary_key=True, autoincrement=True),
+    Column('kind', String(20), nullable=False),
+    Column('entity_id', Integer, nullable=False)
+)
+
+# Сохраненные индексы автодополнения (см. models/autocomplete.py)
+autocomplete_index = Table(
+    'autocomplete_index',
+    Base.metadata,
+    Column('kind', String(20), primary_key=True),
+    Column('built_at', DateTime),
+    # Последняя запись журнала, учтенная в data
+    Column('journal_seq', Integer, nullable=False, default=0),
+    Column('data', LargeBinary)
+)
+
+# Журнал изменений названий и имен для автодополнения, заполняется триггерами
+autocomplete_journal = Table(
+    'autocomplete_journal',
+    Base.metadata,
+    Column('seq', Integer, primary_key=True, autoincrement=True),
+    Column('kind', String(20), nullable=False),
+    Column('entity_id', Integer, nullable=False)
+)
+
+# Последовательности, выдаваемые процессам блоками (см. models/order_numbers.py);
+# next_value - первое значение, еще не выданное ни одному процессу
+number_sequences = Table(
+    'number_sequences',
+    Base.metadata,
+    Column('name', String(50), primary_key=True),
+    Column('next_value', Integer, nullable=False)
+)
+
+# Сохраненная матрица совместных покупок изданий (см. models/recommendations.py)
+recommendation_index = Table(
+    'recommendation_index',
+    Base.metadata,
+    Column('name', String(20), primary_key=True),
+    Column('built_at', DateTime),
+    # Последний заказ, учтенный в data
+    Column('order_seq', Integer, nullable=False, default=0),
+    Column('data', LargeBinary)
+)
+
+# Сохраненный индекс похожести изданий по содержанию (см. models/content_similarity.py);
+# векторы лежат в отдельном файле vectors_file, в data - идентификаторы и частоты слов
+content_index = Table(
+    'content_index',
+    Base.metadata,
+    Column('name', String(20), primary_key=True),
+    Column('built_at', DateTime),
+    # Последняя запись журнала, учтенная в снимке
+    Column('journal_seq', Integer, nullable=False, default=0),
+    Column('vectors_file', String(255)),
+    Column('data', LargeBinary)
+)
+
+# Журнал изменений названий, описаний и жанров изданий, заполняется триггерами
+content_journal = Table(
+    'content_journal',
+    Base.metadata,
+    Column('seq', Integer, primary_key=True, autoincrement=True),
+    Column('publication_id', Integer, nullable=False)
+)
+
+# Журнал изменений изданий для фасетного поиска, заполняется триггерами (models/facets.py)
+facet_journal = Table(
+    'facet_journal',
+    Base.metadata,
+    Column('seq', Integer, primary_key=True, autoincrement=True),
+    Column('publication_id', Integer, nullable=False)
+)
+
+# Версии таблиц каталога для проверки кэша поиска, увеличиваются триггерами (models/search_cache.py)
+table_versions = Table(
+    'table_versions',
+    Base.metadata,
+    Column('table_name', String(50), primary_key=True),
+    Column('version', Integer, nullable=False, default=0)
 )
 
 class UserRole(enum.Enum):
@@ -39,6 +154,10 @@ class OrderStatus(enum.Enum):
 class User(Base):
     """Модель пользователя"""
     __tablename__ = 'users'
+    __table_args__ = (
+        # Постраничный просмотр пользователей по дате регистрации
+        Index('ix_users_registration_id', 'registration_date', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     email = Column(String(255), unique=True, nullable=False)
@@ -118,6 +237,15 @@ class Publisher(Base):
 class Publication(Base):
     """Модель издания (книги)"""
     __tablename__ = 'publications'
+    __table_args__ = (
+        Index('ix_publications_publisher', 'publisher_id'),
+        # Отчет по инвентарю сортирует по остатку
+        Index('ix_publications_stock_quantity', 'stock_quantity'),
+        # Постраничный просмотр каталога по ключу (models/pagination.py)
+        Index('ix_publications_title_id', 'title', 'id'),
+        Index('ix_publications_price_id', 'price', 'id'),
+        Index('ix_publications_year_id', 'publication_year', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String(255), nullable=False)
@@ -134,6 +262,15 @@ class Publication(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Сводка отзывов, обновляется вместе с отзывами (см. models/review_stats.py)
+    reviews_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_sum = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count_1 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count_2 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count_3 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count_4 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count_5 = Column(Integer, nullable=False, default=0, server_default='0')
+    
     # Внешние ключи
     publisher_id = Column(Integer, ForeignKey('publishers.id'))
     
@@ -147,6 +284,16 @@ class Publication(Base):
     def __repr__(self):
         return f'<Publication {self.title}>'
     
+    @property
+    def average_rating(self) -> float:
+        return self.rating_sum / self.reviews_count if self.reviews_count else 0.0
+    
+    @property
+    def rating_histogram(self) -> tuple:
+        """Число отзывов с оценками 1-5"""
+        return (self.rating_count_1, self.rating_count_2, self.rating_count_3,
+                self.rating_count_4, self.rating_count_5)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -164,6 +311,16 @@ class Publication(Base):
 class Order(Base):
     """Модель заказа"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Заказы пользователя по дате (Мои заказы, статистика пользователя)
+        Index('ix_orders_user_date', 'user_id', 'order_date'),
+        # Отчеты по продажам за период с фильтром по статусу (покрывающий: сумма заказа
+        # в индексе, иначе индекс постраничного просмотра не хуже для планировщика)
+        Index('ix_orders_date_status_total', 'order_date', 'status', 'total_amount'),
+        # Постраничный просмотр заказов по дате и сумме
+        Index('ix_orders_date_id', 'order_date', 'id'),
+        Index('ix_orders_total_id', 'total_amount', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     order_number = Column(String(50), unique=True)
@@ -198,6 +355,11 @@ class Order(Base):
 class OrderItem(Base):
     """Модель позиции заказа"""
     __tablename__ = 'order_items'
+    __table_args__ = (
+        Index('ix_order_items_order', 'order_id'),
+        # Отчеты по популярности и жанрам суммируют продажи по изданию
+        Index('ix_order_items_publication', 'publication_id', 'quantity', 'unit_price'),
+    )
     
     id = Column(Integer, primary_key=True)
     quantity = Column(Integer, nullable=False)
@@ -214,9 +376,54 @@ class OrderItem(Base):
     def __repr__(self):
         return f'<OrderItem {self.id}>'
 
+# Журнал изменений статуса заказов (см. models/order_status.py): строка на операцию
+# и по строке на каждый измененный заказ с его прежним статусом
+order_status_batches = Table(
+    'order_status_batches',
+    Base.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('created_at', DateTime, nullable=False),
+    Column('user_id', Integer),
+    Column('to_status', Enum(OrderStatus), nullable=False),
+    Column('changed', Integer, nullable=False, default=0)
+)
+
+order_status_log = Table(
+    'order_status_log',
+    Base.metadata,
+    Column('batch_id', Integer, primary_key=True),
+    Column('order_id', Integer, primary_key=True),
+    Column('from_status', Enum(OrderStatus), nullable=False),
+    # История статусов одного заказа
+    Index('ix_order_status_log_order', 'order_id')
+)
+
+# Корзины покупателей (см. models/carts.py): reserved экземпляров позиции уже
+# списаны с остатка издания и возвращаются после expires_at
+cart_items = Table(
+    'cart_items',
+    Base.metadata,
+    Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
+    Column('publication_id', Integer, ForeignKey('publications.id'), primary_key=True),
+    Column('quantity', Integer, nullable=False),
+    Column('reserved', Integer, nullable=False, default=0),
+    Column('unit_price', Float, nullable=False),
+    Column('added_at', DateTime, nullable=False),
+    # NULL - резерва нет (истек или снят)
+    Column('expires_at', DateTime),
+    # Очистка истекших резервов читает только начало индекса
+    Index('ix_cart_items_expires', 'expires_at')
+)
+
 class Review(Base):
     """Модель отзыва"""
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # Рейтинг издания считается прямо по индексу
+        Index('ix_reviews_publication_rating', 'publication_id', 'rating'),
+        # Отзывы пользователя и проверка повторного отзыва
+        Index('ix_reviews_user_publication', 'user_id', 'publication_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     rating = Column(Integer, nullable=False)  # 1-5
@@ -235,25 +442,239 @@ class Review(Base):
     def __repr__(self):
         return f'<Review {self.id}>'
 
+# Объекты схемы вне моделей, которые строит models.migrations.upgrade;
+# изменение списка меняет отпечаток и запускает обновление существующих баз
+SCHEMA_EXTRAS = [
+    'publications_fts v1',
+    'fuzzy_index_journal triggers v1',
+    'facet_journal triggers v1',
+    'table_versions triggers v1',
+    'autocomplete_journal triggers v1',
+    'content_journal triggers v1',
+]
+
+
+def schema_fingerprint(metadata=None) -> str:
+    """Отпечаток описания схемы: таблицы, колонки и индексы моделей"""
+    metadata = metadata if metadata is not None else Base.metadata
+    parts = list(SCHEMA_EXTRAS)
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f'table {table.name}')
+        for column in table.columns:
+            parts.append(f'  {column.name} {column.type} null={column.nullable} pk={column.primary_key}')
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            columns = ','.join(column.name for column in index.columns)
+            parts.append(f'  index {index.name}({columns}) unique={index.unique}')
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
 class DatabaseManager:
     """Менеджер базы данных"""
     
-    def __init__(self, database_url=None):
+    def __init__(self, database_url=None, engine_profile=None):
         self.database_url = database_url or Config.DATABASE_URL
-        self.engine = create_engine(self.database_url, echo=False)
+        self.engine = create_configured_engine(self.database_url, engine_profile, echo=False)
         self.SessionLocal = sessionmaker(bind=self.engine)
-        Base.metadata.create_all(bind=self.engine)
+        self.schema_updated = self.ensure_schema()
+        
+        # Кэш представлений изданий, сбрасывается при записи через сессии SessionLocal
+        from models.catalog_cache import CatalogCache
+        self.catalog_cache = CatalogCache()
+        self.catalog_cache.install(self.SessionLocal)
+        
+        # Сводка отзывов в publications пересчитывается при каждой записи отзывов
+        from models.review_stats import install_review_stats
+        install_review_stats()
+        self._reporting = None
+        self._fuzzy = None
+        self._facets = None
+        self._search_cache = None
+        self._autocomplete = None
+        self._recommendations = None
+        self._content_similarity = None
+        self._order_numbers = None
+        self._carts = None
+        self._checkout_queue = None
+        
+        # Счетчики сессий, открытых через session_scope
+        self._stats_lock = threading.Lock()
+        self._open_sessions = weakref.WeakSet()
+        self._session_stats = {
+            'operations': 0,
+            'last_held_objects': 0,
+            'peak_held_objects': 0,
+            'released_objects': 0,
+        }
+    
+    def ensure_schema(self) -> bool:
+        """Создать или обновить схему, если сохраненный отпечаток не совпадает
+
+        При совпадении отпечатка обходимся одним запросом вместо проверки
+        каждой таблицы через create_all.
+        """
+        fingerprint = schema_fingerprint()
+        try:
+            with self.engine.connect() as connection:
+                stored = connection.execute(
+                    select(schema_info.c.value).where(schema_info.c.key == 'fingerprint')
+                ).scalar()
+        except DBAPIError:
+            stored = None  # База создана до появления schema_info
+
+        if stored == fingerprint:
+            return False
+
+        from models.migrations import upgrade
+        upgrade(self.engine)
+
+        with self.engine.begin() as connection:
+            connection.execute(delete(schema_info).where(schema_info.c.key == 'fingerprint'))
+            connection.execute(insert(schema_info).values(key='fingerprint', value=fingerprint))
+        return True
     
     def get_session(self):
         """Получить сессию БД"""
         return self.SessionLocal()
     
+    @contextmanager
+    def session_scope(self):
+        """Сессия на одну операцию
+
+        По завершении операции незафиксированные изменения откатываются, а все
+        загруженные объекты удаляются из карты идентичности сессии.
+        """
+        session = self.get_session()
+        with self._stats_lock:
+            self._open_sessions.add(session)
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            held = len(session.identity_map)
+            session.close()
+            with self._stats_lock:
+                self._open_sessions.discard(session)
+                self._session_stats['operations'] += 1
+                self._session_stats['last_held_objects'] = held
+                self._session_stats['peak_held_objects'] = max(self._session_stats['peak_held_objects'], held)
+                self._session_stats['released_objects'] += held
+    
+    def session_stats(self) -> dict:
+        """Статистика сессий: число операций и объектов в картах идентичности"""
+        with self._stats_lock:
+            stats = dict(self._session_stats)
+            open_sessions = list(self._open_sessions)
+        stats['open_sessions'] = len(open_sessions)
+        stats['held_objects'] = sum(len(session.identity_map) for session in open_sessions)
+        return stats
+    
+    @property
+    def reporting(self):
+        """База только для чтения для отчетов и экспорта, см. models/reporting.py"""
+        if self._reporting is None:
+            from models.reporting import ReportingDatabase
+            self._reporting = ReportingDatabase(self.engine, self.database_url)
+        return self._reporting
+    
+    @property
+    def fuzzy(self):
+        """Нечеткий поиск имен авторов и названий, см. models/fuzzy_index.py"""
+        if self._fuzzy is None:
+            from models.fuzzy_index import FuzzyMatcher
+            self._fuzzy = FuzzyMatcher(self.engine)
+        return self._fuzzy
+    
+    @property
+    def search_cache(self):
+        """Кэш результатов поиска по критериям, см. models/search_cache.py"""
+        if self._search_cache is None:
+            from models.search_cache import SearchCache
+            self._search_cache = SearchCache(self.engine)
+        return self._search_cache
+    
+    @property
+    def autocomplete(self):
+        """Подсказки по началу названия, имени автора, издательства и жанра, см. models/autocomplete.py"""
+        if self._autocomplete is None:
+            from models.autocomplete import Autocomplete
+            self._autocomplete = Autocomplete(self.engine)
+        return self._autocomplete
+    
+    @property
+    def recommendations(self):
+        """«С этим изданием также покупают» по совместным покупкам, см. models/recommendations.py"""
+        if self._recommendations is None:
+            from models.recommendations import Recommender
+            self._recommendations = Recommender(self.engine)
+        return self._recommendations
+    
+    @property
+    def content_similarity(self):
+        """Похожие издания по названию, описанию и жанрам, см. models/content_similarity.py"""
+        if self._content_similarity is None:
+            from models.content_similarity import ContentSimilarity
+            self._content_similarity = ContentSimilarity(self.engine)
+        return self._content_similarity
+    
+    @property
+    def order_numbers(self):
+        """Выдача номеров заказов блоками последовательности, см. models/order_numbers.py"""
+        if self._order_numbers is None:
+            from models.order_numbers import OrderNumberAllocator
+            self._order_numbers = OrderNumberAllocator(self.engine)
+        return self._order_numbers
+    
+    @property
+    def carts(self):
+        """Корзины покупателей с резервом остатков, см. models/carts.py"""
+        if self._carts is None:
+            from models.carts import CartService
+            self._carts = CartService(self)
+        return self._carts
+    
+    @property
+    def checkout_queue(self):
+        """Оформление заказов пакетами с одной фиксацией, см. models/checkout_queue.py"""
+        if self._checkout_queue is None:
+            from models.checkout_queue import CheckoutQueue
+            self._checkout_queue = CheckoutQueue(self)
+        return self._checkout_queue
+    
+    @property
+    def facets(self):
+        """Фасетный поиск по каталогу, см. models/facets.py"""
+        if self._facets is None:
+            from models.facets import FacetIndex
+            self._facets = FacetIndex(self.engine)
+        return self._facets
+    
+    def report_scope(self, max_staleness_s=None, force_refresh=False):
+        """Сессия только для чтения для отчетов; снимок не старше max_staleness_s секунд"""
+        return self.reporting.session_scope(max_staleness_s, force_refresh)
+    
+    def run_in_transaction(self, operation, attempts=None):
+        """Выполнить operation(session) в отдельной транзакции с повтором при блокировке БД"""
+        def attempt():
+            session = self.get_session()
+            try:
+                result = operation(session)
+                session.commit()
+                return result
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+        
+        return run_with_retry(attempt, attempts)
+    
     def init_db(self):
         """Инициализация базы данных с тестовыми данными"""
         session = self.get_session()
         try:
             # Проверяем, есть ли уже данные
-            if session.query(User).count() == 0:
+            if session.query(User.id).first() is None:
                 self._create_test_data(session)
                 session.commit()
                 print("База данных инициализирована с тестовыми данными")
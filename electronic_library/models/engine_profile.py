@@ -0,0 +1,192 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
+from config import Config
+from models.instrumentation import instrumentation
+
+# Профили движка БД. 'default' повторяет прежнее поведение (голый create_engine),
+# 'production' включает WAL, настроенные прагмы, пул соединений и busy timeout.
+ENGINE_PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {
+        'pragmas': {},
+        'busy_timeout_ms': None,
+        'pool_size': None,
+        'max_overflow': None,
+        'pool_timeout': None,
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -64000,       # отрицательное значение - размер в КБ (~64 МБ)
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'busy_timeout_ms': 5000,
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+    },
+}
+
+
+def get_engine_profile(name: Optional[str] = None) -> Dict[str, Any]:
+    """Получить профиль движка с учетом переопределений из конфигурации"""
+    name = name or Config.DB_ENGINE_PROFILE
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Неизвестный профиль движка БД: {name}")
+
+    profile = dict(ENGINE_PROFILES[name])
+    pragmas = dict(profile['pragmas'])
+
+    if Config.DB_JOURNAL_MODE:
+        pragmas['journal_mode'] = Config.DB_JOURNAL_MODE
+    if Config.DB_SYNCHRONOUS:
+        pragmas['synchronous'] = Config.DB_SYNCHRONOUS
+    if Config.DB_CACHE_SIZE_KB:
+        pragmas['cache_size'] = -int(Config.DB_CACHE_SIZE_KB)
+    if Config.DB_MMAP_SIZE_MB:
+        pragmas['mmap_size'] = int(Config.DB_MMAP_SIZE_MB) * 1024 * 1024
+    if Config.DB_BUSY_TIMEOUT_MS:
+        profile['busy_timeout_ms'] = int(Config.DB_BUSY_TIMEOUT_MS)
+    if Config.DB_POOL_SIZE:
+        profile['pool_size'] = int(Config.DB_POOL_SIZE)
+    if Config.DB_MAX_OVERFLOW:
+        profile['max_overflow'] = int(Config.DB_MAX_OVERFLOW)
+    if Config.DB_POOL_TIMEOUT:
+        profile['pool_timeout'] = int(Config.DB_POOL_TIMEOUT)
+
+    profile['pragmas'] = pragmas
+    profile['name'] = name
+    return profile
+
+
+def _is_sqlite_file(database_url: str) -> bool:
+    """Проверка, что URL указывает на файловую базу SQLite"""
+    url = make_url(database_url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _engine_options(database_url: str, profile: Dict[str, Any], engine_kwargs: Dict[str, Any]):
+    """Параметры create_engine и прагмы SQLite для профиля"""
+    is_sqlite = make_url(database_url).get_backend_name() == 'sqlite'
+
+    kwargs = dict(engine_kwargs)
+    # Пул соединений имеет смысл только для файловой базы или серверной СУБД
+    if not is_sqlite or _is_sqlite_file(database_url):
+        for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+            if profile[option] is not None:
+                kwargs.setdefault(option, profile[option])
+
+    if is_sqlite and profile['busy_timeout_ms'] is not None:
+        connect_args = dict(kwargs.pop('connect_args', {}))
+        # Соединения из пула могут использоваться разными потоками
+        connect_args.setdefault('check_same_thread', False)
+        connect_args.setdefault('timeout', profile['busy_timeout_ms'] / 1000)
+        kwargs['connect_args'] = connect_args
+
+    pragmas = {}
+    if is_sqlite:
+        pragmas = dict(profile['pragmas'])
+        if not _is_sqlite_file(database_url):
+            # WAL и mmap недоступны для базы в памяти
+            pragmas.pop('journal_mode', None)
+            pragmas.pop('mmap_size', None)
+        if profile['busy_timeout_ms'] is not None:
+            pragmas['busy_timeout'] = profile['busy_timeout_ms']
+    return kwargs, pragmas
+
+
+def create_configured_engine(database_url: str, profile_name: Optional[str] = None, **engine_kwargs) -> Engine:
+    """Создание движка БД с применением выбранного профиля"""
+    kwargs, pragmas = _engine_options(database_url, get_engine_profile(profile_name), engine_kwargs)
+    engine = create_engine(database_url, **kwargs)
+    if pragmas:
+        _install_sqlite_pragmas(engine, pragmas)
+
+    if instrumentation.enabled:
+        instrumentation.attach(engine)
+
+    return engine
+
+
+def create_configured_async_engine(database_url: str, profile_name: Optional[str] = None, **engine_kwargs):
+    """Асинхронный движок (aiosqlite, asyncpg) с теми же настройками профиля"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    kwargs, pragmas = _engine_options(database_url, get_engine_profile(profile_name), engine_kwargs)
+    if 'pool_size' in kwargs:
+        # aiosqlite по умолчанию открывает соединение на каждый запрос (NullPool)
+        kwargs.setdefault('poolclass', AsyncAdaptedQueuePool)
+    engine = create_async_engine(database_url, **kwargs)
+    # События соединений и выполнения доступны у синхронного движка-обертки
+    if pragmas:
+        _install_sqlite_pragmas(engine.sync_engine, pragmas)
+
+    if instrumentation.enabled:
+        instrumentation.attach(engine.sync_engine)
+
+    return engine
+
+
+def _install_sqlite_pragmas(engine: Engine, pragmas: Dict[str, Any]):
+    """Применение прагм SQLite к каждому новому соединению пула"""
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def is_lock_error(error: Exception) -> bool:
+    """Является ли ошибка блокировкой базы данных"""
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error.orig if error.orig is not None else error).lower()
+    return 'database is locked' in message or 'database is busy' in message \
+        or 'could not serialize' in message or 'deadlock' in message
+
+
+def run_with_retry(operation: Callable[[], Any], attempts: int = None, backoff_ms: int = None) -> Any:
+    """Выполнение операции с повторными попытками при блокировке БД
+
+    Между попытками выдерживается экспоненциально растущая пауза со случайным
+    разбросом. Операция должна сама откатывать свою транзакцию при ошибке.
+    """
+    # Операция выполняется хотя бы один раз, даже при DB_RETRY_ATTEMPTS = 0
+    attempts = max(1, attempts if attempts is not None else Config.DB_RETRY_ATTEMPTS)
+    backoff_ms = backoff_ms if backoff_ms is not None else Config.DB_RETRY_BACKOFF_MS
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return operation()
+        except OperationalError as e:
+            if attempt == attempts or not is_lock_error(e):
+                raise
+            delay = backoff_ms * (2 ** (attempt - 1)) / 1000
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+async def run_with_retry_async(operation: Callable[[], Awaitable[Any]], attempts: int = None,
+                               backoff_ms: int = None) -> Any:
+    """Асинхронный вариант run_with_retry: пауза между попытками не блокирует цикл событий"""
+    attempts = max(1, attempts if attempts is not None else Config.DB_RETRY_ATTEMPTS)
+    backoff_ms = backoff_ms if backoff_ms is not None else Config.DB_RETRY_BACKOFF_MS
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return await operation()
+        except OperationalError as e:
+            if attempt == attempts or not is_lock_error(e):
+                raise
+            delay = backoff_ms * (2 ** (attempt - 1)) / 1000
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
@@ -0,0 +1,372 @@
+"""Фасетный поиск по каталогу: отбор изданий и количество по каждому значению фильтра
+
+Для каждого издания в памяти хранятся столбцы numpy: язык (код), издательство,
+год, цена, признак существования, и для каждого жанра - битовая маска изданий.
+Отбор по фильтрам - логические операции над масками, количество изданий по
+значениям фасета - np.bincount / np.count_nonzero по отобранным строкам,
+поэтому результат и все счетчики считаются за один проход по столбцам без
+агрегатного запроса на каждое значение.
+
+Счетчики фасета считаются с учетом всех фильтров, кроме фильтра самого
+фасета: выбрав жанр «Фантастика», пользователь видит, сколько изданий дадут
+остальные жанры (значения одного фасета объединяются по ИЛИ, разные фасеты -
+по И).
+
+Изменения изданий (цена, год, язык, издательство) и связей с жанрами
+попадают в журнал facet_journal через триггеры SQLite; перед каждым поиском
+применяются только новые записи журнала.
+"""
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.engine import Engine
+from models.database_models import Genre, Publication, Publisher, facet_journal, publication_genres
+
+# Ценовые диапазоны (нижняя граница включительно, верхняя - нет)
+PRICE_BANDS: List[Tuple[float, Optional[float]]] = [
+    (0, 300), (300, 500), (500, 1000), (1000, 2000), (2000, 5000), (5000, None),
+]
+# Ширина интервала фасета «год издания»
+YEAR_BUCKET = 10
+# Сколько записей журнала хранить для отставших процессов; остальные удаляются
+JOURNAL_KEEP = 10000
+# При большем числе измененных изданий (массовая загрузка) столбцы читаются заново
+RELOAD_THRESHOLD = 5000
+
+FacetValue = namedtuple('FacetValue', 'key label count')
+FacetResult = namedtuple('FacetResult', 'total publication_ids facets')
+
+
+def price_band_label(band: int) -> str:
+    low, high = PRICE_BANDS[band]
+    return f"от {low:g} руб." if high is None else f"{low:g}-{high:g} руб."
+
+
+class FacetIndex:
+    """Столбцы изданий в памяти для фасетного поиска"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.journal_seq = 0
+
+    # --- загрузка и обновление ---
+
+    def _load(self):
+        with self.engine.connect() as connection:
+            # Журнал до этой отметки уже отражен в читаемых строках (одна транзакция чтения)
+            self.journal_seq = connection.execute(select(func.max(facet_journal.c.seq))).scalar() or 0
+            rows = connection.execute(
+                select(Publication.id, Publication.language, Publication.publisher_id,
+                       Publication.publication_year, Publication.price).order_by(Publication.id)
+            ).all()
+            links = connection.execute(
+                select(publication_genres.c.publication_id, publication_genres.c.genre_id)
+            ).all()
+            self.genre_names = dict(connection.execute(select(Genre.id, Genre.name)).all())
+            self.publisher_names = dict(connection.execute(select(Publisher.id, Publisher.name)).all())
+
+        count = len(rows)
+        capacity = max(16, count * 5 // 4)
+        self.size = count
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.language = np.full(capacity, -1, dtype=np.int16)
+        self.publisher = np.full(capacity, -1, dtype=np.int64)
+        self.year = np.zeros(capacity, dtype=np.int32)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.languages: List[str] = []
+        self._language_codes: Dict[str, int] = {}
+
+        if count:
+            columns = list(zip(*rows))
+            self.ids[:count] = columns[0]
+            self.alive[:count] = True
+            self.language[:count] = [self._language_code(value) for value in columns[1]]
+            self.publisher[:count] = [value if value is not None else -1 for value in columns[2]]
+            self.year[:count] = [value or 0 for value in columns[3]]
+            self.price[:count] = columns[4]
+
+        self.genres: Dict[int, np.ndarray] = {}
+        if links:
+            link_ids, link_genres = (np.array(column, dtype=np.int64) for column in zip(*links))
+            slots = np.searchsorted(self.ids[:count], link_ids)
+            for genre_id in np.unique(link_genres).tolist():
+                mask = np.zeros(capacity, dtype=bool)
+                mask[slots[link_genres == genre_id]] = True
+                self.genres[genre_id] = mask
+        self._loaded = True
+
+    def _language_code(self, language: Optional[str]) -> int:
+        if language is None:
+            return -1
+        code = self._language_codes.get(language)
+        if code is None:
+            code = self._language_codes[language] = len(self.languages)
+            self.languages.append(language)
+        return code
+
+    def _slot(self, publication_id: int, create: bool = False) -> Optional[int]:
+        """Позиция издания в столбцах; новые издания (id растут) дописываются в конец"""
+        slot = int(np.searchsorted(self.ids[:self.size], publication_id))
+        if slot < self.size and self.ids[slot] == publication_id:
+            return slot
+        if not create:
+            return None
+        if slot != self.size:
+            raise LookupError(publication_id)
+        if self.size == len(self.ids):
+            self._grow()
+        self.ids[slot] = publication_id
+        self.size += 1
+        return slot
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        for name in ('ids', 'alive', 'language', 'publisher', 'year', 'price'):
+            array = getattr(self, name)
+            grown = np.full(capacity, -1 if name in ('language', 'publisher') else 0, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+        for genre_id, mask in self.genres.items():
+            grown = np.zeros(capacity, dtype=bool)
+            grown[:len(mask)] = mask
+            self.genres[genre_id] = grown
+
+    def sync(self):
+        """Загрузить столбцы при первом обращении, затем применять новые записи журнала"""
+        if self._loaded:
+            with self.engine.connect() as connection:
+                changes = self._read_changes(connection)
+            if changes == ():
+                return
+            if changes is not None:
+                try:
+                    self._apply(*changes)
+                    self._trim_journal()
+                    return
+                except LookupError:
+                    pass  # Издание вне порядка id: столбцы читаются заново
+        self._load()
+
+    def _read_changes(self, connection):
+        """Новые записи журнала и текущие данные затронутых изданий
+
+        Возвращает () без изменений и None, если проще перечитать все столбцы:
+        нужные записи журнала уже удалены или изменений слишком много.
+        """
+        oldest = connection.execute(select(func.min(facet_journal.c.seq))).scalar()
+        if oldest is not None and oldest > self.journal_seq + 1:
+            return None
+        journal = connection.execute(
+            select(facet_journal.c.seq, facet_journal.c.publication_id)
+            .where(facet_journal.c.seq > self.journal_seq)
+        ).all()
+        if not journal:
+            return ()
+        changed = sorted({row.publication_id for row in journal})
+        if len(changed) > RELOAD_THRESHOLD:
+            return None
+
+        rows = {row.id: row for row in connection.execute(
+            select(Publication.id, Publication.language, Publication.publisher_id,
+                   Publication.publication_year, Publication.price).where(Publication.id.in_(changed))
+        )}
+        links = connection.execute(
+            select(publication_genres.c.publication_id, publication_genres.c.genre_id)
+            .where(publication_genres.c.publication_id.in_(changed))
+        ).all()
+        unknown_genres = {row.genre_id for row in links} - set(self.genre_names)
+        if unknown_genres:
+            self.genre_names.update(connection.execute(
+                select(Genre.id, Genre.name).where(Genre.id.in_(unknown_genres))).all())
+        publishers = {row.publisher_id for row in rows.values()} - set(self.publisher_names) - {None}
+        if publishers:
+            self.publisher_names.update(connection.execute(
+                select(Publisher.id, Publisher.name).where(Publisher.id.in_(publishers))).all())
+        return changed, rows, links, max(row.seq for row in journal)
+
+    def refresh(self):
+        """Перечитать столбцы целиком (для СУБД без триггеров журнала)"""
+        with self._lock:
+            self._load()
+
+    def _apply(self, changed: Sequence[int], rows: Dict, links: Iterable, journal_seq: int):
+        genres_by_publication: Dict[int, List[int]] = {}
+        for publication_id, genre_id in links:
+            genres_by_publication.setdefault(publication_id, []).append(genre_id)
+
+        for publication_id in changed:
+            row = rows.get(publication_id)
+            slot = self._slot(publication_id, create=row is not None)
+            if slot is None:
+                continue
+            for mask in self.genres.values():
+                mask[slot] = False
+            if row is None:
+                self.alive[slot] = False
+                continue
+            self.alive[slot] = True
+            self.language[slot] = self._language_code(row.language)
+            self.publisher[slot] = row.publisher_id if row.publisher_id is not None else -1
+            self.year[slot] = row.publication_year or 0
+            self.price[slot] = row.price
+            for genre_id in genres_by_publication.get(publication_id, ()):
+                if genre_id not in self.genres:
+                    self.genres[genre_id] = np.zeros(len(self.ids), dtype=bool)
+                self.genres[genre_id][slot] = True
+        self.journal_seq = journal_seq
+
+    def _trim_journal(self):
+        with self.engine.begin() as connection:
+            connection.execute(delete(facet_journal).where(facet_journal.c.seq <= self.journal_seq - JOURNAL_KEEP))
+
+    # --- поиск ---
+
+    def _masks(self, genre_ids, languages, publisher_ids, min_year, max_year, price_bands) -> Dict[str, np.ndarray]:
+        """Маска каждого заданного фильтра по столбцам [0, size)"""
+        size = self.size
+        masks = {}
+        if genre_ids:
+            mask = np.zeros(size, dtype=bool)
+            for genre_id in genre_ids:
+                if genre_id in self.genres:
+                    mask |= self.genres[genre_id][:size]
+            masks['genre'] = mask
+        if languages:
+            codes = [self._language_codes[language] for language in languages if language in self._language_codes]
+            masks['language'] = np.isin(self.language[:size], codes)
+        if publisher_ids:
+            masks['publisher'] = np.isin(self.publisher[:size], list(publisher_ids))
+        if min_year is not None or max_year is not None:
+            year = self.year[:size]
+            mask = year > 0
+            if min_year is not None:
+                mask &= year >= min_year
+            if max_year is not None:
+                mask &= year <= max_year
+            masks['year'] = mask
+        if price_bands:
+            price = self.price[:size]
+            mask = np.zeros(size, dtype=bool)
+            for band in price_bands:
+                low, high = PRICE_BANDS[band]
+                mask |= (price >= low) if high is None else ((price >= low) & (price < high))
+            masks['price'] = mask
+        return masks
+
+    def search(self, genre_ids: Sequence[int] = (), languages: Sequence[str] = (),
+               publisher_ids: Sequence[int] = (), min_year: Optional[int] = None,
+               max_year: Optional[int] = None, price_bands: Sequence[int] = (),
+               publication_ids: Optional[Sequence[int]] = None, limit: int = 20,
+               top_publishers: int = 10) -> FacetResult:
+        """Издания, подходящие под фильтры, и количество изданий по значениям каждого фасета
+
+        publication_ids ограничивает поиск заранее найденными изданиями (например,
+        полнотекстовым поиском). Возвращает первые limit идентификаторов и
+        словарь фасет -> список FacetValue(key, label, count) с ненулевыми счетчиками.
+        """
+        with self._lock:
+            self.sync()
+            size = self.size
+            base = self.alive[:size].copy()
+            if publication_ids is not None:
+                base &= np.isin(self.ids[:size], np.fromiter(publication_ids, dtype=np.int64))
+
+            masks = self._masks(genre_ids, languages, publisher_ids, min_year, max_year, price_bands)
+
+            def selection(excluded: Optional[str] = None) -> np.ndarray:
+                mask = base.copy()
+                for name, facet_mask in masks.items():
+                    if name != excluded:
+                        mask &= facet_mask
+                return mask
+
+            selected = selection()
+            facets = {
+                'genre': self._genre_counts(selection('genre')),
+                'language': self._language_counts(selection('language')),
+                'publisher': self._publisher_counts(selection('publisher'), top_publishers),
+                'year': self._year_counts(selection('year')),
+                'price': self._price_counts(selection('price')),
+            }
+            matched = np.flatnonzero(selected)
+            return FacetResult(len(matched), self.ids[matched[:limit]].tolist(), facets)
+
+    def _genre_counts(self, mask: np.ndarray) -> List[FacetValue]:
+        size = self.size
+        values = [FacetValue(genre_id, self.genre_names.get(genre_id, str(genre_id)),
+                             int(np.count_nonzero(genre_mask[:size] & mask)))
+                  for genre_id, genre_mask in self.genres.items()]
+        return sorted((value for value in values if value.count), key=lambda value: -value.count)
+
+    def _language_counts(self, mask: np.ndarray) -> List[FacetValue]:
+        codes = self.language[:self.size][mask]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.languages))
+        values = [FacetValue(language, language, int(counts[code])) for code, language in enumerate(self.languages)]
+        return sorted((value for value in values if value.count), key=lambda value: -value.count)
+
+    def _publisher_counts(self, mask: np.ndarray, top: int) -> List[FacetValue]:
+        publishers = self.publisher[:self.size][mask]
+        keys, counts = np.unique(publishers[publishers >= 0], return_counts=True)
+        order = np.argsort(-counts, kind='stable')[:top]
+        return [FacetValue(int(keys[i]), self.publisher_names.get(int(keys[i]), str(keys[i])), int(counts[i]))
+                for i in order]
+
+    def _year_counts(self, mask: np.ndarray) -> List[FacetValue]:
+        years = self.year[:self.size][mask]
+        years = years[years > 0]
+        if not len(years):
+            return []
+        keys, counts = np.unique(years // YEAR_BUCKET * YEAR_BUCKET, return_counts=True)
+        return [FacetValue((int(key), int(key) + YEAR_BUCKET - 1), f"{key}-{key + YEAR_BUCKET - 1}", int(count))
+                for key, count in zip(keys, counts)]
+
+    def _price_counts(self, mask: np.ndarray) -> List[FacetValue]:
+        edges = [low for low, _ in PRICE_BANDS[1:]]
+        bands = np.searchsorted(edges, self.price[:self.size][mask], side='right')
+        counts = np.bincount(bands, minlength=len(PRICE_BANDS))
+        return [FacetValue(band, price_band_label(band), int(count))
+                for band, count in enumerate(counts) if count]
+
+
+# --- журнал изменений ---
+
+JOURNAL_TRIGGERS = {
+    'publications_facets_ai': """
+        CREATE TRIGGER IF NOT EXISTS publications_facets_ai AFTER INSERT ON publications BEGIN
+        INSERT INTO facet_journal (publication_id) VALUES (NEW.id);
+        END""",
+    'publications_facets_au': """
+        CREATE TRIGGER IF NOT EXISTS publications_facets_au
+        AFTER UPDATE OF language, publisher_id, publication_year, price ON publications BEGIN
+        INSERT INTO facet_journal (publication_id) VALUES (NEW.id);
+        END""",
+    'publications_facets_ad': """
+        CREATE TRIGGER IF NOT EXISTS publications_facets_ad AFTER DELETE ON publications BEGIN
+        INSERT INTO facet_journal (publication_id) VALUES (OLD.id);
+        END""",
+    'publication_genres_facets_ai': """
+        CREATE TRIGGER IF NOT EXISTS publication_genres_facets_ai AFTER INSERT ON publication_genres BEGIN
+        INSERT INTO facet_journal (publication_id) VALUES (NEW.publication_id);
+        END""",
+    'publication_genres_facets_ad': """
+        CREATE TRIGGER IF NOT EXISTS publication_genres_facets_ad AFTER DELETE ON publication_genres BEGIN
+        INSERT INTO facet_journal (publication_id) VALUES (OLD.publication_id);
+        END""",
+}
+
+
+def ensure_journal_triggers(engine: Engine) -> List[str]:
+    """Создать триггеры журнала (только SQLite; на других СУБД столбцы обновляются перезагрузкой)"""
+    if engine.dialect.name != 'sqlite':
+        return []
+    with engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        for ddl in JOURNAL_TRIGGERS.values():
+            connection.exec_driver_sql(ddl)
+    return [name for name in JOURNAL_TRIGGERS if name not in existing]
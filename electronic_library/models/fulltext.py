@@ -0,0 +1,183 @@
+"""Полнотекстовый индекс каталога на SQLite FTS5
+
+Виртуальная таблица publications_fts хранит для каждого издания (rowid = id
+издания) название, описание, имена авторов, названия жанров и ISBN.
+Синхронизация с основными таблицами выполняется триггерами на вставку,
+изменение и удаление публикаций, связей с авторами и жанрами, а также на
+переименование авторов и жанров, поэтому индекс актуален при любом способе
+записи, включая пакетную вставку через Core.
+
+Токенизатор unicode61 приводит регистр кириллицы, «ё» при индексации и в
+запросах заменяется на «е». Каждое слово запроса ищется как префикс,
+результаты упорядочены по BM25.
+
+Индекс создает models.migrations.upgrade; на других СУБД поиск идет прежними
+запросами ILIKE (см. CatalogQueries).
+"""
+import re
+from typing import Dict, Optional
+from sqlalchemy import Column, Integer, MetaData, Table, Text, func, inspect, literal_column, text
+from sqlalchemy.engine import Engine
+
+FTS_TABLE = 'publications_fts'
+
+# Описание виртуальной таблицы для построения запросов (не создается через create_all)
+fts_metadata = MetaData()
+publications_fts = Table(
+    FTS_TABLE, fts_metadata,
+    Column('rowid', Integer, primary_key=True),
+    Column('title', Text),
+    Column('description', Text),
+    Column('authors', Text),
+    Column('genres', Text),
+    Column('isbn', Text),
+)
+
+# Веса колонок для bm25 в порядке объявления: название и ISBN важнее описания
+BM25_WEIGHTS = (10.0, 1.0, 5.0, 2.0, 10.0)
+
+CREATE_FTS_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    title, description, authors, genres, isbn,
+    tokenize = "unicode61 remove_diacritics 2"
+)
+"""
+
+
+def _fold_yo(expression: str) -> str:
+    """remove_diacritics действует только на латиницу, поэтому «ё» заменяется явно"""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Строки индекса для изданий, выбранных условием {where}
+_INDEX_ROWS = f"""
+INSERT INTO {{fts}} (rowid, title, description, authors, genres, isbn)
+SELECT p.id, {_fold_yo('p.title')}, {_fold_yo('p.description')},
+       (SELECT {_fold_yo("group_concat(a.full_name, ' ')")} FROM authors a
+          JOIN publication_authors pa ON pa.author_id = a.id WHERE pa.publication_id = p.id),
+       (SELECT {_fold_yo("group_concat(g.name, ' ')")} FROM genres g
+          JOIN publication_genres pg ON pg.genre_id = g.id WHERE pg.publication_id = p.id),
+       -- ISBN хранится и с дефисами, и одним словом, чтобы находиться по любой записи
+       coalesce(p.isbn || ' ' || replace(p.isbn, '-', ''), '')
+FROM publications p WHERE {{where}};
+"""
+
+
+def _reindex(where: str, delete_where: str) -> str:
+    """Тело триггера: удалить устаревшие строки индекса и построить заново"""
+    return (f"DELETE FROM {FTS_TABLE} WHERE {delete_where};\n"
+            + _INDEX_ROWS.format(fts=FTS_TABLE, where=where))
+
+
+FTS_TRIGGERS: Dict[str, str] = {
+    'publications_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS publications_fts_ai AFTER INSERT ON publications BEGIN
+        {_INDEX_ROWS.format(fts=FTS_TABLE, where='p.id = NEW.id')}
+        END""",
+    'publications_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS publications_fts_au
+        AFTER UPDATE OF title, description, isbn ON publications BEGIN
+        {_reindex('p.id = NEW.id', 'rowid IN (OLD.id, NEW.id)')}
+        END""",
+    'publications_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS publications_fts_ad AFTER DELETE ON publications BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id;
+        END""",
+    'publication_authors_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS publication_authors_fts_ai AFTER INSERT ON publication_authors BEGIN
+        {_reindex('p.id = NEW.publication_id', 'rowid = NEW.publication_id')}
+        END""",
+    'publication_authors_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS publication_authors_fts_ad AFTER DELETE ON publication_authors BEGIN
+        {_reindex('p.id = OLD.publication_id', 'rowid = OLD.publication_id')}
+        END""",
+    'publication_genres_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS publication_genres_fts_ai AFTER INSERT ON publication_genres BEGIN
+        {_reindex('p.id = NEW.publication_id', 'rowid = NEW.publication_id')}
+        END""",
+    'publication_genres_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS publication_genres_fts_ad AFTER DELETE ON publication_genres BEGIN
+        {_reindex('p.id = OLD.publication_id', 'rowid = OLD.publication_id')}
+        END""",
+    'authors_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS authors_fts_au AFTER UPDATE OF full_name ON authors BEGIN
+        {_reindex('p.id IN (SELECT publication_id FROM publication_authors WHERE author_id = NEW.id)',
+                  'rowid IN (SELECT publication_id FROM publication_authors WHERE author_id = NEW.id)')}
+        END""",
+    'genres_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS genres_fts_au AFTER UPDATE OF name ON genres BEGIN
+        {_reindex('p.id IN (SELECT publication_id FROM publication_genres WHERE genre_id = NEW.id)',
+                  'rowid IN (SELECT publication_id FROM publication_genres WHERE genre_id = NEW.id)')}
+        END""",
+}
+
+
+def ensure_fulltext_index(engine: Engine) -> bool:
+    """Создать таблицу FTS5 и триггеры; при создании таблицы заполнить ее
+
+    Возвращает True, если индекс был построен заново.
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    created = FTS_TABLE not in inspect(engine).get_table_names()
+    with engine.begin() as connection:
+        connection.exec_driver_sql(CREATE_FTS_TABLE)
+        for ddl in FTS_TRIGGERS.values():
+            connection.exec_driver_sql(ddl)
+    if created:
+        rebuild_fulltext_index(engine)
+    return created
+
+
+def rebuild_fulltext_index(engine: Engine) -> int:
+    """Перестроить индекс по всем изданиям; возвращает число проиндексированных"""
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DELETE FROM {FTS_TABLE}")
+        connection.exec_driver_sql(_INDEX_ROWS.format(fts=FTS_TABLE, where='1'))
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        return connection.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+# --- построение запросов ---
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_ISBN_RE = re.compile(r'^[\dXx][\dXx\-\s]{3,}$')
+
+
+def _terms(value: str) -> list:
+    """Слова запроса для MATCH; ISBN с дефисами превращается в одно слово"""
+    value = value.strip()
+    if _ISBN_RE.match(value):
+        return [re.sub(r'[\-\s]', '', value).lower()]
+    return [word.lower().replace('ё', 'е') for word in _WORD_RE.findall(value)]
+
+
+def match_expression(text_query: str = '', **column_queries: str) -> Optional[str]:
+    """Выражение FTS5 MATCH: все слова обязательны, каждое ищется как префикс
+
+    text_query ищется по всем колонкам, column_queries - по отдельным колонкам
+    (title, description, authors, genres, isbn), например
+    match_expression(title='war', authors='толст') -> 'title : ("war"*) AND authors : ("толст"*)'.
+    """
+    parts = []
+    for column, value in [(None, text_query)] + list(column_queries.items()):
+        terms = _terms(value or '')
+        if not terms:
+            continue
+        expression = ' AND '.join(f'"{term}"*' for term in terms)
+        parts.append(f'{column} : ({expression})' if column else f'({expression})')
+    return ' AND '.join(parts) if parts else None
+
+
+def apply_fulltext(query, model_id_column, expression: str):
+    """Ограничить select() изданиями, подходящими под выражение, и упорядочить по BM25"""
+    fts = literal_column(FTS_TABLE)
+    return query.join(publications_fts, publications_fts.c.rowid == model_id_column) \
+        .where(fts.op('MATCH')(expression)) \
+        .order_by(func.bm25(fts, *BM25_WEIGHTS))
+
+
+def fulltext_supported(bind) -> bool:
+    """Полнотекстовый индекс есть только в SQLite"""
+    return bind is not None and bind.dialect.name == 'sqlite'
@@ -0,0 +1,464 @@
+"""Нечеткий поиск имен авторов и названий изданий по триграммам
+
+Строка нормализуется (регистр, «ё» -> «е», «й» -> «и», знаки препинания -> пробел)
+и раскладывается на триграммы слов с дополнением пробелами, как в pg_trgm:
+«лев» -> «  л», « ле», «лев», «ев ». Похожесть двух строк - доля общих
+триграмм (коэффициент Жаккара), похожесть по словам - доля триграмм запроса,
+найденных в строке (запрос «толстой» похож на «Лев Николаевич Толстой»).
+
+Индекс одного вида (author - authors.full_name, title - publications.title)
+состоит из снимка и надстройки:
+- снимок - массивы numpy: различные нормализованные строки, их идентификаторы
+  (CSR) и списки строк по каждой триграмме (CSR); хранится сжатым в таблице
+  fuzzy_index и загружается в память одним запросом;
+- надстройка - словари в памяти для записей, измененных после снимка.
+  Изменения приходят из журнала fuzzy_index_journal, который заполняют
+  триггеры на вставку, изменение и удаление авторов и изданий; перед каждым
+  поиском читаются только новые записи журнала.
+
+Поиск берет списки самых редких триграмм запроса в пределах бюджета, считает
+совпадения через numpy и проверяет лучших кандидатов точным расчетом, поэтому
+время ответа почти не зависит от числа строк (на 1 млн названий - меньше
+миллисекунды в медиане, см. benchmarks/fuzzy_index_benchmark.py).
+
+Перестроить снимки (например, после массовой загрузки) и проверить поиск:
+    python -m models.fuzzy_index rebuild
+    python -m models.fuzzy_index search --kind author --query "Талстой"
+"""
+import argparse
+import io
+import re
+import sys
+import threading
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from models.database_models import Author, Publication, fuzzy_index, fuzzy_index_journal
+
+# Вид индекса -> колонка с индексируемым текстом
+KINDS = {
+    'author': Author.__table__.c.full_name,
+    'title': Publication.__table__.c.title,
+}
+
+# Сколько элементов списков триграмм просматривается за один поиск
+POSTINGS_BUDGET = 20000
+# Сколько самых редких триграмм запроса берется всегда, даже сверх бюджета
+MIN_TRIGRAMS = 3
+# Сколько кандидатов проверяется точным расчетом похожести
+CANDIDATES = 64
+
+# Пороги похожести для поиска с опечатками и подсказки «возможно, вы имели в виду»
+SEARCH_SIMILARITY = 0.5
+SUGGEST_SIMILARITY = 0.5
+
+FuzzyMatch = namedtuple('FuzzyMatch', 'text score entity_ids')
+
+_SEPARATOR = '\n'
+_NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(value: str) -> str:
+    """Строка для сравнения: регистр, «ё», «й» и знаки препинания не учитываются"""
+    value = (value or '').casefold().replace('ё', 'е').replace('й', 'и')
+    return _NON_WORD_RE.sub(' ', value).strip()
+
+
+def trigrams(normalized: str) -> Set[str]:
+    """Триграммы слов нормализованной строки"""
+    result = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(query_trigrams: Set[str], candidate_trigrams: Set[str]) -> float:
+    """Доля общих триграмм (коэффициент Жаккара)"""
+    shared = len(query_trigrams & candidate_trigrams)
+    return shared / (len(query_trigrams) + len(candidate_trigrams) - shared) if shared else 0.0
+
+
+def word_similarity(query_trigrams: Set[str], candidate_trigrams: Set[str]) -> float:
+    """Доля триграмм запроса, найденных в строке"""
+    return len(query_trigrams & candidate_trigrams) / len(query_trigrams) if query_trigrams else 0.0
+
+
+def _pack_strings(values: Iterable[str]) -> np.ndarray:
+    return np.frombuffer(_SEPARATOR.join(values).encode('utf-8'), dtype=np.uint8)
+
+
+def _unpack_strings(array: np.ndarray) -> List[str]:
+    data = array.tobytes().decode('utf-8')
+    return data.split(_SEPARATOR) if data else []
+
+
+class TrigramIndex:
+    """Триграммный индекс строк одного вида: снимок numpy и надстройка изменений"""
+
+    def __init__(self, terms: List[str], displays: List[str], entity_offsets: np.ndarray,
+                 entity_ids: np.ndarray, trigram_keys: List[str], posting_offsets: np.ndarray,
+                 postings: np.ndarray, journal_seq: int = 0):
+        # Снимок: строки (слоты), их идентификаторы и списки слотов по триграммам
+        self.terms = terms
+        self.displays = displays
+        self.entity_offsets = entity_offsets
+        self.entity_ids = entity_ids
+        # Число триграмм строки = число ее вхождений в списки триграмм
+        self.term_sizes = np.bincount(postings, minlength=len(terms))
+        self.trigram_keys = trigram_keys
+        self.trigram_slots = {key: position for position, key in enumerate(trigram_keys)}
+        self.posting_offsets = posting_offsets
+        self.postings = postings
+        self.journal_seq = journal_seq
+
+        # Надстройка: идентификаторы, измененные после снимка, и их текущие строки
+        self.stale_ids: Set[int] = set()
+        self.overlay_terms: Dict[str, Set[int]] = {}
+        self.overlay_displays: Dict[str, str] = {}
+        self.overlay_postings: Dict[str, Set[str]] = {}
+        self.overlay_entity_terms: Dict[int, str] = {}
+
+    # --- построение и сохранение ---
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, str]], journal_seq: int = 0) -> 'TrigramIndex':
+        """Построить снимок по парам (идентификатор, текст)"""
+        slots: Dict[str, int] = {}
+        displays: List[str] = []
+        slot_entities: List[List[int]] = []
+        for entity_id, value in rows:
+            term = normalize(value)
+            if not term:
+                continue
+            slot = slots.get(term)
+            if slot is None:
+                slot = slots[term] = len(displays)
+                displays.append(' '.join((value or '').split()))
+                slot_entities.append([])
+            slot_entities[slot].append(entity_id)
+
+        terms = list(slots)
+        entity_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        entity_offsets[1:] = np.cumsum([len(ids) for ids in slot_entities])
+        entity_ids = np.fromiter((entity_id for ids in slot_entities for entity_id in ids),
+                                 dtype=np.int64, count=int(entity_offsets[-1]))
+
+        # Пары (триграмма, слот), упорядоченные по триграмме, дают списки слотов
+        trigram_ids: Dict[str, int] = {}
+        pair_trigrams, pair_slots = [], []
+        for slot, term in enumerate(terms):
+            for trigram in trigrams(term):
+                pair_trigrams.append(trigram_ids.setdefault(trigram, len(trigram_ids)))
+                pair_slots.append(slot)
+        pair_trigrams = np.array(pair_trigrams, dtype=np.int32)
+        order = np.argsort(pair_trigrams, kind='stable')
+        postings = np.array(pair_slots, dtype=np.int32)[order]
+        posting_offsets = np.zeros(len(trigram_ids) + 1, dtype=np.int64)
+        posting_offsets[1:] = np.cumsum(np.bincount(pair_trigrams, minlength=len(trigram_ids)))
+
+        return cls(terms, displays, entity_offsets, entity_ids, list(trigram_ids),
+                   posting_offsets, postings, journal_seq)
+
+    def to_bytes(self) -> bytes:
+        """Сжатый снимок (надстройка не сохраняется: ее восстановит журнал)
+
+        Сжатие вдвое уменьшает снимок, но на миллионе строк занимает десятки
+        секунд: на больших базах снимки лучше построить заранее командой rebuild.
+        """
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            terms=_pack_strings(self.terms),
+            displays=_pack_strings(self.displays),
+            entity_offsets=self.entity_offsets,
+            entity_ids=self.entity_ids,
+            trigram_keys=_pack_strings(self.trigram_keys),
+            posting_offsets=self.posting_offsets,
+            postings=self.postings,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, journal_seq: int = 0) -> 'TrigramIndex':
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(
+                _unpack_strings(arrays['terms']), _unpack_strings(arrays['displays']),
+                arrays['entity_offsets'], arrays['entity_ids'], _unpack_strings(arrays['trigram_keys']),
+                arrays['posting_offsets'], arrays['postings'], journal_seq,
+            )
+
+    def __len__(self) -> int:
+        return len(self.terms) + len(self.overlay_terms)
+
+    # --- изменения ---
+
+    def apply_changes(self, changes: Dict[int, Optional[str]], journal_seq: int):
+        """Учесть новые значения текста по идентификаторам (None - запись удалена)"""
+        for entity_id, value in changes.items():
+            self.stale_ids.add(entity_id)
+            old_term = self.overlay_entity_terms.pop(entity_id, None)
+            if old_term is not None:
+                self._overlay_discard(old_term, entity_id)
+
+            term = normalize(value) if value is not None else ''
+            if not term:
+                continue
+            self.overlay_entity_terms[entity_id] = term
+            if term not in self.overlay_terms:
+                self.overlay_terms[term] = set()
+                self.overlay_displays[term] = ' '.join(value.split())
+                for trigram in trigrams(term):
+                    self.overlay_postings.setdefault(trigram, set()).add(term)
+            self.overlay_terms[term].add(entity_id)
+        self.journal_seq = max(self.journal_seq, journal_seq)
+
+    def _overlay_discard(self, term: str, entity_id: int):
+        ids = self.overlay_terms.get(term)
+        if ids is None:
+            return
+        ids.discard(entity_id)
+        if not ids:
+            del self.overlay_terms[term]
+            del self.overlay_displays[term]
+            for trigram in trigrams(term):
+                terms = self.overlay_postings.get(trigram)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self.overlay_postings[trigram]
+
+    # --- поиск ---
+
+    def _snapshot_entities(self, slot: int) -> Tuple[int, ...]:
+        ids = self.entity_ids[self.entity_offsets[slot]:self.entity_offsets[slot + 1]]
+        if self.stale_ids:
+            return tuple(int(entity_id) for entity_id in ids if int(entity_id) not in self.stale_ids)
+        return tuple(int(entity_id) for entity_id in ids)
+
+    def _snapshot_candidates(self, query_trigrams: Set[str], by_words: bool,
+                             min_similarity: float) -> List[Tuple[int, float]]:
+        """Слоты снимка, похожие на запрос, с точной похожестью
+
+        Кандидаты отбираются по спискам самых редких триграмм запроса в
+        пределах бюджета, затем для лучших из них вхождение в остальные
+        (длинные) списки проверяется двоичным поиском: списки упорядочены
+        по слоту.
+        """
+        ranges = []
+        for trigram in query_trigrams:
+            position = self.trigram_slots.get(trigram)
+            if position is not None:
+                start, end = self.posting_offsets[position], self.posting_offsets[position + 1]
+                ranges.append((end - start, start, end))
+        if not ranges:
+            return []
+
+        ranges.sort()
+        scanned, split = 0, len(ranges)
+        for count, (length, start, end) in enumerate(ranges):
+            if count >= MIN_TRIGRAMS and scanned + length > POSTINGS_BUDGET:
+                split = count
+                break
+            scanned += length
+
+        slots, shared = np.unique(
+            np.concatenate([self.postings[start:end] for _, start, end in ranges[:split]]),
+            return_counts=True)
+        if len(slots) > CANDIDATES:
+            best = np.argpartition(shared, -CANDIDATES)[-CANDIDATES:]
+            slots, shared = slots[best], shared[best]
+        for _, start, end in ranges[split:]:
+            posting = self.postings[start:end]
+            found = np.minimum(np.searchsorted(posting, slots), len(posting) - 1)
+            shared = shared + (posting[found] == slots)
+
+        if by_words:
+            scores = shared / len(query_trigrams)
+        else:
+            scores = shared / (len(query_trigrams) + self.term_sizes[slots] - shared)
+        passed = scores >= min_similarity
+        return list(zip(slots[passed].tolist(), scores[passed].tolist()))
+
+    def search(self, query: str, limit: int = 5, min_similarity: float = 0.3,
+               by_words: bool = False) -> List[FuzzyMatch]:
+        """Строки индекса, похожие на query, по убыванию похожести
+
+        by_words=True сравнивает по доле триграмм запроса (поиск по части
+        строки, например фамилии), иначе - по коэффициенту Жаккара.
+        """
+        query_trigrams = trigrams(normalize(query))
+        if not query_trigrams:
+            return []
+        measure = word_similarity if by_words else similarity
+
+        matches: Dict[str, FuzzyMatch] = {}
+        for slot, score in self._snapshot_candidates(query_trigrams, by_words, min_similarity):
+            term = self.terms[slot]
+            entity_ids = self._snapshot_entities(slot)
+            if entity_ids:
+                matches[term] = FuzzyMatch(self.displays[slot], score, entity_ids)
+
+        overlay_candidates = set()
+        for trigram in query_trigrams:
+            overlay_candidates.update(self.overlay_postings.get(trigram, ()))
+        for term in overlay_candidates:
+            score = measure(query_trigrams, trigrams(term))
+            if score < min_similarity:
+                continue
+            known = matches.get(term)
+            entity_ids = tuple(sorted(self.overlay_terms[term]))
+            if known is not None:
+                entity_ids = tuple(sorted(set(known.entity_ids) | set(entity_ids)))
+            matches[term] = FuzzyMatch(self.overlay_displays[term], score, entity_ids)
+
+        return sorted(matches.values(), key=lambda match: (-match.score, match.text))[:limit]
+
+
+class FuzzyMatcher:
+    """Индексы всех видов для одной базы: загрузка, синхронизация с журналом, поиск"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._indexes: Dict[str, TrigramIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, kind: str) -> TrigramIndex:
+        """Актуальный индекс вида kind: загрузить или построить, затем применить журнал"""
+        if kind not in KINDS:
+            raise ValueError(f"Неизвестный вид индекса: {kind}")
+        with self._lock:
+            with self.engine.connect() as connection:
+                index = self._indexes.get(kind)
+                stored_seq = connection.execute(
+                    select(fuzzy_index.c.journal_seq).where(fuzzy_index.c.kind == kind)
+                ).scalar()
+                if stored_seq is None:
+                    index = None
+                elif index is None or stored_seq > index.journal_seq:
+                    # Снимок в базе новее: журнал до него мог быть очищен
+                    index = self._load(connection, kind)
+            if index is None:
+                index = self.rebuild(kind)[kind]
+            self._sync(index, kind)
+            self._indexes[kind] = index
+            return index
+
+    def similar(self, kind: str, query: str, limit: int = 5, min_similarity: float = 0.3,
+                by_words: bool = False) -> List[FuzzyMatch]:
+        """Похожие авторы (kind='author') или названия (kind='title')"""
+        return self.index(kind).search(query, limit, min_similarity, by_words)
+
+    def _load(self, connection: Connection, kind: str) -> TrigramIndex:
+        row = connection.execute(
+            select(fuzzy_index.c.data, fuzzy_index.c.journal_seq).where(fuzzy_index.c.kind == kind)
+        ).one()
+        return TrigramIndex.from_bytes(row.data, row.journal_seq)
+
+    def _sync(self, index: TrigramIndex, kind: str):
+        """Применить записи журнала, появившиеся после снимка"""
+        column = KINDS[kind]
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(fuzzy_index_journal.c.seq, fuzzy_index_journal.c.entity_id)
+                .where(fuzzy_index_journal.c.seq > index.journal_seq, fuzzy_index_journal.c.kind == kind)
+            ).all()
+            if not rows:
+                return
+            changed = {row.entity_id for row in rows}
+            current = dict(connection.execute(
+                select(column.table.c.id, column).where(column.table.c.id.in_(changed))
+            ).all())
+        index.apply_changes({entity_id: current.get(entity_id) for entity_id in changed},
+                            max(row.seq for row in rows))
+
+    def rebuild(self, kind: Optional[str] = None) -> Dict[str, TrigramIndex]:
+        """Построить снимки заново по таблицам и сохранить их в базе"""
+        built = {}
+        for name in ([kind] if kind else list(KINDS)):
+            column = KINDS[name]
+            with self.engine.begin() as connection:
+                # Записи журнала до этой отметки уже отражены в читаемых строках
+                journal_seq = connection.execute(select(func.max(fuzzy_index_journal.c.seq))).scalar() or 0
+                rows = connection.execute(select(column.table.c.id, column)).yield_per(50000)
+                index = TrigramIndex.build(((row[0], row[1]) for row in rows), journal_seq)
+                connection.execute(delete(fuzzy_index).where(fuzzy_index.c.kind == name))
+                connection.execute(insert(fuzzy_index).values(
+                    kind=name, built_at=datetime.now(), journal_seq=journal_seq, data=index.to_bytes()
+                ))
+            self._indexes[name] = built[name] = index
+        self._trim_journal()
+        return built
+
+    def _trim_journal(self):
+        """Удалить записи журнала, учтенные во всех сохраненных снимках"""
+        with self.engine.begin() as connection:
+            seqs = connection.execute(select(fuzzy_index.c.kind, fuzzy_index.c.journal_seq)).all()
+            if {row.kind for row in seqs} >= set(KINDS):
+                oldest = min(row.journal_seq for row in seqs)
+                connection.execute(delete(fuzzy_index_journal).where(fuzzy_index_journal.c.seq <= oldest))
+
+
+# --- журнал изменений ---
+
+def _journal_triggers(table: str, column: str, kind: str) -> Dict[str, str]:
+    journal = fuzzy_index_journal.name
+    return {
+        f'{table}_fuzzy_ai': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fuzzy_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {journal} (kind, entity_id) VALUES ('{kind}', NEW.id);
+            END""",
+        f'{table}_fuzzy_au': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fuzzy_au AFTER UPDATE OF {column} ON {table} BEGIN
+            INSERT INTO {journal} (kind, entity_id) VALUES ('{kind}', NEW.id);
+            END""",
+        f'{table}_fuzzy_ad': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fuzzy_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {journal} (kind, entity_id) VALUES ('{kind}', OLD.id);
+            END""",
+    }
+
+
+JOURNAL_TRIGGERS: Dict[str, str] = {}
+for _kind, _column in KINDS.items():
+    JOURNAL_TRIGGERS.update(_journal_triggers(_column.table.name, _column.name, _kind))
+
+
+def ensure_journal_triggers(engine: Engine) -> List[str]:
+    """Создать триггеры журнала (только SQLite; для других СУБД снимки перестраиваются командой rebuild)"""
+    if engine.dialect.name != 'sqlite':
+        return []
+    with engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        for ddl in JOURNAL_TRIGGERS.values():
+            connection.exec_driver_sql(ddl)
+    return [name for name in JOURNAL_TRIGGERS if name not in existing]
+
+
+def main():
+    from models.database_models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Нечеткий индекс имен авторов и названий')
+    parser.add_argument('command', choices=['rebuild', 'search'])
+    parser.add_argument('--kind', choices=sorted(KINDS), default=None)
+    parser.add_argument('--query', default='')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.database_url)
+    if args.command == 'rebuild':
+        for kind, index in db_manager.fuzzy.rebuild(args.kind).items():
+            print(f"{kind}: различных строк {len(index)}, триграмм {len(index.trigram_keys)}")
+        return 0
+
+    for match in db_manager.fuzzy.similar(args.kind or 'title', args.query, limit=10, by_words=True):
+        print(f"{match.score:.2f}  {match.text}  (id: {', '.join(map(str, match.entity_ids[:5]))})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""Учет SQL-запросов по действиям меню и поиск шаблонов N+1
+
+Включается переменной окружения SQL_INSTRUMENTATION=1. Запросы относятся к
+самой внутренней активной области: методу ElectronicLibraryApp или экспортера,
+помеченному декоратором @instrumented. По каждой области копятся число
+вызовов и запросов, время выполнения SQL и число полученных строк. Если за
+один вызов запрос одной формы (текст без значений параметров) выполнился
+SQL_N_PLUS_ONE_THRESHOLD раз и более, он отмечается как вероятный N+1 -
+обычно это ленивая загрузка связи в цикле. Отчет печатается при завершении
+процесса и, если задан SQL_INSTRUMENTATION_REPORT, сохраняется в JSON.
+
+Для проверок и бенчмарков есть query_budget(): контекст, который считает
+запросы движка в текущем потоке независимо от переменной окружения и
+бросает QueryBudgetExceeded при превышении бюджета (tests/test_query_budgets.py).
+"""
+import atexit
+import functools
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+
+# Списки параметров IN (?, ?, ...) разной длины считаются одной формой запроса
+_IN_LIST_RE = re.compile(r'\(\?(?:,\s*\?)+\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: текст без переменных частей"""
+    return _IN_LIST_RE.sub('(?...)', _WHITESPACE_RE.sub(' ', statement).strip())
+
+
+class _CountingCursor:
+    """Обертка курсора DBAPI, считающая полученные строки"""
+
+    def __init__(self, cursor, on_rows):
+        self._cursor = cursor
+        self._on_rows = on_rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._on_rows(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._on_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._on_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._on_rows(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryRecorder:
+    """Счетчики запросов одного вызова (или одного бюджета)"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.shapes: Counter = Counter()
+
+    def add_rows(self, count: int):
+        self.rows += count
+
+    def repeated_shapes(self, threshold: int) -> Dict[str, int]:
+        """Формы запросов, повторившиеся не менее threshold раз"""
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+class SQLInstrumentation:
+    """Сбор статистики SQL по областям (действиям меню, вызовам экспортеров)"""
+
+    def __init__(self, n_plus_one_threshold: int = 5):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._engines = []
+        self.stats: Dict[str, Dict[str, object]] = {}
+
+    # --- подключение к движку ---
+
+    def attach(self, engine: Engine):
+        """Подписаться на события выполнения запросов движка"""
+        if engine in self._engines:
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        self._engines.append(engine)
+
+    def detach(self, engine: Engine):
+        if engine not in self._engines:
+            return
+        event.remove(engine, 'before_cursor_execute', self._before_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_execute)
+        self._engines.remove(engine)
+
+    def _stack(self) -> List[QueryRecorder]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _budgets(self) -> List[QueryRecorder]:
+        # Бюджеты, как и области, свои у каждого потока: запросы фоновых потоков
+        # (очистки корзин, очереди оформления) не попадают в чужой бюджет
+        if not hasattr(self._local, 'budgets'):
+            self._local.budgets = []
+        return self._local.budgets
+
+    def _recorders(self) -> List[QueryRecorder]:
+        """Получатели статистики текущего запроса"""
+        recorders = list(self._budgets())
+        stack = self._stack()
+        if stack:
+            recorders.append(stack[-1])
+        return recorders
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Время начала хранится в контексте выполнения: запрос с ошибкой не доходит
+        # до after_cursor_execute, и контекст освобождается вместе с ним
+        context._instrumentation_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._instrumentation_started
+        recorders = self._recorders()
+        if not recorders:
+            return
+        shape = statement_shape(statement)
+        for recorder in recorders:
+            recorder.queries += 1
+            recorder.sql_time += elapsed
+            recorder.shapes[shape] += 1
+
+        if context is not None and cursor.description is not None:
+            def on_rows(count):
+                for recorder in recorders:
+                    recorder.add_rows(count)
+            # Результат читает строки через context.cursor, подменяем его оберткой
+            context.cursor = _CountingCursor(cursor, on_rows)
+
+    # --- области учета ---
+
+    @contextmanager
+    def scope(self, label: str) -> Iterator[QueryRecorder]:
+        """Отнести запросы внутри блока к области label"""
+        recorder = QueryRecorder(label)
+        stack = self._stack()
+        stack.append(recorder)
+        try:
+            yield recorder
+        finally:
+            stack.pop()
+            self._merge(recorder)
+
+    def _merge(self, recorder: QueryRecorder):
+        with self._lock:
+            stats = self.stats.setdefault(recorder.label, {
+                'calls': 0, 'queries': 0, 'sql_time_ms': 0.0, 'rows': 0, 'max_queries': 0, 'n_plus_one': {},
+            })
+            stats['calls'] += 1
+            stats['queries'] += recorder.queries
+            stats['sql_time_ms'] += recorder.sql_time * 1000
+            stats['rows'] += recorder.rows
+            stats['max_queries'] = max(stats['max_queries'], recorder.queries)
+            for shape, count in recorder.repeated_shapes(self.n_plus_one_threshold).items():
+                stats['n_plus_one'][shape] = max(stats['n_plus_one'].get(shape, 0), count)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    # --- отчет ---
+
+    def report(self) -> str:
+        """Текстовый отчет по областям, самые затратные сначала"""
+        lines = ["", "=" * 100, "SQL ПО ДЕЙСТВИЯМ", "=" * 100,
+                 f"{'Действие':<52} | {'Вызовов':>7} | {'Запросов':>8} | {'SQL, мс':>9} | {'Строк':>9}",
+                 "-" * 100]
+        ordered = sorted(self.stats.items(), key=lambda item: item[1]['sql_time_ms'], reverse=True)
+        for label, stats in ordered:
+            lines.append(f"{label[:52]:<52} | {stats['calls']:7d} | {stats['queries']:8d} | "
+                         f"{stats['sql_time_ms']:9.1f} | {stats['rows']:9d}")
+            for shape, count in sorted(stats['n_plus_one'].items(), key=lambda item: -item[1]):
+                lines.append(f"    ⚠ вероятный N+1 ({count} повторов за вызов): {shape[:120]}")
+        return "\n".join(lines)
+
+    def save_report(self, file_path: str):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, ensure_ascii=False, indent=2)
+
+    def _report_at_exit(self):
+        if not self.stats:
+            return
+        print(self.report(), file=sys.stderr)
+        if Config.SQL_INSTRUMENTATION_REPORT:
+            self.save_report(Config.SQL_INSTRUMENTATION_REPORT)
+
+    def enable(self):
+        """Включить учет по областям и вывод отчета при завершении"""
+        if not self.enabled:
+            self.enabled = True
+            atexit.register(self._report_at_exit)
+
+    # --- бюджеты запросов ---
+
+    @contextmanager
+    def budget(self, engines: Union[Engine, Sequence[Engine]], max_queries: Optional[int] = None,
+               max_repeats: Optional[int] = None, label: str = 'budget') -> Iterator[QueryRecorder]:
+        """Считать запросы блока (в текущем потоке) к указанным движкам и проверить бюджет при выходе"""
+        recorder = QueryRecorder(label)
+        engines = [engines] if isinstance(engines, Engine) else list(engines)
+        attached = [engine for engine in engines if engine not in self._engines]
+        for engine in attached:
+            self.attach(engine)
+        budgets = self._budgets()
+        budgets.append(recorder)
+        try:
+            yield recorder
+        finally:
+            budgets.remove(recorder)
+            for engine in attached:
+                self.detach(engine)
+
+        if max_queries is not None and recorder.queries > max_queries:
+            raise QueryBudgetExceeded(
+                f"{label}: выполнено {recorder.queries} запросов при бюджете {max_queries}", recorder)
+        if max_repeats is not None:
+            repeated = recorder.repeated_shapes(max_repeats + 1)
+            if repeated:
+                shape, count = max(repeated.items(), key=lambda item: item[1])
+                raise QueryBudgetExceeded(
+                    f"{label}: запрос повторен {count} раз (допустимо {max_repeats}): {shape[:200]}", recorder)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Превышен бюджет запросов; наследует AssertionError для использования в проверках"""
+
+    def __init__(self, message: str, recorder: QueryRecorder):
+        super().__init__(message)
+        self.recorder = recorder
+
+
+# Общий экземпляр для приложения
+instrumentation = SQLInstrumentation(Config.SQL_N_PLUS_ONE_THRESHOLD)
+if Config.SQL_INSTRUMENTATION:
+    instrumentation.enable()
+
+
+def query_budget(engines: Union[Engine, Sequence[Engine]], max_queries: Optional[int] = None,
+                 max_repeats: Optional[int] = None, label: str = 'budget'):
+    """Проверка бюджета запросов:
+
+        with query_budget(db_manager.engine, max_queries=3, max_repeats=1):
+            app.browse_catalog()
+    """
+    return instrumentation.budget(engines, max_queries, max_repeats, label)
+
+
+def instrumented(cls):
+    """Декоратор класса: каждый публичный метод становится областью учета SQL
+
+    Без SQL_INSTRUMENTATION класс возвращается без изменений.
+    """
+    if not instrumentation.enabled:
+        return cls
+
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_'):
+            continue
+        label = f'{cls.__name__}.{name}'
+        if isinstance(attr, staticmethod):
+            setattr(cls, name, staticmethod(_wrap(attr.__func__, label)))
+        elif isinstance(attr, classmethod):
+            setattr(cls, name, classmethod(_wrap(attr.__func__, label)))
+        elif callable(attr):
+            setattr(cls, name, _wrap(attr, label))
+    return cls
+
+
+def _wrap(func, label: str):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with instrumentation.scope(label):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,263 @@
+"""Миграции схемы для существующих баз данных
+
+Запуск из каталога electronic_library:
+    python -m models.migrations upgrade   - добавить недостающие колонки, индексы и ключи
+    python -m models.migrations verify    - проверить планы запросов отчетов
+    python -m models.migrations reindex   - перестроить полнотекстовый индекс и индекс похожих изданий
+
+По умолчанию verify проверяет чистую схему в памяти: на маленькой базе со
+статистикой ANALYZE планировщик SQLite вправе предпочесть полный просмотр.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm import Session
+from models.database_models import Base, DatabaseManager, publication_authors, publication_genres
+
+# Таблицы связей, которые должны иметь составной первичный ключ
+ASSOCIATION_TABLES = [publication_authors, publication_genres]
+
+# Индекс, который должен использоваться в плане каждого запроса отчетов
+EXPECTED_REPORT_INDEXES = {
+    # Покрывающий индекс: без него отчет выбирал между ix_orders_date_id и
+    # прежним (order_date, status) по порядку их создания
+    'sales_report': ['ix_orders_date_status_total'],
+    'popular_publications_report': ['ix_order_items_publication'],
+    'user_activity_report': ['ix_orders_user_date'],
+    'inventory_report': ['ix_publications_stock_quantity'],
+    'genres_report': ['ix_order_items_publication'],
+    'view_my_orders': ['ix_orders_user_date'],
+}
+
+
+def ensure_association_primary_keys(engine: Engine) -> List[str]:
+    """Добавить составной первичный ключ таблицам связей, созданным без него
+
+    SQLite не умеет добавлять первичный ключ к существующей таблице, поэтому
+    таблица пересоздается, а дубликаты связей при переносе отбрасываются.
+    """
+    rebuilt = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in ASSOCIATION_TABLES:
+        if table.name not in existing_tables:
+            continue
+        if inspector.get_pk_constraint(table.name).get('constrained_columns'):
+            continue
+
+        columns = ', '.join(column.name for column in table.columns)
+        not_null = ' AND '.join(f'{column.name} IS NOT NULL' for column in table.columns)
+        with engine.begin() as connection:
+            if engine.dialect.name == 'sqlite':
+                backup_name = f'_old_{table.name}'
+                connection.execute(text(f'ALTER TABLE {table.name} RENAME TO {backup_name}'))
+                # Индексы переименованной таблицы мешают созданию новых с теми же именами
+                for index in inspect(connection).get_indexes(backup_name):
+                    connection.execute(text(f'DROP INDEX IF EXISTS {index["name"]}'))
+                table.create(bind=connection)
+                connection.execute(text(
+                    f'INSERT OR IGNORE INTO {table.name} ({columns}) '
+                    f'SELECT {columns} FROM {backup_name} WHERE {not_null}'
+                ))
+                connection.execute(text(f'DROP TABLE {backup_name}'))
+            else:
+                connection.execute(text(f'DELETE FROM {table.name} WHERE NOT ({not_null})'))
+                connection.execute(text(f'ALTER TABLE {table.name} ADD PRIMARY KEY ({columns})'))
+        rebuilt.append(table.name)
+
+    return rebuilt
+
+
+def add_missing_columns(engine: Engine) -> List[str]:
+    """Добавить в существующие таблицы колонки из описания моделей
+
+    Новая колонка должна допускать NULL или иметь server_default: иначе
+    существующим строкам нечего в нее записать.
+    """
+    added = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    raise RuntimeError(f"Колонку {table.name}.{column.name} нельзя добавить без server_default")
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                added.append(f'{table.name}.{column.name}')
+
+    return added
+
+
+# Индексы прежних версий схемы, замененные другими
+OBSOLETE_INDEXES = {
+    # (order_date, status) -> ix_orders_date_status_total (order_date, status, total_amount)
+    'orders': ['ix_orders_date_status'],
+}
+
+
+def drop_obsolete_indexes(engine: Engine) -> List[str]:
+    """Удалить индексы из OBSOLETE_INDEXES, оставшиеся в базе"""
+    dropped = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table_name, names in OBSOLETE_INDEXES.items():
+            if table_name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table_name)}
+            for name in names:
+                if name in existing:
+                    connection.execute(text(f'DROP INDEX {name}'))
+                    dropped.append(name)
+
+    return dropped
+
+
+def create_missing_indexes(engine: Engine) -> List[str]:
+    """Построить индексы из описания моделей, отсутствующие в базе"""
+    created = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=connection)
+                    created.append(index.name)
+
+    return created
+
+
+def upgrade(engine: Engine) -> Dict[str, List[str]]:
+    """Привести существующую базу к текущей схеме"""
+    from models.fulltext import ensure_fulltext_index, FTS_TABLE
+    from models.fuzzy_index import ensure_journal_triggers
+    from models.facets import ensure_journal_triggers as ensure_facet_triggers
+    from models.review_stats import STAT_COLUMNS, reconcile_review_stats
+    from models.search_cache import ensure_version_triggers
+    from models.autocomplete import ensure_journal_triggers as ensure_autocomplete_triggers
+    from models.content_similarity import ensure_journal_triggers as ensure_content_triggers
+
+    Base.metadata.create_all(bind=engine)
+    columns = add_missing_columns(engine)
+    # Сводка отзывов в новых колонках заполняется по существующим отзывам
+    if any(f'publications.{column.name}' in columns for column in STAT_COLUMNS):
+        reconcile_review_stats(engine)
+    return {
+        'columns': columns,
+        'primary_keys': ensure_association_primary_keys(engine),
+        'indexes': create_missing_indexes(engine),
+        'dropped_indexes': drop_obsolete_indexes(engine),
+        'fulltext': [FTS_TABLE] if ensure_fulltext_index(engine) else [],
+        'triggers': ensure_journal_triggers(engine) + ensure_facet_triggers(engine)
+                    + ensure_version_triggers(engine) + ensure_autocomplete_triggers(engine)
+                    + ensure_content_triggers(engine),
+    }
+
+
+def report_queries(session: Session) -> Dict[str, object]:
+    """Запросы отчетов с типичными параметрами"""
+    from reports.report_queries import ReportQueries
+
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=30)
+    return {
+        'sales_report': ReportQueries.sales_by_day(session, start_date, end_date),
+        'popular_publications_report': ReportQueries.popular_publications(session, 10),
+        'user_activity_report': ReportQueries.user_activity(session, 10),
+        'inventory_report': ReportQueries.inventory(session),
+        'genres_report': ReportQueries.genres_stats(session),
+        'view_my_orders': ReportQueries.user_orders(session, 1),
+    }
+
+
+def explain_query_plan(session: Session, query) -> List[str]:
+    """План выполнения запроса (только SQLite)"""
+    compiled = query.statement.compile(
+        dialect=session.get_bind().dialect,
+        compile_kwargs={'literal_binds': True}
+    )
+    rows = session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).fetchall()
+    return [row[-1] for row in rows]
+
+
+def verify_report_indexes(session: Session) -> List[Tuple[str, bool, List[str]]]:
+    """Проверить, что каждый запрос отчетов использует ожидаемый индекс"""
+    results = []
+    for name, query in report_queries(session).items():
+        plan = explain_query_plan(session, query)
+        expected = EXPECTED_REPORT_INDEXES[name]
+        used = all(any(index in line for line in plan) for index in expected)
+        results.append((name, used, plan))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Миграции схемы базы данных')
+    parser.add_argument('command', choices=['upgrade', 'verify', 'reindex'])
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'upgrade':
+        db_manager = DatabaseManager(args.database_url)
+        result = upgrade(db_manager.engine)
+        print(f"Добавлены колонки: {', '.join(result['columns']) or 'нет'}")
+        print(f"Пересозданы таблицы связей: {', '.join(result['primary_keys']) or 'нет'}")
+        print(f"Построены индексы: {', '.join(result['indexes']) or 'нет'}")
+        print(f"Удалены устаревшие индексы: {', '.join(result['dropped_indexes']) or 'нет'}")
+        print(f"Построен полнотекстовый индекс: {', '.join(result['fulltext']) or 'нет'}")
+        print(f"Созданы триггеры журналов изменений: {', '.join(result['triggers']) or 'нет'}")
+        return 0
+
+    if args.command == 'reindex':
+        from models.fulltext import rebuild_fulltext_index
+
+        db_manager = DatabaseManager(args.database_url)
+        if db_manager.engine.dialect.name == 'sqlite':
+            print(f"Полнотекстовый индекс, изданий: {rebuild_fulltext_index(db_manager.engine)}")
+        else:
+            print("Полнотекстовый индекс поддерживается только для SQLite.")
+        # Снимок похожих изданий строится заранее, а не при первом открытии издания в приложении
+        print(f"Индекс похожих изданий, изданий: {len(db_manager.content_similarity.rebuild())}")
+        return 0
+
+    db_manager = DatabaseManager(args.database_url or 'sqlite://')
+    if db_manager.engine.dialect.name != 'sqlite':
+        print("Проверка планов запросов поддерживается только для SQLite.")
+        return 1
+
+    session = db_manager.get_session()
+    try:
+        results = verify_report_indexes(session)
+    finally:
+        session.close()
+
+    failed = 0
+    for name, used, plan in results:
+        mark = '✓' if used else '✗'
+        print(f"{mark} {name}: ожидается {', '.join(EXPECTED_REPORT_INDEXES[name])}")
+        for line in plan:
+            print(f"    {line}")
+        failed += 0 if used else 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
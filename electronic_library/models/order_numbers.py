@@ -0,0 +1,148 @@
+"""Номера заказов: блоки общей последовательности на процесс (hi/lo)
+
+Прежний номер ORD-ГГГГММДД-<id пользователя> повторялся при втором заказе
+пользователя за день и нарушал уникальность order_number. Номер из
+автоинкрементного id заказа известен только после вставки, а запрос к
+последовательности на каждый заказ - лишнее обращение к базе и лишняя
+точка конкуренции за блокировку записи.
+
+Поэтому процесс резервирует сразу блок из block_size значений общей
+последовательности (таблица number_sequences) одним коротким UPDATE и
+выдает номера из блока в памяти, без запросов. Блоки разных процессов не
+пересекаются, поэтому номера уникальны без проверки. Номер имеет вид
+ORD-ГГГГММДД-<значение, 8 цифр>: дата - день выдачи, значения растут со
+временем в пределах процесса и в среднем между процессами (процесс может
+выдавать номера из блока, зарезервированного раньше, чем блок соседа).
+Значения блока, не выданные до завершения процесса, пропускаются - номера
+уникальны, но идут с пропусками. После fork дочерний процесс не
+использует блок родителя и резервирует свой.
+
+Прежние номера (4 цифры после даты) с новыми не совпадают. Скорость
+выдачи для нескольких процессов: benchmarks/order_number_benchmark.py.
+"""
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models.database_models import number_sequences
+from models.engine_profile import run_with_retry, run_with_retry_async
+
+SEQUENCE_NAME = 'order_number'
+NUMBER_DIGITS = 8
+
+
+def format_order_number(value: int, day: Optional[datetime] = None) -> str:
+    return f"ORD-{(day or datetime.now()):%Y%m%d}-{value:0{NUMBER_DIGITS}d}"
+
+
+def _advance(name: str, block_size: int):
+    return (update(number_sequences).where(number_sequences.c.name == name)
+            .values(next_value=number_sequences.c.next_value + block_size))
+
+
+def _current(name: str):
+    return select(number_sequences.c.next_value).where(number_sequences.c.name == name)
+
+
+class _Block:
+    """Зарезервированный диапазон [next, limit) и процесс, которому он принадлежит"""
+
+    def __init__(self):
+        self.next = self.limit = 0
+        self.pid = None
+
+    def take(self) -> Optional[int]:
+        if self.pid != os.getpid() or self.next >= self.limit:
+            return None
+        value = self.next
+        self.next += 1
+        return value
+
+    def reset(self, limit: int, block_size: int):
+        self.next, self.limit, self.pid = limit - block_size, limit, os.getpid()
+
+
+class OrderNumberAllocator:
+    """Выдача номеров заказов из блоков последовательности; безопасна для потоков"""
+
+    def __init__(self, engine: Engine, block_size: Optional[int] = None, name: str = SEQUENCE_NAME):
+        self.engine = engine
+        self.block_size = block_size or Config.ORDER_NUMBER_BLOCK
+        self.name = name
+        self.reservations = 0
+        self._block = _Block()
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        """Следующее значение последовательности"""
+        with self._lock:
+            value = self._block.take()
+            if value is None:
+                self._block.reset(run_with_retry(self._reserve), self.block_size)
+                self.reservations += 1
+                value = self._block.take()
+            return value
+
+    def next_number(self) -> str:
+        return format_order_number(self.allocate())
+
+    def _reserve(self) -> int:
+        """Зарезервировать блок; возвращает границу блока (первое значение после него)"""
+        try:
+            with self.engine.begin() as connection:
+                return self._reserve_in(connection)
+        except IntegrityError:
+            # Строку последовательности одновременно создал другой процесс
+            with self.engine.begin() as connection:
+                return self._reserve_in(connection)
+
+    def _reserve_in(self, connection: Connection) -> int:
+        # UPDATE первым оператором: блокировка записи берется сразу, чтение ниже видит свое изменение
+        if connection.execute(_advance(self.name, self.block_size)).rowcount:
+            return connection.execute(_current(self.name)).scalar_one()
+        connection.execute(insert(number_sequences).values(name=self.name, next_value=1 + self.block_size))
+        return 1 + self.block_size
+
+
+class AsyncOrderNumberAllocator:
+    """То же для асинхронного движка (AsyncDatabaseManager)"""
+
+    def __init__(self, engine, block_size: Optional[int] = None, name: str = SEQUENCE_NAME):
+        self.engine = engine
+        self.block_size = block_size or Config.ORDER_NUMBER_BLOCK
+        self.name = name
+        self.reservations = 0
+        self._block = _Block()
+        self._lock = asyncio.Lock()
+
+    async def allocate(self) -> int:
+        async with self._lock:
+            value = self._block.take()
+            if value is None:
+                self._block.reset(await run_with_retry_async(self._reserve), self.block_size)
+                self.reservations += 1
+                value = self._block.take()
+            return value
+
+    async def next_number(self) -> str:
+        return format_order_number(await self.allocate())
+
+    async def _reserve(self) -> int:
+        for attempt in range(2):
+            try:
+                async with self.engine.begin() as connection:
+                    if (await connection.execute(_advance(self.name, self.block_size))).rowcount:
+                        return (await connection.execute(_current(self.name))).scalar_one()
+                    await connection.execute(
+                        insert(number_sequences).values(name=self.name, next_value=1 + self.block_size))
+                    return 1 + self.block_size
+            except IntegrityError:
+                # Строку последовательности одновременно создал другой процесс
+                if attempt:
+                    raise
+
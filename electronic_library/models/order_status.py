@@ -0,0 +1,164 @@
+"""Изменение статуса заказов: допустимые переходы и массовые операции
+
+Допустимые переходы (TRANSITIONS):
+    PENDING -> PAID, CANCELLED
+    PAID    -> SHIPPED, CANCELLED
+    SHIPPED -> DELIVERED
+DELIVERED и CANCELLED - конечные статусы.
+
+bulk_change_status переводит в новый статус заказы из списка id или по
+фильтру (текущий статус, дата оформления до заданной). Заказы, из статуса
+которых переход не допускается, не меняются и считаются пропущенными.
+Работа идет блоками по chunk_size заказов, каждый блок - одна короткая
+транзакция из операторов над множествами, без загрузки объектов:
+
+    INSERT INTO order_status_log (batch_id, order_id, from_status)
+        SELECT :batch, id, status FROM orders WHERE <фильтр> AND <блок id> AND status IN (<допустимые>)
+    UPDATE orders SET status = :new WHERE id IN (SELECT order_id FROM order_status_log
+                                                 WHERE batch_id = :batch AND <блок id>)
+
+Журнал компактный: строка операции в order_status_batches (время,
+пользователь, новый статус) и по паре (заказ, прежний статус) на каждый
+измененный заказ. Обновляются ровно записанные в журнал заказы, поэтому
+журнал и таблица заказов не расходятся. Блоки по возрастанию id, границы
+блока фильтра - ключевой выборкой без OFFSET от начала таблицы.
+
+Скорость на сотнях тысяч заказов: benchmarks/order_status_benchmark.py.
+"""
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import and_, func, insert, literal, select, update
+from sqlalchemy.engine import Engine
+from models.database_models import Order, OrderStatus, order_status_batches, order_status_log
+from models.engine_profile import run_with_retry
+
+CHUNK_SIZE = 5000
+
+TRANSITIONS: Dict[OrderStatus, Tuple[OrderStatus, ...]] = {
+    OrderStatus.PENDING: (OrderStatus.PAID, OrderStatus.CANCELLED),
+    OrderStatus.PAID: (OrderStatus.SHIPPED, OrderStatus.CANCELLED),
+    OrderStatus.SHIPPED: (OrderStatus.DELIVERED,),
+    OrderStatus.DELIVERED: (),
+    OrderStatus.CANCELLED: (),
+}
+
+# changed - число измененных заказов по прежнему статусу, skipped - пропущенных по текущему
+StatusChange = namedtuple('StatusChange', 'batch_id target changed skipped elapsed_ms')
+
+# Блок заказов: список id или диапазон (после low, не больше high; high=None - до конца)
+Chunk = Union[List[int], Tuple[int, Optional[int]]]
+
+
+def can_transition(current: OrderStatus, target: OrderStatus) -> bool:
+    return target in TRANSITIONS.get(current, ())
+
+
+def allowed_sources(target: OrderStatus) -> List[OrderStatus]:
+    """Статусы, из которых допускается переход в target"""
+    return [status for status, targets in TRANSITIONS.items() if target in targets]
+
+
+def _in_chunk(column, chunk: Chunk):
+    if isinstance(chunk, list):
+        return column.in_(chunk)
+    low, high = chunk
+    return column > low if high is None else and_(column > low, column <= high)
+
+
+def _chunks(engine: Engine, order_ids: Optional[Sequence[int]], conditions: list,
+            chunk_size: int) -> Iterator[Chunk]:
+    """Блоки заказов по возрастанию id"""
+    if order_ids is not None:
+        ids = sorted(set(order_ids))
+        for start in range(0, len(ids), chunk_size):
+            yield ids[start:start + chunk_size]
+        return
+    orders = Order.__table__
+    low = 0
+    while True:
+        # Граница блока - chunk_size-й подходящий заказ после предыдущей границы
+        with engine.connect() as connection:
+            high = connection.execute(
+                select(orders.c.id).where(*conditions, orders.c.id > low)
+                .order_by(orders.c.id).offset(chunk_size - 1).limit(1)
+            ).scalar()
+        yield low, high
+        if high is None:
+            return
+        low = high
+
+
+def _apply_chunk(engine: Engine, batch_id: int, target: OrderStatus, sources: List[OrderStatus],
+                 conditions: list, chunk: Chunk) -> Counter:
+    """Перевести заказы одного блока; возвращает пропущенные заказы по статусам"""
+    orders = Order.__table__
+    with engine.begin() as connection:
+        connection.execute(insert(order_status_log).from_select(
+            ['batch_id', 'order_id', 'from_status'],
+            select(literal(batch_id), orders.c.id, orders.c.status)
+            .where(*conditions, _in_chunk(orders.c.id, chunk), orders.c.status.in_(sources))
+        ))
+        connection.execute(update(orders).where(orders.c.id.in_(
+            select(order_status_log.c.order_id)
+            .where(order_status_log.c.batch_id == batch_id, _in_chunk(order_status_log.c.order_id, chunk))
+        )).values(status=target))
+        skipped = connection.execute(
+            select(orders.c.status, func.count())
+            .where(*conditions, _in_chunk(orders.c.id, chunk), orders.c.status != target,
+                   orders.c.status.notin_(sources))
+            .group_by(orders.c.status)
+        ).all()
+    return Counter(dict(skipped))
+
+
+def bulk_change_status(engine: Engine, target: OrderStatus, order_ids: Optional[Sequence[int]] = None,
+                       current_status: Optional[OrderStatus] = None, placed_before: Optional[datetime] = None,
+                       user_id: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> StatusChange:
+    """Перевести заказы order_ids или подходящие под фильтр в статус target
+
+    Заказы, уже находящиеся в статусе target, не считаются пропущенными.
+    """
+    if order_ids is None and current_status is None and placed_before is None:
+        raise ValueError("Не заданы ни заказы, ни условие отбора")
+    orders = Order.__table__
+    conditions = []
+    if current_status is not None:
+        conditions.append(orders.c.status == current_status)
+    if placed_before is not None:
+        conditions.append(orders.c.order_date < placed_before)
+    sources = allowed_sources(target)
+    started = time.perf_counter()
+
+    def create_batch() -> int:
+        with engine.begin() as connection:
+            return connection.execute(insert(order_status_batches).values(
+                created_at=datetime.now(), user_id=user_id, to_status=target, changed=0
+            )).inserted_primary_key[0]
+
+    batch_id = run_with_retry(create_batch)
+    skipped = Counter()
+    for chunk in _chunks(engine, order_ids, conditions, chunk_size):
+        skipped += run_with_retry(lambda: _apply_chunk(engine, batch_id, target, sources, conditions, chunk))
+
+    with engine.begin() as connection:
+        changed = dict(connection.execute(
+            select(order_status_log.c.from_status, func.count())
+            .where(order_status_log.c.batch_id == batch_id).group_by(order_status_log.c.from_status)
+        ).all())
+        connection.execute(update(order_status_batches).where(order_status_batches.c.id == batch_id)
+                           .values(changed=sum(changed.values())))
+    return StatusChange(batch_id, target, changed, dict(skipped), int((time.perf_counter() - started) * 1000))
+
+
+def status_history(connection, order_id: int) -> List[Tuple[datetime, OrderStatus, OrderStatus, Optional[int]]]:
+    """Изменения статуса заказа: (время, прежний статус, новый статус, пользователь)"""
+    return [tuple(row) for row in connection.execute(
+        select(order_status_batches.c.created_at, order_status_log.c.from_status,
+               order_status_batches.c.to_status, order_status_batches.c.user_id)
+        .select_from(order_status_log.join(order_status_batches,
+                                           order_status_batches.c.id == order_status_log.c.batch_id))
+        .where(order_status_log.c.order_id == order_id)
+        .order_by(order_status_log.c.batch_id)
+    ).all()]
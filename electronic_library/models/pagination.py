@@ -0,0 +1,190 @@
+"""Постраничный просмотр изданий, пользователей и заказов по ключу (keyset)
+
+Вместо OFFSET следующая страница начинается после последней строки
+предыдущей: условие (ключ, id) > (ключ последней строки, id последней строки)
+сразу находит место в составном индексе (ключ, id), поэтому страница N стоит
+столько же, сколько первая, при любом размере таблицы. id в конце ключа
+делает порядок однозначным при одинаковых значениях ключа.
+
+Страница загружается постоянным числом запросов: сами строки (на одну
+больше страницы, чтобы узнать о следующей; на границе строк с пустым ключом -
+двумя запросами) и по запросу selectinload на каждую связь из EAGER_LOADS.
+С ids_only=True читаются только id и ключ из индекса, а сами строки берутся,
+например, из кэша каталога (models/catalog_cache.py).
+
+Пример:
+    page = fetch_page(session, Publication, sort='price')
+    next_page = fetch_page(session, Publication, sort='price', after=page.cursor)
+"""
+from typing import Any, List, NamedTuple, Optional, Tuple
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+from models.database_models import Publication, User, Order
+
+# Допустимые ключи сортировки по моделям
+SORT_KEYS = {
+    Publication: {
+        'id': Publication.id,
+        'title': Publication.title,
+        'price': Publication.price,
+        'year': Publication.publication_year,
+    },
+    User: {
+        'id': User.id,
+        'email': User.email,
+        'registered': User.registration_date,
+    },
+    Order: {
+        'id': Order.id,
+        'date': Order.order_date,
+        'total': Order.total_amount,
+    },
+}
+
+# Связи, которые показываются вместе со строками страницы
+EAGER_LOADS = {
+    Publication: (Publication.authors, Publication.genres, Publication.publisher),
+    User: (),
+    Order: (Order.user,),
+}
+
+# Позиция последней строки страницы: (значение ключа, id)
+Cursor = Tuple[Any, int]
+
+
+class KeysetPage(NamedTuple):
+    """Строки страницы и позиция для запроса следующей"""
+    items: List[Any]
+    cursor: Optional[Cursor]
+    has_more: bool
+
+
+def sort_column(model, sort: str):
+    try:
+        return SORT_KEYS[model][sort]
+    except KeyError:
+        raise ValueError(f"Недопустимый ключ сортировки для {model.__name__}: {sort}") from None
+
+
+def _nullable(key, id_column) -> bool:
+    return key is not id_column and key.nullable
+
+
+def segment_queries(model, sort: str = 'id', after: Optional[Cursor] = None,
+                    descending: bool = False, ids_only: bool = False) -> List[Select]:
+    """Запросы страницы после позиции after, по порядку; без LIMIT
+
+    Строки с пустым ключом образуют отдельный отрезок (первый при сортировке
+    по возрастанию, последний - по убыванию, как хранит их индекс SQLite).
+    Внутри отрезка условие - диапазон по составному индексу (ключ, id),
+    а OR по двум отрезкам заставил бы СУБД просматривать индекс с начала.
+    Страница, попавшая на границу отрезков, дочитывается вторым запросом.
+    ids_only - выбирать строки (id, ключ) вместо объектов модели.
+    """
+    key = sort_column(model, sort)
+    id_column = model.id
+    options = [] if ids_only else [selectinload(relationship) for relationship in EAGER_LOADS[model]]
+
+    def selected():
+        if not ids_only:
+            return select(model)
+        return select(id_column) if key is id_column else select(id_column, key)
+
+    def ordered(query):
+        columns = [id_column] if key is id_column else [key, id_column]
+        return query.order_by(*[column.desc() if descending else column.asc() for column in columns]) \
+            .options(*options)
+
+    def after_id(last_id):
+        return id_column < last_id if descending else id_column > last_id
+
+    if not _nullable(key, id_column):
+        query = selected()
+        if after is not None:
+            value, last_id = after
+            condition = after_id(last_id) if key is id_column else (
+                tuple_(key, id_column) < tuple_(value, last_id) if descending
+                else tuple_(key, id_column) > tuple_(value, last_id))
+            query = query.where(condition)
+        return [ordered(query)]
+
+    null_segment = selected().where(key.is_(None))
+    value_segment = selected().where(key.isnot(None))
+    if after is not None:
+        value, last_id = after
+        if value is None:
+            null_segment = null_segment.where(after_id(last_id))
+            # Позиция в отрезке пустых ключей: отрезок значений при убывании уже пройден
+            return [ordered(null_segment)] + ([] if descending else [ordered(value_segment)])
+        value_segment = value_segment.where(
+            tuple_(key, id_column) < tuple_(value, last_id) if descending
+            else tuple_(key, id_column) > tuple_(value, last_id))
+        # Позиция в отрезке значений: пустые ключи при возрастании уже пройдены
+        return [ordered(value_segment)] + ([ordered(null_segment)] if descending else [])
+    segments = [value_segment, null_segment] if descending else [null_segment, value_segment]
+    return [ordered(segment) for segment in segments]
+
+
+def fetch_page(session: Session, model, sort: str = 'id', after: Optional[Cursor] = None,
+               descending: bool = False, limit: int = 20, ids_only: bool = False) -> KeysetPage:
+    """Загрузить страницу строк model вместе со связями из EAGER_LOADS
+
+    Запрашивается на одну строку больше, чтобы узнать, есть ли следующая страница.
+    ids_only - элементы страницы будут идентификаторами строк.
+    """
+    rows: List[Any] = []
+    for query in segment_queries(model, sort, after, descending, ids_only):
+        result = session.execute(query.limit(limit + 1 - len(rows)))
+        rows.extend(result.all() if ids_only else result.scalars().all())
+        if len(rows) > limit:
+            break
+    return make_page(model, sort, rows, limit, ids_only)
+
+
+def make_page(model, sort: str, rows: List[Any], limit: int, ids_only: bool = False) -> KeysetPage:
+    """Страница из строк, прочитанных запросами segment_queries (до limit + 1 строки)"""
+    items = rows[:limit]
+    cursor = None
+    if items:
+        last = items[-1]
+        cursor = (getattr(last, sort_column(model, sort).key), last.id)
+    if ids_only:
+        items = [row.id for row in items]
+    return KeysetPage(items, cursor, len(rows) > limit)
+
+
+class PageNavigator:
+    """Переходы вперед и назад по страницам: хранит позиции начала просмотренных страниц"""
+
+    def __init__(self, model, sort: str = 'id', descending: bool = False, limit: int = 20,
+                 ids_only: bool = False):
+        sort_column(model, sort)
+        self.model = model
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.ids_only = ids_only
+        self._starts: List[Optional[Cursor]] = [None]
+        self.page: Optional[KeysetPage] = None
+
+    @property
+    def number(self) -> int:
+        return len(self._starts)
+
+    def load(self, session: Session) -> KeysetPage:
+        self.page = fetch_page(session, self.model, self.sort, self._starts[-1], self.descending, self.limit,
+                               self.ids_only)
+        return self.page
+
+    def next(self, session: Session) -> Optional[KeysetPage]:
+        if self.page is None or not self.page.has_more:
+            return None
+        self._starts.append(self.page.cursor)
+        return self.load(session)
+
+    def previous(self, session: Session) -> Optional[KeysetPage]:
+        if len(self._starts) == 1:
+            return None
+        self._starts.pop()
+        return self.load(session)
+
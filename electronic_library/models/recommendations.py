@@ -0,0 +1,273 @@
+"""«С этим изданием также покупают»: матрица совместных покупок изданий
+
+Для каждой пары изданий считается, в скольких заказах они куплены вместе
+(отмененные заказы и оптовые заказы больше MAX_BASKET позиций не
+учитываются). Рекомендации к изданию - соседи с наибольшим числом
+совместных покупок, при равенстве - с меньшим id.
+
+Индекс состоит из снимка и надстройки, как нечеткий индекс (models/fuzzy_index.py):
+- снимок - разреженная матрица в формате CSR (массивы numpy offsets,
+  neighbors, counts); в строке издания хранятся не больше MAX_NEIGHBORS
+  соседей, уже упорядоченных по убыванию числа покупок, поэтому лучшие
+  соседи - начало строки, без сортировки при запросе. Снимок хранится в
+  таблице recommendation_index вместе с номером последнего учтенного заказа;
+- надстройка - словарь приращений по заказам, оформленным после снимка.
+  Заказы только добавляются, а заказ и его позиции записываются в одной
+  транзакции, поэтому вместо журнала и триггеров перед запросом читаются
+  заказы с id больше учтенного.
+
+Заказы, отмененные после учета, остаются в надстройке до перестроения.
+Соседи, отброшенные при усечении строки, учитываются в надстройке только
+своими новыми покупками - перестроение (например, раз в сутки) снимает
+оба приближения:
+    python -m models.recommendations rebuild
+    python -m models.recommendations similar --publication-id 42
+Время построения и память на 10 млн позиций: benchmarks/recommendations_benchmark.py.
+"""
+import argparse
+import heapq
+import io
+import sys
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from itertools import permutations
+from typing import Dict, Iterable, List, Sequence
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+from models.database_models import Order, OrderItem, OrderStatus, recommendation_index
+
+INDEX_NAME = 'co_purchase'
+# Сколько соседей хранится в строке издания
+MAX_NEIGHBORS = 50
+# Заказы с большим числом различных изданий (закупки) не учитываются
+MAX_BASKET = 50
+# По сколько позиций заказов читать из базы при построении
+READ_CHUNK = 500000
+
+Recommendation = namedtuple('Recommendation', 'publication_id count')
+
+
+class CoPurchaseIndex:
+    """Матрица совместных покупок: снимок CSR и надстройка новых заказов"""
+
+    def __init__(self, offsets: np.ndarray, neighbors: np.ndarray, counts: np.ndarray, order_seq: int = 0):
+        # Снимок: соседи издания i - neighbors[offsets[i]:offsets[i + 1]] по убыванию counts
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.counts = counts
+        self.order_seq = order_seq
+        # Надстройка: издание -> {сосед: приращение} по заказам после снимка
+        self.overlay: Dict[int, Dict[int, int]] = {}
+        # Соседи изданий из надстройки с учетом приращений, до следующего изменения
+        self._merged: Dict[int, List[Recommendation]] = {}
+
+    # --- построение и сохранение ---
+
+    @classmethod
+    def build(cls, order_ids: np.ndarray, publication_ids: np.ndarray, order_seq: int = 0) -> 'CoPurchaseIndex':
+        """Построить снимок по парам (заказ, издание) позиций заказов"""
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        publication_ids = np.asarray(publication_ids, dtype=np.int64)
+        if not len(publication_ids):
+            return cls(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                       order_seq)
+        size = int(publication_ids.max()) + 1
+
+        # Различные пары (заказ, издание), упорядоченные по заказу
+        orders, items = np.divmod(np.unique(order_ids * size + publication_ids), size)
+        starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+        del orders
+        basket_sizes = np.diff(np.r_[starts, len(items)])
+        # Сколько позиций заказа идет после данной; у заказов вне 2..MAX_BASKET - ни одной
+        rest = (np.repeat(np.where(basket_sizes <= MAX_BASKET, basket_sizes, 0), basket_sizes)
+                - (np.arange(len(items)) - np.repeat(starts, basket_sizes)) - 1).astype(np.int32)
+        del starts, basket_sizes
+
+        # Пары позиций одного заказа на расстоянии step, в обе стороны; массив
+        # ключей строка * size + столбец выделяется сразу на все пары
+        candidates = np.flatnonzero(rest > 0)
+        pair_keys = np.empty(2 * int(rest[candidates].sum()), dtype=np.int64)
+        filled = 0
+        step = 1
+        while len(candidates):
+            first, second = items[candidates], items[candidates + step]
+            pair_keys[filled:filled + len(candidates)] = first * size + second
+            filled += len(candidates)
+            pair_keys[filled:filled + len(candidates)] = second * size + first
+            filled += len(candidates)
+            step += 1
+            candidates = candidates[rest[candidates] >= step]
+        del items, rest, candidates
+        keys, counts = np.unique(pair_keys, return_counts=True)
+        del pair_keys
+        rows, columns = np.divmod(keys, size)
+        del keys
+
+        # В строке - соседи по убыванию числа покупок, не больше MAX_NEIGHBORS
+        order = np.lexsort((columns, -counts, rows))
+        rows, columns, counts = rows[order], columns[order], counts[order]
+        row_starts = np.searchsorted(rows, rows, side='left')
+        keep = np.arange(len(rows)) - row_starts < MAX_NEIGHBORS
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(rows[keep], minlength=size))
+        return cls(offsets, columns[keep].astype(np.int32), counts[keep].astype(np.int32), order_seq)
+
+    def to_bytes(self) -> bytes:
+        """Снимок без сжатия (надстройка не сохраняется: ее восстановят новые заказы)"""
+        buffer = io.BytesIO()
+        np.savez(buffer, offsets=self.offsets, neighbors=self.neighbors, counts=self.counts)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, order_seq: int = 0) -> 'CoPurchaseIndex':
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(arrays['offsets'], arrays['neighbors'], arrays['counts'], order_seq)
+
+    def __len__(self) -> int:
+        """Число изданий, у которых есть соседи в снимке"""
+        return int(np.count_nonzero(np.diff(self.offsets)))
+
+    # --- изменения ---
+
+    def apply_orders(self, baskets: Iterable[Sequence[int]], order_seq: int):
+        """Учесть новые заказы (списки изданий) в надстройке"""
+        for basket in baskets:
+            basket = set(basket)
+            if 2 <= len(basket) <= MAX_BASKET:
+                for first, second in permutations(basket, 2):
+                    partners = self.overlay.setdefault(first, {})
+                    partners[second] = partners.get(second, 0) + 1
+                for publication_id in basket:
+                    self._merged.pop(publication_id, None)
+        self.order_seq = max(self.order_seq, order_seq)
+
+    # --- запросы ---
+
+    def similar(self, publication_id: int, limit: int = 5) -> List[Recommendation]:
+        """Издания, чаще всего покупаемые вместе с publication_id"""
+        if 0 <= publication_id < len(self.offsets) - 1:
+            start, end = int(self.offsets[publication_id]), int(self.offsets[publication_id + 1])
+        else:
+            start = end = 0
+        deltas = self.overlay.get(publication_id)
+        if not deltas:
+            end = min(end, start + limit)
+            return [Recommendation(*pair) for pair in
+                    zip(self.neighbors[start:end].tolist(), self.counts[start:end].tolist())]
+
+        ranked = self._merged.get(publication_id)
+        if ranked is None:
+            merged = dict(zip(self.neighbors[start:end].tolist(), self.counts[start:end].tolist()))
+            for neighbor, delta in deltas.items():
+                merged[neighbor] = merged.get(neighbor, 0) + delta
+            ranked = [Recommendation(*pair) for pair in
+                      heapq.nsmallest(MAX_NEIGHBORS, merged.items(), key=lambda pair: (-pair[1], pair[0]))]
+            self._merged[publication_id] = ranked
+        return ranked[:limit]
+
+
+class Recommender:
+    """Индекс совместных покупок одной базы: загрузка, учет новых заказов, рекомендации"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._index = None
+        self._lock = threading.Lock()
+
+    def index(self) -> CoPurchaseIndex:
+        """Актуальный индекс: загрузить или построить, затем учесть новые заказы"""
+        with self._lock:
+            with self.engine.connect() as connection:
+                index = self._index
+                stored_seq = connection.execute(
+                    select(recommendation_index.c.order_seq).where(recommendation_index.c.name == INDEX_NAME)
+                ).scalar()
+                if stored_seq is None:
+                    index = None
+                elif index is None or stored_seq > index.order_seq:
+                    # Снимок в базе новее: его построил другой процесс
+                    index = self._load(connection)
+                if index is not None:
+                    self._sync(connection, index)
+            if index is None:
+                index = self.rebuild()
+            self._index = index
+            return index
+
+    def similar(self, publication_id: int, limit: int = 5) -> List[Recommendation]:
+        return self.index().similar(publication_id, limit)
+
+    def _load(self, connection: Connection) -> CoPurchaseIndex:
+        row = connection.execute(
+            select(recommendation_index.c.data, recommendation_index.c.order_seq)
+            .where(recommendation_index.c.name == INDEX_NAME)
+        ).one()
+        return CoPurchaseIndex.from_bytes(row.data, row.order_seq)
+
+    def _sync(self, connection: Connection, index: CoPurchaseIndex):
+        """Учесть заказы, оформленные после снимка"""
+        orders, items = Order.__table__, OrderItem.__table__
+        rows = connection.execute(
+            select(orders.c.id, orders.c.status, items.c.publication_id)
+            .select_from(orders.join(items, items.c.order_id == orders.c.id))
+            .where(orders.c.id > index.order_seq)
+        ).all()
+        if not rows:
+            return
+        baskets: Dict[int, List[int]] = defaultdict(list)
+        for order_id, status, publication_id in rows:
+            if status != OrderStatus.CANCELLED and publication_id is not None:
+                baskets[order_id].append(publication_id)
+        index.apply_orders(baskets.values(), max(row.id for row in rows))
+
+    def rebuild(self) -> CoPurchaseIndex:
+        """Построить снимок заново по всем заказам и сохранить его в базе"""
+        orders, items = Order.__table__, OrderItem.__table__
+        with self.engine.begin() as connection:
+            order_seq = connection.execute(select(func.max(orders.c.id))).scalar() or 0
+            result = connection.execute(
+                select(items.c.order_id, items.c.publication_id)
+                .select_from(items.join(orders, items.c.order_id == orders.c.id))
+                .where(orders.c.id <= order_seq, orders.c.status != OrderStatus.CANCELLED,
+                       items.c.publication_id.isnot(None))
+            ).yield_per(READ_CHUNK)
+            pairs = [np.array(chunk, dtype=np.int64).reshape(-1, 2) for chunk in result.partitions()]
+            pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+            index = CoPurchaseIndex.build(pairs[:, 0], pairs[:, 1], order_seq)
+            connection.execute(delete(recommendation_index).where(recommendation_index.c.name == INDEX_NAME))
+            connection.execute(insert(recommendation_index).values(
+                name=INDEX_NAME, built_at=datetime.now(), order_seq=order_seq, data=index.to_bytes()
+            ))
+        self._index = index
+        return index
+
+
+def main():
+    from models.database_models import DatabaseManager, Publication
+
+    parser = argparse.ArgumentParser(description='Рекомендации по совместным покупкам')
+    parser.add_argument('command', choices=['rebuild', 'similar'])
+    parser.add_argument('--publication-id', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.database_url)
+    if args.command == 'rebuild':
+        index = db_manager.recommendations.rebuild()
+        print(f"Изданий с соседями: {len(index)}, пар: {len(index.neighbors)}, заказов до №{index.order_seq}")
+        return 0
+
+    recommendations = db_manager.recommendations.similar(args.publication_id, args.limit)
+    with db_manager.session_scope() as session:
+        titles = dict(session.execute(select(Publication.id, Publication.title).where(
+            Publication.id.in_([item.publication_id for item in recommendations]))).all())
+    for item in recommendations:
+        print(f"{item.count:>5}  {titles.get(item.publication_id, '?')}  (id: {item.publication_id})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""База только для чтения для отчетов и экспорта
+
+Тяжелые агрегаты отчетов на основной базе SQLite удерживают блокировку чтения
+и мешают оформлению заказов. Поэтому отчеты и экспорт читают:
+    snapshot - копию основной базы, снятую через online backup API SQLite и
+               обновляемую, когда она старше REPORTING_MAX_STALENESS_S;
+    replica  - реплику по адресу REPORTING_DATABASE_URL;
+    primary  - основную базу (прежнее поведение).
+Для базы в памяти и серверных СУБД без реплики используется primary.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from config import Config
+from models.engine_profile import create_configured_engine, _is_sqlite_file
+
+REPORTING_MODES = ('snapshot', 'replica', 'primary')
+
+
+class ReportingDatabase:
+    """Движок и сессии только для чтения для отчетов"""
+
+    def __init__(self, primary_engine: Engine, primary_url: str, mode: Optional[str] = None,
+                 replica_url: Optional[str] = None, snapshot_path: Optional[str] = None,
+                 max_staleness_s: Optional[float] = None):
+        mode = mode or Config.REPORTING_MODE
+        if mode not in REPORTING_MODES:
+            raise ValueError(f"Неизвестный режим базы отчетов: {mode}")
+        replica_url = replica_url or Config.REPORTING_DATABASE_URL
+
+        self.primary_engine = primary_engine
+        self.max_staleness_s = Config.REPORTING_MAX_STALENESS_S if max_staleness_s is None else max_staleness_s
+        self.snapshot_path = None
+        self._engine: Optional[Engine] = None
+        self._refresh_lock = threading.Lock()
+
+        if mode == 'replica' and not replica_url:
+            mode = 'primary'
+        if mode == 'snapshot' and not _is_sqlite_file(primary_url):
+            mode = 'primary'
+        self.mode = mode
+
+        if mode == 'replica':
+            self._engine = create_configured_engine(replica_url)
+        elif mode == 'snapshot':
+            self.primary_path = make_url(primary_url).database
+            self.snapshot_path = snapshot_path or Config.REPORTING_SNAPSHOT_PATH or \
+                os.path.splitext(self.primary_path)[0] + '.report-snapshot.db'
+        else:
+            self._engine = primary_engine
+
+        self.SessionLocal = sessionmaker(bind=self._engine, autoflush=False)
+        event.listen(self.SessionLocal, 'before_flush', self._reject_flush)
+
+    @staticmethod
+    def _reject_flush(session, flush_context, instances):
+        raise RuntimeError("Сессия отчетов доступна только для чтения")
+
+    @property
+    def engine(self) -> Engine:
+        """Движок отчетов; снимок создается при первом обращении"""
+        if self._engine is None:
+            self.refresh()
+        return self._engine
+
+    # --- снимок ---
+
+    def snapshot_age(self) -> Optional[float]:
+        """Возраст снимка в секундах (None, если снимка нет или он не используется)"""
+        if self.mode != 'snapshot' or not os.path.exists(self.snapshot_path):
+            return None
+        return max(0.0, time.time() - os.path.getmtime(self.snapshot_path))
+
+    def is_stale(self, max_staleness_s: Optional[float] = None) -> bool:
+        if self.mode != 'snapshot':
+            return False
+        bound = self.max_staleness_s if max_staleness_s is None else max_staleness_s
+        age = self.snapshot_age()
+        return age is None or age > bound
+
+    def refresh(self) -> float:
+        """Снять новый снимок основной базы; возвращает длительность в секундах"""
+        if self.mode != 'snapshot':
+            return 0.0
+
+        with self._refresh_lock:
+            started = time.perf_counter()
+            # Свой временный файл у каждого обновления: снимок могут обновлять
+            # одновременно несколько процессов приложения
+            handle, temp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.snapshot_path) + '.', suffix='.tmp',
+                dir=os.path.dirname(os.path.abspath(self.snapshot_path))
+            )
+            os.close(handle)
+            try:
+                source = sqlite3.connect(self.primary_path)
+                target = sqlite3.connect(temp_path)
+                try:
+                    # Копирование одним шагом дает согласованный снимок; в режиме WAL
+                    # чтение копии не блокирует запись в основную базу
+                    source.backup(target)
+                    # Снимок открывается только для чтения, ему не нужен WAL
+                    target.execute("PRAGMA journal_mode=DELETE")
+                finally:
+                    target.close()
+                    source.close()
+                os.replace(temp_path, self.snapshot_path)
+            except Exception:
+                os.remove(temp_path)
+                raise
+            if self._engine is None:
+                self._engine = create_configured_engine(
+                    f'sqlite:///file:{self.snapshot_path}?mode=ro&uri=true', 'default'
+                )
+                self.SessionLocal.configure(bind=self._engine)
+            else:
+                # Соединения пула указывают на прежний файл снимка
+                self._engine.dispose()
+            return time.perf_counter() - started
+
+    # --- сессии ---
+
+    @contextmanager
+    def session_scope(self, max_staleness_s: Optional[float] = None,
+                      force_refresh: bool = False) -> Iterator[Session]:
+        """Сессия только для чтения; устаревший снимок обновляется перед открытием"""
+        if force_refresh or self.is_stale(max_staleness_s) or self._engine is None:
+            self.refresh()
+        session = self.SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def describe(self) -> str:
+        """Краткое описание источника данных для заголовков меню"""
+        if self.mode == 'replica':
+            return f"реплика {self._engine.url.render_as_string(hide_password=True)}"
+        if self.mode == 'primary':
+            return "основная база"
+        age = self.snapshot_age()
+        if age is None:
+            return "снимок базы (будет создан)"
+        return f"снимок базы от {time.strftime('%H:%M:%S', time.localtime(time.time() - age))} " \
+               f"({age:.0f} с назад)"
+
+    def dispose(self):
+        if self._engine is not None and self._engine is not self.primary_engine:
+            self._engine.dispose()
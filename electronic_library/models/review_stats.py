@@ -0,0 +1,171 @@
+"""Сводка отзывов в строке издания: количество, сумма оценок и гистограмма
+
+Колонки publications.reviews_count, rating_sum и rating_count_1..5 заменяют
+агрегаты по таблице reviews: карточке издания, экспорту и отчетам не нужно
+читать все отзывы, чтобы показать средний рейтинг.
+
+Сводка обновляется в той же транзакции, что и отзывы. Обработчики событий
+Session сравнивают оценку и издание каждого добавленного, измененного и
+удаленного отзыва до и после flush и прибавляют разницу одним UPDATE
+на издание (reviews_count = reviews_count + 1 и т. п.), поэтому одновременные
+отзывы к одному изданию не теряют друг друга.
+
+Вставка отзывов через Core (генератор синтетических данных, импорт) сводку не
+обновляет - после нее вызывается reconcile_review_stats. Команда пересчета:
+    python -m models.review_stats reconcile          - пересчитать расхождения
+    python -m models.review_stats reconcile --check  - только найти расхождения
+"""
+import argparse
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, event, func, inspect, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from models.database_models import Publication, Review
+
+RATINGS = (1, 2, 3, 4, 5)
+HISTOGRAM_COLUMNS = [Publication.__table__.c[f'rating_count_{rating}'] for rating in RATINGS]
+STAT_COLUMNS = [Publication.__table__.c.reviews_count, Publication.__table__.c.rating_sum] + HISTOGRAM_COLUMNS
+
+# Ключ session.info: оценки отзывов до flush, собранные в before_flush
+_BEFORE_KEY = 'review_stats_before'
+
+# Запись отзыва для сводки: (издание, оценка)
+ReviewKey = Tuple[Optional[int], Optional[int]]
+
+
+def _changes_review(state) -> bool:
+    return any(state.attrs[key].history.has_changes() for key in ('rating', 'publication_id', 'publication'))
+
+
+def _before_flush(session: Session, flush_context, instances):
+    """Запомнить прежние издание и оценку изменяемых и удаляемых отзывов
+
+    Прежние значения читаются из базы одним запросом: после flush удаленных
+    строк уже нет, а у объекта, измененного после commit, старое значение в
+    памяти не сохраняется.
+    """
+    changed = {}
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Review):
+            continue
+        state = inspect(obj)
+        if state.key is None or (obj in session.dirty and not _changes_review(state)):
+            continue
+        changed[state.key[1][0]] = obj
+    if not changed:
+        return
+    reviews = Review.__table__
+    rows = session.connection().execute(
+        select(reviews.c.id, reviews.c.publication_id, reviews.c.rating).where(reviews.c.id.in_(list(changed))))
+    session.info[_BEFORE_KEY] = {id(changed[review_id]): (publication_id, rating)
+                                 for review_id, publication_id, rating in rows}
+
+
+def _after_flush(session: Session, flush_context):
+    before = session.info.pop(_BEFORE_KEY, {})
+    changes: List[Tuple[ReviewKey, int]] = []
+    for obj in session.new:
+        if isinstance(obj, Review):
+            changes.append(((obj.publication_id, obj.rating), 1))
+    for obj in list(session.dirty) + list(session.deleted):
+        if id(obj) not in before:
+            continue
+        changes.append((before[id(obj)], -1))
+        if obj in session.dirty:
+            changes.append(((obj.publication_id, obj.rating), 1))
+    apply_review_changes(session, changes)
+
+
+def apply_review_changes(session: Session, changes: List[Tuple[ReviewKey, int]]):
+    """Прибавить к сводке изданий изменения ((издание, оценка), +1 или -1)"""
+    deltas: Dict[int, List[int]] = defaultdict(lambda: [0] * (2 + len(RATINGS)))
+    for (publication_id, rating), sign in changes:
+        if publication_id is None or rating not in RATINGS:
+            continue
+        delta = deltas[publication_id]
+        delta[0] += sign
+        delta[1] += sign * rating
+        delta[1 + rating] += sign
+    publications = Publication.__table__
+    connection = session.connection()
+    mapper = inspect(Publication)
+    for publication_id, delta in deltas.items():
+        values = {column.key: column + change for column, change in zip(STAT_COLUMNS, delta) if change}
+        if not values:
+            continue
+        # updated_at не меняется: новый отзыв не меняет само издание
+        values['updated_at'] = publications.c.updated_at
+        connection.execute(update(publications).where(publications.c.id == publication_id).values(**values))
+        loaded = session.identity_map.get(mapper.identity_key_from_primary_key((publication_id,)))
+        if loaded is not None:
+            session.expire(loaded, [column.key for column in STAT_COLUMNS])
+
+
+def install_review_stats():
+    """Подключить обновление сводки ко всем сессиям (повторный вызов ничего не делает)"""
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush', _after_flush)
+
+
+def _actual_stats():
+    """Сводка, посчитанная по таблице reviews"""
+    return select(
+        Review.publication_id.label('publication_id'),
+        func.count().label('reviews_count'),
+        func.sum(Review.rating).label('rating_sum'),
+        *[func.sum(case((Review.rating == rating, 1), else_=0)).label(f'rating_count_{rating}')
+          for rating in RATINGS]
+    ).where(Review.publication_id.isnot(None)).group_by(Review.publication_id).subquery('actual')
+
+
+def reconcile_review_stats(engine: Engine, check_only: bool = False) -> int:
+    """Пересчитать сводку по таблице reviews; возвращает число изданий с расхождениями
+
+    Обновляются только расходящиеся строки: издания без отзывов с ненулевой
+    сводкой и издания, у которых сводка отличается от посчитанной.
+    """
+    publications = Publication.__table__
+    actual = _actual_stats()
+    differs = or_(*[func.coalesce(actual.c[column.key], 0) != column for column in STAT_COLUMNS])
+    without_reviews = and_(
+        publications.c.reviews_count != 0,
+        publications.c.id.notin_(select(Review.publication_id).where(Review.publication_id.isnot(None))))
+
+    with engine.begin() as connection:
+        drifted = connection.execute(
+            select(func.count()).select_from(publications.outerjoin(actual, actual.c.publication_id == publications.c.id))
+            .where(differs)).scalar()
+        if check_only or not drifted:
+            return drifted
+        keep_updated_at = {'updated_at': publications.c.updated_at}
+        connection.execute(update(publications).where(without_reviews)
+                           .values({**{column.key: 0 for column in STAT_COLUMNS}, **keep_updated_at}))
+        connection.execute(
+            update(publications).where(publications.c.id == actual.c.publication_id).where(differs)
+            .values({**{column.key: actual.c[column.key] for column in STAT_COLUMNS}, **keep_updated_at}))
+    return drifted
+
+
+def main():
+    from models.database_models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Сводка отзывов в таблице изданий')
+    parser.add_argument('command', choices=['reconcile'])
+    parser.add_argument('--check', action='store_true', help='только найти расхождения, не исправлять')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.database_url)
+    drifted = reconcile_review_stats(db_manager.engine, check_only=args.check)
+    if args.check:
+        print(f"Изданий с расхождениями в сводке отзывов: {drifted}")
+        return 1 if drifted else 0
+    print(f"Сводка отзывов пересчитана, исправлено изданий: {drifted}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
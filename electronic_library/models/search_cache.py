@@ -0,0 +1,212 @@
+"""Кэш результатов поиска изданий по критериям
+
+Популярные запросы (жанр «Фантастика», диапазон цен) повторяются много раз,
+а каждый раз СУБД заново выполняет поиск с соединениями и полнотекстовым
+индексом. Кэш хранит упорядоченный список id найденных изданий по ключу из
+нормализованных критериев: регистр и лишние пробелы в тексте не важны, числа
+приводятся к одному типу. Сами издания читаются по id (например, из кэша
+каталога, см. models/catalog_cache.py).
+
+Запись действительна, пока не изменились таблицы, от которых зависит
+результат: издания - всегда, авторы и связи с ними - при поиске по автору,
+жанры и связи с ними - при поиске по жанру. Версии таблиц хранит
+table_versions, их увеличивают триггеры SQLite на запись (в том числе через
+Core и из других процессов); изменение остатка или отзывов версию не меняет.
+Перед поиском версии читаются одним запросом по первичному ключу. Кроме того,
+запись устаревает через ttl_s секунд, а при превышении max_entries
+вытесняются давно не запрошенные записи.
+
+Для каждой записи запоминается время выполнения запроса, поэтому stats()
+показывает не только долю попаданий, но и сэкономленное время.
+
+Триггеры создает models.migrations.upgrade; на других СУБД кэш отключен.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from config import Config
+from models.catalog_queries import CatalogQueries
+from models.database_models import Publication, table_versions
+
+# Таблицы, версии которых учитываются, и типы записи, меняющие результат поиска
+VERSIONED_TABLES = {
+    'publications': {'INSERT': None, 'DELETE': None,
+                     'UPDATE': 'title, description, isbn, publication_year, price'},
+    'authors': {'DELETE': None, 'UPDATE': 'full_name'},
+    'genres': {'DELETE': None, 'UPDATE': 'name'},
+    'publication_authors': {'INSERT': None, 'DELETE': None},
+    'publication_genres': {'INSERT': None, 'DELETE': None},
+}
+
+# Критерии, от которых зависит набор таблиц
+AUTHOR_TABLES = ('authors', 'publication_authors')
+GENRE_TABLES = ('genres', 'publication_genres')
+
+SearchKey = Tuple
+
+
+class SearchEntry(NamedTuple):
+    publication_ids: Tuple[int, ...]
+    versions: Tuple[int, ...]
+    created: float
+    # Время выполнения запроса поиска, с
+    cost_s: float
+
+
+def normalize_text(value: Optional[str]) -> str:
+    return ' '.join((value or '').casefold().split())
+
+
+def normalize_number(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def normalize_criteria(title: str = '', author: str = '', genre: str = '', min_year: Optional[int] = None,
+                       max_year: Optional[int] = None, min_price: Optional[float] = None,
+                       max_price: Optional[float] = None, limit: int = 50, use_fulltext: bool = False,
+                       publication_ids: Optional[Sequence[int]] = None,
+                       author_ids: Optional[Sequence[int]] = None) -> SearchKey:
+    """Ключ кэша: критерии CatalogQueries.search в каноническом виде"""
+    return (
+        normalize_text(title), normalize_text(author), normalize_text(genre),
+        None if min_year is None else int(min_year), None if max_year is None else int(max_year),
+        normalize_number(min_price), normalize_number(max_price), int(limit), bool(use_fulltext),
+        None if publication_ids is None else tuple(sorted(set(publication_ids))),
+        None if author_ids is None else tuple(sorted(set(author_ids))),
+    )
+
+
+def dependent_tables(key: SearchKey) -> Tuple[str, ...]:
+    """Таблицы, изменение которых может изменить результат поиска с ключом key"""
+    title, author, genre = key[:3]
+    author_ids = key[10]
+    tables = ('publications',)
+    if author or author_ids is not None:
+        tables += AUTHOR_TABLES
+    if genre:
+        tables += GENRE_TABLES
+    return tables
+
+
+class SearchCache:
+    """Результаты поиска по нормализованным критериям с проверкой версий таблиц"""
+
+    def __init__(self, engine: Engine, max_entries: int = None, ttl_s: float = None):
+        self.engine = engine
+        self.max_entries = Config.SEARCH_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_s = Config.SEARCH_CACHE_TTL_S if ttl_s is None else ttl_s
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[SearchKey, SearchEntry]' = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0, 'evictions': 0,
+                       'query_s': 0.0, 'saved_s': 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.engine.dialect.name == 'sqlite'
+
+    def __len__(self):
+        return len(self._entries)
+
+    def versions(self, session: Session, tables: Sequence[str]) -> Tuple[int, ...]:
+        """Текущие версии таблиц в порядке tables"""
+        stored = dict(session.execute(
+            select(table_versions.c.table_name, table_versions.c.version)
+            .where(table_versions.c.table_name.in_(tables))).all())
+        return tuple(stored.get(table, 0) for table in tables)
+
+    def search_ids(self, session: Session, **criteria) -> List[int]:
+        """id изданий, найденных CatalogQueries.search(**criteria), в порядке результата"""
+        key = normalize_criteria(**criteria)
+        if not self.enabled:
+            return self._execute(session, criteria)[0]
+
+        # Версии читаются в той же транзакции до поиска: запись, сделанная
+        # после чтения версий, увеличит их, и сохраненный результат не подойдет
+        versions = self.versions(session, dependent_tables(key))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.versions != versions:
+                    self._stats['stale'] += 1
+                    del self._entries[key]
+                elif now - entry.created > self.ttl_s:
+                    self._stats['expired'] += 1
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['saved_s'] += entry.cost_s
+                    return list(entry.publication_ids)
+            self._stats['misses'] += 1
+
+        publication_ids, cost_s = self._execute(session, criteria)
+        with self._lock:
+            self._stats['query_s'] += cost_s
+            self._entries[key] = SearchEntry(tuple(publication_ids), versions, time.monotonic(), cost_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return publication_ids
+
+    def _execute(self, session: Session, criteria: dict) -> Tuple[List[int], float]:
+        query = CatalogQueries.search(**criteria).with_only_columns(Publication.id, maintain_column_froms=True)
+        started = time.perf_counter()
+        publication_ids = session.scalars(query).all()
+        return publication_ids, time.perf_counter() - started
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Попадания, промахи (в том числе из-за новых версий и срока жизни) и сэкономленное время"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / requests if requests else 0.0
+        stats['avg_query_ms'] = stats['query_s'] * 1000 / stats['misses'] if stats['misses'] else 0.0
+        return stats
+
+
+# --- версии таблиц ---
+
+def _trigger_name(table: str, operation: str) -> str:
+    return f'{table}_version_{operation[0].lower()}'
+
+
+def _version_triggers() -> Dict[str, str]:
+    triggers = {}
+    for table, operations in VERSIONED_TABLES.items():
+        for operation, columns in operations.items():
+            name = _trigger_name(table, operation)
+            event = f'{operation} OF {columns}' if columns else operation
+            triggers[name] = f"""
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END"""
+    return triggers
+
+
+VERSION_TRIGGERS = _version_triggers()
+
+
+def ensure_version_triggers(engine: Engine) -> List[str]:
+    """Создать строки table_versions и триггеры (только SQLite); возвращает созданные триггеры"""
+    if engine.dialect.name != 'sqlite':
+        return []
+    with engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        for table in VERSIONED_TABLES:
+            connection.execute(text("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (:name, 0)"),
+                               {'name': table})
+        for ddl in VERSION_TRIGGERS.values():
+            connection.exec_driver_sql(ddl)
+    return [name for name in VERSION_TRIGGERS if name not in existing]
@@ -0,0 +1,393 @@
+"""Генератор синтетических данных для воспроизведения нагрузки
+
+Дополняет тестовые данные DatabaseManager._create_test_data каталогом,
+пользователями, заказами и отзывами заданного объема. Популярность изданий,
+авторов, издательств и активность пользователей распределены по Ципфу, так что
+небольшая доля изданий дает основную часть продаж, как в реальном магазине.
+Вставка идет пакетами через Core insert; при одинаковых seed и дате окончания
+истории (--end-date) результат полностью воспроизводим.
+
+Запуск из каталога electronic_library:
+    python -m models.synthetic_data --scale 100k --seed 42
+    python -m models.synthetic_data --orders 3000000 --publications 300000 --reviews 2000000
+"""
+import argparse
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func, insert, select
+from models.database_models import DatabaseManager, User, Author, Genre, Publisher, Publication, Order, \
+    OrderItem, Review, OrderStatus, UserRole, publication_authors, publication_genres
+from models.review_stats import reconcile_review_stats
+
+# Готовые наборы объемов (по числу заказов)
+SCALE_PRESETS = {
+    '10k': {'users': 2000, 'authors': 1500, 'publishers': 50, 'publications': 5000,
+            'orders': 10000, 'reviews': 10000},
+    '100k': {'users': 20000, 'authors': 10000, 'publishers': 200, 'publications': 30000,
+             'orders': 100000, 'reviews': 100000},
+    '1m': {'users': 100000, 'authors': 50000, 'publishers': 1000, 'publications': 200000,
+           'orders': 1000000, 'reviews': 1000000},
+}
+
+GENRE_NAMES = [
+    'Фантастика', 'Программирование', 'Детектив', 'Классика', 'Бизнес', 'Фэнтези', 'История',
+    'Психология', 'Поэзия', 'Детская литература', 'Приключения', 'Биография', 'Наука',
+    'Философия', 'Триллер', 'Любовный роман', 'Кулинария', 'Путешествия', 'Искусство', 'Здоровье'
+]
+
+FIRST_NAMES = ['Александр', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Андрей',
+               'Татьяна', 'Алексей', 'Наталья', 'Михаил', 'Ирина', 'Николай', 'Светлана', 'Павел', 'Юлия']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+              'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров',
+              'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин']
+TITLE_ADJECTIVES = ['Тайный', 'Последний', 'Великий', 'Забытый', 'Новый', 'Темный', 'Далекий', 'Чистый',
+                    'Быстрый', 'Вечный', 'Золотой', 'Северный', 'Живой', 'Практический', 'Полный']
+TITLE_NOUNS = ['город', 'код', 'путь', 'сад', 'мир', 'остров', 'дом', 'берег', 'ключ', 'алгоритм',
+               'архив', 'рассвет', 'лес', 'проект', 'горизонт', 'лабиринт', 'океан', 'маяк', 'шифр']
+TITLE_TAILS = ['', '', ' и его тени', ': полное руководство', '. Книга 2', ' на рассвете', ' без правил',
+               ' для начинающих', ' и другие рассказы', '. Хроники', ' в эпоху перемен']
+LANGUAGES = ['Русский', 'Английский', 'Немецкий', 'Французский', 'Испанский']
+LANGUAGE_WEIGHTS = [80, 12, 3, 3, 2]
+PAYMENT_METHODS = ['Банковская карта', 'Электронный кошелек', 'Наличные при получении']
+STATUS_WEIGHTS = [
+    (OrderStatus.DELIVERED, 60), (OrderStatus.PAID, 15), (OrderStatus.SHIPPED, 10),
+    (OrderStatus.PENDING, 10), (OrderStatus.CANCELLED, 5)
+]
+RATING_WEIGHTS = [5, 7, 15, 33, 40]
+COMMENTS = ['Отличная книга!', 'Рекомендую.', 'Ожидал большего.', 'Прочитал за один вечер.',
+            'Хороший перевод.', 'Скучновато.', 'Лучшая книга автора.', '']
+
+
+class ZipfSampler:
+    """Выбор идентификаторов с вероятностью, убывающей по закону Ципфа
+
+    Ранги перемешиваются, чтобы популярные объекты не совпадали с младшими id.
+    """
+
+    def __init__(self, rng: random.Random, ids: List[int], exponent: float = 1.1):
+        self.rng = rng
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, len(self.ids) + 1)))
+
+    def sample(self, k: int = 1) -> List[int]:
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+    def sample_distinct(self, k: int) -> List[int]:
+        """Несколько различных идентификаторов (k много меньше размера выборки)"""
+        chosen = []
+        while len(chosen) < min(k, len(self.ids)):
+            candidate = self.sample()[0]
+            if candidate not in chosen:
+                chosen.append(candidate)
+        return chosen
+
+
+class SyntheticDataGenerator:
+    """Генератор синтетических данных большого объема"""
+
+    def __init__(self, db_manager: DatabaseManager, seed: int = 42, batch_size: int = 10000,
+                 end_date: Optional[datetime] = None, history_days: int = 730, zipf_exponent: float = 1.1):
+        self.db_manager = db_manager
+        self.engine = db_manager.engine
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        # Данные привязаны к дате окончания, чтобы отчеты за последние дни не были пустыми
+        self.end_date = end_date or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.history_days = history_days
+        self.zipf_exponent = zipf_exponent
+        self.counts: Dict[str, int] = {}
+
+    def generate(self, users: int = 0, authors: int = 0, publishers: int = 0, publications: int = 0,
+                 orders: int = 0, reviews: int = 0, progress: bool = False) -> Dict[str, int]:
+        """Заполнение базы; возвращает количество вставленных строк по таблицам"""
+        self.progress = progress
+        # Базовые учетные записи и справочники из _create_test_data
+        self.db_manager.init_db()
+
+        genre_ids = self._generate_genres()
+        author_ids = self._existing_ids(Author) + self._generate_authors(authors)
+        publisher_ids = self._existing_ids(Publisher) + self._generate_publishers(publishers)
+        publication_prices = self._existing_prices()
+        publication_prices.update(self._generate_publications(publications, publisher_ids, author_ids, genre_ids))
+        user_ids = self._existing_ids(User) + self._generate_users(users)
+
+        publication_sampler = ZipfSampler(self.rng, sorted(publication_prices), self.zipf_exponent)
+        user_sampler = ZipfSampler(self.rng, user_ids, self.zipf_exponent)
+        self._generate_orders(orders, user_sampler, publication_sampler, publication_prices)
+        self._generate_reviews(reviews, user_sampler, publication_sampler)
+        if reviews:
+            # Отзывы вставлены через Core, сводка в publications пересчитывается одним проходом
+            reconcile_review_stats(self.engine)
+        return dict(self.counts)
+
+    # --- служебные методы ---
+
+    def _existing_ids(self, model) -> List[int]:
+        with self.engine.connect() as connection:
+            return [row[0] for row in connection.execute(select(model.id).order_by(model.id))]
+
+    def _existing_prices(self) -> Dict[int, float]:
+        with self.engine.connect() as connection:
+            return dict(connection.execute(select(Publication.id, Publication.price)).all())
+
+    def _next_id(self, model) -> int:
+        with self.engine.connect() as connection:
+            return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+    def _insert_batches(self, table, rows_iter, name: str):
+        """Пакетная вставка: одна транзакция на batch_size строк"""
+        total = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(itertools.islice(rows_iter, self.batch_size))
+            if not batch:
+                break
+            with self.engine.begin() as connection:
+                connection.execute(insert(table), batch)
+            total += len(batch)
+            if self.progress:
+                elapsed = time.perf_counter() - started
+                print(f"  {name}: {total} строк ({total / elapsed if elapsed else 0:.0f} строк/с)", end='\r')
+        if self.progress and total:
+            print()
+        self.counts[name] = self.counts.get(name, 0) + total
+        return total
+
+    def _generate_genres(self) -> List[int]:
+        with self.engine.connect() as connection:
+            existing = set(connection.execute(select(Genre.name)).scalars())
+        missing = [{'name': name, 'description': f'Книги жанра «{name}»'} for name in GENRE_NAMES if name not in existing]
+        if missing:
+            self._insert_batches(Genre.__table__, iter(missing), 'genres')
+        return self._existing_ids(Genre)
+
+    def _generate_authors(self, count: int) -> List[int]:
+        start = self._next_id(Author)
+        rng = self.rng
+        countries = ['Россия'] * 6 + ['США', 'Великобритания', 'Франция', 'Германия']
+
+        def rows():
+            for author_id in range(start, start + count):
+                yield {
+                    'id': author_id,
+                    'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    'country': rng.choice(countries),
+                }
+
+        self._insert_batches(Author.__table__, rows(), 'authors')
+        return list(range(start, start + count))
+
+    def _generate_publishers(self, count: int) -> List[int]:
+        start = self._next_id(Publisher)
+
+        def rows():
+            for publisher_id in range(start, start + count):
+                yield {
+                    'id': publisher_id,
+                    'name': f'Издательство {self.rng.choice(TITLE_ADJECTIVES)} {self.rng.choice(TITLE_NOUNS)} №{publisher_id}',
+                    'contact_email': f'info@publisher{publisher_id}.ru',
+                }
+
+        self._insert_batches(Publisher.__table__, rows(), 'publishers')
+        return list(range(start, start + count))
+
+    def _generate_publications(self, count: int, publisher_ids: List[int], author_ids: List[int],
+                               genre_ids: List[int]) -> Dict[int, float]:
+        start = self._next_id(Publication)
+        rng = self.rng
+        publisher_sampler = ZipfSampler(rng, publisher_ids, self.zipf_exponent)
+        author_sampler = ZipfSampler(rng, author_ids, self.zipf_exponent)
+        genre_sampler = ZipfSampler(rng, genre_ids, 0.8)
+        prices: Dict[int, float] = {}
+        author_links = []
+        genre_links = []
+
+        def rows():
+            for publication_id in range(start, start + count):
+                # Цены распределены логнормально: много недорогих книг и длинный хвост
+                price = round(min(15000.0, max(99.0, rng.lognormvariate(6.6, 0.5))), 0)
+                prices[publication_id] = price
+                title = f'{rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)}{rng.choice(TITLE_TAILS)}'
+                for author_id in author_sampler.sample_distinct(rng.choices([1, 2, 3], [80, 15, 5])[0]):
+                    author_links.append({'publication_id': publication_id, 'author_id': author_id})
+                for genre_id in genre_sampler.sample_distinct(rng.choices([1, 2], [75, 25])[0]):
+                    genre_links.append({'publication_id': publication_id, 'genre_id': genre_id})
+                yield {
+                    'id': publication_id,
+                    'title': title,
+                    'description': f'{title}. ' + ' '.join(rng.choices(TITLE_NOUNS, k=12)),
+                    'isbn': f'979-{publication_id:012d}',
+                    'publication_year': int(self.end_date.year - rng.expovariate(1 / 15)),
+                    'price': price,
+                    'stock_quantity': rng.choices([0, rng.randint(1, 4), rng.randint(5, 200)], [5, 15, 80])[0],
+                    'pages': rng.randint(80, 1200),
+                    'language': rng.choices(LANGUAGES, LANGUAGE_WEIGHTS)[0],
+                    'publisher_id': publisher_sampler.sample()[0] if publisher_ids else None,
+                }
+
+        # Связи копятся в памяти и сбрасываются после каждого пакета изданий
+        rows_iter = rows()
+        while True:
+            batch = list(itertools.islice(rows_iter, self.batch_size))
+            if not batch:
+                break
+            with self.engine.begin() as connection:
+                connection.execute(insert(Publication.__table__), batch)
+                if author_links:
+                    connection.execute(insert(publication_authors), author_links)
+                if genre_links:
+                    connection.execute(insert(publication_genres), genre_links)
+            self.counts['publications'] = self.counts.get('publications', 0) + len(batch)
+            self.counts['publication_authors'] = self.counts.get('publication_authors', 0) + len(author_links)
+            self.counts['publication_genres'] = self.counts.get('publication_genres', 0) + len(genre_links)
+            author_links.clear()
+            genre_links.clear()
+            if self.progress:
+                print(f"  publications: {self.counts['publications']} строк", end='\r')
+        if self.progress and count:
+            print()
+        return prices
+
+    def _generate_users(self, count: int) -> List[int]:
+        from werkzeug.security import generate_password_hash
+
+        start = self._next_id(User)
+        rng = self.rng
+        # Хеширование пароля дорогое, поэтому у всех синтетических пользователей один хеш
+        password_hash = generate_password_hash('Synthetic123')
+        first_day = self.end_date - timedelta(days=self.history_days)
+
+        def rows():
+            for user_id in range(start, start + count):
+                yield {
+                    'id': user_id,
+                    'email': f'user{user_id}@example.com',
+                    'password_hash': password_hash,
+                    'first_name': rng.choice(FIRST_NAMES),
+                    'last_name': rng.choice(LAST_NAMES),
+                    'registration_date': first_day + timedelta(seconds=rng.randrange(self.history_days * 86400)),
+                    'role': UserRole.USER,
+                    'is_active': rng.random() > 0.02,
+                }
+
+        self._insert_batches(User.__table__, rows(), 'users')
+        return list(range(start, start + count))
+
+    def _random_order_date(self) -> datetime:
+        """Дата заказа: рост продаж к концу периода и пик по выходным"""
+        rng = self.rng
+        while True:
+            days_ago = min(self.history_days - 1, int(rng.expovariate(2.0 / self.history_days)))
+            moment = self.end_date - timedelta(days=days_ago, seconds=rng.randrange(86400))
+            if moment.weekday() >= 5 or rng.random() < 0.75:
+                return moment
+
+    def _generate_orders(self, count: int, user_sampler: ZipfSampler, publication_sampler: ZipfSampler,
+                         prices: Dict[int, float]):
+        if not count:
+            return
+        order_start = self._next_id(Order)
+        item_id = self._next_id(OrderItem)
+        rng = self.rng
+        statuses = [status for status, _ in STATUS_WEIGHTS]
+        status_weights = [weight for _, weight in STATUS_WEIGHTS]
+        inserted = 0
+
+        for batch_start in range(order_start, order_start + count, self.batch_size):
+            batch_end = min(batch_start + self.batch_size, order_start + count)
+            orders = []
+            items = []
+            for order_id in range(batch_start, batch_end):
+                publication_ids = publication_sampler.sample_distinct(
+                    rng.choices([1, 2, 3, 4, 5], [55, 25, 11, 6, 3])[0]
+                )
+                total = 0.0
+                for publication_id in publication_ids:
+                    quantity = rng.choices([1, 2, 3], [85, 12, 3])[0]
+                    unit_price = prices[publication_id]
+                    total += quantity * unit_price
+                    items.append({
+                        'id': item_id,
+                        'order_id': order_id,
+                        'publication_id': publication_id,
+                        'quantity': quantity,
+                        'unit_price': unit_price,
+                    })
+                    item_id += 1
+                orders.append({
+                    'id': order_id,
+                    'order_number': f'SYN-{order_id:010d}',
+                    'order_date': self._random_order_date(),
+                    'total_amount': total,
+                    'status': rng.choices(statuses, status_weights)[0],
+                    'payment_method': rng.choice(PAYMENT_METHODS),
+                    'shipping_address': f'г. Москва, ул. {rng.choice(LAST_NAMES)}а, д. {rng.randint(1, 150)}',
+                    'user_id': user_sampler.sample()[0],
+                })
+            with self.engine.begin() as connection:
+                connection.execute(insert(Order.__table__), orders)
+                connection.execute(insert(OrderItem.__table__), items)
+            inserted += len(orders)
+            self.counts['orders'] = self.counts.get('orders', 0) + len(orders)
+            self.counts['order_items'] = self.counts.get('order_items', 0) + len(items)
+            if self.progress:
+                print(f"  orders: {inserted} строк", end='\r')
+        if self.progress:
+            print()
+
+    def _generate_reviews(self, count: int, user_sampler: ZipfSampler, publication_sampler: ZipfSampler):
+        rng = self.rng
+        start = self._next_id(Review)
+        first_day = self.end_date - timedelta(days=self.history_days)
+
+        def rows():
+            for review_id in range(start, start + count):
+                yield {
+                    'id': review_id,
+                    'rating': rng.choices([1, 2, 3, 4, 5], RATING_WEIGHTS)[0],
+                    'comment': rng.choice(COMMENTS),
+                    'created_at': first_day + timedelta(seconds=rng.randrange(self.history_days * 86400)),
+                    'is_approved': True,
+                    'user_id': user_sampler.sample()[0],
+                    'publication_id': publication_sampler.sample()[0],
+                }
+
+        self._insert_batches(Review.__table__, rows(), 'reviews')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация синтетических данных')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--scale', choices=sorted(SCALE_PRESETS), default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--end-date', default=None, help='последний день истории заказов, ГГГГ-ММ-ДД')
+    for name in ('users', 'authors', 'publishers', 'publications', 'orders', 'reviews'):
+        parser.add_argument(f'--{name}', type=int, default=None)
+    args = parser.parse_args()
+
+    volumes = dict(SCALE_PRESETS[args.scale]) if args.scale else {name: 0 for name in SCALE_PRESETS['10k']}
+    for name in volumes:
+        if getattr(args, name) is not None:
+            volumes[name] = getattr(args, name)
+
+    db_manager = DatabaseManager(args.database_url)
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d') if args.end_date else None
+    generator = SyntheticDataGenerator(db_manager, seed=args.seed, batch_size=args.batch_size, end_date=end_date)
+
+    started = time.perf_counter()
+    counts = generator.generate(progress=True, **volumes)
+    elapsed = time.perf_counter() - started
+
+    total_rows = sum(counts.values())
+    print(f"\nВставлено строк: {total_rows} за {elapsed:.1f} с ({total_rows / elapsed if elapsed else 0:.0f} строк/с)")
+    for name, value in counts.items():
+        print(f"  {name}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from datetime import datetime
+from sqlalchemy import func, desc
+from sqlalchemy.orm import Session, Query
+from models.database_models import User, Publication, Order, Review, Genre, OrderItem, OrderStatus, \
+    publication_genres
+
+
+class ReportQueries:
+    """Запросы отчетов и аналитики
+
+    Запросы собраны в одном месте, чтобы их использовали меню отчетов, экспорт
+    и проверка планов выполнения (models.migrations verify).
+    """
+
+    @staticmethod
+    def sales_by_day(session: Session, start_date: datetime, end_date: datetime) -> Query:
+        """Продажи по дням за период"""
+        return session.query(
+            func.date(Order.order_date).label('date'),
+            func.count(Order.id).label('orders_count'),
+            func.sum(Order.total_amount).label('total_revenue'),
+            func.sum(func.coalesce(OrderItem.quantity, 0)).label('items_sold')
+        ).join(Order.items).filter(
+            Order.status.in_([OrderStatus.PAID, OrderStatus.DELIVERED]),
+            Order.order_date >= start_date,
+            Order.order_date <= end_date
+        ).group_by(func.date(Order.order_date)).order_by('date')
+
+    @staticmethod
+    def popular_publications(session: Session, limit: int) -> Query:
+        """Издания с наибольшим количеством продаж"""
+        return session.query(
+            Publication.id,
+            Publication.title,
+            func.sum(OrderItem.quantity).label('total_sold'),
+            func.sum(OrderItem.quantity * OrderItem.unit_price).label('total_revenue'),
+            (Publication.rating_sum * 1.0 / func.nullif(Publication.reviews_count, 0)).label('avg_rating')
+        ).join(OrderItem).group_by(Publication.id) \
+            .order_by(desc('total_sold')).limit(limit)
+
+    @staticmethod
+    def user_activity(session: Session, limit: int) -> Query:
+        """Самые активные пользователи"""
+        return session.query(
+            User.id,
+            User.email,
+            User.first_name,
+            User.last_name,
+            func.count(Order.id).label('orders_count'),
+            func.sum(Order.total_amount).label('total_spent'),
+            func.count(Review.id).label('reviews_count')
+        ).outerjoin(Order).outerjoin(Review).group_by(User.id) \
+            .order_by(desc('orders_count')).limit(limit)
+
+    @staticmethod
+    def inventory(session: Session) -> Query:
+        """Все публикации по убыванию количества на складе"""
+        return session.query(Publication).order_by(desc(Publication.stock_quantity))
+
+    @staticmethod
+    def genres_stats(session: Session) -> Query:
+        """Статистика продаж по жанрам"""
+        return session.query(
+            Genre.name,
+            func.count(Publication.id).label('publications_count'),
+            func.sum(OrderItem.quantity).label('total_sold'),
+            func.sum(OrderItem.quantity * OrderItem.unit_price).label('total_revenue')
+        ).select_from(Genre) \
+            .join(publication_genres, publication_genres.c.genre_id == Genre.id) \
+            .join(Publication, Publication.id == publication_genres.c.publication_id) \
+            .outerjoin(OrderItem, OrderItem.publication_id == Publication.id) \
+            .group_by(Genre.id).order_by(desc('total_revenue'))
+
+    @staticmethod
+    def user_orders(session: Session, user_id: int) -> Query:
+        """Заказы пользователя, новые сначала"""
+        return session.query(Order).filter_by(user_id=user_id).order_by(desc(Order.order_date))
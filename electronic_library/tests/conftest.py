@@ -0,0 +1,55 @@
+"""Общие фикстуры тестов
+
+Тесты запускаются из каталога electronic_library:
+    python -m pytest -q
+"""
+import contextlib
+import io
+import os
+import sys
+from unittest import mock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database_models import DatabaseManager  # noqa: E402
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """Менеджер временной файловой базы SQLite со схемой, созданной ensure_schema()"""
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'library.db'}")
+    yield manager
+    manager.engine.dispose()
+
+
+@pytest.fixture
+def library(db_manager):
+    """Временная база с небольшим синтетическим набором данных (models/synthetic_data.py)"""
+    from models.synthetic_data import SyntheticDataGenerator
+
+    SyntheticDataGenerator(db_manager, seed=1).generate(users=30, authors=20, publishers=5, publications=60,
+                                                        orders=200, reviews=50)
+    return db_manager
+
+
+@pytest.fixture
+def app(library):
+    from main import ElectronicLibraryApp
+
+    return ElectronicLibraryApp(library)
+
+
+def run_action(app, action, answers=(), user_id=None) -> str:
+    """Выполнить пункт меню, как run(): ответы на input() берутся из answers; возвращает вывод"""
+    answers = list(answers)
+    output = io.StringIO()
+    app.current_user_id = user_id
+    try:
+        with mock.patch('builtins.input', lambda prompt='': answers.pop(0) if answers else ''), \
+                contextlib.redirect_stdout(output):
+            with app._action_scope():
+                action()
+    finally:
+        app.current_user_id = None
+    return output.getvalue()
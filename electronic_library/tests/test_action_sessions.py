@@ -0,0 +1,19 @@
+"""Сессия на действие меню: объекты не копятся между действиями"""
+from conftest import run_action
+from test_query_budgets import busiest_buyer
+
+
+def test_actions_release_their_sessions(app, library):
+    user_id = busiest_buyer(library.engine)
+    held = {'browse_catalog': set(), 'view_my_orders': set()}
+    for _ in range(20):
+        for name, action, action_user in (('browse_catalog', app.browse_catalog, None),
+                                          ('view_my_orders', app.view_my_orders, user_id)):
+            run_action(app, action, user_id=action_user)
+            stats = library.session_stats()
+            assert stats['open_sessions'] == 0 and stats['held_objects'] == 0
+            assert app.session is None and app.current_user is None
+            held[name].add(stats['last_held_objects'])
+    # Каждое действие держит одно и то же число объектов, и пик не превышает одного действия
+    assert all(len(counts) == 1 for counts in held.values())
+    assert library.session_stats()['peak_held_objects'] == max(max(counts) for counts in held.values())
@@ -0,0 +1,113 @@
+"""Списание остатков при оформлении: нехватка и гонка за последний экземпляр"""
+import threading
+import pytest
+from sqlalchemy import func, select
+from models.checkout import InsufficientStock, checkout, place_order, take_stock
+from models.checkout_queue import CheckoutQueue
+from models.database_models import Order, Publication, User
+
+
+@pytest.fixture
+def stock(db_manager):
+    """Издания с остатками 5, 1 и 1 экземпляр и покупатель; возвращает (id изданий, id покупателя)"""
+    with db_manager.session_scope() as session:
+        publications = [Publication(title=f'Издание {number}', isbn=f'test-{number}', price=100.0,
+                                    stock_quantity=quantity)
+                        for number, quantity in enumerate((5, 1, 1), 1)]
+        user = User(email='buyer@test', password_hash='-', first_name='Покупатель', last_name='Тестовый')
+        session.add_all(publications + [user])
+        session.commit()
+        ids = [publication.id for publication in publications]
+        user_id = user.id
+    return ids, user_id
+
+
+def cart_of(*items):
+    return [{'publication_id': publication_id, 'title': '', 'quantity': quantity, 'unit_price': 100.0}
+            for publication_id, quantity in items]
+
+
+def stock_of(session, publication_ids):
+    return dict(session.execute(select(Publication.id, Publication.stock_quantity)
+                                .where(Publication.id.in_(publication_ids))).all())
+
+
+def orders_count(db_manager) -> int:
+    with db_manager.engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(Order.__table__)).scalar()
+
+
+def test_take_stock_restores_taken_rows_on_shortage(db_manager, stock):
+    (plenty, last, _), _ = stock
+    session = db_manager.get_session()
+    try:
+        with pytest.raises(InsufficientStock) as error:
+            take_stock(session, {plenty: 2, last: 3})
+        assert error.value.shortages == {last: 1}
+        # Списанное возвращено в той же транзакции, без отката
+        assert stock_of(session, [plenty, last]) == {plenty: 5, last: 1}
+        take_stock(session, {plenty: 5})
+        session.commit()
+        assert stock_of(session, [plenty, last]) == {plenty: 0, last: 1}
+    finally:
+        session.close()
+
+
+def test_place_order_shortage_creates_no_order(db_manager, stock):
+    (plenty, last, _), user_id = stock
+    session = db_manager.get_session()
+    try:
+        with pytest.raises(InsufficientStock) as error:
+            place_order(session, 'TEST-1', user_id, cart_of((plenty, 2), (last, 2)))
+        assert error.value.shortages == {last: 1}
+        session.commit()
+    finally:
+        session.close()
+    with db_manager.session_scope() as session:
+        assert stock_of(session, [plenty, last]) == {plenty: 5, last: 1}
+    assert orders_count(db_manager) == 0
+
+
+def test_concurrent_checkouts_of_last_copy(db_manager, stock):
+    (_, last, _), user_id = stock
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def buyer():
+        barrier.wait()
+        try:
+            outcomes.append(checkout(db_manager, user_id, cart_of((last, 1))))
+        except InsufficientStock as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=buyer) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    shortages = [outcome for outcome in outcomes if isinstance(outcome, InsufficientStock)]
+    assert len(outcomes) == 2 and len(shortages) == 1
+    assert shortages[0].shortages == {last: 0}
+    with db_manager.session_scope() as session:
+        assert stock_of(session, [last]) == {last: 0}
+    assert orders_count(db_manager) == 1
+
+
+def test_queued_checkouts_of_last_copy_in_one_batch(db_manager, stock):
+    (plenty, last, other), user_id = stock
+    checkout_queue = CheckoutQueue(db_manager, batch_size=10, max_wait_ms=200)
+    try:
+        futures = [checkout_queue.submit(user_id, cart_of((plenty, 1), (last, 1))),
+                   checkout_queue.submit(user_id, cart_of((plenty, 1), (last, 1), (other, 1)))]
+        order_id, _ = futures[0].result(10)
+        with pytest.raises(InsufficientStock):
+            futures[1].result(10)
+    finally:
+        checkout_queue.close(10)
+    assert checkout_queue.batches == 1
+    with db_manager.session_scope() as session:
+        # Второй заказ пакета вернул списанное по нему, первый остался в силе
+        assert stock_of(session, [plenty, last, other]) == {plenty: 4, last: 0, other: 1}
+        assert session.get(Order, order_id) is not None
+    assert orders_count(db_manager) == 1
@@ -0,0 +1,36 @@
+"""Похожие издания: точная близость и построение индекса вне экрана издания"""
+from models.content_similarity import MIN_SIMILARITY, words
+
+
+def test_adjective_endings_are_stemmed():
+    assert words('детективных') == words('детективный') == ['детективн']
+    assert words('книжных') == words('книжный')
+
+
+def test_similar_requires_shared_terms(db_manager):
+    from models.database_models import Publication
+
+    with db_manager.session_scope() as session:
+        session.add_all([
+            Publication(title='Война и мир', description='Роман о войне 1812 года', price=1.0),
+            Publication(title='Чистый код', description='Рефакторинг и тестирование программ', price=1.0),
+            Publication(title='Война миров', description='Роман о вторжении марсиан', price=1.0),
+        ])
+        session.commit()
+    similar = db_manager.content_similarity.similar(1, 5)
+    assert [item.publication_id for item in similar] == [3]
+    assert all(item.score >= MIN_SIMILARITY for item in similar)
+    assert db_manager.content_similarity.similar(2, 5) == []
+
+
+def test_similar_without_wait_builds_in_background(db_manager):
+    from models.database_models import Publication
+
+    with db_manager.session_scope() as session:
+        session.add_all([Publication(title=f'Роман о войне, часть {number}', price=1.0) for number in range(3)])
+        session.commit()
+    similarity = db_manager.content_similarity
+    assert similarity.similar(1, 5, wait=False) == []
+    similarity.start_loading().join(30)
+    assert similarity.last_error is None
+    assert {item.publication_id for item in similarity.similar(1, 5, wait=False)} == {2, 3}
@@ -0,0 +1,16 @@
+"""Планы запросов отчетов на схеме, созданной ensure_schema()"""
+from models.migrations import EXPECTED_REPORT_INDEXES, verify_report_indexes
+
+
+def test_schema_is_current_after_ensure_schema(db_manager):
+    assert db_manager.schema_updated
+    assert not db_manager.ensure_schema()
+
+
+def test_report_queries_use_expected_indexes(db_manager):
+    with db_manager.session_scope() as session:
+        results = verify_report_indexes(session)
+    assert {name for name, _, _ in results} == set(EXPECTED_REPORT_INDEXES)
+    for name, _, plan in results:
+        for index in EXPECTED_REPORT_INDEXES[name]:
+            assert any(index in line for line in plan), f"{name}: нет {index} в плане {plan}"
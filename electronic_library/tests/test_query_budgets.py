@@ -0,0 +1,53 @@
+"""Бюджеты запросов действий меню: N+1 не должен вернуться"""
+import threading
+import pytest
+from sqlalchemy import func, select
+from models.database_models import Order
+from models.instrumentation import QueryBudgetExceeded, query_budget
+from conftest import run_action
+
+
+def busiest_buyer(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(select(Order.user_id).group_by(Order.user_id)
+                                  .order_by(func.count().desc()).limit(1)).scalar()
+
+
+def test_browse_catalog_budget(app, library):
+    # Первая страница: подсчет, id страницы и представления изданий пакетом
+    with query_budget(library.engine, max_queries=6, max_repeats=1):
+        run_action(app, app.browse_catalog)
+    # Повторный просмотр берет представления из кэша каталога
+    with query_budget(library.engine, max_queries=3, max_repeats=1):
+        run_action(app, app.browse_catalog)
+
+
+def test_view_my_orders_budget(app, library):
+    user_id = busiest_buyer(library.engine)
+    with query_budget(library.engine, max_queries=5, max_repeats=1) as recorder:
+        output = run_action(app, app.view_my_orders, user_id=user_id)
+    assert output.count('Заказ #') > 10
+    assert recorder.rows > 0
+
+
+def test_budget_reports_repeated_statements(library):
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(library.engine, max_repeats=1):
+            with library.engine.connect() as connection:
+                for order_id in range(1, 4):
+                    connection.execute(select(Order.id).where(Order.id == order_id)).all()
+
+
+def test_budget_ignores_other_threads(library):
+    def background():
+        with library.engine.connect() as connection:
+            for _ in range(10):
+                connection.execute(select(func.count()).select_from(Order)).scalar()
+
+    with query_budget(library.engine, max_queries=1) as recorder:
+        thread = threading.Thread(target=background)
+        thread.start()
+        thread.join()
+        with library.engine.connect() as connection:
+            connection.execute(select(func.count()).select_from(Order)).scalar()
+    assert recorder.queries == 1